@@ -0,0 +1,563 @@
+"""
+Выгрузка журналов TeachAI для аналитики.
+
+Аналитики разбирали assessment_log, activity_log и control_tasks_log
+в pandas вручную. Этот модуль потоково (пачками, не загружая журналы
+целиком) выгружает журналы всех учащихся и прогресс из состояния в
+колоночные таблицы Parquet или Feather (Arrow IPC), которые pandas
+читает за секунды:
+
+    lessons_viewed — просмотренные уроки (activity_log, lesson_viewed)
+    question_attempts — вопросы учащегося к системе (questions_log)
+    assessment_answers — ответы тестов, строка на вопрос (assessment_log)
+    control_task_attempts — попытки контрольных заданий (хранилища попыток)
+    lesson_progress — попытки тестов и выполнение уроков из состояния
+
+Журналы читаются вместе с ротированными сегментами. Учащиеся находятся
+по каталогам logs/learners/<id>/ и data/learners/<id>/; журналы,
+состояние и попытки без learner_id попадают в таблицы с пустым learner_id.
+
+Parquet и Feather требуют pyarrow; формат csv работает без зависимостей.
+
+Пример:
+    python analytics_export.py --format parquet --output exports
+"""
+
+import os
+import csv
+import json
+import logging
+import argparse
+from datetime import datetime
+from pathlib import Path
+
+from logger import (
+    iter_log_records,
+    ACTIVITY_LOG_FILE,
+    ASSESSMENT_LOG_FILE,
+    QUESTIONS_LOG_FILE,
+)
+from log_writer import flush_log_writer
+from learner_namespace import LEARNERS_DIR
+from state_storage import read_state_snapshot
+from control_tasks_store import ControlTaskAttemptStore
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet
+
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ("parquet", "feather", "csv")
+FILE_EXTENSIONS = {"parquet": ".parquet", "feather": ".feather", "csv": ".csv"}
+
+# Сколько строк накапливается перед записью очередной пачки
+BATCH_ROWS = 5000
+
+# Хранилище попыток контрольных заданий в каталоге состояния учащегося
+# (см. control_tasks_logger)
+CONTROL_TASKS_STORE_FILE = "control_tasks_log.sqlite3"
+
+# Колонки таблиц: (имя, тип); типы — string, int, float, bool, timestamp
+TABLE_SCHEMAS = {
+    "lessons_viewed": [
+        ("learner_id", "string"),
+        ("timestamp", "timestamp"),
+        ("status", "string"),
+        ("course", "string"),
+        ("section", "string"),
+        ("topic", "string"),
+        ("lesson_title", "string"),
+    ],
+    "question_attempts": [
+        ("learner_id", "string"),
+        ("timestamp", "timestamp"),
+        ("question", "string"),
+        ("answer", "string"),
+    ],
+    "assessment_answers": [
+        ("learner_id", "string"),
+        ("timestamp", "timestamp"),
+        ("course", "string"),
+        ("section", "string"),
+        ("topic", "string"),
+        ("lesson", "string"),
+        ("score", "float"),
+        ("question_index", "int"),
+        ("question", "string"),
+        ("user_answer", "int"),
+        ("correct_answer", "int"),
+        ("is_correct", "bool"),
+    ],
+    "control_task_attempts": [
+        ("learner_id", "string"),
+        ("attempt_id", "string"),
+        ("cell_id", "string"),
+        ("timestamp", "timestamp"),
+        ("execution_success", "bool"),
+        ("passed", "bool"),
+        ("score", "float"),
+        ("message", "string"),
+        ("execution_time_ms", "float"),
+        ("student_code", "string"),
+        ("execution_output", "string"),
+    ],
+    "lesson_progress": [
+        ("learner_id", "string"),
+        ("course_id", "string"),
+        ("lesson_id", "string"),
+        ("attempt", "int"),
+        ("timestamp", "timestamp"),
+        ("score", "float"),
+        ("is_passed", "bool"),
+        ("lesson_completed", "bool"),
+        ("control_task_correct", "bool"),
+    ],
+}
+
+# Статистика ячеек контрольных заданий (ControlTasksLogger.export_stats)
+CELL_STATS_SCHEMA = [
+    ("cell_id", "string"),
+    ("total_attempts", "int"),
+    ("successful_attempts", "int"),
+    ("first_success_attempt", "int"),
+    ("last_attempt_timestamp", "timestamp"),
+    ("best_score", "float"),
+    ("average_score", "float"),
+    ("total_execution_time_ms", "float"),
+]
+
+
+def _to_timestamp(value):
+    """ISO-строка времени → datetime (None, если не разбирается)."""
+    if isinstance(value, datetime):
+        return value
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def _to_int(value):
+    try:
+        return int(value) if value is not None and value != "" else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_float(value):
+    try:
+        return float(value) if value is not None and value != "" else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_bool(value):
+    return None if value is None else bool(value)
+
+
+def _to_string(value):
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+_CONVERTERS = {
+    "string": _to_string,
+    "int": _to_int,
+    "float": _to_float,
+    "bool": _to_bool,
+    "timestamp": _to_timestamp,
+}
+
+
+class TableWriter:
+    """Потоковая запись таблицы пачками в Parquet, Feather или CSV."""
+
+    def __init__(self, path, schema, format="parquet"):
+        """
+        Инициализация записи таблицы.
+
+        Args:
+            path (str | Path): Путь к файлу
+            schema (list): Колонки таблицы: [(имя, тип), ...]
+            format (str): parquet, feather или csv
+
+        Raises:
+            ValueError: Если формат не поддерживается
+            ImportError: Если для формата нужен не установленный pyarrow
+        """
+        if format not in EXPORT_FORMATS:
+            raise ValueError(f"Неподдерживаемый формат: {format}")
+        if format != "csv" and not PYARROW_AVAILABLE:
+            raise ImportError(
+                f"Для формата {format} нужен pyarrow (pip install pyarrow) "
+                "или используйте формат csv"
+            )
+        self.path = Path(path)
+        self.schema = schema
+        self.format = format
+        self.rows = 0
+        self._batch = []
+        self._writer = None
+        self._file = None
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self._tmp_path = self.path.with_name(self.path.name + ".tmp")
+
+        if format == "csv":
+            self._file = open(self._tmp_path, "w", encoding="utf-8", newline="")
+            self._writer = csv.writer(self._file)
+            self._writer.writerow([name for name, _ in schema])
+        else:
+            self._arrow_schema = pa.schema(
+                [(name, self._arrow_type(kind)) for name, kind in schema]
+            )
+            if format == "parquet":
+                self._writer = pyarrow.parquet.ParquetWriter(
+                    str(self._tmp_path), self._arrow_schema, compression="zstd"
+                )
+            else:
+                self._file = pa.OSFile(str(self._tmp_path), "wb")
+                self._writer = pyarrow.ipc.new_file(self._file, self._arrow_schema)
+
+    @staticmethod
+    def _arrow_type(kind):
+        return {
+            "string": pa.string(),
+            "int": pa.int64(),
+            "float": pa.float64(),
+            "bool": pa.bool_(),
+            "timestamp": pa.timestamp("us"),
+        }[kind]
+
+    def write(self, row):
+        """
+        Добавляет строку (пачка записывается по накоплении BATCH_ROWS строк).
+
+        Args:
+            row (dict): Значения колонок; отсутствующие колонки пусты
+        """
+        self._batch.append(
+            [_CONVERTERS[kind](row.get(name)) for name, kind in self.schema]
+        )
+        if len(self._batch) >= BATCH_ROWS:
+            self._flush_batch()
+
+    def _flush_batch(self):
+        if not self._batch:
+            return
+        if self.format == "csv":
+            self._writer.writerows(
+                [
+                    [
+                        value.isoformat() if isinstance(value, datetime) else value
+                        for value in row
+                    ]
+                    for row in self._batch
+                ]
+            )
+        else:
+            columns = list(zip(*self._batch))
+            batch = pa.RecordBatch.from_arrays(
+                [
+                    pa.array(column, type=field.type)
+                    for column, field in zip(columns, self._arrow_schema)
+                ],
+                schema=self._arrow_schema,
+            )
+            if self.format == "parquet":
+                self._writer.write_batch(batch)
+            else:
+                self._writer.write(batch)
+        self.rows += len(self._batch)
+        self._batch = []
+
+    def close(self):
+        """
+        Дописывает последнюю пачку и атомарно публикует файл.
+
+        Returns:
+            int: Число записанных строк
+        """
+        self._flush_batch()
+        if self.format == "csv":
+            self._file.close()
+        else:
+            self._writer.close()
+            if self._file is not None:
+                self._file.close()
+        os.replace(self._tmp_path, self.path)
+        return self.rows
+
+    def abort(self):
+        """Прерывает запись и удаляет недописанный файл."""
+        try:
+            if self._file is not None:
+                self._file.close()
+            elif self._writer is not None:
+                self._writer.close()
+        except Exception:
+            pass
+        try:
+            os.remove(self._tmp_path)
+        except OSError:
+            pass
+
+
+def write_table(path, schema, rows, format="parquet"):
+    """
+    Записывает таблицу из итератора строк.
+
+    Args:
+        path (str | Path): Путь к файлу
+        schema (list): Колонки таблицы: [(имя, тип), ...]
+        rows (iterable): Строки-словари
+        format (str): parquet, feather или csv
+
+    Returns:
+        int: Число записанных строк
+    """
+    writer = TableWriter(path, schema, format)
+    try:
+        for row in rows:
+            writer.write(row)
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.close()
+
+
+def discover_learners(project_dir="."):
+    """
+    Находит каталоги журналов и состояния учащихся.
+
+    Args:
+        project_dir (str | Path): Корень проекта (с каталогами logs/ и data/)
+
+    Returns:
+        list: [(learner_id, каталог журналов, файл состояния)]; learner_id
+        пуст для журналов и состояния без учащегося
+    """
+    project_dir = Path(project_dir)
+    logs_dir = project_dir / "logs"
+    data_dir = project_dir / "data"
+    learner_ids = set()
+    for base in (logs_dir / LEARNERS_DIR, data_dir / LEARNERS_DIR):
+        if base.is_dir():
+            learner_ids.update(entry.name for entry in base.iterdir() if entry.is_dir())
+    return [("", logs_dir, data_dir / "state.json")] + [
+        (
+            learner_id,
+            logs_dir / LEARNERS_DIR / learner_id,
+            data_dir / LEARNERS_DIR / learner_id / "state.json",
+        )
+        for learner_id in sorted(learner_ids)
+    ]
+
+
+def iter_lessons_viewed(learners):
+    """Строки таблицы lessons_viewed."""
+    for learner_id, log_dir, _ in learners:
+        for entry in iter_log_records(
+            str(log_dir / ACTIVITY_LOG_FILE), include_rotated=True
+        ):
+            if entry.get("action_type") != "lesson_viewed":
+                continue
+            details = entry.get("details") or {}
+            yield {
+                "learner_id": learner_id,
+                "timestamp": entry.get("timestamp"),
+                "status": entry.get("status"),
+                "course": details.get("course"),
+                "section": details.get("section"),
+                "topic": details.get("topic"),
+                "lesson_title": details.get("lesson_title"),
+            }
+
+
+def iter_question_attempts(learners):
+    """Строки таблицы question_attempts."""
+    for learner_id, log_dir, _ in learners:
+        for entry in iter_log_records(
+            str(log_dir / QUESTIONS_LOG_FILE), include_rotated=True
+        ):
+            yield {
+                "learner_id": learner_id,
+                "timestamp": entry.get("timestamp"),
+                "question": entry.get("question"),
+                "answer": entry.get("answer"),
+            }
+
+
+def iter_assessment_answers(learners):
+    """Строки таблицы assessment_answers: по строке на вопрос теста."""
+    for learner_id, log_dir, _ in learners:
+        for entry in iter_log_records(
+            str(log_dir / ASSESSMENT_LOG_FILE), include_rotated=True
+        ):
+            test = {
+                "learner_id": learner_id,
+                "timestamp": entry.get("timestamp"),
+                "course": entry.get("course"),
+                "section": entry.get("section"),
+                "topic": entry.get("topic"),
+                "lesson": entry.get("lesson"),
+                "score": entry.get("score"),
+            }
+            for index, question in enumerate(entry.get("questions") or []):
+                yield dict(
+                    test,
+                    question_index=index,
+                    question=question.get("question"),
+                    user_answer=question.get("user_answer"),
+                    correct_answer=question.get("correct_answer"),
+                    is_correct=question.get("is_correct"),
+                )
+
+
+def iter_control_task_attempts(learners):
+    """Строки таблицы control_task_attempts из хранилищ попыток учащихся."""
+    # Попытки, ещё стоящие в очереди фоновой записи, должны попасть в выгрузку
+    flush_log_writer()
+    for learner_id, _, state_file in learners:
+        store_file = state_file.parent / CONTROL_TASKS_STORE_FILE
+        if not store_file.exists():
+            continue
+        store = ControlTaskAttemptStore(store_file)
+        try:
+            for attempt in store.iter_attempts():
+                check_result = attempt.get("check_result") or {}
+                yield {
+                    "learner_id": learner_id,
+                    "attempt_id": attempt.get("attempt_id"),
+                    "cell_id": attempt.get("cell_id"),
+                    "timestamp": attempt.get("timestamp"),
+                    "execution_success": attempt.get("execution_success"),
+                    "passed": check_result.get("passed"),
+                    "score": check_result.get("score"),
+                    "message": check_result.get("message"),
+                    "execution_time_ms": attempt.get("execution_time_ms"),
+                    "student_code": attempt.get("student_code"),
+                    "execution_output": attempt.get("execution_output"),
+                }
+        finally:
+            store.close()
+
+
+def iter_lesson_progress(learners):
+    """Строки таблицы lesson_progress из состояния учащихся."""
+    for learner_id, _, state_file in learners:
+        if not state_file.parent.is_dir():
+            continue
+        try:
+            state = read_state_snapshot(state_file)
+        except Exception as e:
+            logger.error(f"Ошибка при чтении состояния {state_file}: {str(e)}")
+            state = None
+        if not state:
+            continue
+
+        learning = state.get("learning") or {}
+        completion = learning.get("lesson_completion_status") or {}
+        completed = set(learning.get("completed_lessons") or [])
+        control_tasks = state.get("control_tasks") or {}
+        course_id = (state.get("course_plan") or {}).get("id")
+        attempts = learning.get("lesson_attempts") or {}
+        lesson_ids = list(attempts) + [
+            lesson_id
+            for lesson_id in list(completion) + list(completed)
+            if lesson_id not in attempts
+        ]
+        for lesson_id in dict.fromkeys(lesson_ids):
+            lesson = {
+                "learner_id": learner_id,
+                "course_id": course_id,
+                "lesson_id": lesson_id,
+                "lesson_completed": bool(completion.get(lesson_id))
+                or lesson_id in completed,
+                "control_task_correct": (control_tasks.get(lesson_id) or {}).get(
+                    "is_correct"
+                ),
+            }
+            lesson_attempts = attempts.get(lesson_id) or []
+            if not lesson_attempts:
+                yield lesson
+            for number, attempt in enumerate(lesson_attempts, 1):
+                yield dict(
+                    lesson,
+                    attempt=number,
+                    timestamp=attempt.get("timestamp"),
+                    score=attempt.get("score"),
+                    is_passed=attempt.get("is_passed"),
+                )
+
+
+def export_analytics(
+    output_dir="exports", format="parquet", project_dir=".", tables=None
+):
+    """
+    Выгружает журналы и прогресс всех учащихся в колоночные таблицы.
+
+    Args:
+        output_dir (str | Path): Каталог для файлов таблиц
+        format (str): parquet, feather или csv
+        project_dir (str | Path): Корень проекта (с каталогами logs/ и data/)
+        tables (list, optional): Какие таблицы выгрузить (по умолчанию все)
+
+    Returns:
+        dict: Имя таблицы -> {"path": путь к файлу, "rows": число строк}
+
+    Raises:
+        ValueError: Если формат или имя таблицы не поддерживаются
+        ImportError: Если для формата нужен не установленный pyarrow
+    """
+    tables = list(tables or TABLE_SCHEMAS)
+    unknown = [name for name in tables if name not in TABLE_SCHEMAS]
+    if unknown:
+        raise ValueError(f"Неизвестные таблицы: {', '.join(unknown)}")
+
+    project_dir = Path(project_dir)
+    learners = discover_learners(project_dir)
+    sources = {
+        "lessons_viewed": lambda: iter_lessons_viewed(learners),
+        "question_attempts": lambda: iter_question_attempts(learners),
+        "assessment_answers": lambda: iter_assessment_answers(learners),
+        "control_task_attempts": lambda: iter_control_task_attempts(learners),
+        "lesson_progress": lambda: iter_lesson_progress(learners),
+    }
+
+    results = {}
+    for name in tables:
+        path = Path(output_dir) / f"{name}{FILE_EXTENSIONS.get(format, '')}"
+        rows = write_table(path, TABLE_SCHEMAS[name], sources[name](), format)
+        results[name] = {"path": str(path), "rows": rows}
+        logger.info(f"Таблица {name}: {rows} строк → {path}")
+    return results
+
+
+def main():
+    """Точка входа командной строки."""
+    parser = argparse.ArgumentParser(
+        description="Выгрузка журналов TeachAI для аналитики"
+    )
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="parquet")
+    parser.add_argument("--output", default="exports", help="каталог для таблиц")
+    parser.add_argument("--project-dir", default=".", help="корень проекта TeachAI")
+    parser.add_argument("--tables", nargs="*", choices=list(TABLE_SCHEMAS))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    results = export_analytics(args.output, args.format, args.project_dir, args.tables)
+    for name, info in results.items():
+        print(f"{name}: {info['rows']} → {info['path']}")
+
+
+if __name__ == "__main__":
+    main()
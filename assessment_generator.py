@@ -49,8 +49,8 @@ class AssessmentGenerator(BaseContentGenerator):
             clean_content = self._clean_html_for_analysis(lesson_content)
 
             # Ограничиваем длину, но берем больше текста для более точных вопросов
-            content_for_questions = (
-                clean_content[:4000] if len(clean_content) > 4000 else clean_content
+            content_for_questions = self.prompt_budget.fit(
+                "lesson", clean_content, max_tokens=1600
             )
 
             prompt = self._build_assessment_prompt(
@@ -11,6 +11,7 @@ from interface_utils import InterfaceUtils, InterfaceStyles, InterfaceState
 
 # Импортируем специализированный обработчик результатов
 from assessment_results_handler import AssessmentResultsHandler
+from course_plan_index import get_course_plan_index
 
 
 class AssessmentInterface:
@@ -142,14 +143,19 @@ class AssessmentInterface:
                         "self.assessment равен None - это основная проблема!"
                     )
 
-                questions = self.assessment.generate_questions(
-                    course=course_title,
-                    section=section_title,
-                    topic=topic_title,
-                    lesson=lesson_title,
-                    lesson_content=current_lesson_content,
-                    num_questions=5,
-                )
+                # Вопросы могли быть сгенерированы сразу после показа урока
+                questions = None
+                if self.lesson_interface is not None:
+                    questions = self.lesson_interface.artifacts.get("assessment")
+                if not questions:
+                    questions = self.assessment.generate_questions(
+                        course=course_title,
+                        section=section_title,
+                        topic=topic_title,
+                        lesson=lesson_title,
+                        lesson_content=current_lesson_content,
+                        num_questions=5,
+                    )
             except Exception as e:
                 self.logger.error(f"ОШИБКА при генерации вопросов: {str(e)}")
                 # Очищаем сообщение о загрузке и показываем ошибку
@@ -379,23 +385,15 @@ class AssessmentInterface:
             learning_progress = self.state_manager.get_learning_progress()
             course_title = learning_progress.get("current_course", "Курс Python")
 
-        # Ищем названия раздела и темы
-        section_title = "Раздел"
-        topic_title = "Тема"
-        lesson_title = "Урок"
-
-        for section in course_plan.get("sections", []):
-            if section.get("id") == current_section:
-                section_title = self.utils.get_safe_title(section, "Раздел")
-                for topic in section.get("topics", []):
-                    if topic.get("id") == current_topic:
-                        topic_title = self.utils.get_safe_title(topic, "Тема")
-                        for lesson in topic.get("lessons", []):
-                            if lesson.get("id") == current_lesson:
-                                lesson_title = self.utils.get_safe_title(lesson, "Урок")
-                                break
-                        break
-                break
+        # Названия раздела, темы и урока — из индекса плана
+        index = get_course_plan_index(course_plan)
+        section = index.section(current_section)
+        topic = index.topic(current_section, current_topic)
+        lesson = index.lesson(current_section, current_topic, current_lesson)
+
+        section_title = self.utils.get_safe_title(section, "Раздел") if section else "Раздел"
+        topic_title = self.utils.get_safe_title(topic, "Тема") if topic else "Тема"
+        lesson_title = self.utils.get_safe_title(lesson, "Урок") if lesson else "Урок"
 
         return course_title, section_title, topic_title, lesson_title
 
@@ -0,0 +1,83 @@
+"""
+Утилиты для асинхронной генерации контента из виджетов Jupyter.
+
+Обработчики кнопок ipywidgets — обычные синхронные функции. Если вызвать
+в них генерацию напрямую, kernel не обрабатывает другие события виджетов,
+пока идёт запрос к LLM. Здесь собраны помощники, которые запускают корутину
+в event loop kernel и возвращают управление обработчику сразу.
+"""
+
+import asyncio
+import functools
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+async def run_in_thread(func, *args, **kwargs):
+    """
+    Выполняет синхронную функцию в рабочем потоке и ожидает результат.
+
+    Используется для генераторов, у которых нет нативного async-пути
+    (многошаговая генерация с валидацией): event loop при этом свободен.
+
+    Args:
+        func (callable): Синхронная функция
+        *args: Позиционные аргументы
+        **kwargs: Именованные аргументы
+
+    Returns:
+        Результат func
+    """
+    return await asyncio.to_thread(functools.partial(func, *args, **kwargs))
+
+
+def schedule(coro, on_error=None):
+    """
+    Запускает корутину из синхронного обработчика виджета.
+
+    В Jupyter корутина ставится задачей в работающий event loop kernel,
+    и обработчик кнопки завершается сразу. Без запущенного цикла
+    (запуск из командной строки) корутина выполняется синхронно.
+
+    Args:
+        coro (coroutine): Корутина для выполнения
+        on_error (callable, optional): Вызывается с исключением, если
+            корутина завершилась ошибкой
+
+    Returns:
+        asyncio.Task | Any: Задача (в Jupyter) или результат корутины
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+
+    if loop is None:
+        try:
+            return asyncio.run(coro)
+        except Exception as e:
+            if on_error:
+                on_error(e)
+                return None
+            raise
+
+    task = loop.create_task(coro)
+
+    def _on_done(done_task):
+        if done_task.cancelled():
+            return
+        error = done_task.exception()
+        if error is None:
+            return
+        logger.error(f"Ошибка в фоновой задаче генерации: {str(error)}")
+        if on_error:
+            try:
+                on_error(error)
+            except Exception as callback_error:
+                logger.error(
+                    f"Ошибка в обработчике ошибки фоновой задачи: {str(callback_error)}"
+                )
+
+    task.add_done_callback(_on_done)
+    return task
@@ -57,10 +57,10 @@ class ConceptsGenerator(BaseContentGenerator):
             # чтобы CSS не утекал в анализ как «материал урока».
             clean_content = self.clean_lesson_html_for_analysis(content_without_header)
 
-            # 8000 символов — достаточно для типичного урока целиком;
-            # 3000 было слишком мало и часто содержало только введение.
-            content_for_analysis = (
-                clean_content[:8000] if len(clean_content) > 8000 else clean_content
+            # Бюджет больше стандартного: урок нужен почти целиком, иначе
+            # в анализ попадает только введение.
+            content_for_analysis = self.prompt_budget.fit(
+                "lesson", clean_content, max_tokens=3200
             )
 
             prompt = self._build_concepts_prompt(
@@ -98,6 +98,7 @@ class ConceptsGenerator(BaseContentGenerator):
             concepts = self._extract_concepts_from_response(concepts_data)
 
             if not concepts or len(concepts) == 0:
+                self.discard_cached_response()
                 raise Exception("API вернул пустой список понятий")
 
             # Дополнительная проверка качества понятий
@@ -115,6 +116,7 @@ class ConceptsGenerator(BaseContentGenerator):
                 # Если все понятия подозрительные, генерируем заново с более строгим промптом
                 if len(invalid_concepts) == len(concepts):
                     self.logger.warning("Все понятия подозрительные, генерируем заново...")
+                    self.discard_cached_response()
                     # Добавляем дополнительное предупреждение в промпт
                     enhanced_prompt = prompt + "\n\n🚨 ВНИМАНИЕ: В предыдущем ответе были понятия, не связанные с содержанием урока. Строго анализируй только текст урока!"
                     messages[1]["content"] = enhanced_prompt
@@ -124,6 +126,7 @@ class ConceptsGenerator(BaseContentGenerator):
                         temperature=0.1,  # Еще более низкая температура
                         max_tokens=2000,
                         response_format={"type": "json_object"},
+                        use_cache=False,
                     )
                     
                     concepts_data = json.loads(response_content)
@@ -162,9 +165,7 @@ class ConceptsGenerator(BaseContentGenerator):
 
             # Очищаем и ограничиваем содержание урока
             clean_content = self._clean_html_for_analysis(lesson_content)
-            content_for_context = (
-                clean_content[:2000] if len(clean_content) > 2000 else clean_content
-            )
+            content_for_context = self.prompt_budget.fit("lesson_context", clean_content)
 
             prompt = self._build_concept_explanation_prompt(
                 concept_name,
@@ -227,8 +228,9 @@ class ConceptsGenerator(BaseContentGenerator):
         content = re.sub(r'[a-zA-Z-]+\s*:\s*[^;]+;', '', content)
         content = re.sub(r'[a-zA-Z-]+\s*:\s*[^;]+', '', content)
         
-        # Финальная очистка пробелов
-        content = re.sub(r'\s+', ' ', content).strip()
+        # Финальная очистка пробелов (границы абзацев сохраняем)
+        content = re.sub(r'[^\S\n]+', ' ', content)
+        content = re.sub(r' *\n\s*', '\n\n', content).strip()
         
         return content
 
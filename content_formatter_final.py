@@ -4,6 +4,7 @@
 
 import re
 import logging
+from html import escape
 from typing import Dict, Any, Optional, List, Tuple
 from pathlib import Path
 
@@ -55,23 +56,7 @@ class ContentFormatterFinal:
         try:
             self.logger.info(f"Форматирование контента урока: {lesson_title}")
             
-            # Очищаем контент
-            cleaned_content = self._clean_content(raw_content)
-            
-            # Шаг 1: Извлекаем блоки кода и создаем плейсхолдеры
-            content_with_placeholders, code_blocks = self._extract_code_blocks(cleaned_content)
-            
-            # Шаг 2: Markdown → HTML (таблицы, списки, заголовки)
-            processed_content = render_markdown_to_html(content_with_placeholders)
-            
-            # Шаг 3: Восстанавливаем блоки кода
-            final_content = self._restore_code_blocks(processed_content, code_blocks)
-            
-            # Шаг 4: LaTeX и таблицы, которые LLM мог вставить после markdown
-            final_content = enhance_content(final_content)
-            
-            # Шаг 5: Очищаем финальный контент от лишних параграфов вокруг блоков кода
-            final_content = self._clean_final_content(final_content)
+            final_content = self._render_content(raw_content)
             
             # Создаем финальный HTML
             final_html = self._create_final_html(final_content, lesson_title)
@@ -83,6 +68,47 @@ class ContentFormatterFinal:
             self.logger.error(f"Ошибка при форматировании контента: {str(e)}")
             return self._create_error_html(raw_content, str(e))
     
+    def format_partial_lesson_content(self, partial_content: str) -> str:
+        """
+        Быстро форматирует незавершённый текст урока при потоковой генерации.
+        
+        Незакрытый блок кода временно закрывается, чтобы markdown не
+        превратил остаток урока в код. Логирование не ведётся — метод
+        вызывается много раз за генерацию.
+        
+        Args:
+            partial_content (str): Накопленный на данный момент сырой текст
+            
+        Returns:
+            str: HTML превью урока
+        """
+        try:
+            if partial_content.count("```") % 2 == 1:
+                partial_content = partial_content.rstrip() + "\n```"
+            return self._create_final_html(self._render_content(partial_content), "")
+        except Exception:
+            return f"<div class='lesson-content'><pre>{escape(partial_content)}</pre></div>"
+    
+    def _render_content(self, raw_content: str) -> str:
+        """Переводит сырой markdown урока в HTML (без обёртки)."""
+        # Очищаем контент
+        cleaned_content = self._clean_content(raw_content)
+        
+        # Шаг 1: Извлекаем блоки кода и создаем плейсхолдеры
+        content_with_placeholders, code_blocks = self._extract_code_blocks(cleaned_content)
+        
+        # Шаг 2: Markdown → HTML (таблицы, списки, заголовки)
+        processed_content = render_markdown_to_html(content_with_placeholders)
+        
+        # Шаг 3: Восстанавливаем блоки кода
+        final_content = self._restore_code_blocks(processed_content, code_blocks)
+        
+        # Шаг 4: LaTeX и таблицы, которые LLM мог вставить после markdown
+        final_content = enhance_content(final_content)
+        
+        # Шаг 5: Очищаем финальный контент от лишних параграфов вокруг блоков кода
+        return self._clean_final_content(final_content)
+    
     def _clean_content(self, content: str) -> str:
         """Очищает контент от лишних элементов."""
         try:
@@ -22,6 +22,7 @@ from qa_generator import QAGenerator
 from concepts_generator import ConceptsGenerator
 from relevance_checker import RelevanceChecker
 from content_utils import append_question_reminder
+from async_tasks import run_in_thread
 
 
 class ContentGenerator:
@@ -167,6 +168,43 @@ class ContentGenerator:
                 self.loading_manager.hide_loading()
             raise
 
+    def generate_lesson_streaming(
+        self,
+        course,
+        section,
+        topic,
+        lesson,
+        user_name,
+        communication_style="friendly",
+        on_update=None,
+    ):
+        """
+        Генерирует урок потоково, передавая HTML превью в on_update.
+
+        Индикатор загрузки не показывается — его роль выполняет превью.
+
+        Args:
+            course (str): Название курса
+            section (str): Название раздела
+            topic (str): Название темы
+            lesson (str): Название урока
+            user_name (str): Имя пользователя
+            communication_style (str): Стиль общения
+            on_update (callable, optional): Получает HTML превью урока
+
+        Returns:
+            dict: Словарь с заголовком и содержанием урока
+        """
+        return self.lesson_gen.generate_lesson_streaming(
+            course,
+            section,
+            topic,
+            lesson,
+            user_name,
+            communication_style,
+            on_update=on_update,
+        )
+
     def generate_examples(
         self,
         lesson_data,
@@ -541,6 +579,158 @@ class ContentGenerator:
         answer_html = append_question_reminder(answer_html, questions_count)
         return answer_html
 
+    # ========================================
+    # АСИНХРОННЫЕ МЕТОДЫ
+    # ========================================
+    # Аргументы и результаты совпадают с синхронными версиями. Урок, ответ
+    # на вопрос и подробное объяснение идут через AsyncOpenAI; многошаговые
+    # генераторы (тест, примеры, понятия, релевантность) выполняются
+    # в рабочем потоке. В обоих случаях event loop kernel не блокируется,
+    # и несколько генераций можно запустить одновременно:
+    #     await asyncio.gather(gen.generate_lesson_async(...),
+    #                          gen.generate_assessment_async(...))
+    # Индикаторы загрузки здесь не показываются — это делает вызывающий UI.
+
+    async def generate_course_plan_async(
+        self, course_data, total_study_hours, lesson_duration_minutes
+    ):
+        """Асинхронная версия generate_course_plan."""
+        return await run_in_thread(
+            self.course_plan_gen.generate_course_plan,
+            course_data,
+            total_study_hours,
+            lesson_duration_minutes,
+        )
+
+    async def generate_lesson_async(
+        self, course, section, topic, lesson, user_name, communication_style="friendly"
+    ):
+        """Асинхронная версия generate_lesson."""
+        return await self.lesson_gen.generate_lesson_async(
+            course, section, topic, lesson, user_name, communication_style
+        )
+
+    async def generate_examples_data_async(
+        self,
+        lesson_data,
+        lesson_content,
+        communication_style="friendly",
+        course_context=None,
+    ):
+        """Асинхронная версия generate_examples_data."""
+        return await run_in_thread(
+            self.examples_gen.generate_examples_data,
+            lesson_data,
+            lesson_content,
+            communication_style,
+            course_context=course_context,
+        )
+
+    async def generate_assessment_async(
+        self, course, section, topic, lesson, lesson_content, num_questions=5
+    ):
+        """Асинхронная версия generate_assessment."""
+        return await run_in_thread(
+            self.assessment_gen.generate_assessment,
+            course,
+            section,
+            topic,
+            lesson,
+            lesson_content,
+            num_questions,
+        )
+
+    async def answer_question_async(
+        self,
+        course,
+        section,
+        topic,
+        lesson,
+        user_question,
+        lesson_content,
+        user_name,
+        communication_style="friendly",
+    ):
+        """Асинхронная версия answer_question."""
+        return await self.qa_gen.answer_question_async(
+            course,
+            section,
+            topic,
+            lesson,
+            user_question,
+            lesson_content,
+            user_name,
+            communication_style,
+        )
+
+    async def get_detailed_explanation_async(
+        self,
+        course,
+        section,
+        topic,
+        lesson,
+        lesson_content,
+        communication_style="friendly",
+    ):
+        """Асинхронная версия get_detailed_explanation."""
+        return await self.explanation_gen.get_detailed_explanation_async(
+            course, section, topic, lesson, lesson_content, communication_style
+        )
+
+    async def generate_concepts_async(
+        self,
+        lesson_content,
+        communication_style="friendly",
+        lesson_data=None,
+        course_context=None,
+    ):
+        """Асинхронная версия generate_concepts."""
+        return await run_in_thread(
+            self.generate_concepts,
+            lesson_content,
+            communication_style,
+            lesson_data=lesson_data,
+            course_context=course_context,
+        )
+
+    async def explain_concept_async(
+        self, concept, lesson_content, communication_style="friendly"
+    ):
+        """Асинхронная версия explain_concept."""
+        return await run_in_thread(
+            self.concepts_gen.explain_concept,
+            concept,
+            lesson_content,
+            communication_style,
+        )
+
+    async def check_question_relevance_async(
+        self,
+        user_question,
+        lesson_content,
+        lesson_data,
+        course_context=None,
+        lesson_raw_content=None,
+    ):
+        """Асинхронная версия check_question_relevance."""
+        return await run_in_thread(
+            self.relevance_checker.check_question_relevance,
+            user_question,
+            lesson_content,
+            lesson_data,
+            course_context=course_context,
+            lesson_raw_content=lesson_raw_content,
+        )
+
+    def get_cache_stats(self):
+        """
+        Возвращает статистику постоянного кэша ответов LLM.
+
+        Returns:
+            dict: Попадания, промахи, число записей и размер кэша
+        """
+        return self.lesson_gen.response_cache.get_stats()
+
     # ========================================
     # МЕТОДЫ ДЛЯ СОВМЕСТИМОСТИ СО СТАРЫМ КОДОМ
     # ========================================
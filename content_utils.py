@@ -8,9 +8,28 @@ import os
 import json
 import re
 import logging
+import threading
+import contextvars
 from datetime import datetime
-import httpx
-from openai import OpenAI
+from log_rotation import prune_directory
+from llm_cache import get_response_cache
+from llm_rate_limit import CircuitOpenError, RetryPolicy, get_request_scheduler
+from llm_singleflight import get_single_flight
+from prompt_budget import PromptBudget, count_message_tokens
+from llm_transport import (
+    get_shared_async_openai_client,
+    get_shared_http_client,
+    get_shared_openai_client,
+)
+
+# Ключ кэша последнего ответа в текущем потоке/задаче asyncio:
+# (id генератора, ключ) — для discard_cached_response
+_last_response_key = contextvars.ContextVar("llm_last_response_key", default=None)
+
+# exec сгенерированного кода с redirect_stdout подменяет общий для процесса
+# sys.stdout; такие вызовы из разных потоков выполняются строго по одному,
+# иначе вывод смешивается, а sys.stdout может остаться закрытым буфером
+CODE_EXEC_LOCK = threading.RLock()
 
 
 def append_question_reminder(answer_html: str, questions_count: int) -> str:
@@ -267,22 +286,11 @@ class BaseContentGenerator:
         self.debug_dir = debug_dir
         self.model = os.getenv("LLM_MODEL", "gpt-4o-mini")
 
-        # Инициализация клиента OpenAI (с прокси из OPENAI_PROXY/HTTPS_PROXY/HTTP_PROXY)
-        self.http_client = None
+        # Клиент OpenAI поверх общего для процесса пула соединений
+        # (прокси из OPENAI_PROXY/HTTPS_PROXY/HTTP_PROXY, см. llm_transport);
+        # здесь только проверяем, что транспорт настраивается
         try:
-            proxy_url = (
-                os.getenv("OPENAI_PROXY")
-                or os.getenv("HTTPS_PROXY")
-                or os.getenv("HTTP_PROXY")
-                or ""
-            ).strip()
-            if not proxy_url or proxy_url.startswith("${"):
-                raise RuntimeError(
-                    "Прокси не задан. Укажите OPENAI_PROXY или HTTPS_PROXY/HTTP_PROXY."
-                )
-
-            self.http_client = httpx.Client(proxy=proxy_url)
-            self.client = OpenAI(api_key=self.api_key, http_client=self.http_client)
+            get_shared_openai_client(self.api_key)
             self.logger.info(
                 "%s инициализирован с прокси, модель: %s",
                 self.__class__.__name__,
@@ -292,9 +300,29 @@ class BaseContentGenerator:
             self.logger.error(f"Ошибка при инициализации клиента OpenAI: {str(e)}")
             raise
 
+        # Общий постоянный кэш ответов (см. llm_cache), объединение
+        # одинаковых одновременных запросов (см. llm_singleflight) и
+        # лимиты/повторы/circuit breaker (см. llm_rate_limit)
+        self.response_cache = get_response_cache()
+        self.single_flight = get_single_flight()
+        self.request_scheduler = get_request_scheduler()
+
+        # Бюджеты секций промпта в токенах (см. prompt_budget)
+        self.prompt_budget = PromptBudget(self.model)
+
         # Создаем директорию для отладочных файлов
         os.makedirs(self.debug_dir, exist_ok=True)
 
+    @property
+    def http_client(self):
+        """Общий httpx.Client (берётся при каждом обращении: пул мог быть пересоздан)."""
+        return get_shared_http_client()
+
+    @property
+    def client(self):
+        """Клиент OpenAI поверх текущего общего пула соединений."""
+        return get_shared_openai_client(self.api_key)
+
     def save_debug_response(
         self, response_type, prompt, response_content, additional_data=None
     ):
@@ -327,6 +355,9 @@ class BaseContentGenerator:
 
             self.logger.info(f"Отладочный ответ сохранен: {filepath}")
 
+            # Ограничиваем число и объём отладочных ответов (см. log_rotation)
+            prune_directory(self.debug_dir)
+
         except Exception as e:
             self.logger.error(f"Ошибка при сохранении отладочного ответа: {str(e)}")
 
@@ -339,7 +370,9 @@ class BaseContentGenerator:
           «материал урока» и забивает контекст);
         - HTML-комментарии ``<!-- ... -->``.
 
-        Затем снимаются теги и схлопываются пробельные последовательности.
+        Затем снимаются теги и схлопываются пробельные последовательности;
+        границы абзацев (``</p>``, заголовки, пункты списков, ``<br>``)
+        сохраняются как пустая строка — по ним потом режется бюджет промпта.
 
         Args:
             content (str): Исходный HTML-фрагмент урока.
@@ -356,10 +389,18 @@ class BaseContentGenerator:
             r"<script\b[^>]*>[\s\S]*?</script>", " ", cleaned, flags=re.IGNORECASE
         )
         cleaned = re.sub(r"<!--[\s\S]*?-->", " ", cleaned)
+        cleaned = re.sub(
+            r"<br\s*/?>|</(?:p|div|li|h[1-6]|pre|tr|table|ul|ol|blockquote)>",
+            "\n\n",
+            cleaned,
+            flags=re.IGNORECASE,
+        )
         cleaned = re.sub(r"<[^>]+>", " ", cleaned)
         cleaned = re.sub(r"&[a-zA-Z]+;", " ", cleaned)
         cleaned = re.sub(r"&#\d+;", " ", cleaned)
-        cleaned = re.sub(r"\s+", " ", cleaned).strip()
+        cleaned = re.sub(r"[^\S\n]+", " ", cleaned)
+        cleaned = re.sub(r" *\n\s*\n\s*", "\n\n", cleaned)
+        cleaned = re.sub(r" *\n *", "\n", cleaned).strip()
         return cleaned
 
     def extract_lesson_headers(self, content):
@@ -420,23 +461,31 @@ class BaseContentGenerator:
             changed = False
             for title in titles:
                 if result.lower().startswith(title.lower()):
-                    result = result[len(title) :].lstrip(" ,:;—.-")
+                    result = result[len(title) :].lstrip(" ,:;—.-\n")
                     changed = True
         return result.strip()
 
     def prepare_lesson_text_for_analysis(
-        self, content, course_context=None, max_chars=6000, lesson_title=None
+        self,
+        content,
+        course_context=None,
+        max_chars=None,
+        lesson_title=None,
+        max_tokens=None,
     ):
         """Готовит текст урока для LLM-анализа (релевантность, понятия, QA).
 
         Последовательность: срез breadcrumb-шапки → удаление style/script →
-        снятие HTML-тегов → срез plain-text breadcrumb → ограничение длины.
+        снятие HTML-тегов → срез plain-text breadcrumb → ограничение длины
+        по бюджету токенов секции «lesson» (по целым абзацам).
 
         Args:
             content (str): HTML или markdown урока.
             course_context (dict | None): Контекст курса для среза шапки.
-            max_chars (int): Максимальная длина возвращаемого текста.
+            max_chars (int | None): Устаревший лимит в символах; если задан,
+                применяется вместо бюджета токенов.
             lesson_title (str | None): Название урока для среза plain-text шапки.
+            max_tokens (int | None): Бюджет в токенах вместо стандартного.
 
         Returns:
             str: Чистый текст для промпта.
@@ -448,9 +497,9 @@ class BaseContentGenerator:
         clean = self.strip_plain_text_breadcrumb(
             clean, course_context, lesson_title=lesson_title
         )
-        if max_chars and len(clean) > max_chars:
+        if max_chars:
             return clean[:max_chars]
-        return clean
+        return self.prompt_budget.fit("lesson", clean, max_tokens=max_tokens)
 
     def strip_lesson_breadcrumb(self, content, course_context):
         """Срезает ведущие <h1>/<h2>/<h3>/<h4> с названиями курса/раздела/темы.
@@ -572,6 +621,182 @@ class BaseContentGenerator:
             )
             return text
 
+    def _build_request_kwargs(
+        self, messages, temperature, max_tokens, response_format, model
+    ):
+        """Собирает параметры chat.completions.create для sync и async путей."""
+        # Системные сообщения укладываются в бюджет секции system
+        messages = [
+            (
+                dict(
+                    message,
+                    content=self.prompt_budget.fit("system", message["content"]),
+                )
+                if message.get("role") == "system"
+                and isinstance(message.get("content"), str)
+                else message
+            )
+            for message in messages
+        ]
+        kwargs = {
+            "model": model or self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        }
+
+        if response_format:
+            kwargs["response_format"] = response_format
+
+        return kwargs
+
+    @staticmethod
+    def _build_retries_error(last_exception):
+        """Формирует итоговую ошибку после исчерпания повторных попыток."""
+        return Exception(
+            "Сервер не отвечает. Попробуйте повторить запрос через несколько секунд. "
+            f"Если ошибка сохраняется, проверьте подключение и настройки прокси. "
+            f"Исходная ошибка: {str(last_exception)}"
+        )
+
+    def _get_cached_response(self, kwargs, use_cache):
+        """
+        Ищет ответ в кэше.
+
+        Returns:
+            tuple: (ключ кэша или None, ответ из кэша или None)
+        """
+        if not use_cache or not self.response_cache.enabled:
+            return None, None
+        cache_key = self.response_cache.make_key(kwargs)
+        cached = self.response_cache.get(cache_key)
+        if cached is not None:
+            self.logger.info("Ответ LLM взят из кэша")
+        return cache_key, cached
+
+    def _remember_response_key(self, cache_key):
+        """Запоминает ключ кэша текущего запроса для discard_cached_response."""
+        _last_response_key.set((id(self), cache_key))
+
+    def discard_cached_response(self):
+        """
+        Удаляет из кэша последний ответ этого генератора в текущем потоке.
+
+        Вызывается, когда вызывающий код отверг ответ (не по теме, пустой
+        список понятий, примеры не прошли проверку): иначе тот же ответ
+        возвращался бы из кэша при каждой следующей генерации.
+        """
+        owner, cache_key = _last_response_key.get() or (None, None)
+        if owner == id(self) and cache_key:
+            self.response_cache.invalidate(cache_key)
+            self.logger.info("Отклонённый ответ LLM удалён из кэша")
+        _last_response_key.set(None)
+
+    def _store_cached_response(self, cache_key, kwargs, content):
+        """Сохраняет ответ в кэш, если он пригоден для повторного использования."""
+        if cache_key and self.response_cache.is_cacheable(
+            content, kwargs.get("response_format")
+        ):
+            self.response_cache.set(cache_key, content, model=kwargs.get("model"))
+
+    def _report_request_tokens(self, kwargs):
+        """
+        Логирует размер запроса в токенах.
+
+        Returns:
+            int: Оценка токенов промпта плюс лимит ответа (для TPM-лимита)
+        """
+        prompt_tokens = count_message_tokens(kwargs["messages"], kwargs["model"])
+        self.logger.info(
+            f"Запрос к {kwargs['model']}: {prompt_tokens} токенов промпта, "
+            f"лимит ответа {kwargs['max_tokens']}"
+        )
+        return prompt_tokens + kwargs["max_tokens"]
+
+    def _get_stale_response(self, cache_key, error):
+        """
+        Возвращает устаревший ответ из кэша, пока API недоступен.
+
+        Raises:
+            CircuitOpenError: Если в кэше ничего нет
+        """
+        if cache_key:
+            stale = self.response_cache.get(cache_key, allow_expired=True)
+            if stale is not None:
+                self.logger.warning("API недоступен, использован устаревший ответ из кэша")
+                return stale
+        raise error
+
+    def _request_completion(self, kwargs, cache_key=None, policy=None):
+        """Отправляет запрос через общий планировщик и сохраняет ответ в кэш."""
+        try:
+            response = self.request_scheduler.call(
+                kwargs["model"],
+                self._report_request_tokens(kwargs),
+                lambda: self.client.chat.completions.create(**kwargs),
+                policy,
+            )
+        except CircuitOpenError as e:
+            return self._get_stale_response(cache_key, e)
+        content = response.choices[0].message.content
+        self._store_cached_response(cache_key, kwargs, content)
+        return content
+
+    async def _request_completion_async(self, kwargs, cache_key=None, policy=None):
+        """Асинхронно отправляет запрос через общий планировщик."""
+        try:
+            response = await self.request_scheduler.call_async(
+                kwargs["model"],
+                self._report_request_tokens(kwargs),
+                lambda: self.async_client.chat.completions.create(**kwargs),
+                policy,
+            )
+        except CircuitOpenError as e:
+            return self._get_stale_response(cache_key, e)
+        content = response.choices[0].message.content
+        self._store_cached_response(cache_key, kwargs, content)
+        return content
+
+    def _execute_request(self, kwargs, use_cache, policy=None):
+        """Кэш → объединение одинаковых запросов → запрос к API."""
+        cache_key, cached = self._get_cached_response(kwargs, use_cache)
+        self._remember_response_key(cache_key)
+        if cached is not None:
+            return cached
+
+        if not use_cache:
+            return self._request_completion(kwargs, policy=policy)
+
+        # Одинаковые одновременные запросы ждут один общий вызов API
+        return self.single_flight.do(
+            cache_key or self.response_cache.make_key(kwargs),
+            lambda: self._request_completion(kwargs, cache_key, policy),
+        )
+
+    async def _execute_request_async(self, kwargs, use_cache, policy=None):
+        """Асинхронный аналог _execute_request."""
+        cache_key, cached = self._get_cached_response(kwargs, use_cache)
+        self._remember_response_key(cache_key)
+        if cached is not None:
+            return cached
+
+        if not use_cache:
+            return await self._request_completion_async(kwargs, policy=policy)
+
+        return await self.single_flight.do_async(
+            cache_key or self.response_cache.make_key(kwargs),
+            lambda: self._request_completion_async(kwargs, cache_key, policy),
+        )
+
+    @staticmethod
+    def _build_retry_policy(retries, backoff_factor, initial_delay):
+        """Переводит параметры *_with_retries (число попыток) в RetryPolicy."""
+        return RetryPolicy(
+            retries=max(retries - 1, 0),
+            initial_delay=initial_delay,
+            backoff_factor=backoff_factor,
+        )
+
     def make_api_request(
         self,
         messages,
@@ -579,36 +804,36 @@ class BaseContentGenerator:
         max_tokens=3500,
         response_format=None,
         model=None,
+        use_cache=True,
     ):
         """
         Выполняет запрос к OpenAI API с едиными настройками.
 
+        Временные ошибки (429, 5xx, сеть) повторяются планировщиком
+        (LLM_MAX_RETRIES раз, с учётом Retry-After).
+
         Args:
             messages (list): Список сообщений для API
             temperature (float): Температура генерации
             max_tokens (int): Максимальное количество токенов
             response_format (dict): Формат ответа (например, {"type": "json_object"})
             model (str): Модель; если не указана — self.model
+            use_cache (bool): Брать/сохранять ответ в кэше и объединять
+                одинаковые одновременные запросы (False — для намеренно
+                случайных генераций)
 
         Returns:
             str: Ответ от API
 
         Raises:
+            CircuitOpenError: Если API временно недоступен и ответа нет в кэше
             Exception: При ошибке API
         """
         try:
-            kwargs = {
-                "model": model or self.model,
-                "messages": messages,
-                "temperature": temperature,
-                "max_tokens": max_tokens,
-            }
-
-            if response_format:
-                kwargs["response_format"] = response_format
-
-            response = self.client.chat.completions.create(**kwargs)
-            return response.choices[0].message.content
+            kwargs = self._build_request_kwargs(
+                messages, temperature, max_tokens, response_format, model
+            )
+            return self._execute_request(kwargs, use_cache)
 
         except Exception as e:
             self.logger.error(f"Ошибка при запросе к OpenAI API: {str(e)}")
@@ -624,37 +849,191 @@ class BaseContentGenerator:
         retries=3,
         backoff_factor=2,
         initial_delay=2,
+        use_cache=True,
     ):
-        """Выполняет запрос к OpenAI API с повторными попытками для ошибок сети."""
-        last_exception = None
-        delay = initial_delay
-
-        for attempt in range(1, retries + 1):
-            try:
-                return self.make_api_request(
-                    messages=messages,
-                    temperature=temperature,
-                    max_tokens=max_tokens,
-                    response_format=response_format,
-                    model=model,
-                )
-            except Exception as e:
-                last_exception = e
-                self.logger.warning(
-                    f"Попытка {attempt}/{retries} неудачна: {str(e)}. "
-                    f"Повтор через {delay} сек..."
-                )
+        """
+        Выполняет запрос к OpenAI API с заданным числом попыток.
 
-                if attempt == retries:
-                    break
+        Повторяются только временные ошибки; пауза — экспонента с jitter,
+        но не меньше Retry-After из ответа сервера.
+        """
+        try:
+            kwargs = self._build_request_kwargs(
+                messages, temperature, max_tokens, response_format, model
+            )
+            return self._execute_request(
+                kwargs,
+                use_cache,
+                self._build_retry_policy(retries, backoff_factor, initial_delay),
+            )
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            self.logger.error(f"Ошибка при запросе к OpenAI API: {str(e)}")
+            raise self._build_retries_error(e)
 
-                import time
+    def stream_api_request(
+        self,
+        messages,
+        temperature=0.7,
+        max_tokens=3500,
+        response_format=None,
+        model=None,
+        use_cache=True,
+    ):
+        """
+        Выполняет потоковый запрос к OpenAI API (stream=True).
 
-                time.sleep(delay)
-                delay *= backoff_factor
+        При попадании в кэш весь ответ отдаётся одним фрагментом. Полный
+        ответ после завершения потока сохраняется в кэш так же, как в
+        make_api_request. Если такой же интерактивный запрос уже
+        выполняется, второй не отправляется: ответ приходит одним
+        фрагментом, когда первый завершится. Фоновый запрос (предзагрузку)
+        поток не ждёт и запрашивает урок сам.
 
-        raise Exception(
-            "Сервер не отвечает. Попробуйте повторить запрос через несколько секунд. "
-            f"Если ошибка сохраняется, проверьте подключение и настройки прокси. "
-            f"Исходная ошибка: {str(last_exception)}"
+        Args:
+            messages (list): Список сообщений для API
+            temperature (float): Температура генерации
+            max_tokens (int): Максимальное количество токенов
+            response_format (dict): Формат ответа
+            model (str): Модель; если не указана — self.model
+            use_cache (bool): Брать/сохранять ответ в кэше
+
+        Yields:
+            str: Очередной фрагмент текста ответа
+
+        Raises:
+            Exception: При ошибке API
+        """
+        try:
+            kwargs = self._build_request_kwargs(
+                messages, temperature, max_tokens, response_format, model
+            )
+            cache_key, cached = self._get_cached_response(kwargs, use_cache)
+            self._remember_response_key(cache_key)
+            if cached is not None:
+                yield cached
+                return
+
+            if not use_cache:
+                yield from self._stream_completion(kwargs)
+                return
+
+            yield from self.single_flight.stream(
+                cache_key or self.response_cache.make_key(kwargs),
+                lambda: self._stream_completion(kwargs, cache_key),
+            )
+
+        except Exception as e:
+            self.logger.error(f"Ошибка при потоковом запросе к OpenAI API: {str(e)}")
+            raise
+
+    def _stream_completion(self, kwargs, cache_key=None):
+        """
+        Потоковый запрос к API без кэша и объединения запросов.
+
+        Yields:
+            str: Очередной фрагмент текста ответа
+        """
+        parts = []
+        # Планировщик держит слот интерактивного запроса и результат для
+        # circuit breaker, пока поток не прочитан до конца
+        chunks = self.request_scheduler.stream(
+            kwargs["model"],
+            self._report_request_tokens(kwargs),
+            lambda: self.client.chat.completions.create(
+                stream=True, stream_options={"include_usage": True}, **kwargs
+            ),
         )
+        try:
+            for chunk in chunks:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        except CircuitOpenError as e:
+            yield self._get_stale_response(cache_key, e)
+            return
+        finally:
+            chunks.close()
+
+        self._store_cached_response(cache_key, kwargs, "".join(parts))
+
+    # ========================================
+    # АСИНХРОННЫЙ ПУТЬ (AsyncOpenAI)
+    # ========================================
+
+    @property
+    def async_client(self):
+        """AsyncOpenAI общего пула для текущего event loop (см. llm_transport)."""
+        return get_shared_async_openai_client(self.api_key)
+
+    async def make_api_request_async(
+        self,
+        messages,
+        temperature=0.7,
+        max_tokens=3500,
+        response_format=None,
+        model=None,
+        use_cache=True,
+    ):
+        """
+        Асинхронный аналог make_api_request на AsyncOpenAI.
+
+        Не блокирует event loop Jupyter kernel: пока идёт запрос, виджеты
+        продолжают обрабатывать события, а несколько генераций можно
+        запустить одновременно через asyncio.gather.
+
+        Args:
+            messages (list): Список сообщений для API
+            temperature (float): Температура генерации
+            max_tokens (int): Максимальное количество токенов
+            response_format (dict): Формат ответа (например, {"type": "json_object"})
+            model (str): Модель; если не указана — self.model
+            use_cache (bool): Брать/сохранять ответ в кэше
+
+        Returns:
+            str: Ответ от API
+
+        Raises:
+            Exception: При ошибке API
+        """
+        try:
+            kwargs = self._build_request_kwargs(
+                messages, temperature, max_tokens, response_format, model
+            )
+            return await self._execute_request_async(kwargs, use_cache)
+
+        except Exception as e:
+            self.logger.error(f"Ошибка при асинхронном запросе к OpenAI API: {str(e)}")
+            raise
+
+    async def make_api_request_with_retries_async(
+        self,
+        messages,
+        temperature=0.7,
+        max_tokens=3500,
+        response_format=None,
+        model=None,
+        retries=3,
+        backoff_factor=2,
+        initial_delay=2,
+        use_cache=True,
+    ):
+        """Асинхронный аналог make_api_request_with_retries (пауза через asyncio.sleep)."""
+        try:
+            kwargs = self._build_request_kwargs(
+                messages, temperature, max_tokens, response_format, model
+            )
+            return await self._execute_request_async(
+                kwargs,
+                use_cache,
+                self._build_retry_policy(retries, backoff_factor, initial_delay),
+            )
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            self.logger.error(f"Ошибка при асинхронном запросе к OpenAI API: {str(e)}")
+            raise self._build_retries_error(e)
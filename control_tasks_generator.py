@@ -12,10 +12,20 @@ import re
 from contextlib import redirect_stdout
 from typing import Dict, List, Any, Optional, Tuple
 
-from content_utils import BaseContentGenerator
+from content_utils import BaseContentGenerator, CODE_EXEC_LOCK
 from examples_code_fixes import sanitize_example_code
 from result_checker import ResultChecker, values_equal, stdout_outputs_equal
 
+# Начало skip_reason у заглушек, которые возвращаются при ошибке генерации
+GENERATION_ERROR_REASON = "Ошибка генерации"
+
+
+def is_generation_error(task_data: Dict[str, Any]) -> bool:
+    """Проверяет, что задание — заглушка, возвращённая при ошибке генерации."""
+    return not task_data.get("is_needed", True) and str(
+        task_data.get("skip_reason", "")
+    ).startswith(GENERATION_ERROR_REASON)
+
 
 class ControlTasksGenerator(BaseContentGenerator):
     """Генератор контрольных заданий."""
@@ -60,7 +70,7 @@ class ControlTasksGenerator(BaseContentGenerator):
     def execute_code(code: str) -> Tuple[str, Dict[str, Any]]:
         output_buffer = io.StringIO()
         local_vars: Dict[str, Any] = {}
-        with redirect_stdout(output_buffer):
+        with CODE_EXEC_LOCK, redirect_stdout(output_buffer):
             exec(code, {}, local_vars)
         return output_buffer.getvalue().strip(), local_vars
 
@@ -519,19 +529,32 @@ stdout:
         actual_output: str,
         local_vars: Dict[str, Any],
         expected_output: str,
+        solution_vars: Optional[Dict[str, Any]] = None,
+        execution_error: Optional[str] = None,
     ) -> Tuple[bool, str, str]:
-        """Резервная проверка без LLM (при недоступности API)."""
+        """
+        Резервная проверка без LLM (при недоступности API).
+
+        Переменные уже выполненных решений (solution_vars, local_vars)
+        сравниваются без повторного exec; execution_error — ошибка
+        выполнения решения студента или эталона.
+        """
         failure_reason = ""
         is_correct = False
         solution_code = materialized.get("solution_code", "")
 
         if validation_mode in {"structured", "llm"} and check_variables and solution_code:
-            matched, reason = self.compare_structured_variables(
-                solution_code,
-                user_code,
-                task_code,
-                check_variables,
-            )
+            if execution_error is not None:
+                matched, reason = False, f"Ошибка выполнения: {execution_error}"
+            else:
+                matched, reason = self.compare_structured_variables(
+                    solution_code,
+                    user_code,
+                    task_code,
+                    check_variables,
+                    solution_vars=solution_vars,
+                    user_vars=local_vars if solution_vars is not None else None,
+                )
             is_correct = matched
             failure_reason = reason or ""
         elif validation_mode in {"variable", "both"} and materialized.get("check_variable"):
@@ -565,22 +588,30 @@ stdout:
         user_code: str,
         task_code: str,
         check_variables: List[str],
+        solution_vars: Optional[Dict[str, Any]] = None,
+        user_vars: Optional[Dict[str, Any]] = None,
     ) -> Tuple[bool, Optional[str]]:
-        """Сравнивает ключевые переменные эталона и решения студента."""
+        """
+        Сравнивает ключевые переменные эталона и решения студента.
+
+        Если переменные уже получены (solution_vars и user_vars), код
+        повторно не выполняется.
+        """
         if not check_variables:
             return False, "Не заданы переменные для проверки"
 
-        stable_task = self.stabilize_sklearn_code(task_code)
-        stable_solution = self.stabilize_sklearn_code(solution_code)
-        stable_user = self.stabilize_sklearn_code(
-            self.resolve_executable_code(stable_task, user_code)
-        )
+        if solution_vars is None or user_vars is None:
+            stable_task = self.stabilize_sklearn_code(task_code)
+            stable_solution = self.stabilize_sklearn_code(solution_code)
+            stable_user = self.stabilize_sklearn_code(
+                self.resolve_executable_code(stable_task, user_code)
+            )
 
-        try:
-            _, solution_vars = self.execute_code(stable_solution)
-            _, user_vars = self.execute_code(stable_user)
-        except Exception as exc:
-            return False, f"Ошибка выполнения: {exc}"
+            try:
+                _, solution_vars = self.execute_code(stable_solution)
+                _, user_vars = self.execute_code(stable_user)
+            except Exception as exc:
+                return False, f"Ошибка выполнения: {exc}"
 
         for var_name in check_variables:
             if var_name not in user_vars:
@@ -643,6 +674,17 @@ stdout:
         )
         return task_data
 
+    def ensure_materialized(self, task_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Выполняет solution_code задания, сгенерированного без выполнения
+        (generate_control_task(materialize=False)). Вызывается в потоке kernel.
+        """
+        if task_data.pop("needs_materialization", False) and task_data.get(
+            "is_needed", True
+        ):
+            self.materialize_validation_metadata(task_data)
+        return task_data
+
     def _determine_lesson_subject(
         self,
         course_context: Optional[Dict[str, Any]],
@@ -788,13 +830,22 @@ stdout:
         lesson_content: str,
         communication_style: str = "friendly",
         course_context: Optional[Dict[str, Any]] = None,
+        materialize: bool = True,
     ) -> Dict[str, Any]:
+        """
+        Генерирует контрольное задание по уроку.
+
+        Args:
+            materialize: Выполнить solution_code и вычислить expected_output и
+                параметры проверки. Вне потока kernel передаётся False: exec
+                подменяет общий sys.stdout, поэтому код выполняет потом
+                ensure_materialized в потоке kernel.
+        """
         try:
             lesson_title = lesson_data.get("title", "")
             content_for_prompt = self.prepare_lesson_text_for_analysis(
                 lesson_content,
                 course_context=course_context,
-                max_chars=6000,
                 lesson_title=lesson_title,
             )
             course_subject = self._determine_lesson_subject(
@@ -825,13 +876,16 @@ stdout:
                 max_tokens=2000,
                 response_format={"type": "json_object"},
             )
-            task_data = self._parse_control_task_response(response, lesson_data)
+            task_data = self._parse_control_task_response(
+                response, lesson_data, materialize
+            )
 
             if not self._task_matches_subject(task_data, course_subject):
                 self.logger.warning(
                     "Контрольное задание не по теме урока (%s), повторная генерация",
                     course_subject,
                 )
+                self.discard_cached_response()
                 strict_prompt = (
                     prompt
                     + f"\n\nПОВТОР: предыдущий ответ был про «Основы Python», "
@@ -847,8 +901,11 @@ stdout:
                     temperature=0.2,
                     max_tokens=2000,
                     response_format={"type": "json_object"},
+                    use_cache=False,
+                )
+                task_data = self._parse_control_task_response(
+                    response, lesson_data, materialize
                 )
-                task_data = self._parse_control_task_response(response, lesson_data)
 
             return task_data
         except Exception as e:
@@ -860,7 +917,7 @@ stdout:
                 "expected_output": "",
                 "solution_code": "",
                 "is_needed": False,
-                "skip_reason": f"Ошибка генерации: {e}",
+                "skip_reason": f"{GENERATION_ERROR_REASON}: {e}",
             }
 
     def _build_control_task_prompt(
@@ -872,7 +929,9 @@ stdout:
         course_subject: str = "программирование на Python",
     ) -> str:
         lesson_title = lesson_data.get("title", "")
-        lesson_description = lesson_data.get("description", "")
+        lesson_description = self.prompt_budget.fit(
+            "outline", lesson_data.get("description", "")
+        )
 
         if "машинное обучение" in course_subject:
             subject_rules = """
@@ -977,7 +1036,10 @@ validation_mode: всегда "llm".
 """
 
     def _parse_control_task_response(
-        self, response: str, lesson_data: Optional[Dict[str, Any]] = None
+        self,
+        response: str,
+        lesson_data: Optional[Dict[str, Any]] = None,
+        materialize: bool = True,
     ) -> Dict[str, Any]:
         try:
             start_idx = response.find("{")
@@ -1005,7 +1067,10 @@ validation_mode: всегда "llm".
             task_data.setdefault("condition_rule", "")
 
             if task_data.get("is_needed", True) and task_data.get("solution_code", "").strip():
-                task_data = self.materialize_validation_metadata(task_data)
+                if materialize:
+                    task_data = self.materialize_validation_metadata(task_data)
+                else:
+                    task_data["needs_materialization"] = True
 
             return task_data
         except Exception as e:
@@ -1025,7 +1090,7 @@ validation_mode: всегда "llm".
             "expected_output": "",
             "solution_code": "",
             "hints": [],
-            "skip_reason": "Ошибка генерации задания",
+            "skip_reason": f"{GENERATION_ERROR_REASON} задания",
         }
 
     def validate_task_execution(
@@ -1038,6 +1103,32 @@ validation_mode: всегда "llm".
         task_code: str = "",
     ) -> Dict[str, Any]:
         """Проверяет решение студента через LLM; structured — только fallback при сбое API."""
+        return self.judge_solution(
+            self.run_solution(
+                user_code,
+                task_data=task_data,
+                expected_output=expected_output,
+                task_code=task_code,
+            )
+        )
+
+    def run_solution(
+        self,
+        user_code: str,
+        task_data: Optional[Dict[str, Any]] = None,
+        expected_output: str = "",
+        task_code: str = "",
+    ) -> Dict[str, Any]:
+        """
+        Выполняет решение студента и эталон — первая часть validate_task_execution.
+
+        Выполнение подменяет общий sys.stdout (redirect_stdout), поэтому
+        вызывается в потоке kernel; в рабочий поток можно вынести только
+        judge_solution (запрос к LLM).
+
+        Returns:
+            Dict[str, Any]: Данные для judge_solution
+        """
         task_data = task_data or {}
         task_code = task_data.get("task_code", task_code)
         solution_code = task_data.get("solution_code", "")
@@ -1046,32 +1137,67 @@ validation_mode: всегда "llm".
         if solution_code:
             materialized = self.materialize_validation_metadata(dict(task_data))
 
-        validation_mode = materialized.get("validation_mode", "llm")
-        check_variables = materialized.get("check_variables") or []
-        expected_output = materialized.get("expected_output", expected_output)
-
-        student_stdout = ""
-        local_vars: Dict[str, Any] = {}
-        execution_error: Optional[str] = None
+        run = {
+            "user_code": user_code,
+            "task_code": task_code,
+            "materialized": materialized,
+            "expected_output": materialized.get("expected_output", expected_output),
+            "student_stdout": "",
+            "local_vars": {},
+            "execution_error": None,
+            "reference_stdout": "",
+            "reference_vars": {},
+            "reference_error": None,
+        }
 
         try:
             full_code = self.resolve_executable_code(task_code, user_code)
-            student_stdout, local_vars = self.execute_code(
+            run["student_stdout"], run["local_vars"] = self.execute_code(
                 self.stabilize_sklearn_code(full_code)
             )
         except Exception as exc:
-            execution_error = str(exc)
-            student_stdout = ""
+            run["execution_error"] = str(exc)
 
-        reference_stdout = ""
-        reference_vars: Dict[str, Any] = {}
         if solution_code:
             try:
-                reference_stdout, reference_vars = self.execute_code(
+                run["reference_stdout"], run["reference_vars"] = self.execute_code(
                     self.stabilize_sklearn_code(materialized["solution_code"])
                 )
             except Exception as exc:
                 self.logger.warning("Эталонное решение не выполнилось: %s", exc)
+                run["reference_error"] = str(exc)
+        return run
+
+    def judge_solution(self, run: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Оценивает выполненное решение (результат run_solution) через LLM
+        или резервной проверкой. Код не выполняет — можно вызывать в
+        рабочем потоке.
+
+        Returns:
+            Dict[str, Any]: Результат проверки
+        """
+        materialized = run["materialized"]
+        user_code = run["user_code"]
+        task_code = run["task_code"]
+        validation_mode = materialized.get("validation_mode", "llm")
+        check_variables = materialized.get("check_variables") or []
+        expected_output = run["expected_output"]
+        student_stdout = run["student_stdout"]
+        local_vars = run["local_vars"]
+        execution_error = run["execution_error"]
+        fallback_args = (
+            materialized,
+            user_code,
+            task_code,
+            validation_mode,
+            check_variables,
+            student_stdout,
+            local_vars,
+            expected_output,
+            None if run["reference_error"] else run["reference_vars"],
+            execution_error or run["reference_error"],
+        )
 
         is_correct = False
         failure_reason = execution_error or ""
@@ -1085,8 +1211,8 @@ validation_mode: всегда "llm".
                     student_code=user_code,
                     student_stdout=student_stdout,
                     student_vars=local_vars,
-                    reference_stdout=reference_stdout,
-                    reference_vars=reference_vars,
+                    reference_stdout=run["reference_stdout"],
+                    reference_vars=run["reference_vars"],
                     execution_error=execution_error,
                 )
                 is_correct = llm_result["is_correct"]
@@ -1097,14 +1223,7 @@ validation_mode: всегда "llm".
                 self.logger.error("LLM-проверка недоступна, fallback: %s", exc)
                 validation_method = "structured_fallback"
                 is_correct, failure_reason, feedback = self._validate_structured_fallback(
-                    materialized,
-                    user_code,
-                    task_code,
-                    validation_mode,
-                    check_variables,
-                    student_stdout,
-                    local_vars,
-                    expected_output,
+                    *fallback_args
                 )
                 feedback = (
                     f"{feedback} (нейросеть временно недоступна, применена резервная проверка)"
@@ -1112,14 +1231,7 @@ validation_mode: всегда "llm".
         else:
             validation_method = "structured_fallback"
             is_correct, failure_reason, feedback = self._validate_structured_fallback(
-                materialized,
-                user_code,
-                task_code,
-                validation_mode,
-                check_variables,
-                student_stdout,
-                local_vars,
-                expected_output,
+                *fallback_args
             )
 
         return {
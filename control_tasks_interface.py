@@ -8,6 +8,8 @@ from IPython.display import display, clear_output
 import logging
 from typing import Dict, Any, Optional
 from control_tasks_generator import ControlTasksGenerator
+from content_utils import CODE_EXEC_LOCK
+from async_tasks import run_in_thread, schedule
 
 
 class ControlTasksInterface:
@@ -60,13 +62,19 @@ class ControlTasksInterface:
 
             course_context = self.lesson_interface.current_course_info
 
-            print(f"\n📤 [DIAGNOSTIC] Вызываем generate_control_task...")
-            self.current_task = self.tasks_generator.generate_control_task(
-                lesson_data=lesson_data,
-                lesson_content=lesson_content,
-                communication_style=communication_style,
-                course_context=course_context,
-            )
+            # Задание могло быть сгенерировано сразу после показа урока
+            self.current_task = self.lesson_interface.artifacts.get("control_task")
+            if self.current_task:
+                # В слоте задание без выполнения эталонного кода — выполняем здесь
+                self.tasks_generator.ensure_materialized(self.current_task)
+            else:
+                print(f"\n📤 [DIAGNOSTIC] Вызываем generate_control_task...")
+                self.current_task = self.tasks_generator.generate_control_task(
+                    lesson_data=lesson_data,
+                    lesson_content=lesson_content,
+                    communication_style=communication_style,
+                    course_context=course_context,
+                )
 
             print(f"\n📥 [DIAGNOSTIC] Результат generate_control_task:")
             print(f"title: {self.current_task.get('title', 'НЕТ')}")
@@ -259,7 +267,7 @@ class ControlTasksInterface:
                     task_data.get("task_code", ""), code_input.value
                 )
 
-                with redirect_stdout(output_buffer):
+                with CODE_EXEC_LOCK, redirect_stdout(output_buffer):
                     exec(full_code, namespace)
                 
                 # Получаем результат
@@ -290,17 +298,24 @@ class ControlTasksInterface:
                 # Добавляем ошибку в контейнер
                 results_output.children = [error_html]
 
-        def on_check_button_clicked(b):
-            # ИСПРАВЛЕНО: Защита от множественных нажатий
-            check_button.disabled = True
-            check_button.description = "Проверяется..."
+        async def check_solution():
             try:
-                self._check_solution(code_input.value, task_data, results_output)
+                await self._check_solution_async(
+                    code_input.value, task_data, results_output
+                )
             finally:
                 # Восстанавливаем кнопку
                 check_button.disabled = False
                 check_button.description = "Проверить решение"
 
+        def on_check_button_clicked(b):
+            # ИСПРАВЛЕНО: Защита от множественных нажатий
+            check_button.disabled = True
+            check_button.description = "Проверяется..."
+            # Проверка (выполнение кода + LLM) идёт асинхронно: kernel
+            # не блокируется, кнопка восстанавливается по завершении
+            schedule(check_solution())
+
         execute_button.on_click(on_execute_button_clicked)
         check_button.on_click(on_check_button_clicked)
 
@@ -346,132 +361,46 @@ class ControlTasksInterface:
             # ИСПРАВЛЕНО: Очищаем контейнер результатов
             results_output.children = []
 
-            # Получаем параметры проверки переменной
-            check_variable = task_data.get("check_variable")
-            expected_variable_value = task_data.get("expected_variable_value")
+            validation_result = self._validate_solution(user_code, task_data)
+            self._show_check_result(validation_result, task_data, results_output)
 
-            print(f"\n🔍 [DIAGNOSTIC] Проверка решения:")
-            print(f"check_variable: {check_variable}")
-            print(f"expected_variable_value: {expected_variable_value}")
-            print(f"expected_output: {task_data.get('expected_output', 'НЕТ')}")
-            print(f"user_code: {user_code[:200]}...")
-
-            # Проверяем выполнение
-            validation_result = self.tasks_generator.validate_task_execution(
-                user_code,
-                task_data=task_data,
+        except Exception as e:
+            error_html = widgets.HTML(
+                value=f"<div style='background-color: #f8d7da; border: 1px solid #f5c6cb; border-radius: 5px; padding: 15px; margin: 10px 0;'>"
+                f"<h3 style='color: #721c24; margin: 0;'>❌ Ошибка при проверке</h3>"
+                f"<p style='color: #721c24; margin: 10px 0;'>{str(e)}</p>"
+                f"</div>"
             )
+            # ИСПРАВЛЕНО: Добавляем ошибку в контейнер результатов
+            results_output.children = [error_html]
+        finally:
+            # ИСПРАВЛЕНО: Сбрасываем флаг проверки
+            self.is_checking = False
 
-            print(f"Результат валидации: {validation_result}")
-            
-            # Дополнительная диагностика
-            if check_variable:
-                print(f"🔍 [DIAGNOSTIC] Проверка переменной '{check_variable}':")
-                print(f"   Ожидаемое значение: {expected_variable_value}")
-                print(f"   Фактическое значение: {validation_result.get('actual_variable')}")
-                print(f"   Совпадение: {validation_result.get('is_correct')}")
-            else:
-                print(f"🔍 [DIAGNOSTIC] Проверка вывода:")
-                print(f"   Ожидаемый вывод: '{task_data.get('expected_output', '')}'")
-                print(f"   Фактический вывод: '{validation_result.get('actual_output', '')}'")
-                print(f"   Совпадение: {validation_result.get('actual_output') == task_data.get('expected_output', '').strip()}")
-
-            # Создаем все виджеты для отображения
-            result_widgets = []
-
-            if validation_result["is_correct"]:
-                # Успех
-                feedback = validation_result.get("feedback", "")
-                feedback_html = ""
-                if feedback:
-                    feedback_html = (
-                        f"<p style='color: #155724; margin: 10px 0;'>"
-                        f"<strong>Комментарий:</strong> {feedback}</p>"
-                    )
-                success_html = widgets.HTML(
-                    value="<div style='background-color: #d4edda; border: 1px solid #c3e6cb; border-radius: 5px; padding: 15px; margin: 10px 0;'>"
-                    "<h3 style='color: #155724; margin: 0;'>🎉 Задание выполнено правильно!</h3>"
-                    "<p style='color: #155724; margin: 10px 0;'>Отличная работа! Решение принято.</p>"
-                    f"{feedback_html}"
-                    f"<p style='color: #155724; margin: 10px 0;'><strong>Ваш вывод:</strong> "
-                    f"{validation_result.get('actual_output', 'Нет вывода') or 'Нет вывода'}</p>"
-                    "</div>"
-                )
-                result_widgets.append(success_html)
-
-                # Сохраняем результат
-                self._save_task_result(task_data, True)
-
-                # Добавляем кнопки для перехода
-                success_buttons = self._create_success_buttons()
-                result_widgets.extend(success_buttons)
-
-            else:
-                # Ошибка
-                failure_reason = validation_result.get("failure_reason") or validation_result.get(
-                    "error_message", ""
-                )
-                feedback = validation_result.get("feedback", "")
-                check_variables = task_data.get("check_variables") or []
-                if not check_variables and check_variable:
-                    check_variables = [check_variable]
-
-                error_details = ""
-                if failure_reason:
-                    error_details = (
-                        f"<p style='color: #721c24; margin: 10px 0;'>"
-                        f"<strong>Причина:</strong> {failure_reason}</p>"
-                    )
-                if feedback and feedback != failure_reason:
-                    error_details += (
-                        f"<p style='color: #721c24; margin: 10px 0;'>"
-                        f"<strong>Комментарий:</strong> {feedback}</p>"
-                    )
-
-                expected_hint = ""
-                if task_data.get("validation_mode") == "stdout":
-                    expected_hint = (
-                        f"<p style='color: #721c24; margin: 10px 0;'>"
-                        f"<strong>Ожидаемый вывод:</strong> "
-                        f"{task_data.get('expected_output', 'Не указан')}</p>"
-                    )
-                elif check_variables:
-                    vars_list = ", ".join(f"<code>{v}</code>" for v in check_variables)
-                    expected_hint = (
-                        f"<p style='color: #721c24; margin: 10px 0;'>"
-                        f"<strong>Проверяемые переменные:</strong> {vars_list}</p>"
-                    )
-
-                error_html = widgets.HTML(
-                        value="<div style='background-color: #f8d7da; border: 1px solid #f5c6cb; border-radius: 5px; padding: 15px; margin: 10px 0;'>"
-                        "<h3 style='color: #721c24; margin: 0;'>❌ Задание выполнено неправильно</h3>"
-                        "<p style='color: #721c24; margin: 10px 0;'>Проверьте шаги задания и попробуйте ещё раз.</p>"
-                    f"<p style='color: #721c24; margin: 10px 0;'><strong>Ваш вывод:</strong> "
-                    f"{validation_result.get('actual_output', 'Нет вывода') or 'Нет вывода'}</p>"
-                    f"{expected_hint}"
-                    f"{error_details}"
-                        "</div>"
-                    )
-                result_widgets.append(error_html)
-
-                # Эталонное решение
-                solution_html = widgets.HTML(
-                    value=f"<div style='background-color: #fff3cd; border: 1px solid #ffeaa7; border-radius: 5px; padding: 15px; margin: 10px 0;'>"
-                    f"<h4 style='color: #856404; margin: 0;'>Эталонное решение:</h4>"
-                    f"<pre style='background-color: #f8f9fa; padding: 10px; border-radius: 3px; margin: 10px 0;'>{task_data.get('solution_code', '')}</pre>"
-                    f"</div>"
-                )
-                result_widgets.append(solution_html)
-
-                # Сохраняем результат
-                self._save_task_result(task_data, False)
+    async def _check_solution_async(
+        self, user_code: str, task_data: Dict[str, Any], results_output
+    ):
+        """
+        Асинхронная версия _check_solution.
 
-                # Добавляем кнопки для повторной попытки
-                retry_buttons = self._create_retry_buttons()
-                result_widgets.extend(retry_buttons)
+        Код решения выполняется в потоке kernel (exec подменяет общий
+        sys.stdout), в рабочем потоке идёт только LLM-проверка; виджеты
+        обновляются в event loop kernel.
+        """
+        if self.is_checking:
+            self.logger.warning("Попытка множественного вызова _check_solution - игнорируем")
+            return
+        self.is_checking = True
+        try:
+            results_output.children = []
 
-            # ИСПРАВЛЕНО: Добавляем все виджеты в контейнер результатов
-            results_output.children = result_widgets
+            self._print_check_diagnostics(user_code, task_data)
+            run = self.tasks_generator.run_solution(user_code, task_data=task_data)
+            validation_result = await run_in_thread(
+                self.tasks_generator.judge_solution, run
+            )
+            self._print_check_result_diagnostics(validation_result, task_data)
+            self._show_check_result(validation_result, task_data, results_output)
 
         except Exception as e:
             error_html = widgets.HTML(
@@ -486,6 +415,160 @@ class ControlTasksInterface:
             # ИСПРАВЛЕНО: Сбрасываем флаг проверки
             self.is_checking = False
 
+    def _validate_solution(self, user_code: str, task_data: Dict[str, Any]):
+        """
+        Выполняет и проверяет решение пользователя.
+
+        Returns:
+            Dict[str, Any]: Результат validate_task_execution
+        """
+        self._print_check_diagnostics(user_code, task_data)
+
+        # Проверяем выполнение
+        validation_result = self.tasks_generator.validate_task_execution(
+            user_code,
+            task_data=task_data,
+        )
+
+        self._print_check_result_diagnostics(validation_result, task_data)
+        return validation_result
+
+    def _print_check_diagnostics(self, user_code: str, task_data: Dict[str, Any]):
+        """Диагностика перед проверкой решения (печатается в потоке kernel)."""
+        # Получаем параметры проверки переменной
+        check_variable = task_data.get("check_variable")
+        expected_variable_value = task_data.get("expected_variable_value")
+
+        print(f"\n🔍 [DIAGNOSTIC] Проверка решения:")
+        print(f"check_variable: {check_variable}")
+        print(f"expected_variable_value: {expected_variable_value}")
+        print(f"expected_output: {task_data.get('expected_output', 'НЕТ')}")
+        print(f"user_code: {user_code[:200]}...")
+
+    def _print_check_result_diagnostics(
+        self, validation_result: Dict[str, Any], task_data: Dict[str, Any]
+    ):
+        """Диагностика результата проверки (печатается в потоке kernel)."""
+        check_variable = task_data.get("check_variable")
+        expected_variable_value = task_data.get("expected_variable_value")
+
+        print(f"Результат валидации: {validation_result}")
+
+        # Дополнительная диагностика
+        if check_variable:
+            print(f"🔍 [DIAGNOSTIC] Проверка переменной '{check_variable}':")
+            print(f"   Ожидаемое значение: {expected_variable_value}")
+            print(f"   Фактическое значение: {validation_result.get('actual_variable')}")
+            print(f"   Совпадение: {validation_result.get('is_correct')}")
+        else:
+            print(f"🔍 [DIAGNOSTIC] Проверка вывода:")
+            print(f"   Ожидаемый вывод: '{task_data.get('expected_output', '')}'")
+            print(f"   Фактический вывод: '{validation_result.get('actual_output', '')}'")
+            print(f"   Совпадение: {validation_result.get('actual_output') == task_data.get('expected_output', '').strip()}")
+
+    def _show_check_result(
+        self, validation_result: Dict[str, Any], task_data: Dict[str, Any], results_output
+    ):
+        """Показывает результат проверки и сохраняет его."""
+        check_variable = task_data.get("check_variable")
+
+        # Создаем все виджеты для отображения
+        result_widgets = []
+
+        if validation_result["is_correct"]:
+            # Успех
+            feedback = validation_result.get("feedback", "")
+            feedback_html = ""
+            if feedback:
+                feedback_html = (
+                    f"<p style='color: #155724; margin: 10px 0;'>"
+                    f"<strong>Комментарий:</strong> {feedback}</p>"
+                )
+            success_html = widgets.HTML(
+                value="<div style='background-color: #d4edda; border: 1px solid #c3e6cb; border-radius: 5px; padding: 15px; margin: 10px 0;'>"
+                "<h3 style='color: #155724; margin: 0;'>🎉 Задание выполнено правильно!</h3>"
+                "<p style='color: #155724; margin: 10px 0;'>Отличная работа! Решение принято.</p>"
+                f"{feedback_html}"
+                f"<p style='color: #155724; margin: 10px 0;'><strong>Ваш вывод:</strong> "
+                f"{validation_result.get('actual_output', 'Нет вывода') or 'Нет вывода'}</p>"
+                "</div>"
+            )
+            result_widgets.append(success_html)
+
+            # Сохраняем результат
+            self._save_task_result(task_data, True)
+
+            # Добавляем кнопки для перехода
+            success_buttons = self._create_success_buttons()
+            result_widgets.extend(success_buttons)
+
+        else:
+            # Ошибка
+            failure_reason = validation_result.get("failure_reason") or validation_result.get(
+                "error_message", ""
+            )
+            feedback = validation_result.get("feedback", "")
+            check_variables = task_data.get("check_variables") or []
+            if not check_variables and check_variable:
+                check_variables = [check_variable]
+
+            error_details = ""
+            if failure_reason:
+                error_details = (
+                    f"<p style='color: #721c24; margin: 10px 0;'>"
+                    f"<strong>Причина:</strong> {failure_reason}</p>"
+                )
+            if feedback and feedback != failure_reason:
+                error_details += (
+                    f"<p style='color: #721c24; margin: 10px 0;'>"
+                    f"<strong>Комментарий:</strong> {feedback}</p>"
+                )
+
+            expected_hint = ""
+            if task_data.get("validation_mode") == "stdout":
+                expected_hint = (
+                    f"<p style='color: #721c24; margin: 10px 0;'>"
+                    f"<strong>Ожидаемый вывод:</strong> "
+                    f"{task_data.get('expected_output', 'Не указан')}</p>"
+                )
+            elif check_variables:
+                vars_list = ", ".join(f"<code>{v}</code>" for v in check_variables)
+                expected_hint = (
+                    f"<p style='color: #721c24; margin: 10px 0;'>"
+                    f"<strong>Проверяемые переменные:</strong> {vars_list}</p>"
+                )
+
+            error_html = widgets.HTML(
+                    value="<div style='background-color: #f8d7da; border: 1px solid #f5c6cb; border-radius: 5px; padding: 15px; margin: 10px 0;'>"
+                    "<h3 style='color: #721c24; margin: 0;'>❌ Задание выполнено неправильно</h3>"
+                    "<p style='color: #721c24; margin: 10px 0;'>Проверьте шаги задания и попробуйте ещё раз.</p>"
+                f"<p style='color: #721c24; margin: 10px 0;'><strong>Ваш вывод:</strong> "
+                f"{validation_result.get('actual_output', 'Нет вывода') or 'Нет вывода'}</p>"
+                f"{expected_hint}"
+                f"{error_details}"
+                    "</div>"
+                )
+            result_widgets.append(error_html)
+
+            # Эталонное решение
+            solution_html = widgets.HTML(
+                value=f"<div style='background-color: #fff3cd; border: 1px solid #ffeaa7; border-radius: 5px; padding: 15px; margin: 10px 0;'>"
+                f"<h4 style='color: #856404; margin: 0;'>Эталонное решение:</h4>"
+                f"<pre style='background-color: #f8f9fa; padding: 10px; border-radius: 3px; margin: 10px 0;'>{task_data.get('solution_code', '')}</pre>"
+                f"</div>"
+            )
+            result_widgets.append(solution_html)
+
+            # Сохраняем результат
+            self._save_task_result(task_data, False)
+
+            # Добавляем кнопки для повторной попытки
+            retry_buttons = self._create_retry_buttons()
+            result_widgets.extend(retry_buttons)
+
+        # ИСПРАВЛЕНО: Добавляем все виджеты в контейнер результатов
+        results_output.children = result_widgets
+
     def _save_task_result(self, task_data: Dict[str, Any], is_correct: bool):
         """
         Сохраняет результат выполнения задания.
@@ -499,31 +582,33 @@ class ControlTasksInterface:
             # Сохраняем в state.json
             lesson_id = self.lesson_interface.current_lesson_id
             if lesson_id:
-                self.lesson_interface.state_manager.save_control_task_result(
-                    lesson_id, task_data.get("title", "Задание"), is_correct
-                )
+                # Результат задания, оценка и завершение урока — одной записью состояния
+                with self.lesson_interface.state_manager.transaction():
+                    self.lesson_interface.state_manager.save_control_task_result(
+                        lesson_id, task_data.get("title", "Задание"), is_correct
+                    )
                 
-                # ИСПРАВЛЕНО: Если контрольное задание выполнено правильно И тест пройден - урок завершен
-                if is_correct:
-                    # Проверяем, пройден ли тест
-                    if self.lesson_interface.state_manager.is_test_passed(lesson_id):
-                        # Урок полностью завершен: тест пройден + контрольное задание выполнено
-                        self.lesson_interface.state_manager.save_lesson_assessment(
-                            lesson_id, 
-                            self.lesson_interface.state_manager.get_lesson_score(lesson_id), 
-                            True  # Теперь урок действительно завершен
-                        )
-                        # ДОБАВЛЕНО: всегда выставляем флаг завершённости
-                        self.lesson_interface.state_manager.mark_lesson_complete_manually(lesson_id)
-                        self.logger.info(f"Урок {lesson_id} полностью завершен: тест пройден + контрольное задание выполнено")
+                    # ИСПРАВЛЕНО: Если контрольное задание выполнено правильно И тест пройден - урок завершен
+                    if is_correct:
+                        # Проверяем, пройден ли тест
+                        if self.lesson_interface.state_manager.is_test_passed(lesson_id):
+                            # Урок полностью завершен: тест пройден + контрольное задание выполнено
+                            self.lesson_interface.state_manager.save_lesson_assessment(
+                                lesson_id, 
+                                self.lesson_interface.state_manager.get_lesson_score(lesson_id), 
+                                True  # Теперь урок действительно завершен
+                            )
+                            # ДОБАВЛЕНО: всегда выставляем флаг завершённости
+                            self.lesson_interface.state_manager.mark_lesson_complete_manually(lesson_id)
+                            self.logger.info(f"Урок {lesson_id} полностью завершен: тест пройден + контрольное задание выполнено")
+                        else:
+                            self.logger.info(f"Контрольное задание выполнено, но тест не пройден для урока {lesson_id}")
                     else:
-                        self.logger.info(f"Контрольное задание выполнено, но тест не пройден для урока {lesson_id}")
-                else:
-                    self.logger.info(f"Контрольное задание НЕ выполнено для урока {lesson_id}")
+                        self.logger.info(f"Контрольное задание НЕ выполнено для урока {lesson_id}")
                     
-                self.logger.info(
-                    f"Результат контрольного задания сохранен: {is_correct}"
-                )
+                    self.logger.info(
+                        f"Результат контрольного задания сохранен: {is_correct}"
+                    )
         except Exception as e:
             self.logger.error(f"Ошибка при сохранении результата: {str(e)}")
 
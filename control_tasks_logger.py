@@ -1,14 +1,51 @@
 """
 Модуль логирования контрольных заданий для интерактивных ячеек.
 Записывает попытки решения студентов и статистику выполнения.
+
+Попытки хранятся в SQLite с индексом по ячейке (см. control_tasks_store),
+у каждого учащегося своё хранилище: data/learners/<learner_id>/
+control_tasks_log.sqlite3 (без учащегося — data/control_tasks_log.sqlite3).
+Статистику ячеек и общие итоги считает хранилище при записи попыток; в
+памяти держится её копия, которая сразу учитывает ещё не записанные попытки
+и перечитывается после каждой записи (так видны и попытки других kernel
+того же учащегося). Запись в хранилище идёт в фоновом потоке (log_writer):
+ячейка с заданием не ждёт диска. Прежний control_tasks_log.json (и его
+архивные сегменты) переносится в хранилище один раз.
 """
 
 import json
 import os
+import threading
 from datetime import datetime
 from typing import Dict, List, Any, Optional
 from dataclasses import dataclass, asdict
+from pathlib import Path
 from result_checker import CheckResult
+from log_writer import get_log_writer, flush_log_writer
+from log_rotation import list_segments, open_segment
+from control_tasks_store import ControlTaskAttemptStore
+from learner_namespace import (
+    get_default_learner_id,
+    learner_state_file,
+    normalize_learner_id,
+)
+
+PROJECT_DIR = Path(__file__).parent.absolute()
+LOG_FILE_NAME = "control_tasks_log.json"
+
+
+def learner_log_file(learner_id=None) -> str:
+    """
+    Путь к логу контрольных заданий учащегося.
+
+    Args:
+        learner_id: ID учащегося (None — режим одного учащегося)
+
+    Returns:
+        str: data/learners/<learner_id>/control_tasks_log.json или
+        data/control_tasks_log.json в каталоге проекта
+    """
+    return str(PROJECT_DIR / learner_state_file(learner_id, f"data/{LOG_FILE_NAME}"))
 
 
 @dataclass
@@ -51,65 +88,111 @@ class CellStats:
 class ControlTasksLogger:
     """Система логирования контрольных заданий."""
 
-    def __init__(self, log_file: str = "control_tasks_log.json"):
+    def __init__(
+        self, log_file: Optional[str] = None, legacy_log_files: List[str] = ()
+    ):
         """
         Инициализация логгера.
 
         Args:
-            log_file: Путь к файлу лога
+            log_file: Путь к прежнему JSON-файлу лога; попытки хранятся
+                рядом, в файле с расширением .sqlite3 (по умолчанию — лог
+                учащегося из TEACHAI_LEARNER_ID, см. learner_log_file)
+            legacy_log_files: Другие прежние JSON-логи, попытки из которых
+                переносятся в это хранилище
         """
-        self.log_file = log_file
-        self.log_data = self._load_log_file()
-
-    def _load_log_file(self) -> Dict[str, Any]:
-        """Загружает данные из файла лога."""
-        if os.path.exists(self.log_file):
-            try:
-                with open(self.log_file, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-
-                # Проверяем структуру данных
-                if not isinstance(data, dict):
-                    data = self._create_empty_log()
-
-                # Добавляем отсутствующие поля
-                if "version" not in data:
-                    data["version"] = "1.0"
-                if "created_at" not in data:
-                    data["created_at"] = datetime.now().isoformat()
-                if "attempts" not in data:
-                    data["attempts"] = []
-                if "cell_stats" not in data:
-                    data["cell_stats"] = {}
-
-                return data
-
-            except (json.JSONDecodeError, IOError) as e:
-                print(f"⚠️ Ошибка загрузки лога: {e}. Создается новый файл.")
-                return self._create_empty_log()
-        else:
-            return self._create_empty_log()
-
-    def _create_empty_log(self) -> Dict[str, Any]:
-        """Создает пустую структуру лога."""
+        self.log_file = log_file or learner_log_file(get_default_learner_id())
+        self.store_file = os.path.splitext(self.log_file)[0] + ".sqlite3"
+        # Защищает статистику в памяти: её читают ячейки, а перечитывает
+        # поток записи
+        self._lock = threading.RLock()
+        # Попытки, ещё не сохранённые в хранилище (сохраняются пачкой)
+        self._pending = []
+        self._save_scheduled = False
+        self.store = ControlTaskAttemptStore(self.store_file)
+        for legacy_file in [self.log_file, *legacy_log_files]:
+            self._migrate_log_file(legacy_file)
+
+        self.cell_stats = self.store.load_cell_stats()
+        self.totals = self.store.load_totals()
+
+    def _create_empty_totals(self) -> Dict[str, Any]:
+        """Создает пустые общие итоги."""
         return {
-            "version": "1.0",
-            "created_at": datetime.now().isoformat(),
-            "last_updated": datetime.now().isoformat(),
-            "attempts": [],
-            "cell_stats": {},
+            "total_attempts": 0,
+            "successful_attempts": 0,
+            "total_execution_time_ms": 0.0,
+            "completed_cells": 0,
         }
 
-    def _save_log_file(self):
-        """Сохраняет данные в файл лога."""
-        try:
-            self.log_data["last_updated"] = datetime.now().isoformat()
+    def _migrate_log_file(self, log_file: str):
+        """
+        Переносит попытки из прежнего JSON-лога (и его архивных сегментов)
+        в хранилище и переименовывает файлы в *.migrated.
 
-            with open(self.log_file, "w", encoding="utf-8") as f:
-                json.dump(self.log_data, f, ensure_ascii=False, indent=2)
+        Попытки, уже попавшие в хранилище (по attempt_id), не дублируются,
+        поэтому перенос повторяется и в непустое хранилище, а прерванный
+        перенос безопасно продолжается при следующем запуске.
 
-        except IOError as e:
-            print(f"❌ Ошибка сохранения лога: {e}")
+        Args:
+            log_file: Путь к прежнему JSON-логу
+        """
+        if not os.path.exists(log_file):
+            return
+        try:
+            with open(log_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if not isinstance(data, dict):
+                data = {}
+
+            attempts = []
+            segments = list_segments(log_file)
+            for segment in segments:
+                with open_segment(segment) as f:
+                    attempts.extend(json.load(f).get("attempts", []))
+            attempts.extend(data.get("attempts", []))
+
+            imported = self.store.import_attempts(attempts, data.get("cell_stats", {}))
+            if imported is None:
+                return
+            for path in segments + [log_file]:
+                os.replace(path, path + ".migrated")
+            print(f"ℹ️ Лог контрольных заданий перенесён в {self.store_file} ({imported} попыток)")
+
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"⚠️ Ошибка загрузки лога: {e}. Попытки из него не перенесены.")
+
+    def _persist(self, operation):
+        """Выполняет запись в хранилище в фоновом потоке (log_writer)."""
+        get_log_writer().call(operation, critical=True)
+
+    def _save_pending(self):
+        """
+        Сохраняет накопившиеся попытки одной транзакцией (в потоке записи)
+        и перечитывает статистику из хранилища.
+        """
+        with self._lock:
+            attempts, self._pending = self._pending, []
+            self._save_scheduled = False
+        if not attempts or not self.store.add_attempts(attempts):
+            return
+        self._reload_stats()
+
+    def _reload_stats(self):
+        """Перечитывает статистику из хранилища и добавляет к ней ещё не записанные попытки."""
+        cell_stats = self.store.load_cell_stats()
+        totals = self.store.load_totals()
+        with self._lock:
+            self.cell_stats, self.totals = cell_stats, totals
+            for attempt in self._pending:
+                check_result = attempt["check_result"]
+                self._update_cell_stats(
+                    attempt["cell_id"],
+                    check_result["passed"],
+                    check_result["score"],
+                    attempt["execution_time_ms"],
+                    attempt["timestamp"],
+                )
 
     def log_attempt(
         self,
@@ -136,84 +219,99 @@ class ControlTasksLogger:
         Returns:
             str: Идентификатор попытки
         """
-        # Создаем уникальный ID попытки
-        attempt_id = f"{cell_id}_{len(self.log_data['attempts']) + 1}_{int(datetime.now().timestamp())}"
-
         # Сериализуем результат выполнения
         try:
             serialized_result = json.dumps(execution_result, default=str)
         except:
             serialized_result = str(execution_result)
 
-        # Создаем лог попытки
-        attempt_log = AttemptLog(
-            attempt_id=attempt_id,
-            cell_id=cell_id,
-            student_code=student_code,
-            execution_result=serialized_result,
-            execution_output=execution_output,
-            execution_success=execution_success,
-            check_result={
-                "passed": check_result.passed,
-                "message": check_result.message,
-                "score": check_result.score,
-                "details": check_result.details,
-            },
-            timestamp=datetime.now().isoformat(),
-            execution_time_ms=execution_time_ms,
-        )
-
-        # Добавляем в лог
-        self.log_data["attempts"].append(attempt_log.to_dict())
-
-        # Обновляем статистику по ячейке
-        self._update_cell_stats(cell_id, check_result, execution_time_ms)
-
-        # Сохраняем файл
-        self._save_log_file()
+        with self._lock:
+            # Создаем уникальный ID попытки
+            attempt_id = f"{cell_id}_{self.totals['total_attempts'] + 1}_{int(datetime.now().timestamp())}"
+
+            # Создаем лог попытки
+            attempt_log = AttemptLog(
+                attempt_id=attempt_id,
+                cell_id=cell_id,
+                student_code=student_code,
+                execution_result=serialized_result,
+                execution_output=execution_output,
+                execution_success=execution_success,
+                check_result={
+                    "passed": check_result.passed,
+                    "message": check_result.message,
+                    "score": check_result.score,
+                    "details": check_result.details,
+                },
+                timestamp=datetime.now().isoformat(),
+                execution_time_ms=execution_time_ms,
+            )
+
+            # Обновляем статистику по ячейке и общие итоги
+            self._update_cell_stats(
+                cell_id,
+                check_result.passed,
+                check_result.score,
+                execution_time_ms,
+                attempt_log.timestamp,
+            )
+
+            # Сохраняем попытку в фоне, вместе с другими накопившимися
+            self._pending.append(attempt_log.to_dict())
+            schedule = not self._save_scheduled
+            self._save_scheduled = True
+
+        if schedule:
+            self._persist(self._save_pending)
 
         return attempt_id
 
     def _update_cell_stats(
-        self, cell_id: str, check_result: CheckResult, execution_time_ms: float
+        self,
+        cell_id: str,
+        passed: bool,
+        score: float,
+        execution_time_ms: float,
+        timestamp: str,
     ):
-        """Обновляет статистику по ячейке."""
-        if cell_id not in self.log_data["cell_stats"]:
+        """Обновляет статистику по ячейке и общие итоги в памяти."""
+        if cell_id not in self.cell_stats:
             # Создаем новую статистику
-            self.log_data["cell_stats"][cell_id] = CellStats(
+            self.cell_stats[cell_id] = CellStats(
                 cell_id=cell_id,
                 total_attempts=0,
                 successful_attempts=0,
                 first_success_attempt=None,
-                last_attempt_timestamp=datetime.now().isoformat(),
+                last_attempt_timestamp=timestamp,
                 best_score=0.0,
                 average_score=0.0,
                 total_execution_time_ms=0.0,
             ).to_dict()
 
-        stats = self.log_data["cell_stats"][cell_id]
+        stats = self.cell_stats[cell_id]
 
         # Обновляем счетчики
         stats["total_attempts"] += 1
         stats["total_execution_time_ms"] += execution_time_ms
-        stats["last_attempt_timestamp"] = datetime.now().isoformat()
+        stats["last_attempt_timestamp"] = timestamp
+        self.totals["total_attempts"] += 1
+        self.totals["total_execution_time_ms"] += execution_time_ms
 
-        if check_result.passed:
+        if passed:
             stats["successful_attempts"] += 1
+            self.totals["successful_attempts"] += 1
             if stats["first_success_attempt"] is None:
                 stats["first_success_attempt"] = stats["total_attempts"]
+                self.totals["completed_cells"] += 1
 
         # Обновляем лучший результат
-        if check_result.score > stats["best_score"]:
-            stats["best_score"] = check_result.score
+        if score > stats["best_score"]:
+            stats["best_score"] = score
 
-        # Пересчитываем средний результат
-        cell_attempts = [
-            a for a in self.log_data["attempts"] if a["cell_id"] == cell_id
-        ]
-        if cell_attempts:
-            total_score = sum(a["check_result"]["score"] for a in cell_attempts)
-            stats["average_score"] = total_score / len(cell_attempts)
+        # Обновляем средний результат
+        stats["average_score"] += (
+            score - stats["average_score"]
+        ) / stats["total_attempts"]
 
     def get_cell_stats(self, cell_id: str) -> Optional[Dict[str, Any]]:
         """
@@ -225,7 +323,7 @@ class ControlTasksLogger:
         Returns:
             Словарь со статистикой или None
         """
-        return self.log_data["cell_stats"].get(cell_id)
+        return self.cell_stats.get(cell_id)
 
     def get_cell_attempts(self, cell_id: str) -> List[Dict[str, Any]]:
         """
@@ -237,7 +335,8 @@ class ControlTasksLogger:
         Returns:
             Список попыток
         """
-        return [a for a in self.log_data["attempts"] if a["cell_id"] == cell_id]
+        flush_log_writer()
+        return self.store.get_cell_attempts(cell_id)
 
     def get_last_attempt(self, cell_id: str) -> Optional[Dict[str, Any]]:
         """
@@ -249,8 +348,8 @@ class ControlTasksLogger:
         Returns:
             Словарь с последней попыткой или None
         """
-        attempts = self.get_cell_attempts(cell_id)
-        return attempts[-1] if attempts else None
+        flush_log_writer()
+        return self.store.get_last_attempt(cell_id)
 
     def get_successful_attempt(self, cell_id: str) -> Optional[Dict[str, Any]]:
         """
@@ -262,11 +361,8 @@ class ControlTasksLogger:
         Returns:
             Словарь с успешной попыткой или None
         """
-        attempts = self.get_cell_attempts(cell_id)
-        for attempt in attempts:
-            if attempt["check_result"]["passed"]:
-                return attempt
-        return None
+        flush_log_writer()
+        return self.store.get_first_successful_attempt(cell_id)
 
     def is_cell_completed(self, cell_id: str) -> bool:
         """
@@ -278,30 +374,22 @@ class ControlTasksLogger:
         Returns:
             True, если есть успешная попытка
         """
-        return self.get_successful_attempt(cell_id) is not None
+        stats = self.cell_stats.get(cell_id)
+        return bool(stats and stats["successful_attempts"] > 0)
 
     def get_overall_stats(self) -> Dict[str, Any]:
         """Возвращает общую статистику по всем заданиям."""
-        total_cells = len(self.log_data["cell_stats"])
-        completed_cells = sum(
-            1
-            for stats in self.log_data["cell_stats"].values()
-            if stats["successful_attempts"] > 0
-        )
-        total_attempts = len(self.log_data["attempts"])
-
-        if total_attempts > 0:
-            successful_attempts = sum(
-                1 for a in self.log_data["attempts"] if a["check_result"]["passed"]
-            )
-            success_rate = successful_attempts / total_attempts
-            avg_execution_time = (
-                sum(a["execution_time_ms"] for a in self.log_data["attempts"])
-                / total_attempts
-            )
-        else:
-            success_rate = 0.0
-            avg_execution_time = 0.0
+        with self._lock:
+            total_cells = len(self.cell_stats)
+            completed_cells = self.totals["completed_cells"]
+            total_attempts = self.totals["total_attempts"]
+
+            if total_attempts > 0:
+                success_rate = self.totals["successful_attempts"] / total_attempts
+                avg_execution_time = self.totals["total_execution_time_ms"] / total_attempts
+            else:
+                success_rate = 0.0
+                avg_execution_time = 0.0
 
         return {
             "total_cells": total_cells,
@@ -312,25 +400,42 @@ class ControlTasksLogger:
             "total_attempts": total_attempts,
             "success_rate": success_rate,
             "average_execution_time_ms": avg_execution_time,
-            "log_file_size_kb": os.path.getsize(self.log_file) / 1024
-            if os.path.exists(self.log_file)
-            else 0,
+            "log_file_size_kb": self.store.size_bytes() / 1024,
         }
 
-    def export_stats(self, format: str = "json") -> str:
+    def export_stats(self, format: str = "json", path: Optional[str] = None) -> str:
         """
         Экспортирует статистику в указанном формате.
 
+        Форматы 'parquet' и 'feather' записывают статистику ячеек в файл
+        (колонки CellStats) для загрузки в pandas; попытки целиком выгружает
+        analytics_export.
+
         Args:
-            format: Формат экспорта ('json', 'csv')
+            format: Формат экспорта ('json', 'csv', 'parquet', 'feather')
+            path: Файл для 'parquet'/'feather' (по умолчанию
+                control_tasks_stats.<формат> рядом с хранилищем)
 
         Returns:
-            Строка с данными в указанном формате
+            Строка с данными в указанном формате или путь к файлу
         """
+        if format in ("parquet", "feather"):
+            from analytics_export import CELL_STATS_SCHEMA, FILE_EXTENSIONS, write_table
+
+            if path is None:
+                path = os.path.join(
+                    os.path.dirname(self.store_file) or ".",
+                    f"control_tasks_stats{FILE_EXTENSIONS[format]}",
+                )
+            with self._lock:
+                rows = [dict(stats) for stats in self.cell_stats.values()]
+            write_table(path, CELL_STATS_SCHEMA, rows, format)
+            return str(path)
+
         if format == "json":
             stats_data = {
                 "overall_stats": self.get_overall_stats(),
-                "cell_stats": self.log_data["cell_stats"],
+                "cell_stats": self.cell_stats,
                 "exported_at": datetime.now().isoformat(),
             }
             return json.dumps(stats_data, ensure_ascii=False, indent=2)
@@ -341,7 +446,7 @@ class ControlTasksLogger:
                 "cell_id,total_attempts,successful_attempts,best_score,average_score"
             ]
 
-            for cell_id, stats in self.log_data["cell_stats"].items():
+            for cell_id, stats in self.cell_stats.items():
                 line = f"{cell_id},{stats['total_attempts']},{stats['successful_attempts']},{stats['best_score']:.3f},{stats['average_score']:.3f}"
                 lines.append(line)
 
@@ -357,26 +462,61 @@ class ControlTasksLogger:
         Args:
             cell_id: Идентификатор ячейки
         """
-        # Удаляем попытки
-        self.log_data["attempts"] = [
-            a for a in self.log_data["attempts"] if a["cell_id"] != cell_id
-        ]
-
-        # Удаляем статистику
-        if cell_id in self.log_data["cell_stats"]:
-            del self.log_data["cell_stats"][cell_id]
-
-        # Сохраняем изменения
-        self._save_log_file()
+        # Сначала дописываем очередь, чтобы удаление не обогнала запись попыток
+        flush_log_writer()
+        with self._lock:
+            self._pending = [a for a in self._pending if a["cell_id"] != cell_id]
+
+            # Удаляем статистику и вычитаем её из общих итогов
+            stats = self.cell_stats.pop(cell_id, None)
+            if stats is not None:
+                self.totals["total_attempts"] -= stats["total_attempts"]
+                self.totals["successful_attempts"] -= stats["successful_attempts"]
+                self.totals["total_execution_time_ms"] -= stats["total_execution_time_ms"]
+                if stats["successful_attempts"] > 0:
+                    self.totals["completed_cells"] -= 1
+
+            # Удаляем попытки
+            self.store.delete_cell(cell_id)
 
     def clear_all_data(self):
         """Очищает все данные лога."""
-        self.log_data = self._create_empty_log()
-        self._save_log_file()
+        flush_log_writer()
+        with self._lock:
+            self._pending = []
+            self.cell_stats = {}
+            self.totals = self._create_empty_totals()
+            self.store.clear()
+
+
+# Глобальный экземпляр логгера (учащийся из TEACHAI_LEARNER_ID); в режиме
+# одного учащегося переносится и прежний лог из корня проекта
+default_logger = ControlTasksLogger(
+    legacy_log_files=(
+        [] if get_default_learner_id() else [str(PROJECT_DIR / LOG_FILE_NAME)]
+    )
+)
+
 
+def set_default_learner(learner_id: Optional[str]) -> ControlTasksLogger:
+    """
+    Переключает глобальный логгер на хранилище учащегося.
 
-# Глобальный экземпляр логгера
-default_logger = ControlTasksLogger()
+    Вызывается движком, когда учащийся задан явно, а не через
+    TEACHAI_LEARNER_ID: попытки ячеек попадают в каталог этого учащегося.
+
+    Args:
+        learner_id: ID учащегося (None — режим одного учащегося)
+
+    Returns:
+        ControlTasksLogger: Текущий глобальный логгер
+    """
+    global default_logger
+    log_file = learner_log_file(normalize_learner_id(learner_id))
+    if log_file != default_logger.log_file:
+        flush_log_writer()
+        default_logger = ControlTasksLogger(log_file)
+    return default_logger
 
 
 def log_attempt(
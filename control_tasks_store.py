@@ -0,0 +1,458 @@
+"""
+Хранилище попыток контрольных заданий.
+
+Раньше все попытки лежали одним списком attempts в control_tasks_log.json:
+поиск попыток ячейки перебирал весь список, общая статистика пересчитывалась
+по всем попыткам, а каждая попытка перезаписывала весь файл. Теперь попытки
+хранятся в SQLite по строке на попытку с индексом по cell_id, а статистика
+ячеек — счётчиками по строке на ячейку, которые увеличиваются
+(SET n = n + ?) в той же транзакции, что и вставка попытки. Общие итоги
+суммируются по статистике ячеек. История в десятки тысяч попыток не
+замедляет ячейки.
+
+Хранилище могут одновременно писать несколько kernel одного учащегося:
+статистика считается в SQLite, а не переписывается снимками из памяти
+одного процесса, поэтому попытки одного kernel не затирают попытки другого.
+"""
+
+import os
+import json
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Сколько строк читать за раз при обходе всех попыток
+ITER_BATCH_SIZE = 500
+
+
+_INSERT_ATTEMPT_SQL = (
+    "INSERT INTO attempts (attempt_id, cell_id, timestamp, passed, score,"
+    " execution_time_ms, data) VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+
+# Статистика ячейки увеличивается на одну попытку; в DO UPDATE имена колонок
+# обозначают значения до обновления
+_INCREMENT_STATS_SQL = """
+    INSERT INTO cell_stats (cell_id, total_attempts, successful_attempts,
+        first_success_attempt, last_attempt_timestamp, best_score, score_sum,
+        total_execution_time_ms)
+    VALUES (?, 1, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (cell_id) DO UPDATE SET
+        total_attempts = total_attempts + 1,
+        successful_attempts = successful_attempts + excluded.successful_attempts,
+        first_success_attempt = COALESCE(
+            first_success_attempt,
+            CASE WHEN excluded.successful_attempts > 0 THEN total_attempts + 1 END
+        ),
+        last_attempt_timestamp = excluded.last_attempt_timestamp,
+        best_score = MAX(best_score, excluded.best_score),
+        score_sum = score_sum + excluded.score_sum,
+        total_execution_time_ms = total_execution_time_ms
+            + excluded.total_execution_time_ms
+"""
+
+# Пересчёт статистики ячейки по её попыткам (параметр — cell_id четыре раза)
+_RECOMPUTE_STATS_SQL = """
+    INSERT OR REPLACE INTO cell_stats
+    SELECT cell_id, COUNT(*), SUM(passed),
+        -- без успешных попыток MIN(seq) — NULL, счёт 0, и номер остаётся NULL
+        NULLIF((SELECT COUNT(*) FROM attempts AS a WHERE a.cell_id = ? AND a.seq <= (
+            SELECT MIN(seq) FROM attempts AS p WHERE p.cell_id = ? AND p.passed = 1)), 0),
+        (SELECT timestamp FROM attempts AS l WHERE l.cell_id = ?
+            ORDER BY seq DESC LIMIT 1),
+        COALESCE(MAX(score), 0.0), COALESCE(SUM(score), 0.0),
+        COALESCE(SUM(execution_time_ms), 0.0)
+    FROM attempts WHERE cell_id = ? GROUP BY cell_id
+"""
+
+_UPSERT_STATS_SQL = """
+    INSERT INTO cell_stats (cell_id, total_attempts, successful_attempts,
+        first_success_attempt, last_attempt_timestamp, best_score, score_sum,
+        total_execution_time_ms)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (cell_id) DO UPDATE SET
+        total_attempts = excluded.total_attempts,
+        successful_attempts = excluded.successful_attempts,
+        first_success_attempt = excluded.first_success_attempt,
+        last_attempt_timestamp = excluded.last_attempt_timestamp,
+        best_score = excluded.best_score,
+        score_sum = excluded.score_sum,
+        total_execution_time_ms = excluded.total_execution_time_ms
+"""
+
+_KEEP_FULLER_STATS_SQL = " WHERE excluded.total_attempts > cell_stats.total_attempts"
+
+
+class ControlTaskAttemptStore:
+    """Попытки контрольных заданий в SQLite с индексом по ячейке."""
+
+    def __init__(self, path):
+        """
+        Инициализация хранилища.
+
+        Args:
+            path (str | Path): Путь к SQLite-файлу
+        """
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn = None
+        self.enabled = True
+
+    def _ensure_connection(self, create):
+        """
+        Открывает SQLite-файл при первом обращении.
+
+        Args:
+            create (bool): Создать файл, если его нет (для записи); чтение
+                несуществующего хранилища файл не создаёт
+
+        Returns:
+            bool: True если соединение открыто
+        """
+        if self._conn is not None:
+            return True
+        if not self.enabled or (not create and not self.path.exists()):
+            return False
+        try:
+            self._connect()
+            return True
+        except Exception as e:
+            logger.error(f"Не удалось открыть хранилище попыток {self.path}: {str(e)}")
+            self.enabled = False
+            return False
+
+    def _connect(self):
+        """Открывает SQLite-файл и создаёт таблицы."""
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self._conn = sqlite3.connect(
+            str(self.path), check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS attempts (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                attempt_id TEXT NOT NULL,
+                cell_id TEXT NOT NULL,
+                timestamp TEXT,
+                passed INTEGER NOT NULL,
+                score REAL,
+                execution_time_ms REAL,
+                data TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS attempts_cell ON attempts (cell_id, seq)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS attempts_cell_passed ON attempts (cell_id, passed, seq)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS attempts_id ON attempts (attempt_id)"
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cell_stats (
+                cell_id TEXT PRIMARY KEY,
+                total_attempts INTEGER NOT NULL,
+                successful_attempts INTEGER NOT NULL,
+                first_success_attempt INTEGER,
+                last_attempt_timestamp TEXT,
+                best_score REAL NOT NULL,
+                score_sum REAL NOT NULL,
+                total_execution_time_ms REAL NOT NULL
+            )
+            """
+        )
+
+    @staticmethod
+    def _stats_row(stats):
+        """Строка cell_stats из статистики ячейки (поля CellStats)."""
+        return (
+            stats["cell_id"],
+            stats["total_attempts"],
+            stats["successful_attempts"],
+            stats.get("first_success_attempt"),
+            stats.get("last_attempt_timestamp"),
+            stats.get("best_score") or 0.0,
+            (stats.get("average_score") or 0.0) * stats["total_attempts"],
+            stats.get("total_execution_time_ms") or 0.0,
+        )
+
+    @staticmethod
+    def _attempt_row(attempt):
+        """Строка таблицы attempts для попытки."""
+        check_result = attempt.get("check_result") or {}
+        return (
+            attempt.get("attempt_id", ""),
+            attempt["cell_id"],
+            attempt.get("timestamp"),
+            1 if check_result.get("passed") else 0,
+            check_result.get("score"),
+            attempt.get("execution_time_ms"),
+            json.dumps(attempt, ensure_ascii=False, default=str),
+        )
+
+    def _write(self, statements):
+        """Выполняет изменения одной транзакцией."""
+        with self._lock:
+            if not self._ensure_connection(create=True):
+                return False
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                for sql, params, many in statements:
+                    if many:
+                        self._conn.executemany(sql, params)
+                    else:
+                        self._conn.execute(sql, params)
+                self._conn.execute("COMMIT")
+                return True
+            except Exception as e:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                logger.error(f"Ошибка при записи в хранилище попыток: {str(e)}")
+                return False
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            if not self._ensure_connection(create=False):
+                return []
+            try:
+                return self._conn.execute(sql, params).fetchall()
+            except Exception as e:
+                logger.error(f"Ошибка при чтении хранилища попыток: {str(e)}")
+                return []
+
+    def add_attempts(self, attempts):
+        """
+        Сохраняет пачку попыток и увеличивает статистику их ячеек
+        одной транзакцией.
+
+        Args:
+            attempts (list): Попытки (AttemptLog.to_dict()) в порядке добавления
+
+        Returns:
+            bool: True если сохранено
+        """
+        attempts = [a for a in attempts if a.get("cell_id")]
+        statements = []
+        for attempt in attempts:
+            check_result = attempt.get("check_result") or {}
+            passed = 1 if check_result.get("passed") else 0
+            statements.append((_INSERT_ATTEMPT_SQL, self._attempt_row(attempt), False))
+            statements.append(
+                (
+                    _INCREMENT_STATS_SQL,
+                    (
+                        attempt["cell_id"],
+                        passed,
+                        1 if passed else None,
+                        attempt.get("timestamp"),
+                        check_result.get("score") or 0.0,
+                        check_result.get("score") or 0.0,
+                        attempt.get("execution_time_ms") or 0.0,
+                    ),
+                    False,
+                )
+            )
+        return self._write(statements)
+
+    def import_attempts(self, attempts, cell_stats=None):
+        """
+        Переносит попытки из прежнего лога, пропуская уже сохранённые
+        (по attempt_id), и пересчитывает статистику затронутых ячеек.
+
+        Args:
+            attempts (list): Попытки в порядке добавления
+            cell_stats (dict, optional): Статистика ячеек из прежнего лога;
+                используется для ячеек, где она полнее перенесённых попыток
+                (часть попыток могла уйти в удалённые архивные сегменты)
+
+        Returns:
+            int | None: Число перенесённых попыток или None при ошибке
+        """
+        with self._lock:
+            if not self._ensure_connection(create=True):
+                return None
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                known = {
+                    attempt_id
+                    for (attempt_id,) in self._conn.execute(
+                        "SELECT attempt_id FROM attempts"
+                    )
+                }
+                new = []
+                for attempt in attempts:
+                    attempt_id = attempt.get("attempt_id", "")
+                    if attempt.get("cell_id") and attempt_id not in known:
+                        known.add(attempt_id)
+                        new.append(self._attempt_row(attempt))
+                self._conn.executemany(_INSERT_ATTEMPT_SQL, new)
+                cell_ids = {row[1] for row in new} | set(cell_stats or ())
+                self._conn.executemany(
+                    _RECOMPUTE_STATS_SQL, [(cell_id,) * 4 for cell_id in cell_ids]
+                )
+                self._conn.executemany(
+                    _UPSERT_STATS_SQL + _KEEP_FULLER_STATS_SQL,
+                    [
+                        self._stats_row(dict(stats, cell_id=cell_id))
+                        for cell_id, stats in (cell_stats or {}).items()
+                    ],
+                )
+                self._conn.execute("COMMIT")
+                return len(new)
+            except Exception as e:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                logger.error(f"Ошибка при переносе попыток в хранилище: {str(e)}")
+                return None
+
+    def delete_cell(self, cell_id):
+        """
+        Удаляет попытки и статистику ячейки.
+
+        Args:
+            cell_id (str): Идентификатор ячейки
+        """
+        self._write(
+            [
+                ("DELETE FROM attempts WHERE cell_id = ?", (cell_id,), False),
+                ("DELETE FROM cell_stats WHERE cell_id = ?", (cell_id,), False),
+            ]
+        )
+
+    def clear(self):
+        """Удаляет все попытки и статистику."""
+        self._write(
+            [
+                ("DELETE FROM attempts", (), False),
+                ("DELETE FROM cell_stats", (), False),
+            ]
+        )
+
+    def load_cell_stats(self):
+        """
+        Статистика всех ячеек.
+
+        Returns:
+            dict: cell_id -> статистика (поля CellStats)
+        """
+        return {
+            row[0]: {
+                "cell_id": row[0],
+                "total_attempts": row[1],
+                "successful_attempts": row[2],
+                "first_success_attempt": row[3],
+                "last_attempt_timestamp": row[4],
+                "best_score": row[5],
+                "average_score": row[6] / row[1] if row[1] else 0.0,
+                "total_execution_time_ms": row[7],
+            }
+            for row in self._query(
+                "SELECT cell_id, total_attempts, successful_attempts,"
+                " first_success_attempt, last_attempt_timestamp, best_score,"
+                " score_sum, total_execution_time_ms FROM cell_stats"
+            )
+        }
+
+    def load_totals(self):
+        """
+        Общие итоги по статистике ячеек.
+
+        Returns:
+            dict: total_attempts, successful_attempts, total_execution_time_ms
+                и completed_cells
+        """
+        rows = self._query(
+            "SELECT COALESCE(SUM(total_attempts), 0),"
+            " COALESCE(SUM(successful_attempts), 0),"
+            " COALESCE(SUM(total_execution_time_ms), 0.0),"
+            " COUNT(CASE WHEN successful_attempts > 0 THEN 1 END) FROM cell_stats"
+        )
+        total_attempts, successful, execution_time, completed = (
+            rows[0] if rows else (0, 0, 0.0, 0)
+        )
+        return {
+            "total_attempts": total_attempts,
+            "successful_attempts": successful,
+            "total_execution_time_ms": float(execution_time),
+            "completed_cells": completed,
+        }
+
+    def count_attempts(self):
+        """Число сохранённых попыток."""
+        rows = self._query("SELECT COUNT(*) FROM attempts")
+        return rows[0][0] if rows else 0
+
+    def get_cell_attempts(self, cell_id):
+        """
+        Попытки ячейки в порядке добавления.
+
+        Args:
+            cell_id (str): Идентификатор ячейки
+
+        Returns:
+            list: Попытки
+        """
+        rows = self._query(
+            "SELECT data FROM attempts WHERE cell_id = ? ORDER BY seq", (cell_id,)
+        )
+        return [json.loads(data) for (data,) in rows]
+
+    def get_last_attempt(self, cell_id):
+        """Последняя попытка ячейки или None."""
+        rows = self._query(
+            "SELECT data FROM attempts WHERE cell_id = ? ORDER BY seq DESC LIMIT 1",
+            (cell_id,),
+        )
+        return json.loads(rows[0][0]) if rows else None
+
+    def get_first_successful_attempt(self, cell_id):
+        """Первая успешная попытка ячейки или None."""
+        rows = self._query(
+            "SELECT data FROM attempts WHERE cell_id = ? AND passed = 1 ORDER BY seq LIMIT 1",
+            (cell_id,),
+        )
+        return json.loads(rows[0][0]) if rows else None
+
+    def iter_attempts(self):
+        """
+        Обходит все попытки в порядке добавления, читая их пачками.
+
+        Yields:
+            dict: Попытка
+        """
+        last_seq = 0
+        while True:
+            rows = self._query(
+                "SELECT seq, data FROM attempts WHERE seq > ? ORDER BY seq LIMIT ?",
+                (last_seq, ITER_BATCH_SIZE),
+            )
+            if not rows:
+                return
+            for seq, data in rows:
+                yield json.loads(data)
+            last_seq = rows[-1][0]
+
+    def size_bytes(self):
+        """Размер файлов хранилища на диске (с журналом WAL)."""
+        total = 0
+        for suffix in ("", "-wal"):
+            try:
+                total += os.path.getsize(str(self.path) + suffix)
+            except OSError:
+                continue
+        return total
+
+    def close(self):
+        """Закрывает соединение с SQLite (повторное обращение откроет его снова)."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
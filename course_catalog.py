@@ -0,0 +1,224 @@
+"""
+Каталог курсов.
+
+Раньше courses.json открывался и разбирался заново при каждом обращении,
+а курс по ID искался перебором списка. Каталог загружается один раз и
+индексируется по ID и ключевым словам; файл перечитывается, только если
+изменились его время изменения или размер (проверка — os.stat).
+
+Курсы могут лежать в нескольких файлах: к courses.json добавляются все
+*.json из каталога courses.d/ (в порядке имён) и файлы из
+COURSE_CATALOG_PATHS. Формат каждого файла — как у courses.json
+({"courses": [...]}). Курс с уже встречавшимся ID заменяет прежний
+(так можно переопределить курс из courses.json), сохраняя его место
+в списке.
+
+Настройки (переменные окружения / .env):
+    COURSE_CATALOG_PATHS — дополнительные файлы или каталоги каталога
+        курсов через os.pathsep (";" в Windows, ":" в остальных ОС)
+"""
+
+import os
+import re
+import json
+import logging
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CATALOG_FILE = "courses.json"
+DEFAULT_CATALOG_DIR = "courses.d"
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _words(text):
+    """Слова текста в нижнем регистре."""
+    return _WORD_RE.findall(str(text or "").lower())
+
+
+class CourseCatalog:
+    """Каталог курсов из одного или нескольких JSON-файлов."""
+
+    def __init__(self, sources):
+        """
+        Инициализация каталога.
+
+        Args:
+            sources (list[Path]): Файлы каталога и каталоги с *.json
+        """
+        self.sources = [Path(source) for source in sources]
+        self._lock = threading.Lock()
+        self._files = {}  # путь -> ((mtime_ns, size), список курсов)
+        self._signature = None
+        self._courses = []
+        self._by_id = {}
+        self._by_word = {}  # слово -> набор ID курсов
+
+    def _catalog_files(self):
+        """Файлы каталога в порядке приоритета (последний важнее)."""
+        files = []
+        for source in self.sources:
+            if source.is_dir():
+                files.extend(sorted(source.glob("*.json")))
+            elif source.exists():
+                files.append(source)
+        return files
+
+    def _refresh(self):
+        """Перечитывает изменившиеся файлы и перестраивает индексы при изменениях."""
+        files = self._catalog_files()
+        stats = []
+        for path in files:
+            try:
+                stat = path.stat()
+                stats.append((path, (stat.st_mtime_ns, stat.st_size)))
+            except OSError:
+                continue
+        signature = tuple((str(path), stamp) for path, stamp in stats)
+        if signature == self._signature:
+            return
+
+        loaded = {}
+        for path, stamp in stats:
+            cached = self._files.get(path)
+            if cached is not None and cached[0] == stamp:
+                loaded[path] = cached
+                continue
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    courses = json.load(f).get("courses", [])
+                loaded[path] = (stamp, courses)
+                logger.debug(f"Каталог курсов загружен: {path} ({len(courses)} курсов)")
+            except Exception as e:
+                logger.error(f"Ошибка при загрузке каталога курсов {path}: {str(e)}")
+                # Битый файл не должен скрывать курсы из остальных файлов
+                loaded[path] = (stamp, cached[1] if cached else [])
+
+        self._files = loaded
+        self._signature = signature
+        self._build_indexes([loaded[path][1] for path, _ in stats])
+
+    def _build_indexes(self, course_lists):
+        """Строит список курсов и индексы по ID и словам."""
+        positions = {}
+        courses = []
+        for course_list in course_lists:
+            for course in course_list:
+                course_id = course.get("id") if isinstance(course, dict) else None
+                if not course_id:
+                    continue
+                if course_id in positions:
+                    courses[positions[course_id]] = course
+                else:
+                    positions[course_id] = len(courses)
+                    courses.append(course)
+
+        by_word = {}
+        for course in courses:
+            words = set(_words(course.get("title")))
+            for keyword in course.get("keywords", []) or []:
+                words.update(_words(keyword))
+            for word in words:
+                by_word.setdefault(word, set()).add(course["id"])
+
+        self._courses = courses
+        self._by_id = {course["id"]: course for course in courses}
+        self._by_word = by_word
+
+    def get_all(self):
+        """
+        Все курсы каталога.
+
+        Returns:
+            list: Курсы в порядке файлов каталога
+        """
+        with self._lock:
+            self._refresh()
+            return self._courses
+
+    def get(self, course_id):
+        """
+        Курс по ID.
+
+        Args:
+            course_id (str): Идентификатор курса
+
+        Returns:
+            dict | None: Данные курса или None, если курс не найден
+        """
+        with self._lock:
+            self._refresh()
+            return self._by_id.get(course_id)
+
+    def search(self, query, limit=None):
+        """
+        Ищет курсы по словам названия и ключевым словам.
+
+        Слово запроса совпадает со словом курса, если является его началом
+        («финанс» найдёт «финансы»). Курсы упорядочены по числу совпавших слов.
+
+        Args:
+            query (str): Поисковый запрос
+            limit (int, optional): Максимальное число результатов
+
+        Returns:
+            list: Найденные курсы (пустой запрос — все курсы)
+        """
+        with self._lock:
+            self._refresh()
+            query_words = _words(query)
+            if not query_words:
+                return self._courses[:limit] if limit else list(self._courses)
+
+            scores = {}
+            for query_word in query_words:
+                matched = set(self._by_word.get(query_word, ()))
+                if len(query_word) >= 2:
+                    for word, course_ids in self._by_word.items():
+                        if word.startswith(query_word):
+                            matched.update(course_ids)
+                for course_id in matched:
+                    scores[course_id] = scores.get(course_id, 0) + 1
+
+            order = {course["id"]: i for i, course in enumerate(self._courses)}
+            found = sorted(
+                scores, key=lambda course_id: (-scores[course_id], order[course_id])
+            )
+            if limit:
+                found = found[:limit]
+            return [self._by_id[course_id] for course_id in found]
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_course_catalog(project_dir):
+    """
+    Возвращает общий каталог курсов проекта.
+
+    Args:
+        project_dir (str | Path): Каталог проекта (с courses.json)
+
+    Returns:
+        CourseCatalog: Каталог курсов
+    """
+    project_dir = Path(project_dir)
+    sources = [project_dir / DEFAULT_CATALOG_FILE, project_dir / DEFAULT_CATALOG_DIR]
+    for extra in (os.getenv("COURSE_CATALOG_PATHS") or "").split(os.pathsep):
+        extra = extra.strip()
+        if extra:
+            extra_path = Path(extra)
+            sources.append(
+                extra_path if extra_path.is_absolute() else project_dir / extra_path
+            )
+
+    key = tuple(str(source) for source in sources)
+    with _catalogs_lock:
+        catalog = _catalogs.get(key)
+        if catalog is None:
+            catalog = CourseCatalog(sources)
+            _catalogs[key] = catalog
+        return catalog
@@ -4,9 +4,11 @@
 РЕФАКТОРИНГ: Выделен из state_manager.py для лучшей модульности
 """
 
-import json
 import logging
 
+from course_catalog import get_course_catalog
+from course_plan_index import get_course_plan_index
+
 
 class CourseDataManager:
     """Менеджер данных курсов."""
@@ -33,6 +35,11 @@ class CourseDataManager:
         """
         try:
             self.state_manager.state["course_plan"] = course_plan
+            # Индекс уроков строится сразу, а не на первом нажатии
+            get_course_plan_index(course_plan)
+            # Новый план — новый набор уроков: итоги прогресса пересчитываются
+            self.state_manager.learning_progress.rebuild_progress_totals()
+            self.state_manager.learning_progress._recalculate_course_statistics()
 
             course_title = course_plan.get("title", "Неизвестный курс")
             self.logger.info(f"Учебный план для курса '{course_title}' сохранен")
@@ -62,9 +69,27 @@ class CourseDataManager:
                 "sections": [],
             }
 
+    def get_plan_index(self):
+        """
+        Возвращает индекс текущего плана курса.
+
+        Returns:
+            CoursePlanIndex: Индекс уроков (пустой, если плана нет)
+        """
+        return get_course_plan_index(self.get_course_plan())
+
+    def get_course_catalog(self):
+        """
+        Возвращает каталог курсов (courses.json и дополнительные файлы).
+
+        Returns:
+            CourseCatalog: Каталог курсов
+        """
+        return get_course_catalog(self.state_manager.project_dir)
+
     def get_course_by_id(self, course_id):
         """
-        Загружает информацию о курсе из файла courses.json.
+        Возвращает информацию о курсе из каталога курсов.
 
         Args:
             course_id (str): Идентификатор курса
@@ -73,14 +98,10 @@ class CourseDataManager:
             dict: Данные о курсе или None, если курс не найден
         """
         try:
-            courses_file = self.state_manager.project_dir / "courses.json"
-            with open(courses_file, "r", encoding="utf-8") as f:
-                courses_data = json.load(f)
-
-            for course in courses_data["courses"]:
-                if course["id"] == course_id:
-                    self.logger.debug(f"Найден курс: {course_id}")
-                    return course
+            course = self.get_course_catalog().get(course_id)
+            if course is not None:
+                self.logger.debug(f"Найден курс: {course_id}")
+                return course
 
             self.logger.warning(f"Курс с ID '{course_id}' не найден")
             return None
@@ -90,23 +111,36 @@ class CourseDataManager:
 
     def get_all_courses(self):
         """
-        Загружает список всех доступных курсов из файла courses.json.
+        Возвращает список всех доступных курсов из каталога курсов.
 
         Returns:
             list: Список курсов или пустой список в случае ошибки
         """
         try:
-            courses_file = self.state_manager.project_dir / "courses.json"
-            with open(courses_file, "r", encoding="utf-8") as f:
-                courses_data = json.load(f)
-
-            courses_count = len(courses_data["courses"])
-            self.logger.debug(f"Загружено {courses_count} курсов")
-            return courses_data["courses"]
+            courses = self.get_course_catalog().get_all()
+            self.logger.debug(f"Загружено {len(courses)} курсов")
+            return courses
         except Exception as e:
             self.logger.error(f"Ошибка при загрузке списка курсов: {str(e)}")
             return []
 
+    def search_courses(self, query, limit=None):
+        """
+        Ищет курсы по названию и ключевым словам.
+
+        Args:
+            query (str): Поисковый запрос
+            limit (int, optional): Максимальное число результатов
+
+        Returns:
+            list: Найденные курсы или пустой список в случае ошибки
+        """
+        try:
+            return self.get_course_catalog().search(query, limit=limit)
+        except Exception as e:
+            self.logger.error(f"Ошибка при поиске курсов: {str(e)}")
+            return []
+
     def get_next_lesson(self):
         """
         ИСПРАВЛЕНО: Определяет следующий урок с проверкой завершенности текущего.
@@ -184,6 +218,31 @@ class CourseDataManager:
             self.logger.error(f"Ошибка при определении следующего урока: {str(e)}")
             return None, None, None, None
 
+    def get_lesson_after(self, section_id, topic_id, lesson_id):
+        """
+        Определяет урок, идущий в плане курса сразу после указанного.
+
+        В отличие от get_next_lesson не учитывает прогресс: используется
+        фоновой предзагрузкой, пока пользователь читает текущий урок.
+
+        Args:
+            section_id (str): ID раздела
+            topic_id (str): ID темы
+            lesson_id (str): ID урока
+
+        Returns:
+            tuple: (section_id, topic_id, lesson_id, lesson_data) или None, если урок последний
+        """
+        try:
+            entry = self.get_plan_index().next_after(section_id, topic_id, lesson_id)
+            if entry is None:
+                return None
+            return entry.section_id, entry.topic_id, entry.lesson_id, entry.lesson
+
+        except Exception as e:
+            self.logger.error(f"Ошибка при определении урока после {lesson_id}: {str(e)}")
+            return None
+
     def _get_first_lesson_from_plan(self, course_plan):
         """
         Получает первый урок из плана курса.
@@ -195,26 +254,11 @@ class CourseDataManager:
             tuple: (section_id, topic_id, lesson_id, lesson_data) или (None, None, None, None)
         """
         try:
-            # Получаем первый раздел
-            first_section = course_plan["sections"][0]
-            if not first_section.get("topics"):
-                self.logger.warning(f"Раздел {first_section.get('id')} не содержит тем")
+            entry = get_course_plan_index(course_plan).first()
+            if entry is None:
+                self.logger.warning("План курса не содержит уроков")
                 return None, None, None, None
-
-            # Получаем первую тему
-            first_topic = first_section["topics"][0]
-            if not first_topic.get("lessons"):
-                self.logger.warning(f"Тема {first_topic.get('id')} не содержит уроков")
-                return None, None, None, None
-
-            # Получаем первый урок
-            first_lesson = first_topic["lessons"][0]
-            return (
-                first_section["id"],
-                first_topic["id"],
-                first_lesson["id"],
-                first_lesson,
-            )
+            return entry.section_id, entry.topic_id, entry.lesson_id, entry.lesson
 
         except Exception as e:
             self.logger.error(f"Ошибка при получении первого урока: {str(e)}")
@@ -234,97 +278,19 @@ class CourseDataManager:
             tuple: (section_id, topic_id, lesson_id, lesson_data) или None
         """
         try:
-            # Ищем текущее положение в курсе
-            for section in course_plan["sections"]:
-                if section["id"] == current_section:
-                    # Проверяем наличие тем в разделе
-                    if not section.get("topics"):
-                        self.logger.warning(f"Раздел {section['id']} не содержит тем")
-                        continue
-
-                    for topic in section["topics"]:
-                        if topic["id"] == current_topic:
-                            # Проверяем наличие уроков в теме
-                            if not topic.get("lessons"):
-                                self.logger.warning(
-                                    f"Тема {topic['id']} не содержит уроков"
-                                )
-                                continue
-
-                            # Ищем текущий урок и определяем следующий
-                            for i, lesson in enumerate(topic["lessons"]):
-                                if lesson["id"] == current_lesson:
-                                    # Если есть еще уроки в текущей теме
-                                    if i < len(topic["lessons"]) - 1:
-                                        next_lesson = topic["lessons"][i + 1]
-                                        return (
-                                            section["id"],
-                                            topic["id"],
-                                            next_lesson["id"],
-                                            next_lesson,
-                                        )
-
-                                    # Если уроки в теме закончились, ищем следующую тему
-                                    topic_index = section["topics"].index(topic)
-                                    if topic_index < len(section["topics"]) - 1:
-                                        next_topic = section["topics"][topic_index + 1]
-
-                                        # Проверяем наличие уроков в следующей теме
-                                        if not next_topic.get("lessons"):
-                                            self.logger.warning(
-                                                f"Тема {next_topic['id']} не содержит уроков"
-                                            )
-                                            return None
-
-                                        next_lesson = next_topic["lessons"][0]
-                                        return (
-                                            section["id"],
-                                            next_topic["id"],
-                                            next_lesson["id"],
-                                            next_lesson,
-                                        )
-
-                                    # Если темы в разделе закончились, ищем следующий раздел
-                                    section_index = course_plan["sections"].index(
-                                        section
-                                    )
-                                    if section_index < len(course_plan["sections"]) - 1:
-                                        next_section = course_plan["sections"][
-                                            section_index + 1
-                                        ]
-
-                                        # Проверяем наличие тем в следующем разделе
-                                        if not next_section.get("topics"):
-                                            self.logger.warning(
-                                                f"Раздел {next_section['id']} не содержит тем"
-                                            )
-                                            return None
-
-                                        next_topic = next_section["topics"][0]
-
-                                        # Проверяем наличие уроков в первой теме следующего раздела
-                                        if not next_topic.get("lessons"):
-                                            self.logger.warning(
-                                                f"Тема {next_topic['id']} не содержит уроков"
-                                            )
-                                            return None
-
-                                        next_lesson = next_topic["lessons"][0]
-                                        return (
-                                            next_section["id"],
-                                            next_topic["id"],
-                                            next_lesson["id"],
-                                            next_lesson,
-                                        )
-
-                                    # Если все разделы закончились, курс завершен
-                                    return None
-
-            # Если текущее положение не найдено, возвращаем первый урок
-            self.logger.warning(
-                "Текущее положение в курсе не найдено, возвращаем первый урок"
-            )
-            return self._get_first_lesson_from_plan(course_plan)
+            index = get_course_plan_index(course_plan)
+            if index.get(current_section, current_topic, current_lesson) is None:
+                # Если текущее положение не найдено, возвращаем первый урок
+                self.logger.warning(
+                    "Текущее положение в курсе не найдено, возвращаем первый урок"
+                )
+                return self._get_first_lesson_from_plan(course_plan)
+
+            # Если все уроки закончились, курс завершен
+            entry = index.next_after(current_section, current_topic, current_lesson)
+            if entry is None:
+                return None
+            return entry.section_id, entry.topic_id, entry.lesson_id, entry.lesson
 
         except Exception as e:
             self.logger.error(f"Ошибка при поиске следующего урока: {str(e)}")
@@ -343,32 +309,10 @@ class CourseDataManager:
             dict: Данные урока или None, если урок не найден
         """
         try:
-            course_plan = self.state_manager.state["course_plan"]
-
-            for section in course_plan["sections"]:
-                if section["id"] == section_id:
-                    # Проверяем наличие тем в разделе
-                    if "topics" not in section:
-                        self.logger.warning(
-                            f"Раздел {section_id} не содержит ключа 'topics'"
-                        )
-                        continue
-
-                    for topic in section["topics"]:
-                        if topic["id"] == topic_id:
-                            # Проверяем наличие уроков в теме
-                            if "lessons" not in topic:
-                                self.logger.warning(
-                                    f"Тема {topic_id} не содержит ключа 'lessons'"
-                                )
-                                continue
-
-                            for lesson in topic["lessons"]:
-                                if lesson["id"] == lesson_id:
-                                    self.logger.debug(
-                                        f"Найден урок: {section_id}:{topic_id}:{lesson_id}"
-                                    )
-                                    return lesson
+            lesson = self.get_plan_index().lesson(section_id, topic_id, lesson_id)
+            if lesson is not None:
+                self.logger.debug(f"Найден урок: {section_id}:{topic_id}:{lesson_id}")
+                return lesson
 
             self.logger.warning(
                 f"Урок не найден: section={section_id}, topic={topic_id}, lesson={lesson_id}"
@@ -131,7 +131,7 @@ class CoursePlanGenerator(BaseContentGenerator):
         Создай детальный учебный план для курса:
 
         Название курса: {course_data["title"]}
-        Описание курса: {course_data["description"]}
+        Описание курса: {self.prompt_budget.fit("outline", course_data["description"])}
 
         Общее время обучения: {total_study_hours} часов
         Длительность одного занятия: {lesson_duration_minutes} минут
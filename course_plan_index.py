@@ -0,0 +1,160 @@
+"""
+Индекс плана курса.
+
+План курса — вложенные списки разделы → темы → уроки, и раньше поиск урока,
+названий и следующего урока каждый раз проходил их вложенными циклами
+(по нескольку раз на одно нажатие). Индекс строится по плану один раз и
+даёт по ключу (section_id, topic_id, lesson_id) данные урока, его раздел
+и тему, линейную позицию в курсе и ссылки на предыдущий и следующий урок.
+
+Индекс привязан к объекту плана: get_course_plan_index(course_plan)
+строит его при первом обращении и возвращает готовый, пока в состоянии
+лежит тот же план (save_course_plan и загрузка состояния подставляют новый
+объект — и индекс перестраивается).
+
+Поэтому план нельзя менять на месте (добавлять или удалять разделы, темы
+и уроки в том же словаре): индекс такого плана устареет. Изменённый план
+сохраняется как новый объект через save_course_plan.
+"""
+
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+
+logger = logging.getLogger(__name__)
+
+# Сколько разных планов держать в кэше индексов
+INDEX_CACHE_SIZE = 4
+
+LessonEntry = namedtuple(
+    "LessonEntry",
+    ["section_id", "topic_id", "lesson_id", "section", "topic", "lesson", "position"],
+)
+LessonEntry.__doc__ = (
+    "Урок в индексе: ID, словари раздела, темы и урока, позиция в курсе."
+)
+
+
+class CoursePlanIndex:
+    """Индекс уроков плана курса в порядке прохождения."""
+
+    def __init__(self, course_plan):
+        """
+        Строит индекс.
+
+        Args:
+            course_plan (dict): План курса
+        """
+        self.course_plan = course_plan
+        self.sections = {}  # section_id -> раздел
+        self.topics = {}  # (section_id, topic_id) -> тема
+        self.entries = []  # LessonEntry в порядке прохождения
+        self._by_key = {}  # (section_id, topic_id, lesson_id) -> LessonEntry
+
+        for section in (course_plan or {}).get("sections") or []:
+            section_id = section.get("id")
+            if not section_id:
+                continue
+            self.sections.setdefault(section_id, section)
+            for topic in section.get("topics") or []:
+                topic_id = topic.get("id")
+                if not topic_id:
+                    continue
+                self.topics.setdefault((section_id, topic_id), topic)
+                for lesson in topic.get("lessons") or []:
+                    lesson_id = lesson.get("id")
+                    key = (section_id, topic_id, lesson_id)
+                    if not lesson_id or key in self._by_key:
+                        continue
+                    entry = LessonEntry(
+                        section_id,
+                        topic_id,
+                        lesson_id,
+                        section,
+                        topic,
+                        lesson,
+                        len(self.entries),
+                    )
+                    self.entries.append(entry)
+                    self._by_key[key] = entry
+
+    @property
+    def total(self):
+        """Число уроков в курсе."""
+        return len(self.entries)
+
+    def get(self, section_id, topic_id, lesson_id):
+        """
+        Урок по ID.
+
+        Returns:
+            LessonEntry | None: Запись урока или None, если урока нет в плане
+        """
+        return self._by_key.get((section_id, topic_id, lesson_id))
+
+    def lesson(self, section_id, topic_id, lesson_id):
+        """Данные урока (словарь из плана) или None."""
+        entry = self._by_key.get((section_id, topic_id, lesson_id))
+        return entry.lesson if entry else None
+
+    def section(self, section_id):
+        """Раздел по ID или None."""
+        return self.sections.get(section_id)
+
+    def topic(self, section_id, topic_id):
+        """Тема по ID или None."""
+        return self.topics.get((section_id, topic_id))
+
+    def first(self):
+        """Первый урок курса или None."""
+        return self.entries[0] if self.entries else None
+
+    def next_after(self, section_id, topic_id, lesson_id):
+        """Урок, следующий за указанным, или None (урок последний или не найден)."""
+        entry = self.get(section_id, topic_id, lesson_id)
+        if entry is None or entry.position + 1 >= len(self.entries):
+            return None
+        return self.entries[entry.position + 1]
+
+    def previous_before(self, section_id, topic_id, lesson_id):
+        """Урок, предшествующий указанному, или None."""
+        entry = self.get(section_id, topic_id, lesson_id)
+        if entry is None or entry.position == 0:
+            return None
+        return self.entries[entry.position - 1]
+
+    def lesson_keys(self):
+        """Полные ключи уроков "section_id:topic_id:lesson_id" в порядке прохождения."""
+        return [f"{e.section_id}:{e.topic_id}:{e.lesson_id}" for e in self.entries]
+
+
+_index_cache = OrderedDict()  # id(course_plan) -> CoursePlanIndex
+_index_lock = threading.Lock()
+
+
+def get_course_plan_index(course_plan):
+    """
+    Возвращает индекс плана курса, строя его при первом обращении.
+
+    Args:
+        course_plan (dict): План курса
+
+    Returns:
+        CoursePlanIndex: Индекс этого плана
+    """
+    key = id(course_plan)
+    with _index_lock:
+        index = _index_cache.get(key)
+        # Индекс держит ссылку на план, так что id не достанется другому объекту
+        if index is not None and index.course_plan is course_plan:
+            _index_cache.move_to_end(key)
+            return index
+
+    index = CoursePlanIndex(course_plan)
+    with _index_lock:
+        _index_cache[key] = index
+        _index_cache.move_to_end(key)
+        while len(_index_cache) > INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    logger.debug(f"Индекс плана курса построен: {index.total} уроков")
+    return index
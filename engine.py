@@ -15,6 +15,18 @@ from content_generator import ContentGenerator
 from assessment import Assessment
 from logger import Logger
 from interface import UserInterface, InterfaceState
+from llm_transport import close_shared_clients
+from lesson_prefetcher import shutdown_lesson_prefetcher
+from lesson_artifacts import shutdown_artifact_executor
+from log_writer import shutdown_log_writer
+from log_rotation import RotatingLogHandler, apply_log_retention
+from learner_namespace import (
+    LEARNERS_DIR,
+    get_default_learner_id,
+    normalize_learner_id,
+    StateLockError,
+)
+from control_tasks_logger import set_default_learner
 
 # Импортируем новые компоненты для улучшения UX
 from startup_dashboard import StartupDashboard
@@ -23,12 +35,30 @@ from loading_indicators import LoadingManager
 class TeachAIEngine:
     """Основной класс системы TeachAI, который координирует все компоненты."""
     
-    def __init__(self):
-        """Инициализация системы TeachAI."""
+    def __init__(self, learner_id=None):
+        """
+        Инициализация системы TeachAI.
+
+        Args:
+            learner_id (str, optional): ID учащегося — своё состояние для
+                каждого учащегося одной установки (по умолчанию
+                TEACHAI_LEARNER_ID; без него — общее состояние data/state.json)
+        """
+        self.learner_id = normalize_learner_id(learner_id) or get_default_learner_id()
+        # Журналы учащегося (и teachai.log) — в его каталоге logs/learners/<id>/
+        self.log_dir = (
+            os.path.join("logs", LEARNERS_DIR, self.learner_id) if self.learner_id else "logs"
+        )
+
         # Настраиваем базовый логгер
         self._setup_logging()
         self.logger = logging.getLogger(__name__)
         self.logger.info("Инициализация TeachAI...")
+
+        if self.learner_id:
+            self.logger.info(f"Учащийся: {self.learner_id}")
+        # Попытки контрольных заданий пишутся в каталог этого учащегося
+        set_default_learner(self.learner_id)
         
         # Инициализируем компоненты
         self.config_manager = None
@@ -45,10 +75,24 @@ class TeachAIEngine:
         # Флаг готовности системы
         self.is_ready = False
     
+    def _create_state_manager(self):
+        """
+        Создаёт менеджер состояния текущего учащегося.
+
+        Raises:
+            StateLockError: Состояние учащегося открыто в другом kernel
+        """
+        try:
+            return StateManager(learner_id=self.learner_id)
+        except StateLockError:
+            print("\n❌ ОШИБКА: TeachAI с этим учащимся уже запущен в другом kernel!")
+            print("🔧 Закройте другой notebook (или перезапустите его kernel) и повторите запуск")
+            raise
+
     def _setup_logging(self):
         """Настраивает базовый логгер для системы."""
         # Создаем директорию для логов, если она не существует
-        Path("logs").mkdir(exist_ok=True)
+        Path(self.log_dir).mkdir(exist_ok=True, parents=True)
         
         # Настраиваем формат логов
         log_format = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
@@ -56,8 +100,13 @@ class TeachAIEngine:
             level=logging.INFO,
             format=log_format,
             handlers=[
-                # Явно указываем кодировку UTF-8 для файлового логгера
-                logging.FileHandler("logs/teachai.log", mode="a", encoding="utf-8")
+                # Явно указываем кодировку UTF-8 для файлового логгера;
+                # при превышении LOG_MAX_MB файл ротируется (см. log_rotation).
+                # У каждого учащегося свой файл: kernel разных учащихся не
+                # ротируют журнал друг друга
+                RotatingLogHandler(
+                    os.path.join(self.log_dir, "teachai.log"), encoding="utf-8"
+                )
                 # Убираем StreamHandler для чистого интерфейса
             ]
         )
@@ -123,11 +172,15 @@ class TeachAIEngine:
             
             # Инициализируем менеджер состояния
             self.logger.info("Создание StateManager...")
-            self.state_manager = StateManager()
+            self.state_manager = self._create_state_manager()
             
             # Инициализируем логгер системы
             self.logger.info("Создание Logger...")
-            self.system_logger = Logger()
+            self.system_logger = Logger(self.log_dir)
+
+            # Ротируем выросшие за прошлые сеансы журналы, удаляем старые
+            # сегменты — только свои: журналы других учащихся пишут их kernel
+            apply_log_retention(self.log_dir, "debug_responses")
             
             # Инициализируем менеджер загрузки
             self.logger.info("Создание LoadingManager...")
@@ -281,7 +334,7 @@ class TeachAIEngine:
             
             # Инициализируем менеджер состояния
             if not self.state_manager:
-                self.state_manager = StateManager()
+                self.state_manager = self._create_state_manager()
             
             # Инициализируем дашборд, если он еще не создан
             if not self.startup_dashboard:
@@ -330,7 +383,7 @@ class TeachAIEngine:
                 return False
             
             # Инициализируем менеджер состояния
-            self.state_manager = StateManager()
+            self.state_manager = self._create_state_manager()
             
             # Инициализируем дашборд, если он еще не создан
             if not self.startup_dashboard:
@@ -411,9 +464,9 @@ class TeachAIEngine:
         try:
             self.logger.info("Завершение работы TeachAI...")
             
-            # Сохраняем текущее состояние
+            # Дописываем отложенные изменения состояния
             if self.state_manager:
-                self.state_manager.save_state()
+                self.state_manager.shutdown()
             
             # Логируем завершение работы
             if self.system_logger:
@@ -422,6 +475,26 @@ class TeachAIEngine:
                     details={}
                 )
             
+            # Статистика хранилища уроков и кэша ответов LLM за сеанс
+            if self.state_manager:
+                self.logger.info(
+                    f"Хранилище уроков: {self.state_manager.get_lesson_cache_stats()}"
+                )
+            if self.content_generator:
+                self.logger.info(
+                    f"Кэш ответов LLM: {self.content_generator.get_cache_stats()}"
+                )
+            
+            # Останавливаем фоновую предзагрузку до закрытия пула соединений
+            shutdown_lesson_prefetcher()
+            shutdown_artifact_executor()
+
+            # Закрываем общий пул соединений с LLM API
+            close_shared_clients()
+
+            # Дописываем очередь журналов на диск
+            shutdown_log_writer()
+            
             self.logger.info("Система успешно завершила работу")
             return True
             
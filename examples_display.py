@@ -14,6 +14,7 @@ from typing import Any, Dict, List
 
 import ipywidgets as widgets
 
+from content_utils import CODE_EXEC_LOCK
 from examples_code_fixes import sanitize_examples
 from examples_html_utils import is_stub_only_description, looks_like_python_code
 
@@ -36,7 +37,7 @@ def _create_fallback_code_widget(code: str) -> widgets.VBox:
         with output:
             buffer = io.StringIO()
             try:
-                with redirect_stdout(buffer):
+                with CODE_EXEC_LOCK, redirect_stdout(buffer):
                     exec(code_area.value, {})
                 text = buffer.getvalue()
                 if text.strip():
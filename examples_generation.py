@@ -61,7 +61,6 @@ class ExamplesGeneration(BaseContentGenerator):
             content_for_prompt = self.prepare_lesson_text_for_analysis(
                 lesson_content,
                 course_context=course_context,
-                max_chars=6000,
                 lesson_title=lesson_title,
             )
 
@@ -100,7 +99,11 @@ class ExamplesGeneration(BaseContentGenerator):
                 response_format={"type": "json_object"},
             )
 
-            examples_data = self._parse_and_validate(raw_response)
+            try:
+                examples_data = self._parse_and_validate(raw_response)
+            except ValueError:
+                self.discard_cached_response()
+                raise
 
             self.save_debug_response(
                 "examples",
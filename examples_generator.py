@@ -47,7 +47,6 @@ class ExamplesGenerator:
                 self.generation.prepare_lesson_text_for_analysis(
                     lesson_content,
                     course_context=course_context,
-                    max_chars=6000,
                     lesson_title=lesson_data.get("title", "Урок"),
                 ),
                 lesson_data.get("keywords", []),
@@ -63,6 +62,10 @@ class ExamplesGenerator:
                 else str(lesson_keywords)
             )
 
+            if not self.validation.examples_usable(raw):
+                # Отвергнутый ответ не должен возвращаться из кэша
+                self.generation.discard_cached_response()
+
             validated = self.validation.validate_and_regenerate_if_needed(
                 examples=raw,
                 course_subject=course_subject,
@@ -3,13 +3,19 @@
 
 Работает со списком словарей вида {"title", "description", "code"}.
 Никакого парсинга HTML — структура примеров проходит через систему как данные.
+
+Код примеров выполняется в отдельном процессе интерпретатора: проверка
+идёт в фоновых потоках (артефакты урока, асинхронная генерация), а exec
+в kernel подменял бы общий sys.stdout и глотал вывод kernel, да и код от
+LLM не должен иметь доступа к состоянию kernel.
 """
 
 import ast
-import io
+import sys
 import logging
-from contextlib import redirect_stdout
-from typing import Dict, List
+import subprocess
+import tempfile
+from typing import Dict, List, Optional, Tuple
 
 from content_utils import BaseContentGenerator
 from examples_code_fixes import sanitize_examples
@@ -21,6 +27,49 @@ from examples_html_utils import (
 )
 
 
+# Сколько ждать выполнения одного примера, сек
+EXAMPLE_EXEC_TIMEOUT = 30
+
+
+def run_example_code(
+    code: str, timeout: float = EXAMPLE_EXEC_TIMEOUT
+) -> Optional[Tuple[str, str]]:
+    """
+    Выполняет код примера в отдельном процессе Python.
+
+    Процесс запускается во временном каталоге, без stdin; вывод примера
+    не показывается.
+
+    Args:
+        code (str): Код примера
+        timeout (float): Максимальное время выполнения, сек
+
+    Returns:
+        tuple[str, str] | None: (тип исключения, сообщение) или None, если
+            пример выполнился без ошибок
+    """
+    with tempfile.TemporaryDirectory(prefix="teachai-example-") as work_dir:
+        try:
+            result = subprocess.run(
+                [sys.executable, "-c", code],
+                cwd=work_dir,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                timeout=timeout,
+            )
+        except subprocess.TimeoutExpired:
+            return "TimeoutError", f"пример выполнялся дольше {timeout:.0f} сек"
+    if result.returncode == 0:
+        return None
+    stderr = result.stderr.decode("utf-8", errors="replace").strip()
+    last_line = stderr.splitlines()[-1] if stderr else f"код выхода {result.returncode}"
+    error_type, _, message = last_line.partition(":")
+    if not message or " " in error_type:
+        return "Exception", last_line
+    return error_type.rsplit(".", 1)[-1], message.strip()
+
+
 class ExamplesValidation(BaseContentGenerator):
     """Валидатор и регенератор примеров (в формате list[dict])."""
 
@@ -92,7 +141,7 @@ class ExamplesValidation(BaseContentGenerator):
         return True
 
     def validate_examples_execute(self, examples: List[Dict[str, str]]) -> bool:
-        """Пытается выполнить код каждого примера в изолированном окружении."""
+        """Пытается выполнить код каждого примера в отдельном процессе."""
         if not isinstance(examples, list) or len(examples) < self.MIN_EXAMPLES:
             return False
 
@@ -102,28 +151,33 @@ class ExamplesValidation(BaseContentGenerator):
                 self.logger.warning("Пример %s без кода", index)
                 return False
             try:
-                with redirect_stdout(io.StringIO()):
-                    exec(code, {})
-            except ModuleNotFoundError as exc:
+                error = run_example_code(code)
+            except OSError as exc:
+                self.logger.warning("Не удалось запустить пример %s: %s", index, exc)
+                return False
+            if error is None:
+                continue
+            error_type, message = error
+            if error_type == "ModuleNotFoundError":
                 self.logger.info(
                     "Пример %s: модуль не установлен (%s) — это не повод для fallback",
                     index,
-                    exc,
+                    message,
                 )
-                return False
-            except ImportError as exc:
+            elif error_type == "ImportError":
                 self.logger.info(
                     "Пример %s: ImportError (%s) — покажем код от LLM без exec",
                     index,
-                    exc,
+                    message,
                 )
-                return False
-            except Exception as exc:
-                self.logger.warning("Пример %s не выполняется: %s", index, exc)
-                return False
+            else:
+                self.logger.warning(
+                    "Пример %s не выполняется: %s: %s", index, error_type, message
+                )
+            return False
         return True
 
-    def _examples_usable(self, examples: List[Dict[str, str]]) -> bool:
+    def examples_usable(self, examples: List[Dict[str, str]]) -> bool:
         """Примеры пригодны для показа: структура + синтаксис (exec опционален)."""
         return self.validate_examples_quality(examples) and self.validate_examples_syntax(
             examples
@@ -146,7 +200,7 @@ class ExamplesValidation(BaseContentGenerator):
 Ключевые слова: {keywords_str}
 
 Материал урока:
-{lesson_content[:2500]}
+{self.prompt_budget.fit("lesson_context", lesson_content, max_tokens=1000)}
 
 ОБЯЗАТЕЛЬНО:
 - JSON с массивом examples из 3 элементов
@@ -179,6 +233,7 @@ class ExamplesValidation(BaseContentGenerator):
             temperature=0.2,
             max_tokens=4000,
             response_format={"type": "json_object"},
+            use_cache=False,
         )
         payload = parse_examples_json_response(response)
         validate_examples_payload(payload, min_examples=3)
@@ -305,19 +360,8 @@ class ExamplesValidation(BaseContentGenerator):
         communication_style,
     ) -> List[Dict[str, str]]:
         """Проверяет качество, при необходимости перегенерирует, иначе — fallback."""
-        if self._examples_usable(examples):
-            if self.validate_examples_execute(examples):
-                return self._finalize_examples(examples)
-            self.logger.warning(
-                "Примеры от LLM корректны, но не выполнились в среде "
-                "(sklearn/tensorflow могут быть не установлены) — санитизируем и показываем"
-            )
-            fixed = self._finalize_examples(examples)
-            if self.validate_examples_execute(fixed):
-                return fixed
-            if self._examples_usable(fixed):
-                return fixed
-            return examples
+        if self.examples_usable(examples):
+            return self._prefer_finalized(examples)
 
         self.logger.warning("Примеры не прошли проверку качества, повторная генерация...")
         try:
@@ -329,13 +373,8 @@ class ExamplesValidation(BaseContentGenerator):
                 communication_style,
                 course_subject,
             )
-            if self._examples_usable(regenerated):
-                finalized = self._finalize_examples(regenerated)
-                if self.validate_examples_execute(finalized):
-                    return finalized
-                if self._examples_usable(finalized):
-                    return finalized
-                return regenerated
+            if self.examples_usable(regenerated):
+                return self._prefer_finalized(regenerated)
         except Exception as exc:
             self.logger.warning("Повторная генерация упала: %s", exc)
 
@@ -346,6 +385,25 @@ class ExamplesValidation(BaseContentGenerator):
             )
         )
 
+    def _prefer_finalized(self, examples: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """
+        Санитизированные примеры, если они пригодны или выполняются, иначе исходные.
+
+        Пригодные после санитизации примеры показываются в любом случае,
+        поэтому код запускается (один раз) только когда санитизация
+        нарушила структуру примеров.
+        """
+        finalized = self._finalize_examples(examples)
+        if self.examples_usable(finalized):
+            return finalized
+        if self.validate_examples_execute(finalized):
+            return finalized
+        self.logger.warning(
+            "Санитизированные примеры не прошли проверку и не выполнились "
+            "(sklearn/tensorflow могут быть не установлены) — показываем код от LLM"
+        )
+        return examples
+
     def _finalize_examples(self, examples: List[Dict[str, str]]) -> List[Dict[str, str]]:
         """Санитизация кода (sklearn/tf) перед показом пользователю."""
         return sanitize_examples(examples)
@@ -48,53 +48,50 @@ class ExplanationGenerator(BaseContentGenerator):
             Exception: Если не удалось сгенерировать объяснение
         """
         try:
-            lesson_title = str(lesson) if lesson is not None else "Урок"
-
-            prompt = self._build_explanation_prompt(
-                course,
-                section,
-                topic,
-                lesson_title,
-                lesson_content,
-                communication_style,
+            prompt, messages, debug_data = self._prepare_explanation_request(
+                course, section, topic, lesson, lesson_content, communication_style
             )
 
-            messages = [
-                {
-                    "role": "system",
-                    "content": "Ты - опытный преподаватель и эксперт в данной области.",
-                },
-                {"role": "user", "content": prompt},
-            ]
-
             explanation = self.make_api_request(
                 messages=messages, temperature=0.7, max_tokens=3500
             )
 
-            self.save_debug_response(
-                "detailed_explanation",
-                prompt,
-                explanation,
-                {
-                    "course": course,
-                    "section": section,
-                    "topic": topic,
-                    "lesson": lesson_title,
-                    "communication_style": communication_style,
-                },
+            return self._finalize_explanation(
+                explanation, prompt, debug_data, communication_style
+            )
+
+        except Exception as e:
+            self.logger.error(
+                f"Критическая ошибка при генерации подробного объяснения: {str(e)}"
             )
+            raise Exception(f"Не удалось сгенерировать подробное объяснение: {str(e)}")
 
-            # Снимаем возможные markdown-обёртки ```html ... ```, '''html ... ''',
-            # ~~~html ... ~~~ — LLM иногда возвращает HTML, завёрнутый в код-fence.
-            explanation = self.clean_markdown_code_blocks(explanation)
-            explanation = enhance_content(explanation)
+    async def get_detailed_explanation_async(
+        self,
+        course,
+        section,
+        topic,
+        lesson,
+        lesson_content,
+        communication_style="friendly",
+    ):
+        """
+        Асинхронно генерирует подробное объяснение (AsyncOpenAI).
+
+        Аргументы и результат совпадают с get_detailed_explanation.
+        """
+        try:
+            prompt, messages, debug_data = self._prepare_explanation_request(
+                course, section, topic, lesson, lesson_content, communication_style
+            )
 
-            styled_explanation = self._apply_compact_styles(
-                explanation, communication_style
+            explanation = await self.make_api_request_async(
+                messages=messages, temperature=0.7, max_tokens=3500
             )
 
-            self.logger.info("Подробное объяснение успешно сгенерировано")
-            return styled_explanation
+            return self._finalize_explanation(
+                explanation, prompt, debug_data, communication_style
+            )
 
         except Exception as e:
             self.logger.error(
@@ -102,6 +99,63 @@ class ExplanationGenerator(BaseContentGenerator):
             )
             raise Exception(f"Не удалось сгенерировать подробное объяснение: {str(e)}")
 
+    def _prepare_explanation_request(
+        self, course, section, topic, lesson, lesson_content, communication_style
+    ):
+        """
+        Готовит промпт, сообщения и отладочные данные для объяснения.
+
+        Returns:
+            tuple: (prompt, messages, debug_data)
+        """
+        lesson_title = str(lesson) if lesson is not None else "Урок"
+
+        prompt = self._build_explanation_prompt(
+            course,
+            section,
+            topic,
+            lesson_title,
+            lesson_content,
+            communication_style,
+        )
+
+        messages = [
+            {
+                "role": "system",
+                "content": "Ты - опытный преподаватель и эксперт в данной области.",
+            },
+            {"role": "user", "content": prompt},
+        ]
+
+        debug_data = {
+            "course": course,
+            "section": section,
+            "topic": topic,
+            "lesson": lesson_title,
+            "communication_style": communication_style,
+        }
+        return prompt, messages, debug_data
+
+    def _finalize_explanation(
+        self, explanation, prompt, debug_data, communication_style
+    ):
+        """Сохраняет отладочный ответ, чистит и стилизует объяснение."""
+        self.save_debug_response(
+            "detailed_explanation", prompt, explanation, debug_data
+        )
+
+        # Снимаем возможные markdown-обёртки ```html ... ```, '''html ... ''',
+        # ~~~html ... ~~~ — LLM иногда возвращает HTML, завёрнутый в код-fence.
+        explanation = self.clean_markdown_code_blocks(explanation)
+        explanation = enhance_content(explanation)
+
+        styled_explanation = self._apply_compact_styles(
+            explanation, communication_style
+        )
+
+        self.logger.info("Подробное объяснение успешно сгенерировано")
+        return styled_explanation
+
     def _apply_compact_styles(self, explanation, communication_style):
         """
         ИСПРАВЛЕНО: Применяет компактные CSS стили к объяснению.
@@ -234,6 +288,7 @@ class ExplanationGenerator(BaseContentGenerator):
         style_description = ContentUtils.COMMUNICATION_STYLES.get(
             communication_style, ContentUtils.COMMUNICATION_STYLES["friendly"]
         )
+        lesson_excerpt = self.prompt_budget.fit("lesson_context", lesson_content)
 
         return f"""
         Предоставь подробное объяснение материала по следующему уроку:
@@ -244,7 +299,7 @@ class ExplanationGenerator(BaseContentGenerator):
         Урок: {lesson_title}
 
         СОДЕРЖАНИЕ УРОКА (ОСНОВА ДЛЯ ОБЪЯСНЕНИЯ):
-        {lesson_content[:2000]}  # Ограничиваем длину для запроса
+        {lesson_excerpt}
 
         Используй следующий стиль общения: {style_description}
 
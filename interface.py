@@ -19,6 +19,7 @@ from setup_interface import SetupInterface
 from lesson_interface import LessonInterface
 from assessment_interface import AssessmentInterface
 from completion_interface import CompletionInterface
+from course_plan_index import get_course_plan_index
 
 
 class UserInterface:
@@ -364,37 +365,18 @@ class UserInterface:
         Returns:
             tuple: (section_title, topic_title, lesson_title)
         """
-        section_title = "Раздел"
-        topic_title = "Тема"
-        lesson_title = "Урок"
-
-        for section in course_plan.get("sections", []):
-            if section.get("id") == section_id:
-                section_title = (
-                    section.get("title")
-                    or section.get("name")
-                    or section.get("id")
-                    or "Раздел"
-                )
-                for topic in section.get("topics", []):
-                    if topic.get("id") == topic_id:
-                        topic_title = (
-                            topic.get("title")
-                            or topic.get("name")
-                            or topic.get("id")
-                            or "Тема"
-                        )
-                        for lesson in topic.get("lessons", []):
-                            if lesson.get("id") == lesson_id:
-                                lesson_title = (
-                                    lesson.get("title")
-                                    or lesson.get("name")
-                                    or lesson.get("id")
-                                    or "Урок"
-                                )
-                                break
-                        break
-                break
+        index = get_course_plan_index(course_plan)
+        section = index.section(section_id) or {}
+        topic = index.topic(section_id, topic_id) or {}
+        lesson = index.lesson(section_id, topic_id, lesson_id) or {}
+
+        section_title = (
+            section.get("title") or section.get("name") or section.get("id") or "Раздел"
+        )
+        topic_title = topic.get("title") or topic.get("name") or topic.get("id") or "Тема"
+        lesson_title = (
+            lesson.get("title") or lesson.get("name") or lesson.get("id") or "Урок"
+        )
 
         return section_title, topic_title, lesson_title
 
@@ -0,0 +1,179 @@
+"""
+Пространства состояния учащихся.
+
+Одна установка TeachAI может обслуживать целый класс: у каждого учащегося
+свой каталог состояния data/learners/<learner_id>/ (state.json, SQLite или
+журнал — по STATE_BACKEND), а сгенерированные уроки лежат в общем
+хранилище data/lesson_content.sqlite3 и переиспользуются между учащимися
+одного курса. Урок обращается к учащемуся по имени, поэтому общий урок
+достаётся только учащимся с тем же планом курса, стилем общения и именем.
+
+Каталог состояния учащегося захватывается файловой блокировкой на всё время работы
+менеджера состояния: два kernel одного учащегося не перезапишут данные
+друг друга. Блокировка берётся один раз при открытии, поэтому число
+учащихся не влияет на стоимость отдельных запросов.
+
+Без learner_id используется прежний файл data/state.json, и он не
+блокируется.
+
+Настройки (переменные окружения / .env):
+    TEACHAI_LEARNER_ID — учащийся по умолчанию для TeachAIEngine
+    STATE_LOCK_TIMEOUT — сколько ждать блокировку состояния, секунд (10)
+"""
+
+import os
+import re
+import time
+import hashlib
+import logging
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+LEARNERS_DIR = "learners"
+LOCK_FILE_NAME = "state.lock"
+LOCK_POLL_SECONDS = 0.1
+
+_SAFE_ID = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+
+class StateLockError(RuntimeError):
+    """Состояние учащегося уже открыто в другом процессе."""
+
+
+def normalize_learner_id(learner_id):
+    """
+    Приводит ID учащегося к безопасному имени каталога.
+
+    Простые ID (латиница, цифры, _ . -) используются как есть, остальные
+    (кириллица, e-mail и т.п.) — с хешем, чтобы разные ID не совпали.
+
+    Args:
+        learner_id (str): ID учащегося
+
+    Returns:
+        str | None: Имя каталога или None для режима одного учащегося
+    """
+    if learner_id is None:
+        return None
+    learner_id = str(learner_id).strip()
+    if not learner_id:
+        return None
+    if _SAFE_ID.match(learner_id) and learner_id not in (".", ".."):
+        return learner_id
+    slug = re.sub(r"[^A-Za-z0-9_-]+", "-", learner_id).strip("-")[:32]
+    digest = hashlib.sha1(learner_id.encode("utf-8")).hexdigest()[:12]
+    return f"{slug}-{digest}" if slug else digest
+
+
+def get_default_learner_id():
+    """ID учащегося из окружения (TEACHAI_LEARNER_ID) или None."""
+    return normalize_learner_id(os.getenv("TEACHAI_LEARNER_ID"))
+
+
+def learner_state_file(learner_id, state_file="data/state.json"):
+    """
+    Путь к файлу состояния учащегося относительно каталога проекта.
+
+    Args:
+        learner_id (str | None): ID учащегося
+        state_file (str): Файл состояния режима одного учащегося
+
+    Returns:
+        Path: data/learners/<learner_id>/state.json или state_file
+    """
+    learner_dir = normalize_learner_id(learner_id)
+    if learner_dir is None:
+        return Path(state_file)
+    state_file = Path(state_file)
+    return state_file.parent / LEARNERS_DIR / learner_dir / state_file.name
+
+
+class StateFileLock:
+    """Межпроцессная блокировка каталога состояния (fcntl / msvcrt)."""
+
+    def __init__(self, path):
+        """
+        Инициализация блокировки.
+
+        Args:
+            path (str | Path): Путь к файлу блокировки
+        """
+        self.path = Path(path)
+        self._file = None
+
+    @property
+    def locked(self):
+        """Удерживается ли блокировка этим экземпляром."""
+        return self._file is not None
+
+    def acquire(self, timeout=None):
+        """
+        Захватывает блокировку, ожидая её освобождения не дольше timeout.
+
+        Args:
+            timeout (float, optional): Максимальное ожидание, секунд
+                (по умолчанию STATE_LOCK_TIMEOUT)
+
+        Raises:
+            StateLockError: Блокировку держит другой процесс
+        """
+        if self._file is not None:
+            return
+        if timeout is None:
+            try:
+                timeout = float(os.getenv("STATE_LOCK_TIMEOUT", 10))
+            except ValueError:
+                timeout = 10.0
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        lock_file = open(self.path, "a+b")
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self._try_lock(lock_file)
+                break
+            except OSError:
+                if time.monotonic() >= deadline:
+                    lock_file.close()
+                    raise StateLockError(
+                        f"Состояние {self.path.parent} уже открыто в другом процессе"
+                    )
+                time.sleep(LOCK_POLL_SECONDS)
+        self._file = lock_file
+        # PID владельца — для диагностики
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(str(os.getpid()).encode("ascii"))
+        lock_file.flush()
+        logger.debug(f"Блокировка состояния захвачена: {self.path}")
+
+    def release(self):
+        """Освобождает блокировку."""
+        lock_file = self._file
+        if lock_file is None:
+            return
+        self._file = None
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        except OSError as e:
+            logger.warning(f"Ошибка при освобождении блокировки состояния: {str(e)}")
+        finally:
+            lock_file.close()
+
+    @staticmethod
+    def _try_lock(lock_file):
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
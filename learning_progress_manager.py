@@ -2,11 +2,39 @@
 Модуль для управления прогрессом обучения.
 Отвечает за отслеживание завершенности уроков, оценки, счетчики вопросов и статистику.
 РЕФАКТОРИНГ: Выделен из state_manager.py для лучшей модульности
+
+Итоги прогресса (число и сумма оценок, лучшая и худшая оценка, число
+попыток, завершённых уроков и контрольных заданий) хранятся в состоянии
+в learning.progress_totals и обновляются при каждом событии — оценке,
+попытке, завершении урока, результате контрольного задания. Дашборд и
+экран завершения читают готовые итоги, а не пересчитывают их по всем
+урокам. Полный пересчёт (rebuild_progress_totals) выполняется только при
+смене плана курса и для состояния, сохранённого до появления итогов.
 """
 
 import logging
 from datetime import datetime
 
+# Тест считается пройденным при оценке выше этого порога
+TEST_PASS_THRESHOLD = 40
+
+# Порог «пройденного теста» в статистике дашборда
+DASHBOARD_PASSED_SCORE = 70
+
+PROGRESS_TOTALS_KEY = "progress_totals"
+
+# Узлы состояния, которые меняет пересчёт итогов и статистики (для save_state)
+STATISTICS_PATHS = tuple(
+    ("learning", key)
+    for key in (
+        PROGRESS_TOTALS_KEY,
+        "average_score",
+        "total_score",
+        "total_assessments",
+        "course_progress_percent",
+    )
+)
+
 
 class LearningProgressManager:
     """Менеджер прогресса обучения."""
@@ -61,7 +89,18 @@ class LearningProgressManager:
             )
 
             # Сохраняем обновленное состояние
-            return self.state_manager.save_state()
+            return self.state_manager.save_state(
+                *(
+                    ("learning", key)
+                    for key in (
+                        "current_course",
+                        "current_section",
+                        "current_topic",
+                        "current_lesson",
+                        "completed_lessons",
+                    )
+                )
+            )
         except Exception as e:
             self.logger.error(f"Ошибка при обновлении прогресса обучения: {str(e)}")
             return False
@@ -87,6 +126,9 @@ class LearningProgressManager:
             if "lesson_completion_status" not in self.state_manager.state["learning"]:
                 self.state_manager.state["learning"]["lesson_completion_status"] = {}
 
+            was_completed = self.is_lesson_completed(lesson_id)
+            totals = self.get_progress_totals()
+
             # Добавляем попытку
             if lesson_id not in self.state_manager.state["learning"]["lesson_attempts"]:
                 self.state_manager.state["learning"]["lesson_attempts"][lesson_id] = []
@@ -99,6 +141,7 @@ class LearningProgressManager:
             self.state_manager.state["learning"]["lesson_attempts"][lesson_id].append(
                 attempt_data
             )
+            totals["attempts_count"] += 1
 
             # Сохраняем лучший результат как текущий
             if is_passed:
@@ -106,9 +149,7 @@ class LearningProgressManager:
                     "lesson_scores"
                 ].get(lesson_id, 0)
                 if score > current_best:
-                    self.state_manager.state["learning"]["lesson_scores"][
-                        lesson_id
-                    ] = score
+                    self._set_lesson_score(lesson_id, score)
 
                 # Тест пройден, но урок НЕ завершается автоматически
                 # Урок завершается только при выполнении контрольного задания ИЛИ принудительно
@@ -116,10 +157,17 @@ class LearningProgressManager:
                     f"Тест по уроку {lesson_id} пройден с оценкой {score}% (урок ещё не завершен)"
                 )
 
-            # Пересчитываем общую статистику
+            self._update_completed_count(lesson_id, was_completed)
+
+            # Обновляем общую статистику
             self._recalculate_course_statistics()
 
-            return self.state_manager.save_state()
+            return self.state_manager.save_state(
+                ("learning", "lesson_attempts", lesson_id),
+                ("learning", "lesson_scores", lesson_id),
+                ("learning", "lesson_completion_status"),
+                *STATISTICS_PATHS,
+            )
         except Exception as e:
             self.logger.error(f"Ошибка при сохранении результата теста: {str(e)}")
             return False
@@ -147,7 +195,7 @@ class LearningProgressManager:
             # Проверяем, есть ли результат теста
             lesson_scores = self.state_manager.state["learning"].get("lesson_scores", {})
             test_score = lesson_scores.get(lesson_id, 0)
-            is_test_passed = test_score > 40  # Тест считается пройденным при >40%
+            is_test_passed = test_score > TEST_PASS_THRESHOLD
             
             # Проверяем, выполнено ли контрольное задание
             control_tasks = self.state_manager.state.get("control_tasks", {})
@@ -188,14 +236,18 @@ class LearningProgressManager:
                 self.state_manager.state["learning"]["lesson_completion_status"] = {}
 
             # Отмечаем урок как завершенный принудительно
+            was_completed = self.is_lesson_completed(lesson_id)
             self.state_manager.state["learning"]["lesson_completion_status"][lesson_id] = True
+            self._update_completed_count(lesson_id, was_completed)
 
             self.logger.info(f"Урок {lesson_id} отмечен как завершенный принудительно")
 
-            # Пересчитываем статистику
+            # Обновляем статистику
             self._recalculate_course_statistics()
 
-            return self.state_manager.save_state()
+            return self.state_manager.save_state(
+                ("learning", "lesson_completion_status", lesson_id), *STATISTICS_PATHS
+            )
         except Exception as e:
             self.logger.error(f"Ошибка при принудительном завершении урока: {str(e)}")
             return False
@@ -213,7 +265,7 @@ class LearningProgressManager:
         try:
             lesson_scores = self.state_manager.state["learning"].get("lesson_scores", {})
             test_score = lesson_scores.get(lesson_id, 0)
-            return test_score > 40  # Тест считается пройденным при >40%
+            return test_score > TEST_PASS_THRESHOLD
         except Exception as e:
             self.logger.error(f"Ошибка при проверке теста для урока {lesson_id}: {str(e)}")
             return False
@@ -251,6 +303,8 @@ class LearningProgressManager:
             if "lesson_completion_status" not in self.state_manager.state["learning"]:
                 self.state_manager.state["learning"]["lesson_completion_status"] = {}
 
+            was_completed = self.is_lesson_completed(lesson_id)
+
             # Отмечаем урок как незавершенный
             self.state_manager.state["learning"]["lesson_completion_status"][
                 lesson_id
@@ -258,16 +312,20 @@ class LearningProgressManager:
 
             # Также удаляем оценку (урок нужно пересдать)
             if "lesson_scores" in self.state_manager.state["learning"]:
-                self.state_manager.state["learning"]["lesson_scores"].pop(
-                    lesson_id, None
-                )
+                self._set_lesson_score(lesson_id, None)
+
+            self._update_completed_count(lesson_id, was_completed)
 
             self.logger.info(f"Урок {lesson_id} отмечен как незавершенный")
 
-            # Пересчитываем статистику
+            # Обновляем статистику
             self._recalculate_course_statistics()
 
-            return self.state_manager.save_state()
+            return self.state_manager.save_state(
+                ("learning", "lesson_completion_status", lesson_id),
+                ("learning", "lesson_scores", lesson_id),
+                *STATISTICS_PATHS,
+            )
         except Exception as e:
             self.logger.error(f"Ошибка при отметке урока как незавершенного: {str(e)}")
             return False
@@ -290,7 +348,7 @@ class LearningProgressManager:
                 self.state_manager.state["learning"]["questions_count"][lesson_id] = 0
 
             self.state_manager.state["learning"]["questions_count"][lesson_id] += 1
-            self.state_manager.save_state()
+            self.state_manager.save_state(("learning", "questions_count", lesson_id))
 
             count = self.state_manager.state["learning"]["questions_count"][lesson_id]
             self.logger.debug(f"Счетчик вопросов для урока {lesson_id}: {count}")
@@ -325,41 +383,168 @@ class LearningProgressManager:
                 self.state_manager.state["learning"]["questions_count"] = {}
 
             self.state_manager.state["learning"]["questions_count"][lesson_id] = 0
-            self.state_manager.save_state()
+            self.state_manager.save_state(("learning", "questions_count", lesson_id))
             self.logger.debug(f"Счетчик вопросов для урока {lesson_id} сброшен")
         except Exception as e:
             self.logger.error(f"Ошибка при сбросе счетчика вопросов: {str(e)}")
 
+    def get_progress_totals(self):
+        """
+        Возвращает итоги прогресса, при необходимости рассчитывая их.
+
+        Returns:
+            dict: scores_count, scores_sum, scores_passed, best_score,
+                worst_score, attempts_count, completed_count, plan_total,
+                control_tasks_correct, control_tasks_failed
+        """
+        totals = self.state_manager.state["learning"].get(PROGRESS_TOTALS_KEY)
+        if not isinstance(totals, dict):
+            totals = self.rebuild_progress_totals()
+        return totals
+
+    def rebuild_progress_totals(self):
+        """
+        Полностью пересчитывает итоги прогресса по состоянию.
+
+        Вызывается при смене плана курса и для состояния без итогов;
+        в остальных случаях итоги обновляются по событиям.
+
+        Returns:
+            dict: Новые итоги
+        """
+        state = self.state_manager.state
+        learning = state["learning"]
+        lesson_scores = learning.get("lesson_scores", {})
+        scores = list(lesson_scores.values())
+        control_results = [
+            result
+            for result in state.get("control_tasks", {}).values()
+            if isinstance(result, dict)
+        ]
+        plan_keys = self.state_manager.get_plan_index().lesson_keys()
+
+        totals = {
+            "scores_count": len(scores),
+            "scores_sum": sum(scores),
+            "scores_passed": sum(1 for score in scores if score >= DASHBOARD_PASSED_SCORE),
+            "best_score": max(scores) if scores else 0,
+            "worst_score": min(scores) if scores else 0,
+            "attempts_count": sum(
+                len(attempts) for attempts in learning.get("lesson_attempts", {}).values()
+            ),
+            "completed_count": sum(1 for key in plan_keys if self.is_lesson_completed(key)),
+            "plan_total": len(plan_keys),
+            "control_tasks_correct": sum(
+                1 for result in control_results if result.get("is_correct", False)
+            ),
+            "control_tasks_failed": sum(
+                1 for result in control_results if not result.get("is_correct", False)
+            ),
+        }
+        learning[PROGRESS_TOTALS_KEY] = totals
+        self.logger.debug(f"Итоги прогресса пересчитаны: {totals}")
+        return totals
+
+    def _set_lesson_score(self, lesson_id, score):
+        """
+        Записывает (или удаляет при score=None) оценку урока и обновляет итоги.
+
+        Args:
+            lesson_id (str): ID урока
+            score (float | None): Новая оценка
+        """
+        lesson_scores = self.state_manager.state["learning"].setdefault("lesson_scores", {})
+        totals = self.get_progress_totals()
+        old = lesson_scores.pop(lesson_id, None)
+        if old is not None:
+            totals["scores_count"] -= 1
+            totals["scores_sum"] -= old
+            if old >= DASHBOARD_PASSED_SCORE:
+                totals["scores_passed"] -= 1
+        if score is not None:
+            lesson_scores[lesson_id] = score
+            totals["scores_count"] += 1
+            totals["scores_sum"] += score
+            if score >= DASHBOARD_PASSED_SCORE:
+                totals["scores_passed"] += 1
+
+        if not lesson_scores:
+            totals["best_score"] = totals["worst_score"] = 0
+        elif old is not None and old in (totals["best_score"], totals["worst_score"]):
+            # Убрана крайняя оценка — пересчитываем только min/max оценок
+            totals["best_score"] = max(lesson_scores.values())
+            totals["worst_score"] = min(lesson_scores.values())
+        elif score is not None:
+            if totals["scores_count"] == 1:
+                totals["best_score"] = totals["worst_score"] = score
+            else:
+                totals["best_score"] = max(totals["best_score"], score)
+                totals["worst_score"] = min(totals["worst_score"], score)
+
+    def _update_completed_count(self, lesson_id, was_completed):
+        """
+        Учитывает изменение завершённости урока в итогах.
+
+        Args:
+            lesson_id (str): ID урока
+            was_completed (bool): Был ли урок завершён до изменения
+        """
+        is_completed = self.is_lesson_completed(lesson_id)
+        if is_completed == was_completed:
+            return
+        try:
+            section_id, topic_id, short_lesson_id = lesson_id.split(":")
+        except ValueError:
+            return
+        # Процент прогресса считается только по урокам текущего плана
+        if self.state_manager.get_plan_index().get(section_id, topic_id, short_lesson_id) is None:
+            return
+        self.get_progress_totals()["completed_count"] += 1 if is_completed else -1
+
+    def record_control_task_result(self, lesson_id, result):
+        """
+        Сохраняет результат контрольного задания и обновляет итоги.
+
+        Args:
+            lesson_id (str): ID урока
+            result (dict): task_title, is_correct, completed_at
+        """
+        was_completed = self.is_lesson_completed(lesson_id)
+        totals = self.get_progress_totals()
+        control_tasks = self.state_manager.state.setdefault("control_tasks", {})
+
+        old = control_tasks.get(lesson_id)
+        if isinstance(old, dict):
+            key = "control_tasks_correct" if old.get("is_correct", False) else "control_tasks_failed"
+            totals[key] -= 1
+        control_tasks[lesson_id] = result
+        key = "control_tasks_correct" if result.get("is_correct", False) else "control_tasks_failed"
+        totals[key] += 1
+
+        self._update_completed_count(lesson_id, was_completed)
+        self._recalculate_course_statistics()
+
     def _recalculate_course_statistics(self):
         """
-        Пересчитывает общую статистику по курсу.
+        Обновляет общую статистику по курсу из итогов прогресса.
         """
         try:
-            lesson_scores = self.state_manager.state["learning"].get(
-                "lesson_scores", {}
-            )
+            learning = self.state_manager.state["learning"]
+            totals = self.get_progress_totals()
 
-            if lesson_scores:
+            if totals["scores_count"]:
                 # Рассчитываем средний балл
-                total_score = sum(lesson_scores.values())
-                total_lessons = len(lesson_scores)
-                self.state_manager.state["learning"]["average_score"] = (
-                    total_score / total_lessons
-                )
-                self.state_manager.state["learning"]["total_score"] = total_score
-                self.state_manager.state["learning"][
-                    "total_assessments"
-                ] = total_lessons
+                learning["average_score"] = totals["scores_sum"] / totals["scores_count"]
+                learning["total_score"] = totals["scores_sum"]
+                learning["total_assessments"] = totals["scores_count"]
             else:
-                self.state_manager.state["learning"]["average_score"] = 0
-                self.state_manager.state["learning"]["total_score"] = 0
-                self.state_manager.state["learning"]["total_assessments"] = 0
+                learning["average_score"] = 0
+                learning["total_score"] = 0
+                learning["total_assessments"] = 0
 
             # Рассчитываем общий прогресс по курсу
             progress_data = self.calculate_course_progress()
-            self.state_manager.state["learning"][
-                "course_progress_percent"
-            ] = progress_data["percent"]
+            learning["course_progress_percent"] = progress_data["percent"]
 
         except Exception as e:
             self.logger.error(f"Ошибка при пересчете статистики курса: {str(e)}")
@@ -392,6 +577,7 @@ class LearningProgressManager:
                 "lesson_attempts", {}
             )
             progress_data = self.calculate_course_progress()
+            totals = self.get_progress_totals()
 
             return {
                 "average_score": self.state_manager.state["learning"].get(
@@ -405,9 +591,9 @@ class LearningProgressManager:
                 "total_lessons": progress_data["total"],
                 "lesson_scores": lesson_scores,
                 "lesson_attempts": lesson_attempts,
-                "lessons_passed": len(lesson_scores),
-                "highest_score": max(lesson_scores.values()) if lesson_scores else 0,
-                "lowest_score": min(lesson_scores.values()) if lesson_scores else 0,
+                "lessons_passed": totals["scores_count"],
+                "highest_score": totals["best_score"],
+                "lowest_score": totals["worst_score"],
             }
         except Exception as e:
             self.logger.error(f"Ошибка при получении детальной статистики: {str(e)}")
@@ -437,7 +623,7 @@ class LearningProgressManager:
             )
 
             # Сохраняем обновленное состояние
-            return self.state_manager.save_state()
+            return self.state_manager.save_state(*STATISTICS_PATHS)
         except Exception as e:
             self.logger.error(
                 f"Ошибка при обновлении результатов тестирования: {str(e)}"
@@ -462,58 +648,25 @@ class LearningProgressManager:
 
     def calculate_course_progress(self):
         """
-        Рассчитывает прогресс на основе завершенных уроков.
+        Возвращает прогресс на основе завершенных уроков (из итогов прогресса).
         ИСПРАВЛЕНО: Урок считается завершенным только если пройден И тест И контрольное задание
 
         Returns:
             dict: Данные о прогрессе (процент, пройдено/всего)
         """
         try:
-            course_plan = self.state_manager.state["course_plan"]
-
-            # Считаем общее количество уроков в курсе и собираем ID всех уроков
-            total_lessons = 0
-            all_lesson_ids = []
-            
-            for section in course_plan.get("sections", []):
-                section_id = section.get("id", "")
-                for topic in section.get("topics", []):
-                    topic_id = topic.get("id", "")
-                    for lesson in topic.get("lessons", []):
-                        lesson_id = lesson.get("id", "")
-                        if section_id and topic_id and lesson_id:
-                            full_lesson_id = f"{section_id}:{topic_id}:{lesson_id}"
-                            all_lesson_ids.append(full_lesson_id)
-                            total_lessons += 1
+            totals = self.get_progress_totals()
+            total_lessons = totals["plan_total"]
 
             # Если уроков нет, возвращаем нулевой прогресс
             if total_lessons == 0:
                 return {"percent": 0, "completed": 0, "total": 0}
 
-            # ИСПРАВЛЕНО: Считаем завершенные уроки на основе новой логики
-            completed_count = 0
-            
-            # Проверяем каждый урок: пройден ли тест И выполнено ли контрольное задание
-            for lesson_id in all_lesson_ids:
-                # Сначала проверяем принудительное завершение
-                completion_status = self.state_manager.state["learning"].get(
-                    "lesson_completion_status", {}
-                )
-                if completion_status.get(lesson_id, False):
-                    # Урок завершен принудительно
-                    completed_count += 1
-                    continue
-
-                # Иначе проверяем обычную логику: тест + контрольное задание
-                if self.is_lesson_completed(lesson_id):
-                    completed_count += 1
-
-            # Рассчитываем процент прогресса
+            completed_count = totals["completed_count"]
             progress_percent = (completed_count / total_lessons) * 100
 
             self.logger.debug(
-                f"Прогресс курса: {completed_count}/{total_lessons} ({progress_percent:.1f}%) "
-                f"(проверено {len(all_lesson_ids)} уроков)"
+                f"Прогресс курса: {completed_count}/{total_lessons} ({progress_percent:.1f}%)"
             )
 
             return {
@@ -0,0 +1,249 @@
+"""
+Параллельная генерация материалов урока.
+Вынесено в отдельный модуль по образцу lesson_display / lesson_navigation.
+
+После показа урока пользователь почти всегда открывает примеры, тест,
+ключевые понятия и контрольное задание. Раньше каждый из них генерировался
+только по нажатию кнопки. Теперь, как только известно содержание урока,
+все четыре генерации запускаются одновременно в пуле потоков, а результаты
+складываются в слот материалов текущего урока.
+
+Асинхронные обработчики кнопок дожидаются идущей генерации (get_async),
+не блокируя kernel. Синхронные берут из слота только готовый результат
+(get) и иначе генерируют материал прежним путём: одинаковый запрос,
+который ещё выполняется в слоте, не отправляется повторно, а ждёт общий
+ответ (см. llm_singleflight). Генерация, завершившаяся ошибкой (в том
+числе заглушка контрольного задания), считается пустым слотом.
+
+Для контрольного задания в пуле выполняется только запрос к LLM: эталонное
+решение выполняется (exec с перехватом stdout) в потоке kernel при показе
+задания, см. ControlTasksGenerator.ensure_materialized.
+
+Настройки (переменные окружения / .env):
+    LESSON_ARTIFACTS_FANOUT — генерировать материалы сразу после показа урока (1, 0 — отключить)
+"""
+
+import os
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from control_tasks_generator import is_generation_error
+
+# Материалы урока в порядке запуска
+ARTIFACT_NAMES = ("examples", "assessment", "concepts", "control_task")
+
+# Сколько ждать идущую генерацию, прежде чем генерировать заново (секунд)
+ARTIFACT_WAIT_SECONDS = 180
+
+# Число вопросов теста — как в интерфейсе тестирования
+ASSESSMENT_NUM_QUESTIONS = 5
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """Возвращает общий пул потоков для генерации материалов."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=len(ARTIFACT_NAMES), thread_name_prefix="lesson-artifacts"
+            )
+        return _executor
+
+
+def shutdown_artifact_executor():
+    """Останавливает пул потоков, отменяя ещё не начатые генерации."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+class LessonArtifacts:
+    """Слот материалов текущего урока."""
+
+    def __init__(self, lesson_interface):
+        """
+        Инициализация слота.
+
+        Args:
+            lesson_interface: Экземпляр LessonInterface
+        """
+        self.lesson_interface = lesson_interface
+        self.logger = logging.getLogger(__name__)
+        self.enabled = os.getenv(
+            "LESSON_ARTIFACTS_FANOUT", "1"
+        ).strip().lower() not in (
+            "0",
+            "false",
+            "no",
+            "off",
+        )
+        self.lesson_key = None
+        self.futures = {}
+
+    def start(self):
+        """
+        Запускает генерацию всех материалов текущего урока.
+
+        Вызывается из LessonDisplay, когда заполнены current_lesson_* и
+        current_course_info. Незапущенные генерации предыдущего урока
+        отменяются.
+        """
+        self.cancel()
+        if not self.enabled:
+            return
+
+        li = self.lesson_interface
+        lesson_key = li.current_lesson_id
+        jobs = self._build_jobs()
+        executor = _get_executor()
+
+        self.lesson_key = lesson_key
+        self.futures = {name: executor.submit(jobs[name]) for name in ARTIFACT_NAMES}
+        self.logger.info(
+            f"Запущена параллельная генерация материалов урока {lesson_key}"
+        )
+
+    def cancel(self):
+        """Освобождает слот; ещё не начатые генерации отменяются."""
+        for future in self.futures.values():
+            future.cancel()
+        self.futures = {}
+        self.lesson_key = None
+
+    def _current_future(self, name):
+        """Future материала, если слот принадлежит текущему уроку."""
+        if (
+            self.lesson_key is None
+            or self.lesson_key != self.lesson_interface.current_lesson_id
+        ):
+            return None
+        future = self.futures.get(name)
+        if future is None or future.cancelled():
+            return None
+        return future
+
+    def get(self, name):
+        """
+        Возвращает готовый материал текущего урока из слота, не дожидаясь.
+
+        Для синхронных обработчиков виджетов: ожидание в них остановило бы
+        kernel.
+
+        Args:
+            name (str): examples, assessment, concepts или control_task
+
+        Returns:
+            Результат генерации или None, если его нет (слот пуст,
+            генерация ещё идёт или завершилась ошибкой)
+        """
+        future = self._current_future(name)
+        if future is None:
+            return None
+        if not future.done():
+            self.logger.info(
+                f"Материал '{name}' урока {self.lesson_key} ещё генерируется, "
+                "генерация по кнопке"
+            )
+            return None
+        try:
+            return future.result()
+        except Exception as e:
+            self.logger.warning(
+                f"Материал '{name}' не получен из слота, будет сгенерирован заново: {str(e)}"
+            )
+            return None
+
+    async def get_async(self, name, timeout=ARTIFACT_WAIT_SECONDS):
+        """
+        Асинхронный аналог get: ожидание не блокирует event loop kernel.
+
+        Args:
+            name (str): examples, assessment, concepts или control_task
+            timeout (float, optional): Максимальное ожидание, секунд
+
+        Returns:
+            Результат генерации или None
+        """
+        future = self._current_future(name)
+        if future is None:
+            return None
+        try:
+            return await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(future)), timeout
+            )
+        except Exception as e:
+            self.logger.warning(
+                f"Материал '{name}' не получен из слота, будет сгенерирован заново: {str(e)}"
+            )
+            return None
+
+    def _build_jobs(self):
+        """
+        Готовит функции генерации с теми же аргументами, что и у кнопок.
+
+        Аргументы фиксируются сейчас: к моменту выполнения пользователь
+        может уже перейти к другому уроку.
+        """
+        li = self.lesson_interface
+        content_generator = li.content_generator
+        lesson_data = li.current_lesson_data
+        lesson_content = li.current_lesson_content
+        lesson_text = li.current_lesson_raw_content or li.current_lesson_content
+        course_info = li.current_course_info
+        communication_style = course_info["user_profile"]["communication_style"]
+        tasks_generator = li.control_tasks_interface.tasks_generator
+
+        def examples():
+            return content_generator.generate_examples_data(
+                lesson_data,
+                lesson_text,
+                communication_style,
+                course_context=course_info,
+            )
+
+        def assessment():
+            # Напрямую через генератор тестов: фасад показывает индикатор загрузки
+            return content_generator.assessment_gen.generate_assessment(
+                course_info["course_title"],
+                course_info["section_title"],
+                course_info["topic_title"],
+                course_info["lesson_title"],
+                lesson_content,
+                ASSESSMENT_NUM_QUESTIONS,
+            )
+
+        def concepts():
+            return content_generator.generate_concepts(
+                lesson_content=lesson_content,
+                communication_style=communication_style,
+                lesson_data=lesson_data,
+                course_context=course_info,
+            )
+
+        def control_task():
+            task = tasks_generator.generate_control_task(
+                lesson_data=lesson_data,
+                lesson_content=lesson_text,
+                communication_style=communication_style,
+                course_context=course_info,
+                # Эталонный код выполняется потом в потоке kernel (ensure_materialized)
+                materialize=False,
+            )
+            # Заглушку ошибки не кладём в слот: по кнопке задание сгенерируется заново
+            if is_generation_error(task):
+                raise RuntimeError(task.get("skip_reason"))
+            return task
+
+        return {
+            "examples": examples,
+            "assessment": assessment,
+            "concepts": concepts,
+            "control_task": control_task,
+        }
@@ -6,6 +6,7 @@
 import ipywidgets as widgets
 from IPython.display import display, clear_output
 import logging
+import os
 import re
 from lesson_utils import LessonUtils
 
@@ -20,6 +21,11 @@ except ImportError:
 # ВРЕМЕННО ОТКЛЮЧАЕМ АВТОМАТИЧЕСКУЮ ИНТЕГРАЦИЮ ЯЧЕЕК
 CELLS_INTEGRATION_AVAILABLE = False
 
+# Сколько ждать урок, который уже генерируется в фоне, прежде чем
+# генерировать его заново (секунд): фоновый запрос уступает интерактивным
+# и может ещё долго не завершиться
+PREFETCH_WAIT_SECONDS = 5
+
 
 class LessonDisplay:
     """Отображение уроков."""
@@ -113,19 +119,22 @@ class LessonDisplay:
             else:
                 # Генерируем новое содержание урока
                 try:
-                    self.logger.info(f"Генерация нового содержания урока '{lesson_title}'")
-
-                    lesson_content_data = (
-                        self.lesson_interface.content_generator.generate_lesson(
-                            course=course_title,
-                            section=section_title,
-                            topic=topic_title,
-                            lesson=lesson_title,
-                            user_name=user_profile["name"],
-                            communication_style=user_profile["communication_style"],
-                        )
+                    # Урок мог быть сгенерирован заранее, пока читался предыдущий
+                    lesson_content_data = self.lesson_interface.prefetcher.take_lesson(
+                        cache_key, timeout=PREFETCH_WAIT_SECONDS
                     )
 
+                    if lesson_content_data is None:
+                        self.logger.info(f"Генерация нового содержания урока '{lesson_title}'")
+
+                        lesson_content_data = self._generate_lesson_content(
+                            course_title,
+                            section_title,
+                            topic_title,
+                            lesson_title,
+                            user_profile,
+                        )
+
                     # Кэшируем в памяти для текущей сессии
                     self.lesson_interface.cached_lesson_content = lesson_content_data["content"]
                     self.lesson_interface.cached_lesson_title = lesson_content_data["title"]
@@ -168,20 +177,14 @@ class LessonDisplay:
             # Проверяем, пройден ли тест для этого урока
             test_passed = self.lesson_interface.state_manager.is_test_passed(cache_key)
             
-            self.lesson_interface.current_course_info = {
-                "course_title": course_title,
-                "section_title": section_title,
-                "topic_title": topic_title,
-                "lesson_title": lesson_title,
-                "section_id": section_id,
-                "topic_id": topic_id,
-                "lesson_id": lesson_id,
-                "user_profile": user_profile,
-                "course_plan": course_plan,
-                "test_passed": test_passed,  # Добавляем информацию о тесте
-                "lesson_content": lesson_content_data["content"],
-                "lesson_raw_content": lesson_content_data.get("raw_content"),
-            }
+            self.lesson_interface.current_course_info = self.utils.build_course_info(
+                course_plan,
+                (course_title, section_title, topic_title, lesson_title),
+                (section_id, topic_id, lesson_id),
+                user_profile,
+                lesson_content_data,
+                test_passed=test_passed,
+            )
 
             # Получаем ID курса безопасно
             course_id = self.utils.get_course_id(course_plan)
@@ -200,6 +203,12 @@ class LessonDisplay:
                 lesson_content=lesson_content_data["content"],
             )
 
+            # Сразу запускаем генерацию материалов урока, которые откроют кнопки
+            self.lesson_interface.artifacts.start()
+
+            # Пока урок читается, готовим следующий
+            self.lesson_interface.prefetcher.schedule_after(section_id, topic_id, lesson_id)
+
             # Создаем интерфейс урока
             return self.create_lesson_interface(
                 lesson_content_data,
@@ -235,6 +244,69 @@ class LessonDisplay:
                 self.lesson_interface,
             )
 
+    def _generate_lesson_content(
+        self, course_title, section_title, topic_title, lesson_title, user_profile
+    ):
+        """
+        Генерирует урок, по возможности показывая текст по мере генерации.
+
+        В потоковом режиме (по умолчанию; LESSON_STREAMING=0 отключает)
+        в текущую ячейку выводится превью, которое обновляется по мере
+        прихода токенов и убирается, когда готов итоговый урок.
+
+        Returns:
+            dict: Словарь с title, content и raw_content
+        """
+        content_generator = self.lesson_interface.content_generator
+        streaming_enabled = os.getenv("LESSON_STREAMING", "1").strip().lower() not in (
+            "0",
+            "false",
+            "no",
+            "off",
+        )
+
+        if not streaming_enabled or not hasattr(
+            content_generator, "generate_lesson_streaming"
+        ):
+            return content_generator.generate_lesson(
+                course=course_title,
+                section=section_title,
+                topic=topic_title,
+                lesson=lesson_title,
+                user_name=user_profile["name"],
+                communication_style=user_profile["communication_style"],
+            )
+
+        from content_renderer import get_display_css
+
+        preview_html = widgets.HTML(
+            value=f"<p style='color: #666;'><i>Генерация урока «{lesson_title}»...</i></p>",
+            layout=widgets.Layout(
+                width="100%",
+                padding="20px",
+                border="1px solid #ddd",
+                border_radius="8px",
+                margin="10px 0",
+            ),
+        )
+        display(preview_html)
+
+        def update_preview(partial_html):
+            preview_html.value = get_display_css() + partial_html
+
+        try:
+            return content_generator.generate_lesson_streaming(
+                course=course_title,
+                section=section_title,
+                topic=topic_title,
+                lesson=lesson_title,
+                user_name=user_profile["name"],
+                communication_style=user_profile["communication_style"],
+                on_update=update_preview,
+            )
+        finally:
+            preview_html.close()
+
     def create_lesson_interface(
         self,
         lesson_content_data,
@@ -4,6 +4,8 @@
 ИСПРАВЛЕНО: Убраны неуместные прощания в конце урока
 """
 
+import time
+
 from content_utils import BaseContentGenerator, ContentUtils
 from content_formatter_final import ContentFormatterFinal
 
@@ -43,22 +45,10 @@ class LessonGenerator(BaseContentGenerator):
             Exception: Если не удалось сгенерировать урок
         """
         try:
-            lesson_title = str(lesson) if lesson is not None else "Урок"
-
-            self.logger.info(f"Генерация содержания урока '{lesson_title}'")
-
-            prompt = self._build_lesson_prompt(
-                course, section, topic, lesson_title, user_name, communication_style
+            lesson_title, prompt, messages = self._prepare_lesson_request(
+                course, section, topic, lesson, user_name, communication_style
             )
 
-            messages = [
-                {
-                    "role": "system",
-                    "content": "Ты - опытный преподаватель Python и эксперт в программировании. Создавай подробные, информативные и практически полезные уроки БЕЗ финальных прощаний и пожеланий удачи. КРИТИЧЕСКИ ВАЖНО: ЭТО КУРС ПО PYTHON! ВСЕ ПРИМЕРЫ КОДА ДОЛЖНЫ БЫТЬ НА PYTHON И ПРАВИЛЬНО ОТФОРМАТИРОВАНЫ С ПЕРЕНОСАМИ СТРОК И ПРАВИЛЬНЫМИ ОТСТУПАМИ! НЕ ПИШИ КОД В ОДНУ СТРОКУ! КАЖДАЯ СТРОКА КОДА НА ОТДЕЛЬНОЙ СТРОКЕ!",
-                },
-                {"role": "user", "content": prompt},
-            ]
-
             self.logger.info("Отправка запроса к OpenAI API...")
 
             lesson_content = self.make_api_request(
@@ -66,45 +56,206 @@ class LessonGenerator(BaseContentGenerator):
             )
 
             self.logger.info("Получен ответ от OpenAI API")
-            
 
+            return self._finalize_lesson(
+                lesson_content,
+                lesson_title,
+                prompt,
+                course,
+                section,
+                topic,
+                user_name,
+                communication_style,
+            )
+
+        except Exception as e:
+            self.logger.error(f"Критическая ошибка при генерации урока: {str(e)}")
+            raise Exception(f"Не удалось сгенерировать урок '{lesson}': {str(e)}")
+
+    def generate_lesson_streaming(
+        self,
+        course,
+        section,
+        topic,
+        lesson,
+        user_name,
+        communication_style="friendly",
+        on_update=None,
+        render_interval=0.3,
+    ):
+        """
+        Генерирует урок в потоковом режиме с промежуточным превью.
+
+        По мере поступления токенов накопленный текст форматируется
+        упрощённо и передаётся в on_update не чаще, чем раз в
+        render_interval секунд. Итоговый результат совпадает с generate_lesson.
+
+        Args:
+            course (str): Название курса
+            section (str): Название раздела
+            topic (str): Название темы
+            lesson (str): Название урока
+            user_name (str): Имя пользователя
+            communication_style (str): Стиль общения
+            on_update (callable, optional): Получает HTML превью урока
+            render_interval (float): Минимальный интервал между превью, сек
+
+        Returns:
+            dict: Словарь с заголовком и содержанием урока
+
+        Raises:
+            Exception: Если не удалось сгенерировать урок
+        """
+        try:
+            lesson_title, prompt, messages = self._prepare_lesson_request(
+                course, section, topic, lesson, user_name, communication_style
+            )
 
-            # Сохраняем отладочную информацию
-            self.save_debug_response(
-                "lesson",
+            self.logger.info("Потоковая отправка запроса к OpenAI API...")
+
+            parts = []
+            last_render = 0.0
+            for delta in self.stream_api_request(
+                messages=messages, temperature=0.7, max_tokens=3500
+            ):
+                parts.append(delta)
+                now = time.monotonic()
+                if on_update and now - last_render >= render_interval:
+                    last_render = now
+                    on_update(
+                        self.content_formatter.format_partial_lesson_content(
+                            "".join(parts)
+                        )
+                    )
+
+            self.logger.info("Получен ответ от OpenAI API")
+
+            return self._finalize_lesson(
+                "".join(parts),
+                lesson_title,
                 prompt,
-                lesson_content,
-                {
-                    "course": course,
-                    "section": section,
-                    "topic": topic,
-                    "lesson": lesson_title,
-                    "user_name": user_name,
-                    "communication_style": communication_style,
-                },
+                course,
+                section,
+                topic,
+                user_name,
+                communication_style,
             )
 
-            # ИСПРАВЛЕНО: Используем единый ContentFormatter для форматирования
-            formatted_content = self.content_formatter.format_lesson_content(
-                lesson_content, lesson_title
+        except Exception as e:
+            self.logger.error(f"Критическая ошибка при генерации урока: {str(e)}")
+            raise Exception(f"Не удалось сгенерировать урок '{lesson}': {str(e)}")
+
+    async def generate_lesson_async(
+        self, course, section, topic, lesson, user_name, communication_style="friendly"
+    ):
+        """
+        Асинхронно генерирует содержание урока (AsyncOpenAI).
+
+        Аргументы и результат совпадают с generate_lesson.
+        """
+        try:
+            lesson_title, prompt, messages = self._prepare_lesson_request(
+                course, section, topic, lesson, user_name, communication_style
             )
 
-            # Сохраняем и сырой текст от LLM (до CSS/HTML-обёртки) — он нужен
-            # для проверки релевантности, ключевых понятий и QA, чтобы CSS
-            # форматтера не попадал в промпт вместо материала урока.
-            result = {
-                "title": lesson_title,
-                "content": formatted_content,
-                "raw_content": lesson_content,
-            }
+            self.logger.info("Асинхронная отправка запроса к OpenAI API...")
 
-            self.logger.info(f"Урок '{lesson_title}' успешно сгенерирован")
-            return result
+            lesson_content = await self.make_api_request_async(
+                messages=messages, temperature=0.7, max_tokens=3500
+            )
+
+            self.logger.info("Получен ответ от OpenAI API")
+
+            return self._finalize_lesson(
+                lesson_content,
+                lesson_title,
+                prompt,
+                course,
+                section,
+                topic,
+                user_name,
+                communication_style,
+            )
 
         except Exception as e:
             self.logger.error(f"Критическая ошибка при генерации урока: {str(e)}")
             raise Exception(f"Не удалось сгенерировать урок '{lesson}': {str(e)}")
 
+    def _prepare_lesson_request(
+        self, course, section, topic, lesson, user_name, communication_style
+    ):
+        """
+        Готовит промпт и сообщения для запроса урока.
+
+        Returns:
+            tuple: (lesson_title, prompt, messages)
+        """
+        lesson_title = str(lesson) if lesson is not None else "Урок"
+
+        self.logger.info(f"Генерация содержания урока '{lesson_title}'")
+
+        prompt = self._build_lesson_prompt(
+            course, section, topic, lesson_title, user_name, communication_style
+        )
+
+        messages = [
+            {
+                "role": "system",
+                "content": "Ты - опытный преподаватель Python и эксперт в программировании. Создавай подробные, информативные и практически полезные уроки БЕЗ финальных прощаний и пожеланий удачи. КРИТИЧЕСКИ ВАЖНО: ЭТО КУРС ПО PYTHON! ВСЕ ПРИМЕРЫ КОДА ДОЛЖНЫ БЫТЬ НА PYTHON И ПРАВИЛЬНО ОТФОРМАТИРОВАНЫ С ПЕРЕНОСАМИ СТРОК И ПРАВИЛЬНЫМИ ОТСТУПАМИ! НЕ ПИШИ КОД В ОДНУ СТРОКУ! КАЖДАЯ СТРОКА КОДА НА ОТДЕЛЬНОЙ СТРОКЕ!",
+            },
+            {"role": "user", "content": prompt},
+        ]
+        return lesson_title, prompt, messages
+
+    def _finalize_lesson(
+        self,
+        lesson_content,
+        lesson_title,
+        prompt,
+        course,
+        section,
+        topic,
+        user_name,
+        communication_style,
+    ):
+        """
+        Сохраняет отладочный ответ и форматирует сырой текст урока.
+
+        Returns:
+            dict: Словарь с title, content (HTML) и raw_content
+        """
+        # Сохраняем отладочную информацию
+        self.save_debug_response(
+            "lesson",
+            prompt,
+            lesson_content,
+            {
+                "course": course,
+                "section": section,
+                "topic": topic,
+                "lesson": lesson_title,
+                "user_name": user_name,
+                "communication_style": communication_style,
+            },
+        )
+
+        # ИСПРАВЛЕНО: Используем единый ContentFormatter для форматирования
+        formatted_content = self.content_formatter.format_lesson_content(
+            lesson_content, lesson_title
+        )
+
+        # Сохраняем и сырой текст от LLM (до CSS/HTML-обёртки) — он нужен
+        # для проверки релевантности, ключевых понятий и QA, чтобы CSS
+        # форматтера не попадал в промпт вместо материала урока.
+        result = {
+            "title": lesson_title,
+            "content": formatted_content,
+            "raw_content": lesson_content,
+        }
+
+        self.logger.info(f"Урок '{lesson_title}' успешно сгенерирован")
+        return result
+
     def _build_lesson_prompt(
         self, course, section, topic, lesson_title, user_name, communication_style
     ):
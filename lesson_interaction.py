@@ -6,6 +6,7 @@
 import ipywidgets as widgets
 import logging
 from lesson_utils import LessonUtils
+from async_tasks import schedule
 
 
 class LessonInteraction:
@@ -52,7 +53,7 @@ class LessonInteraction:
             )
 
             # Привязываем обработчики
-            def on_full_explanation_clicked(b):
+            async def show_full_explanation():
                 try:
                     # Получаем информацию о курсе
                     course_info = self.lesson_interface.current_course_info
@@ -62,7 +63,7 @@ class LessonInteraction:
                     lesson_title = course_info.get("lesson_title", "Урок")
 
                     # Генерируем полное объяснение
-                    explanation = self.lesson_interface.content_generator.get_detailed_explanation(
+                    explanation = await self.lesson_interface.content_generator.get_detailed_explanation_async(
                         course=course_title,
                         section=section_title,
                         topic=topic_title,
@@ -105,14 +106,27 @@ class LessonInteraction:
                     )
                     self.lesson_interface.explain_container.children = [error_html]
 
+            def on_full_explanation_clicked(b):
+                self.lesson_interface.explain_container.children = [
+                    widgets.HTML(
+                        value="<p><strong>Подготовка подробного объяснения...</strong></p>"
+                    )
+                ]
+                # Генерация идёт в event loop kernel и не блокирует виджеты
+                schedule(show_full_explanation())
+
             def on_concepts_explanation_clicked(b):
                 try:
                     # Кэш в памяти: если понятия для этого урока уже извлекали —
                     # не дёргаем LLM повторно (это и быстрее, и стабильнее
                     # с точки зрения навигации «Назад/Вперёд»).
-                    cached = self.lesson_interface.current_lesson_concepts
+                    cached = (
+                        self.lesson_interface.current_lesson_concepts
+                        or self.lesson_interface.artifacts.get("concepts")
+                    )
                     if cached:
                         concepts = cached
+                        self.lesson_interface.current_lesson_concepts = concepts
                     else:
                         concepts = (
                             self.lesson_interface.content_generator.generate_concepts(
@@ -259,9 +273,13 @@ class LessonInteraction:
                 # тратить токены LLM и не выдавать студенту другой список
                 # понятий при каждом возврате.
                 try:
-                    cached = self.lesson_interface.current_lesson_concepts
+                    cached = (
+                        self.lesson_interface.current_lesson_concepts
+                        or self.lesson_interface.artifacts.get("concepts")
+                    )
                     if cached:
                         concepts = cached
+                        self.lesson_interface.current_lesson_concepts = concepts
                     else:
                         concepts = (
                             self.lesson_interface.content_generator.generate_concepts(
@@ -389,6 +407,82 @@ class LessonInteraction:
 
             self.logger.info("Виджеты QA контейнера созданы")
 
+            def show_answer_error(e):
+                self.logger.error(f"Ошибка при генерации ответа: {str(e)}")
+                answer_area.value = f"<p style='color: red;'>Ошибка при генерации ответа: {str(e)}</p>"
+                send_button.disabled = False
+
+            async def answer_question_async(question):
+                content_generator = self.lesson_interface.content_generator
+
+                # Проверяем релевантность вопроса.
+                # Передаём course_context, чтобы из тела урока была срезана
+                # breadcrumb-шапка и LLM учитывал именно материал урока
+                # (а не название курса/раздела).
+                relevance_result = await content_generator.check_question_relevance_async(
+                    question,
+                    self.lesson_interface.current_lesson_content,
+                    self.lesson_interface.current_lesson_data,
+                    course_context=self.lesson_interface.current_course_info,
+                    lesson_raw_content=self.lesson_interface.current_lesson_raw_content,
+                )
+
+                self.logger.info(f"Релевантность вопроса: {relevance_result}")
+
+                # Если вопрос нерелевантен
+                if not relevance_result.get("is_relevant", True):
+                    self.logger.warning("Вопрос нерелевантен уроку")
+                    answer_area.value = f"""
+                    <div style='background-color: #fff3cd; color: #856404; padding: 15px;
+                                border-radius: 8px; border: 1px solid #ffeaa7;'>
+                        <h4>⚠️ Вопрос не связан с уроком</h4>
+                        <p><strong>Ваш вопрос:</strong> {question}</p>
+                        <p><strong>Причина:</strong> {relevance_result.get('reason', 'Вопрос не относится к теме урока')}</p>
+                        <p><strong>Рекомендация:</strong> Задайте вопрос, связанный с содержанием урока.</p>
+                    </div>
+                    """
+                    send_button.disabled = False
+                    return
+
+                # Генерируем ответ
+                self.logger.info("Генерируем ответ на вопрос")
+
+                # Получаем информацию о курсе для правильного вызова answer_question
+                course_info = self.lesson_interface.current_course_info
+                course_title = course_info.get("course_title", "Курс")
+                section_title = course_info.get("section_title", "Раздел")
+                topic_title = course_info.get("topic_title", "Тема")
+                lesson_title = course_info.get("lesson_title", "Урок")
+                user_name = course_info.get("user_profile", {}).get(
+                    "name", "Пользователь"
+                )
+
+                answer = await content_generator.answer_question_async(
+                    course=course_title,
+                    section=section_title,
+                    topic=topic_title,
+                    lesson=lesson_title,
+                    user_question=question,
+                    lesson_content=self.lesson_interface.current_lesson_content,
+                    user_name=user_name,
+                    communication_style=course_info["user_profile"][
+                        "communication_style"
+                    ],
+                )
+
+                self.logger.info(
+                    f"Ответ сгенерирован, длина: {len(answer)} символов"
+                )
+
+                # Отображаем ответ
+                answer_area.value = answer
+
+                # Очищаем поле ввода
+                question_input.value = ""
+                send_button.disabled = False
+
+                self.logger.info("Вопрос успешно обработан")
+
             def on_send_question_button_clicked(b):
                 self.logger.info("Кнопка 'Отправить вопрос' нажата")
                 try:
@@ -421,75 +515,13 @@ class LessonInteraction:
 
                     self.logger.info(f"Счетчик вопросов обновлен: {questions_count}")
 
-                    # Проверяем релевантность вопроса.
-                    # Передаём course_context, чтобы из тела урока была срезана
-                    # breadcrumb-шапка и LLM учитывал именно материал урока
-                    # (а не название курса/раздела).
-                    relevance_result = self.lesson_interface.content_generator.check_question_relevance(
-                        question,
-                        self.lesson_interface.current_lesson_content,
-                        self.lesson_interface.current_lesson_data,
-                        course_context=self.lesson_interface.current_course_info,
-                        lesson_raw_content=self.lesson_interface.current_lesson_raw_content,
-                    )
-
-                    self.logger.info(f"Релевантность вопроса: {relevance_result}")
-
-                    # Если вопрос нерелевантен
-                    if not relevance_result.get("is_relevant", True):
-                        self.logger.warning("Вопрос нерелевантен уроку")
-                        answer_area.value = f"""
-                        <div style='background-color: #fff3cd; color: #856404; padding: 15px;
-                                    border-radius: 8px; border: 1px solid #ffeaa7;'>
-                            <h4>⚠️ Вопрос не связан с уроком</h4>
-                            <p><strong>Ваш вопрос:</strong> {question}</p>
-                            <p><strong>Причина:</strong> {relevance_result.get('reason', 'Вопрос не относится к теме урока')}</p>
-                            <p><strong>Рекомендация:</strong> Задайте вопрос, связанный с содержанием урока.</p>
-                        </div>
-                        """
-                        return
-
-                    # Генерируем ответ
-                    self.logger.info("Генерируем ответ на вопрос")
-
-                    # Получаем информацию о курсе для правильного вызова answer_question
-                    course_info = self.lesson_interface.current_course_info
-                    course_title = course_info.get("course_title", "Курс")
-                    section_title = course_info.get("section_title", "Раздел")
-                    topic_title = course_info.get("topic_title", "Тема")
-                    lesson_title = course_info.get("lesson_title", "Урок")
-                    user_name = course_info.get("user_profile", {}).get(
-                        "name", "Пользователь"
-                    )
-
-                    answer = self.lesson_interface.content_generator.answer_question(
-                        course=course_title,
-                        section=section_title,
-                        topic=topic_title,
-                        lesson=lesson_title,
-                        user_question=question,
-                        lesson_content=self.lesson_interface.current_lesson_content,
-                        user_name=user_name,
-                        communication_style=course_info["user_profile"][
-                            "communication_style"
-                        ],
-                    )
-
-                    self.logger.info(
-                        f"Ответ сгенерирован, длина: {len(answer)} символов"
-                    )
-
-                    # Отображаем ответ
-                    answer_area.value = answer
-
-                    # Очищаем поле ввода
-                    question_input.value = ""
-
-                    self.logger.info("Вопрос успешно обработан")
+                    # Генерация идёт в event loop kernel: обработчик возвращается
+                    # сразу, виджеты остаются отзывчивыми до прихода ответа.
+                    send_button.disabled = True
+                    schedule(answer_question_async(question), on_error=show_answer_error)
 
                 except Exception as e:
-                    self.logger.error(f"Ошибка при генерации ответа: {str(e)}")
-                    answer_area.value = f"<p style='color: red;'>Ошибка при генерации ответа: {str(e)}</p>"
+                    show_answer_error(e)
 
             def on_close_button_clicked(b):
                 self.logger.info("Кнопка 'Закрыть' нажата")
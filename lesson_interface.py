@@ -15,8 +15,10 @@ from lesson_display import LessonDisplay
 from lesson_navigation import LessonNavigation
 from lesson_interaction import LessonInteraction
 from lesson_utils import LessonUtils
+from lesson_artifacts import LessonArtifacts
 from assessment_interface import AssessmentInterface
 from control_tasks_interface import ControlTasksInterface
+from lesson_prefetcher import get_lesson_prefetcher
 
 
 class LessonInterface:
@@ -88,6 +90,11 @@ class LessonInterface:
         self.interaction = LessonInteraction(self)
         self.lesson_utils = LessonUtils()
         self.control_tasks_interface = ControlTasksInterface(content_generator, self)
+        # Слот материалов текущего урока (примеры, тест, понятия, задание)
+        self.artifacts = LessonArtifacts(self)
+
+        # Фоновая предзагрузка следующего урока
+        self.prefetcher = get_lesson_prefetcher(state_manager, content_generator)
 
         # Инициализируем интерфейс тестирования
         try:
@@ -8,6 +8,7 @@ import logging
 from lesson_utils import LessonUtils
 import re
 from cell_integration import cell_adapter
+from async_tasks import schedule
 
 
 class LessonNavigation:
@@ -259,97 +260,105 @@ class LessonNavigation:
             # Показываем выбор типа объяснения
             self.lesson_interface._show_explanation_choice()
 
-        def on_examples_button_clicked(b):
-            # Скрываем другие контейнеры
-            self.lesson_interface._hide_other_containers()
-            # Показываем загрузку примеров
-            if self.lesson_interface.examples_container:
-                self.lesson_interface.examples_container.layout.display = "block"
-                loading_html = widgets.HTML(
-                    value="<p><strong>Генерация примеров...</strong></p>"
+        async def show_examples():
+            try:
+                from examples_display import build_examples_widgets
+
+                lesson_id = self.lesson_interface.current_lesson_id
+                lesson_title = (
+                    self.lesson_interface.current_lesson_data or {}
+                ).get("title", "?")
+                self.logger.info(
+                    f"Генерация примеров для урока {lesson_id} «{lesson_title}»"
                 )
-                self.lesson_interface.examples_container.children = [loading_html]
-                try:
-                    from examples_generator import ExamplesGenerator
-                    from examples_display import build_examples_widgets
 
-                    lesson_id = self.lesson_interface.current_lesson_id
-                    lesson_title = (
-                        self.lesson_interface.current_lesson_data or {}
-                    ).get("title", "?")
+                examples_key = lesson_id
+                cached = (
+                    self.lesson_interface.current_lesson_examples
+                    if self.lesson_interface.current_lesson_examples_key
+                    == examples_key
+                    else None
+                )
+
+                if not cached:
+                    # Примеры могли быть сгенерированы сразу после показа урока
+                    cached = await self.lesson_interface.artifacts.get_async("examples")
+                    if cached:
+                        self.lesson_interface.current_lesson_examples = cached
+                        self.lesson_interface.current_lesson_examples_key = examples_key
+
+                if cached:
                     self.logger.info(
-                        f"Генерация примеров для урока {lesson_id} «{lesson_title}»"
+                        f"Используем кэшированные примеры для {examples_key}"
                     )
-
-                    examples_key = lesson_id
-                    cached = (
-                        self.lesson_interface.current_lesson_examples
-                        if self.lesson_interface.current_lesson_examples_key
-                        == examples_key
-                        else None
+                    examples_data = cached
+                else:
+                    lesson_content = (
+                        self.lesson_interface.current_lesson_raw_content
+                        or self.lesson_interface.current_lesson_content
                     )
+                    # Асинхронно: kernel продолжает обрабатывать виджеты,
+                    # пока генерируются и проверяются примеры
+                    examples_data = await self.lesson_interface.content_generator.generate_examples_data_async(
+                        lesson_data=self.lesson_interface.current_lesson_data,
+                        lesson_content=lesson_content,
+                        communication_style=self.lesson_interface.current_course_info[
+                            "user_profile"
+                        ]["communication_style"],
+                        course_context=self.lesson_interface.current_course_info,
+                    )
+                    self.lesson_interface.current_lesson_examples = examples_data
+                    self.lesson_interface.current_lesson_examples_key = examples_key
 
-                    if cached:
-                        self.logger.info(
-                            f"Используем кэшированные примеры для {examples_key}"
-                        )
-                        examples_data = cached
-                    else:
-                        examples_generator = ExamplesGenerator(
-                            self.lesson_interface.content_generator.api_key
-                        )
-                        lesson_content = (
-                            self.lesson_interface.current_lesson_raw_content
-                            or self.lesson_interface.current_lesson_content
-                        )
-                        examples_data = examples_generator.generate_examples_data(
-                            lesson_data=self.lesson_interface.current_lesson_data,
-                            lesson_content=lesson_content,
-                            communication_style=self.lesson_interface.current_course_info[
-                                "user_profile"
-                            ]["communication_style"],
-                            course_context=self.lesson_interface.current_course_info,
-                        )
-                        self.lesson_interface.current_lesson_examples = examples_data
-                        self.lesson_interface.current_lesson_examples_key = examples_key
+                widgets_to_display = build_examples_widgets(examples_data, cell_adapter)
 
-                    widgets_to_display = build_examples_widgets(examples_data, cell_adapter)
+                close_button = widgets.Button(
+                    description="✕ Закрыть",
+                    button_style="danger",
+                    layout=widgets.Layout(width="auto", margin="10px 0"),
+                )
 
-                    close_button = widgets.Button(
-                        description="✕ Закрыть",
-                        button_style="danger",
-                        layout=widgets.Layout(width="auto", margin="10px 0"),
-                    )
+                def on_close_button_clicked(b):
+                    self.lesson_interface.examples_container.layout.display = "none"
 
-                    def on_close_button_clicked(b):
-                        self.lesson_interface.examples_container.layout.display = "none"
+                close_button.on_click(on_close_button_clicked)
+                widgets_to_display.append(close_button)
 
-                    close_button.on_click(on_close_button_clicked)
-                    widgets_to_display.append(close_button)
+                self.lesson_interface.examples_container.children = widgets_to_display
+            except Exception as e:
+                self.logger.error(f"Ошибка при генерации примеров: {str(e)}")
 
-                    self.lesson_interface.examples_container.children = widgets_to_display
-                except Exception as e:
-                    self.logger.error(f"Ошибка при генерации примеров: {str(e)}")
+                self.lesson_interface.examples_container.children = []
 
-                    self.lesson_interface.examples_container.children = []
+                error_html = widgets.HTML(
+                    value=f"<p style='color: red;'>Ошибка при генерации примеров: {str(e)}</p>"
+                )
+                close_button = widgets.Button(
+                    description="✕ Закрыть",
+                    button_style="danger",
+                    layout=widgets.Layout(width="auto", margin="10px 0"),
+                )
 
-                    error_html = widgets.HTML(
-                        value=f"<p style='color: red;'>Ошибка при генерации примеров: {str(e)}</p>"
-                    )
-                    close_button = widgets.Button(
-                        description="✕ Закрыть",
-                        button_style="danger",
-                        layout=widgets.Layout(width="auto", margin="10px 0"),
-                    )
+                def on_close_button_clicked(b):
+                    self.lesson_interface.examples_container.layout.display = "none"
 
-                    def on_close_button_clicked(b):
-                        self.lesson_interface.examples_container.layout.display = "none"
+                close_button.on_click(on_close_button_clicked)
+                self.lesson_interface.examples_container.children = [
+                    error_html,
+                    close_button,
+                ]
 
-                    close_button.on_click(on_close_button_clicked)
-                    self.lesson_interface.examples_container.children = [
-                        error_html,
-                        close_button,
-                    ]
+        def on_examples_button_clicked(b):
+            # Скрываем другие контейнеры
+            self.lesson_interface._hide_other_containers()
+            # Показываем загрузку примеров
+            if self.lesson_interface.examples_container:
+                self.lesson_interface.examples_container.layout.display = "block"
+                loading_html = widgets.HTML(
+                    value="<p><strong>Генерация примеров...</strong></p>"
+                )
+                self.lesson_interface.examples_container.children = [loading_html]
+                schedule(show_examples())
 
         def on_control_tasks_button_clicked(b):
             # Скрываем другие контейнеры
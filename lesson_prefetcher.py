@@ -0,0 +1,382 @@
+"""
+Фоновая предзагрузка следующего урока.
+
+Пока пользователь читает текущий урок, следующий урок курса генерируется
+в фоновом потоке, и переход «Следующий урок» не ждёт полного запроса к LLM.
+По желанию заранее генерируются и материалы следующего урока (тест,
+примеры, контрольное задание) — их ответы оседают в кэше ответов LLM,
+и при открытии панелей запросы к API уже не нужны.
+
+Задания выполняются по очереди с приоритетами: сначала сам урок, затем
+его материалы. Все запросы предзагрузки идут внутри background_requests(),
+поэтому интерактивные запросы пользователя всегда обслуживаются первыми.
+При смене курса очередь очищается, а результаты уже выполняющихся
+заданий отбрасываются.
+
+Настройки (переменные окружения / .env):
+    LESSON_PREFETCH — предзагрузка следующего урока (1, 0 — отключить)
+    LESSON_PREFETCH_ARTIFACTS — также тест, примеры и контрольное задание (0)
+"""
+
+import os
+import queue
+import logging
+import itertools
+import threading
+
+from lesson_utils import LessonUtils
+from llm_rate_limit import background_requests
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты заданий: меньше — раньше
+PRIORITY_LESSON = 10
+PRIORITY_ARTIFACTS = 20
+
+# Число вопросов теста — как в интерфейсе тестирования
+PREFETCH_NUM_QUESTIONS = 5
+
+
+def _env_flag(name, default):
+    """Читает логический флаг из окружения."""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() not in ("0", "false", "no", "off", "")
+
+
+class LessonPrefetcher:
+    """Фоновая генерация следующего урока и его материалов."""
+
+    def __init__(self, state_manager, content_generator):
+        """
+        Инициализация предзагрузчика.
+
+        Args:
+            state_manager: Менеджер состояния
+            content_generator: Генератор контента (ContentGenerator)
+        """
+        self.state_manager = state_manager
+        self.content_generator = content_generator
+        self.utils = LessonUtils()
+        self.enabled = _env_flag("LESSON_PREFETCH", True)
+        self.prefetch_artifacts = _env_flag("LESSON_PREFETCH_ARTIFACTS", False)
+
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        # Эпоха: увеличивается при отмене, задания старой эпохи отбрасываются
+        self._epoch = 0
+        self._course_id = None
+        self._pending = {}  # (kind, cache_key) -> threading.Event
+        self._lessons = {}  # cache_key -> lesson_content_data
+        self._running = None  # (kind, cache_key) выполняющегося задания
+        self._worker = None
+        self._control_tasks_generator = None
+
+    def schedule_after(self, section_id, topic_id, lesson_id):
+        """
+        Ставит в очередь урок, идущий после указанного.
+
+        Вызывается после показа урока. Если сменился курс, незавершённая
+        предзагрузка предыдущего курса отменяется.
+
+        Args:
+            section_id (str): ID раздела текущего урока
+            topic_id (str): ID темы текущего урока
+            lesson_id (str): ID текущего урока
+        """
+        if not self.enabled:
+            return
+        try:
+            course_id = self.utils.get_course_id(self.state_manager.get_course_plan())
+            if course_id != self._course_id:
+                self.cancel()
+                self._course_id = course_id
+
+            next_lesson = self.state_manager.get_lesson_after(
+                section_id, topic_id, lesson_id
+            )
+            if not next_lesson:
+                return
+            next_ids = next_lesson[:3]
+            cache_key = ":".join(next_ids)
+
+            with self._lock:
+                if cache_key in self._lessons or ("lesson", cache_key) in self._pending:
+                    return
+            if self.state_manager.get_cached_lesson_content(cache_key):
+                if self.prefetch_artifacts:
+                    self._submit(PRIORITY_ARTIFACTS, "artifacts", cache_key, next_ids)
+                return
+
+            self._submit(PRIORITY_LESSON, "lesson", cache_key, next_ids)
+            logger.info(f"Урок {cache_key} поставлен в очередь предзагрузки")
+
+        except Exception as e:
+            logger.error(f"Ошибка при планировании предзагрузки урока: {str(e)}")
+
+    def take_lesson(self, cache_key, timeout=None):
+        """
+        Забирает предзагруженный урок.
+
+        Если урок уже генерируется, ждёт его не дольше timeout; если он
+        только стоит в очереди или не успел за timeout, предзагрузка
+        урока отменяется и возвращается None — вызывающий код генерирует
+        урок сам, не дожидаясь фоновой очереди.
+
+        Args:
+            cache_key (str): Ключ урока "section_id:topic_id:lesson_id"
+            timeout (float, optional): Максимальное ожидание, секунд
+
+        Returns:
+            dict | None: title, content и raw_content урока или None
+        """
+        job = ("lesson", cache_key)
+        with self._lock:
+            lesson = self._lessons.pop(cache_key, None)
+            event = self._pending.get(job)
+            running = self._running == job
+        if lesson is not None:
+            logger.info(f"Урок {cache_key} взят из предзагрузки")
+            return lesson
+        if event is None:
+            return None
+
+        if running:
+            logger.info(f"Ожидание предзагрузки урока {cache_key}")
+            event.wait(timeout)
+        with self._lock:
+            lesson = self._lessons.pop(cache_key, None)
+            if lesson is None and self._pending.get(job) is event:
+                # Результат опоздавшего задания больше не нужен
+                del self._pending[job]
+        if lesson is None:
+            logger.info(f"Урок {cache_key} не успел предзагрузиться, генерация сразу")
+            event.set()
+        return lesson
+
+    def cancel(self):
+        """Отменяет всю запланированную предзагрузку (например, при смене курса)."""
+        with self._lock:
+            self._epoch += 1
+            pending = list(self._pending.values())
+            self._pending.clear()
+            self._lessons.clear()
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        # Ожидающие take_lesson не должны висеть до таймаута
+        for event in pending:
+            event.set()
+        if pending:
+            logger.info(f"Предзагрузка отменена ({len(pending)} заданий)")
+
+    def shutdown(self):
+        """Отменяет предзагрузку и останавливает фоновый поток."""
+        self.cancel()
+        worker = self._worker
+        if worker is not None and worker.is_alive():
+            self._put(float("inf"), None)
+            worker.join(timeout=1)
+        self._worker = None
+
+    def _put(self, priority, job):
+        self._queue.put((priority, next(self._seq), job))
+
+    def _submit(self, priority, kind, cache_key, ids):
+        with self._lock:
+            if (kind, cache_key) in self._pending:
+                return
+            self._pending[(kind, cache_key)] = threading.Event()
+            epoch = self._epoch
+        self._put(priority, (kind, cache_key, ids, epoch))
+        self._ensure_worker()
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(
+                target=self._run, name="lesson-prefetch", daemon=True
+            )
+            self._worker.start()
+
+    def _run(self):
+        """Цикл фонового потока."""
+        while True:
+            _, _, job = self._queue.get()
+            if job is None:
+                return
+            kind, cache_key, ids, epoch = job
+            with self._lock:
+                event = self._pending.get((kind, cache_key))
+                if epoch != self._epoch or event is None or event.is_set():
+                    # Отменено (в том числе забрано take_lesson до начала)
+                    continue
+                self._running = (kind, cache_key)
+
+            succeeded = False
+            try:
+                with background_requests():
+                    if kind == "lesson":
+                        lesson = self._generate_lesson(*ids)
+                        with self._lock:
+                            # Урок, который take_lesson перестал ждать, не храним
+                            if self._pending.get((kind, cache_key)) is event:
+                                self._lessons[cache_key] = lesson
+                        logger.info(f"Урок {cache_key} предзагружен")
+                    else:
+                        self._generate_artifacts(*ids)
+                succeeded = True
+            except Exception as e:
+                logger.warning(
+                    f"Ошибка предзагрузки ({kind}) урока {cache_key}: {str(e)}"
+                )
+            finally:
+                with self._lock:
+                    self._running = None
+                    if self._pending.get((kind, cache_key)) is event:
+                        del self._pending[(kind, cache_key)]
+                    else:
+                        succeeded = False
+                event.set()
+
+            if succeeded and kind == "lesson" and self.prefetch_artifacts:
+                with self._lock:
+                    if epoch != self._epoch:
+                        continue
+                self._submit(PRIORITY_ARTIFACTS, "artifacts", cache_key, ids)
+
+    def _lesson_context(self, section_id, topic_id, lesson_id):
+        """Названия элементов урока и профиль пользователя."""
+        course_plan = self.state_manager.get_course_plan()
+        titles = self.utils.get_element_titles(
+            course_plan, section_id, topic_id, lesson_id
+        )
+        return course_plan, titles, self.state_manager.get_user_profile()
+
+    def _generate_lesson(self, section_id, topic_id, lesson_id):
+        """
+        Генерирует урок теми же параметрами, что и LessonDisplay.
+
+        Returns:
+            dict: title, content и raw_content урока
+        """
+        _, titles, user_profile = self._lesson_context(section_id, topic_id, lesson_id)
+        course_title, section_title, topic_title, lesson_title = titles
+        # Напрямую через генератор уроков: фасад показывает индикатор загрузки
+        return self.content_generator.lesson_gen.generate_lesson(
+            course=course_title,
+            section=section_title,
+            topic=topic_title,
+            lesson=lesson_title,
+            user_name=user_profile["name"],
+            communication_style=user_profile["communication_style"],
+        )
+
+    def _generate_artifacts(self, section_id, topic_id, lesson_id):
+        """
+        Генерирует тест, примеры и контрольное задание урока.
+
+        Результаты не сохраняются: запросы совпадают с теми, что отправит
+        интерфейс, и ответы берутся из кэша ответов LLM.
+        """
+        cache_key = f"{section_id}:{topic_id}:{lesson_id}"
+        lesson = self.state_manager.get_cached_lesson_content(cache_key)
+        if not lesson:
+            with self._lock:
+                lesson = self._lessons.get(cache_key)
+        if not lesson:
+            return
+
+        course_plan, titles, user_profile = self._lesson_context(
+            section_id, topic_id, lesson_id
+        )
+        course_title, section_title, topic_title, lesson_title = titles
+        lesson_data = self.state_manager.get_lesson_data(
+            section_id, topic_id, lesson_id
+        )
+        course_info = self.utils.build_course_info(
+            course_plan,
+            titles,
+            (section_id, topic_id, lesson_id),
+            user_profile,
+            lesson,
+            test_passed=self.state_manager.is_test_passed(cache_key),
+        )
+        lesson_text = lesson.get("raw_content") or lesson["content"]
+        communication_style = user_profile["communication_style"]
+
+        self.content_generator.assessment_gen.generate_assessment(
+            course_title,
+            section_title,
+            topic_title,
+            lesson_title,
+            lesson["content"],
+            PREFETCH_NUM_QUESTIONS,
+        )
+        self.content_generator.examples_gen.generate_examples_data(
+            lesson_data,
+            lesson_text,
+            communication_style,
+            course_context=course_info,
+        )
+        if self._control_tasks_generator is None:
+            from control_tasks_generator import ControlTasksGenerator
+
+            self._control_tasks_generator = ControlTasksGenerator(
+                self.content_generator.api_key
+            )
+        # Только прогрев кэша LLM: эталонный код выполняется (exec с
+        # перехватом stdout) при показе задания в потоке kernel
+        self._control_tasks_generator.generate_control_task(
+            lesson_data,
+            lesson_content=lesson_text,
+            communication_style=communication_style,
+            course_context=course_info,
+            materialize=False,
+        )
+        logger.info(f"Материалы урока {cache_key} предзагружены")
+
+
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+
+def get_lesson_prefetcher(state_manager, content_generator):
+    """
+    Возвращает общий для процесса предзагрузчик.
+
+    Если менеджер состояния или генератор сменились (перезапуск движка),
+    прежний предзагрузчик останавливается.
+
+    Args:
+        state_manager: Менеджер состояния
+        content_generator: Генератор контента
+
+    Returns:
+        LessonPrefetcher: Общий экземпляр
+    """
+    global _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher is not None and (
+            _prefetcher.state_manager is not state_manager
+            or _prefetcher.content_generator is not content_generator
+        ):
+            _prefetcher.shutdown()
+            _prefetcher = None
+        if _prefetcher is None:
+            _prefetcher = LessonPrefetcher(state_manager, content_generator)
+        return _prefetcher
+
+
+def shutdown_lesson_prefetcher():
+    """Останавливает общий предзагрузчик, если он создавался."""
+    global _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher is not None:
+            _prefetcher.shutdown()
+            _prefetcher = None
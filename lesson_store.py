@@ -0,0 +1,658 @@
+"""
+Хранилище содержания уроков.
+
+Раньше сгенерированные уроки (HTML и сырой текст) лежали в state.json в
+разделе lesson_content_cache, и каждый save_state() заново сериализовал
+их все — даже при увеличении счётчика вопросов. Теперь уроки хранятся
+отдельно, в SQLite-файле рядом с состоянием, по строке на урок, и читаются
+только при открытии урока. state.json остаётся маленьким.
+
+Старый раздел lesson_content_cache переносится сюда один раз при загрузке
+состояния (см. StateManager._migrate_lesson_content_cache).
+
+Уроки хранятся сжатыми: HTML и сырой текст сжимаются zlib (или zstd,
+если установлен пакет zstandard; со словарём, обученным на уже
+сохранённых уроках, когда их накопится достаточно). Встроенные блоки
+<style> в HTML не хранятся: CSS урока добавляется при показе
+(content_renderer.get_display_css), а в старых уроках он повторялся
+целиком в каждой записи. Записи, сохранённые до сжатия, пережимаются
+один раз при открытии хранилища.
+
+Размер хранилища ограничен (evict): при превышении лимита по объёму или
+числу уроков, а также для уроков, которые давно не открывались, уроки
+вытесняются с учётом курса. Текущий урок и несколько следующих за ним не
+вытесняются никогда; первыми уходят уроки брошенных курсов (прогресс по
+ним сбрасывается при смене курса, так что они уже пройдены или не нужны),
+затем пройденные уроки текущего курса, затем остальные — каждая группа
+в порядке давности последнего открытия (LRU).
+
+Хранилище может быть общим для нескольких учащихся (см. StateManager с
+learner_id). Тогда каждый учащийся закрепляет (pin) свои текущий и
+следующие уроки, и evict не вытесняет закреплённые кем-либо уроки.
+Закрепления учащегося, который не заходил дольше LESSON_STORE_MAX_AGE_DAYS,
+перестают действовать.
+
+Настройки (переменные окружения / .env):
+    LESSON_STORE_COMPRESSION — zlib, zstd или none (zlib)
+    LESSON_STORE_MAX_MB — максимальный размер уроков на диске, МБ (100)
+    LESSON_STORE_MAX_ENTRIES — максимальное число уроков (1000)
+    LESSON_STORE_MAX_AGE_DAYS — вытеснять уроки, не открывавшиеся столько дней (180, 0 — не вытеснять)
+    LESSON_STORE_KEEP_AHEAD — сколько следующих уроков курса не вытеснять (3)
+"""
+
+import os
+import time
+import zlib
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from content_renderer import strip_embedded_styles
+
+try:
+    import zstandard
+
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE_FILE = "lesson_content.sqlite3"
+
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 9
+
+# Словарь zstd обучается, когда накопится столько уроков
+ZSTD_DICT_MIN_SAMPLES = 16
+ZSTD_DICT_SIZE = 64 * 1024
+
+
+def _env_float(name, default):
+    """Читает число из окружения, при ошибке — значение по умолчанию."""
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        logger.warning("Некорректное значение %s, используется %s", name, default)
+        return float(default)
+
+
+def _get_codec():
+    """Алгоритм сжатия из настроек (zstd без пакета заменяется на zlib)."""
+    codec = (os.getenv("LESSON_STORE_COMPRESSION") or "zlib").strip().lower()
+    if codec == "zstd" and not ZSTD_AVAILABLE:
+        logger.warning(
+            "LESSON_STORE_COMPRESSION=zstd, но пакет zstandard не установлен — используется zlib"
+        )
+        return "zlib"
+    if codec not in ("zlib", "zstd", "none"):
+        logger.warning(
+            f"Неизвестный LESSON_STORE_COMPRESSION={codec}, используется zlib"
+        )
+        return "zlib"
+    return codec
+
+
+class LessonContentStore:
+    """Уроки в SQLite: по строке на урок, чтение по ключу урока."""
+
+    def __init__(self, path, max_bytes=None, max_entries=None, max_age_seconds=None):
+        """
+        Инициализация хранилища.
+
+        Args:
+            path (str | Path): Путь к SQLite-файлу
+            max_bytes (int, optional): Лимит размера уроков на диске
+            max_entries (int, optional): Лимит числа уроков
+            max_age_seconds (float, optional): Вытеснять уроки, не открывавшиеся
+                дольше (0 — не вытеснять по давности)
+        """
+        self.path = Path(path)
+        self.codec = _get_codec()
+        self.max_bytes = int(
+            max_bytes
+            if max_bytes is not None
+            else _env_float("LESSON_STORE_MAX_MB", 100) * 1024 * 1024
+        )
+        self.max_entries = int(
+            max_entries
+            if max_entries is not None
+            else _env_float("LESSON_STORE_MAX_ENTRIES", 1000)
+        )
+        self.max_age_seconds = float(
+            max_age_seconds
+            if max_age_seconds is not None
+            else _env_float("LESSON_STORE_MAX_AGE_DAYS", 180) * 86400
+        )
+        self.keep_ahead = int(_env_float("LESSON_STORE_KEEP_AHEAD", 3))
+        self.evictions = 0
+        self.evicted_bytes = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._zstd_dicts = {}
+        self._zstd_dict_id = None
+        self.enabled = True
+        try:
+            self._connect()
+        except Exception as e:
+            logger.error(f"Не удалось открыть хранилище уроков {self.path}: {str(e)}")
+            self.enabled = False
+
+    def _connect(self):
+        """Открывает SQLite-файл и создаёт таблицу."""
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self._conn = sqlite3.connect(
+            str(self.path), check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS lessons (
+                lesson_id TEXT PRIMARY KEY,
+                title TEXT NOT NULL,
+                content TEXT NOT NULL,
+                raw_content TEXT,
+                size INTEGER NOT NULL,
+                cached_at TEXT NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        # Колонки сжатия (хранилища, созданные до сжатия, дополняются)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(lessons)")}
+        for column, ddl in (
+            ("codec", "codec TEXT NOT NULL DEFAULT 'none'"),
+            ("dict_id", "dict_id INTEGER"),
+            ("raw_size", "raw_size INTEGER NOT NULL DEFAULT 0"),
+            ("course_id", "course_id TEXT"),
+        ):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE lessons ADD COLUMN {ddl}")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS zstd_dicts (
+                dict_id INTEGER PRIMARY KEY,
+                data BLOB NOT NULL,
+                created_at TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pins (
+                owner TEXT NOT NULL,
+                lesson_id TEXT NOT NULL,
+                pinned_at REAL NOT NULL,
+                PRIMARY KEY (owner, lesson_id)
+            )
+            """
+        )
+        if self.codec == "zstd":
+            row = self._conn.execute("SELECT MAX(dict_id) FROM zstd_dicts").fetchone()
+            self._zstd_dict_id = row[0]
+        self._recompress_legacy()
+        logger.debug(f"Хранилище уроков открыто: {self.path}")
+
+    def _zstd_dict(self, dict_id):
+        """Словарь zstd по номеру (загружается из базы один раз)."""
+        if dict_id is None:
+            return None
+        if dict_id not in self._zstd_dicts:
+            row = self._conn.execute(
+                "SELECT data FROM zstd_dicts WHERE dict_id = ?", (dict_id,)
+            ).fetchone()
+            self._zstd_dicts[dict_id] = zstandard.ZstdCompressionDict(row[0])
+        return self._zstd_dicts[dict_id]
+
+    def _encode(self, text):
+        """
+        Сжимает текст текущим алгоритмом.
+
+        Returns:
+            tuple: (данные, codec, dict_id)
+        """
+        if text is None:
+            return None, self.codec, None
+        data = text.encode("utf-8")
+        if self.codec == "zlib":
+            return zlib.compress(data, ZLIB_LEVEL), "zlib", None
+        if self.codec == "zstd":
+            zdict = self._zstd_dict(self._zstd_dict_id)
+            compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=zdict)
+            return compressor.compress(data), "zstd", self._zstd_dict_id
+        return text, "none", None
+
+    def _decode(self, value, codec, dict_id):
+        """Распаковывает значение, сохранённое с указанным алгоритмом."""
+        if value is None or codec in (None, "none"):
+            return value
+        if codec == "zlib":
+            return zlib.decompress(value).decode("utf-8")
+        if codec == "zstd":
+            if not ZSTD_AVAILABLE:
+                raise RuntimeError("Урок сжат zstd, но пакет zstandard не установлен")
+            decompressor = zstandard.ZstdDecompressor(
+                dict_data=self._zstd_dict(dict_id)
+            )
+            return decompressor.decompress(value).decode("utf-8")
+        raise ValueError(f"Неизвестный формат сжатия урока: {codec}")
+
+    def _recompress_legacy(self):
+        """Однократно сжимает записи, сохранённые до появления сжатия."""
+        if self.codec == "none":
+            return
+        rows = self._conn.execute(
+            "SELECT lesson_id, content, raw_content FROM lessons WHERE codec = 'none'"
+        ).fetchall()
+        for lesson_id, content, raw_content in rows:
+            self._write_row(lesson_id, content, raw_content, update_only=True)
+        if rows:
+            logger.info(f"Сжато уроков, сохранённых без сжатия: {len(rows)}")
+
+    def _maybe_train_dictionary(self):
+        """Обучает словарь zstd на сохранённых уроках (один раз)."""
+        if self.codec != "zstd" or self._zstd_dict_id is not None:
+            return
+        count = self._conn.execute("SELECT COUNT(*) FROM lessons").fetchone()[0]
+        if count < ZSTD_DICT_MIN_SAMPLES:
+            return
+        samples = []
+        for content, raw_content, codec, dict_id in self._conn.execute(
+            "SELECT content, raw_content, codec, dict_id FROM lessons"
+        ):
+            for value in (content, raw_content):
+                text = self._decode(value, codec, dict_id)
+                if text:
+                    samples.append(text.encode("utf-8"))
+        try:
+            zdict = zstandard.train_dictionary(ZSTD_DICT_SIZE, samples)
+        except Exception as e:
+            logger.warning(f"Не удалось обучить словарь zstd для уроков: {str(e)}")
+            return
+        cursor = self._conn.execute(
+            "INSERT INTO zstd_dicts (data, created_at) VALUES (?, ?)",
+            (zdict.as_bytes(), datetime.now().isoformat()),
+        )
+        self._zstd_dict_id = cursor.lastrowid
+        self._zstd_dicts[self._zstd_dict_id] = zdict
+        logger.info(f"Обучен словарь zstd для уроков на {len(samples)} образцах")
+
+    def _write_row(
+        self,
+        lesson_id,
+        content,
+        raw_content,
+        title=None,
+        cached_at=None,
+        course_id=None,
+        update_only=False,
+    ):
+        """Сжимает и записывает урок (вызывается под блокировкой)."""
+        # CSS добавляется при показе урока — в хранилище он не нужен
+        content = strip_embedded_styles(content)
+        content_blob, codec, dict_id = self._encode(content)
+        raw_blob, _, _ = self._encode(raw_content or None)
+        raw_size = len(content.encode("utf-8")) + len(
+            (raw_content or "").encode("utf-8")
+        )
+        size = raw_size if codec == "none" else len(content_blob) + len(raw_blob or b"")
+        if update_only:
+            self._conn.execute(
+                "UPDATE lessons SET content = ?, raw_content = ?, codec = ?, dict_id = ?, "
+                "size = ?, raw_size = ? WHERE lesson_id = ?",
+                (content_blob, raw_blob, codec, dict_id, size, raw_size, lesson_id),
+            )
+            return
+        self._conn.execute(
+            "INSERT OR REPLACE INTO lessons "
+            "(lesson_id, title, content, raw_content, size, cached_at, last_access, "
+            "codec, dict_id, raw_size, course_id) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                lesson_id,
+                title,
+                content_blob,
+                raw_blob,
+                size,
+                cached_at or datetime.now().isoformat(),
+                time.time(),
+                codec,
+                dict_id,
+                raw_size,
+                course_id,
+            ),
+        )
+
+    def get(self, lesson_id, course_id=None):
+        """
+        Возвращает урок по ключу.
+
+        Args:
+            lesson_id (str): Ключ урока "section_id:topic_id:lesson_id"
+            course_id (str, optional): Курс урока — дописывается урокам,
+                сохранённым без курса
+
+        Returns:
+            dict | None: title, content и (если есть) raw_content
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT title, content, raw_content, codec, dict_id FROM lessons "
+                "WHERE lesson_id = ?",
+                (lesson_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE lessons SET last_access = ?, course_id = COALESCE(course_id, ?) "
+                "WHERE lesson_id = ?",
+                (time.time(), course_id, lesson_id),
+            )
+            title, content, raw_content, codec, dict_id = row
+            content = self._decode(content, codec, dict_id)
+            raw_content = self._decode(raw_content, codec, dict_id)
+        result = {"title": title, "content": content}
+        if raw_content:
+            result["raw_content"] = raw_content
+        return result
+
+    def put(
+        self,
+        lesson_id,
+        title,
+        content,
+        raw_content=None,
+        cached_at=None,
+        course_id=None,
+    ):
+        """
+        Сохраняет урок (заменяя прежнюю версию).
+
+        Args:
+            lesson_id (str): Ключ урока
+            title (str): Заголовок урока
+            content (str): Отформатированное HTML-содержание
+            raw_content (str, optional): Сырой текст урока от LLM
+            cached_at (str, optional): Время генерации в ISO-формате
+            course_id (str, optional): ID курса (для вытеснения с учётом курса)
+        """
+        if not self.enabled:
+            raise RuntimeError("Хранилище уроков недоступно")
+        with self._lock:
+            self._write_row(
+                lesson_id,
+                content,
+                raw_content,
+                title=title,
+                cached_at=cached_at,
+                course_id=course_id,
+            )
+            self._maybe_train_dictionary()
+
+    def import_entries(self, entries):
+        """
+        Переносит уроки из старого раздела lesson_content_cache.
+
+        Args:
+            entries (dict): lesson_id -> {"title", "content", "raw_content", "cached_at"}
+
+        Returns:
+            int: Число перенесённых уроков
+        """
+        imported = 0
+        for lesson_id, entry in entries.items():
+            if not isinstance(entry, dict) or not entry.get("content"):
+                continue
+            self.put(
+                lesson_id,
+                entry.get("title", ""),
+                entry["content"],
+                raw_content=entry.get("raw_content"),
+                cached_at=entry.get("cached_at"),
+            )
+            imported += 1
+        return imported
+
+    def delete(self, lesson_id):
+        """Удаляет урок из хранилища."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._conn.execute("DELETE FROM lessons WHERE lesson_id = ?", (lesson_id,))
+
+    def clear(self):
+        """Удаляет все уроки."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._conn.execute("DELETE FROM lessons")
+
+    def pin(self, owner, lesson_ids):
+        """
+        Закрепляет уроки за владельцем (учащимся), заменяя прежние закрепления.
+
+        Args:
+            owner (str): Владелец закреплений (ID учащегося)
+            lesson_ids (Iterable[str]): Ключи уроков, которые нельзя вытеснять
+        """
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM pins WHERE owner = ?", (owner,))
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO pins (owner, lesson_id, pinned_at) "
+                    "VALUES (?, ?, ?)",
+                    [(owner, lesson_id, now) for lesson_id in lesson_ids],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def clear_owner(self, owner, lesson_ids=(), key_prefix=None):
+        """
+        Удаляет уроки владельца (учащегося) и его закрепления.
+
+        Удаляются уроки, закреплённые владельцем, переданные в lesson_ids и
+        ключи с префиксом key_prefix. Уроки, закреплённые другими
+        владельцами, остаются: общий урок может быть нужен и им.
+
+        Args:
+            owner (str): Владелец закреплений (ID учащегося)
+            lesson_ids (Iterable[str]): Ключи уроков владельца
+            key_prefix (str, optional): Префикс ключей, принадлежащих только
+                владельцу
+
+        Returns:
+            int: Число удалённых уроков
+        """
+        if not self.enabled:
+            return 0
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                owned = set(lesson_ids)
+                owned.update(
+                    row[0]
+                    for row in self._conn.execute(
+                        "SELECT lesson_id FROM pins WHERE owner = ?", (owner,)
+                    )
+                )
+                if key_prefix:
+                    owned.update(
+                        row[0]
+                        for row in self._conn.execute(
+                            "SELECT lesson_id FROM lessons"
+                            " WHERE substr(lesson_id, 1, length(?)) = ?",
+                            (key_prefix, key_prefix),
+                        )
+                    )
+                owned.difference_update(
+                    row[0]
+                    for row in self._conn.execute(
+                        "SELECT lesson_id FROM pins WHERE owner != ?", (owner,)
+                    )
+                )
+                deleted = 0
+                for lesson_id in owned:
+                    deleted += self._conn.execute(
+                        "DELETE FROM lessons WHERE lesson_id = ?", (lesson_id,)
+                    ).rowcount
+                self._conn.execute("DELETE FROM pins WHERE owner = ?", (owner,))
+                self._conn.execute("COMMIT")
+                return deleted
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def needs_eviction(self):
+        """
+        Быстрая проверка: превышены ли лимиты или есть ли устаревшие уроки.
+
+        Returns:
+            bool: True, если evict() что-нибудь удалит
+        """
+        if not self.enabled:
+            return False
+        with self._lock:
+            total_bytes, total_entries, oldest_access = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0), COUNT(*), MIN(last_access) FROM lessons"
+            ).fetchone()
+        if total_bytes > self.max_bytes or total_entries > self.max_entries:
+            return True
+        return bool(
+            self.max_age_seconds
+            and oldest_access is not None
+            and oldest_access < time.time() - self.max_age_seconds
+        )
+
+    def evict(self, protected=(), current_course=None, completed=()):
+        """
+        Вытесняет уроки сверх лимитов и давно не открывавшиеся.
+
+        Уроки, закреплённые через pin, не вытесняются, пока закрепление
+        не устарело (старше max_age_seconds).
+
+        Args:
+            protected (Iterable[str]): Ключи уроков, которые нельзя вытеснять
+                (текущий урок и следующие за ним)
+            current_course (str, optional): ID текущего курса; уроки других
+                курсов вытесняются первыми (None — без учёта курса)
+            completed (Iterable[str]): Ключи пройденных уроков текущего курса
+
+        Returns:
+            dict: evicted (число уроков) и evicted_bytes
+        """
+        if not self.enabled:
+            return {"evicted": 0, "evicted_bytes": 0}
+        protected = set(protected)
+        completed = set(completed)
+        now = time.time()
+        expire_before = now - self.max_age_seconds if self.max_age_seconds else None
+
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT lesson_id, course_id, size, last_access FROM lessons"
+            ).fetchall()
+            total_bytes = sum(row[2] for row in rows)
+            total_entries = len(rows)
+            pins = self._conn.execute(
+                "SELECT lesson_id FROM pins WHERE pinned_at >= ?",
+                (expire_before if expire_before is not None else 0,),
+            ).fetchall()
+            protected.update(row[0] for row in pins)
+
+            def rank(row):
+                lesson_id, course_id, _, last_access = row
+                if current_course and course_id and course_id != current_course:
+                    group = 0  # брошенный курс
+                elif lesson_id in completed:
+                    group = 1  # пройденный урок текущего курса
+                else:
+                    group = 2
+                return group, last_access
+
+            doomed = []
+            candidates = sorted(
+                (row for row in rows if row[0] not in protected), key=rank
+            )
+            for row in candidates:
+                expired = expire_before is not None and row[3] < expire_before
+                over_limit = (
+                    total_bytes > self.max_bytes or total_entries > self.max_entries
+                )
+                if not expired and not over_limit:
+                    continue
+                doomed.append(row)
+                total_bytes -= row[2]
+                total_entries -= 1
+
+            if doomed:
+                self._conn.executemany(
+                    "DELETE FROM lessons WHERE lesson_id = ?",
+                    [(row[0],) for row in doomed],
+                )
+            evicted_bytes = sum(row[2] for row in doomed)
+            self.evictions += len(doomed)
+            self.evicted_bytes += evicted_bytes
+
+        if doomed:
+            logger.info(
+                f"Из хранилища уроков вытеснено уроков: {len(doomed)} ({evicted_bytes} байт)"
+            )
+        return {"evicted": len(doomed), "evicted_bytes": evicted_bytes}
+
+    def get_stats(self):
+        """
+        Возвращает статистику хранилища.
+
+        Returns:
+            dict: entries, bytes (на диске), raw_bytes (без сжатия),
+                compression_ratio, codec, лимиты (max_bytes, max_entries,
+                max_age_days), вытеснения за сеанс (evictions,
+                evicted_bytes) и courses — entries/bytes по курсам
+        """
+        stats = {
+            "entries": 0,
+            "bytes": 0,
+            "raw_bytes": 0,
+            "compression_ratio": 1.0,
+            "codec": self.codec,
+            "max_bytes": self.max_bytes,
+            "max_entries": self.max_entries,
+            "max_age_days": round(self.max_age_seconds / 86400, 1),
+            "evictions": self.evictions,
+            "evicted_bytes": self.evicted_bytes,
+            "courses": {},
+        }
+        if not self.enabled:
+            return stats
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT course_id, COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(raw_size), 0) "
+                "FROM lessons GROUP BY course_id"
+            ).fetchall()
+        for course_id, entries, size, raw_size in rows:
+            stats["entries"] += entries
+            stats["bytes"] += size
+            stats["raw_bytes"] += raw_size
+            stats["courses"][course_id or ""] = {"entries": entries, "bytes": size}
+        if stats["bytes"]:
+            stats["compression_ratio"] = round(stats["raw_bytes"] / stats["bytes"], 2)
+        return stats
+
+    def close(self):
+        """Закрывает SQLite-соединение."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self.enabled = False
@@ -5,6 +5,8 @@
 
 import logging
 
+from course_plan_index import get_course_plan_index
+
 
 class LessonUtils:
     """Утилиты для работы с уроками."""
@@ -27,43 +29,21 @@ class LessonUtils:
             tuple: (course_title, section_title, topic_title, lesson_title)
         """
         try:
-            # Получаем название курса
             course_title = course_plan.get("title", "Курс")
 
-            # Получаем название раздела (sections - это список)
-            sections = course_plan.get("sections", [])
-            section = None
-            for s in sections:
-                if s.get("id") == section_id:
-                    section = s
-                    break
+            index = get_course_plan_index(course_plan)
+            section = index.section(section_id)
+            topic = index.topic(section_id, topic_id)
+            lesson = index.lesson(section_id, topic_id, lesson_id)
 
             section_title = (
                 section.get("title", f"Раздел {section_id}")
                 if section
                 else f"Раздел {section_id}"
             )
-
-            # Получаем название темы (topics - это список)
-            topics = section.get("topics", []) if section else []
-            topic = None
-            for t in topics:
-                if t.get("id") == topic_id:
-                    topic = t
-                    break
-
             topic_title = (
                 topic.get("title", f"Тема {topic_id}") if topic else f"Тема {topic_id}"
             )
-
-            # Получаем название урока (lessons - это список)
-            lessons = topic.get("lessons", []) if topic else []
-            lesson = None
-            for l in lessons:
-                if l.get("id") == lesson_id:
-                    lesson = l
-                    break
-
             lesson_title = (
                 lesson.get("title", f"Урок {lesson_id}")
                 if lesson
@@ -97,6 +77,49 @@ class LessonUtils:
             self.logger.error(f"Ошибка при получении ID курса: {str(e)}")
             return "default"
 
+    def build_course_info(
+        self,
+        course_plan,
+        titles,
+        ids,
+        user_profile,
+        lesson_content_data,
+        test_passed=False,
+    ):
+        """
+        Собирает контекст курса для генераторов (course_context).
+
+        Один и тот же словарь используется интерфейсом урока и фоновой
+        предзагрузкой, чтобы промпты совпадали и ответы брались из кэша.
+
+        Args:
+            course_plan (dict): План курса
+            titles (tuple): (course_title, section_title, topic_title, lesson_title)
+            ids (tuple): (section_id, topic_id, lesson_id)
+            user_profile (dict): Профиль пользователя
+            lesson_content_data (dict): title, content и raw_content урока
+            test_passed (bool): Пройден ли тест по уроку
+
+        Returns:
+            dict: Контекст курса
+        """
+        course_title, section_title, topic_title, lesson_title = titles
+        section_id, topic_id, lesson_id = ids
+        return {
+            "course_title": course_title,
+            "section_title": section_title,
+            "topic_title": topic_title,
+            "lesson_title": lesson_title,
+            "section_id": section_id,
+            "topic_id": topic_id,
+            "lesson_id": lesson_id,
+            "user_profile": user_profile,
+            "course_plan": course_plan,
+            "test_passed": test_passed,
+            "lesson_content": lesson_content_data["content"],
+            "lesson_raw_content": lesson_content_data.get("raw_content"),
+        }
+
     def clear_lesson_cache(self, lesson_interface):
         """
         Очищает кэш урока в интерфейсе.
@@ -117,6 +140,8 @@ class LessonUtils:
             lesson_interface.current_lesson_concepts = None
             lesson_interface.current_lesson_examples = None
             lesson_interface.current_lesson_examples_key = None
+            if getattr(lesson_interface, "artifacts", None) is not None:
+                lesson_interface.artifacts.cancel()
             self.logger.info("Кэш урока и сессионное состояние очищены")
         except Exception as e:
             self.logger.error(f"Ошибка при очистке кэша урока: {str(e)}")
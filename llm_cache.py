@@ -0,0 +1,342 @@
+"""
+Постоянный кэш ответов LLM.
+
+Ключ — SHA-256 от модели, сообщений, температуры, max_tokens и
+response_format, поэтому одинаковый промпт (урок, примеры, тест, ключевые
+понятия, вердикт проверки решения) возвращается из кэша за миллисекунды.
+Хранилище — один SQLite-файл с вытеснением по TTL, размеру и числу записей
+(в первую очередь вытесняются давно не читавшиеся записи — LRU).
+
+Настройки (переменные окружения / .env):
+    LLM_CACHE_ENABLED — 0/false отключает кэш (по умолчанию включён)
+    LLM_CACHE_PATH — путь к файлу (data/llm_cache.sqlite3)
+    LLM_CACHE_MAX_MB — максимальный суммарный размер ответов, МБ (200)
+    LLM_CACHE_MAX_ENTRIES — максимальное число записей (20000)
+    LLM_CACHE_TTL_HOURS — время жизни записи, часов (720 = 30 дней)
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_FILE = "data/llm_cache.sqlite3"
+
+
+def _env_flag(name, default=True):
+    """Читает булев флаг из окружения."""
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    return value.strip().lower() not in ("0", "false", "no", "off")
+
+
+def _env_float(name, default):
+    """Читает число из окружения, при ошибке — значение по умолчанию."""
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        logger.warning("Некорректное значение %s, используется %s", name, default)
+        return float(default)
+
+
+class LLMResponseCache:
+    """Кэш ответов LLM в SQLite с вытеснением по TTL, размеру и LRU."""
+
+    def __init__(
+        self,
+        path=None,
+        max_bytes=None,
+        max_entries=None,
+        ttl_seconds=None,
+        enabled=None,
+    ):
+        """
+        Инициализация кэша.
+
+        Args:
+            path (str | Path, optional): Путь к SQLite-файлу
+            max_bytes (int, optional): Лимит суммарного размера ответов
+            max_entries (int, optional): Лимит числа записей
+            ttl_seconds (float, optional): Время жизни записи
+            enabled (bool, optional): Включён ли кэш
+        """
+        project_dir = Path(__file__).parent.absolute()
+        self.path = Path(
+            path or os.getenv("LLM_CACHE_PATH") or project_dir / DEFAULT_CACHE_FILE
+        )
+        self.max_bytes = int(
+            max_bytes
+            if max_bytes is not None
+            else _env_float("LLM_CACHE_MAX_MB", 200) * 1024 * 1024
+        )
+        self.max_entries = int(
+            max_entries
+            if max_entries is not None
+            else _env_float("LLM_CACHE_MAX_ENTRIES", 20000)
+        )
+        self.ttl_seconds = float(
+            ttl_seconds
+            if ttl_seconds is not None
+            else _env_float("LLM_CACHE_TTL_HOURS", 720) * 3600
+        )
+        self.enabled = _env_flag("LLM_CACHE_ENABLED") if enabled is None else enabled
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._conn = None
+
+        if self.enabled:
+            try:
+                self._connect()
+            except Exception as e:
+                logger.error(
+                    f"Не удалось открыть кэш ответов LLM, кэш отключён: {str(e)}"
+                )
+                self.enabled = False
+
+    def _connect(self):
+        """Открывает SQLite-файл и создаёт таблицу."""
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self._conn = sqlite3.connect(
+            str(self.path), check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                content TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)"
+        )
+        logger.info(f"Кэш ответов LLM открыт: {self.path}")
+
+    @staticmethod
+    def make_key(request_kwargs):
+        """
+        Строит ключ кэша по параметрам запроса.
+
+        Args:
+            request_kwargs (dict): model, messages, temperature, max_tokens,
+                response_format (как для chat.completions.create)
+
+        Returns:
+            str: Hex SHA-256
+        """
+        payload = {
+            "model": request_kwargs.get("model"),
+            "messages": request_kwargs.get("messages"),
+            "temperature": request_kwargs.get("temperature"),
+            "max_tokens": request_kwargs.get("max_tokens"),
+            "response_format": request_kwargs.get("response_format"),
+        }
+        raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def is_cacheable(content, response_format=None):
+        """
+        Проверяет, стоит ли сохранять ответ.
+
+        Пустые ответы и невалидный JSON (при response_format=json_object)
+        не кэшируются, чтобы повторный запрос мог получить нормальный ответ.
+        """
+        if not content or not str(content).strip():
+            return False
+        if (
+            isinstance(response_format, dict)
+            and response_format.get("type") == "json_object"
+        ):
+            try:
+                json.loads(content)
+            except (TypeError, ValueError):
+                return False
+        return True
+
+    def get(self, key, allow_expired=False):
+        """
+        Возвращает ответ из кэша и обновляет время последнего чтения.
+
+        Args:
+            key (str): Ключ кэша
+            allow_expired (bool): Вернуть и просроченную запись (когда API
+                недоступен, устаревший ответ лучше ошибки)
+
+        Returns:
+            str | None: Ответ или None при промахе
+        """
+        if not self.enabled:
+            return None
+        now = time.time()
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT content, created_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                content, created_at = row
+                expired = self.ttl_seconds and now - created_at > self.ttl_seconds
+                if expired and not allow_expired:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self.evictions += 1
+                    self.misses += 1
+                    return None
+                self._conn.execute(
+                    "UPDATE responses SET last_access = ? WHERE key = ?", (now, key)
+                )
+                self.hits += 1
+                return content
+        except Exception as e:
+            logger.warning(f"Ошибка чтения кэша ответов LLM: {str(e)}")
+            return None
+
+    def set(self, key, content, model=None):
+        """
+        Сохраняет ответ и при необходимости вытесняет старые записи.
+
+        Args:
+            key (str): Ключ кэша
+            content (str): Ответ LLM
+            model (str, optional): Модель (для статистики)
+        """
+        if not self.enabled:
+            return
+        now = time.time()
+        size = len(content.encode("utf-8"))
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses "
+                    "(key, model, content, size, created_at, last_access) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, model, content, size, now, now),
+                )
+                self.stores += 1
+                self._evict_locked(now)
+        except Exception as e:
+            logger.warning(f"Ошибка записи в кэш ответов LLM: {str(e)}")
+
+    def _evict_locked(self, now):
+        """Удаляет просроченные записи, затем самые старые по last_access."""
+        if self.ttl_seconds:
+            cursor = self._conn.execute(
+                "DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,)
+            )
+            self.evictions += max(cursor.rowcount, 0)
+
+        total_bytes, total_entries = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0), COUNT(*) FROM responses"
+        ).fetchone()
+        if total_bytes <= self.max_bytes and total_entries <= self.max_entries:
+            return
+
+        rows = self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY last_access ASC"
+        ).fetchall()
+        doomed = []
+        for key, size in rows:
+            if total_bytes <= self.max_bytes and total_entries <= self.max_entries:
+                break
+            doomed.append((key,))
+            total_bytes -= size
+            total_entries -= 1
+        if doomed:
+            self._conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+            self.evictions += len(doomed)
+            logger.info(f"Из кэша ответов LLM вытеснено записей: {len(doomed)}")
+
+    def invalidate(self, key):
+        """Удаляет одну запись из кэша."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def clear(self):
+        """Полностью очищает кэш."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+        logger.info("Кэш ответов LLM очищен")
+
+    def get_stats(self):
+        """
+        Возвращает статистику кэша.
+
+        Returns:
+            dict: enabled, hits, misses, hit_rate, stores, evictions,
+                entries, bytes
+        """
+        stats = {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (
+                round(self.hits / (self.hits + self.misses), 3)
+                if (self.hits + self.misses)
+                else 0.0
+            ),
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "entries": 0,
+            "bytes": 0,
+        }
+        if self.enabled:
+            try:
+                with self._lock:
+                    total_bytes, total_entries = self._conn.execute(
+                        "SELECT COALESCE(SUM(size), 0), COUNT(*) FROM responses"
+                    ).fetchone()
+                stats["entries"] = total_entries
+                stats["bytes"] = total_bytes
+            except Exception as e:
+                logger.warning(f"Ошибка чтения статистики кэша ответов LLM: {str(e)}")
+        return stats
+
+    def close(self):
+        """Закрывает SQLite-соединение."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self.enabled = False
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """
+    Возвращает общий для процесса кэш ответов LLM.
+
+    Returns:
+        LLMResponseCache: Кэш (может быть выключен настройкой)
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMResponseCache()
+        return _cache
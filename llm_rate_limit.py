@@ -0,0 +1,817 @@
+"""
+Планировщик запросов к LLM: лимиты, повторные попытки и circuit breaker.
+
+Все генераторы работают через один API-ключ, поэтому ограничения общие
+для всех kernel установки (в том числе для kernel разных учащихся, см.
+learner_namespace):
+
+- token bucket по запросам в минуту (RPM) и токенам в минуту (TPM)
+  отдельно для каждой модели — запрос ждёт, пока квота не освободится,
+  вместо того чтобы получить 429;
+- повтор только временных ошибок (429, 5xx, сеть, таймаут) с
+  экспоненциальной задержкой и случайным разбросом (jitter); если сервер
+  прислал Retry-After, ждём не меньше указанного;
+- circuit breaker: после серии временных ошибок подряд запросы какое-то
+  время не отправляются вовсе и сразу завершаются CircuitOpenError —
+  вызывающий код отдаёт кэш или запасной контент;
+- приоритет: фоновые запросы (предзагрузка, см. background_requests) ждут,
+  пока не завершатся все интерактивные.
+
+Квоты RPM/TPM и состояние circuit breaker хранятся в SQLite-файле
+data/llm_limits.sqlite3 рядом с хранилищем уроков и обновляются под
+BEGIN IMMEDIATE: N kernel с одним ключом делят одну квоту, а не получают
+её каждый целиком, и размыкание цепи в одном kernel видно остальным.
+Если файл открыть не удалось, лимиты действуют в пределах процесса; если
+файл занят другим kernel дольше LIMITS_BUSY_TIMEOUT, этот запрос
+учитывается по состоянию в памяти процесса, а не завершается ошибкой.
+Приоритет фоновых запросов по-прежнему учитывается внутри процесса.
+
+Настройки (переменные окружения / .env):
+    LLM_RATE_LIMIT_RPM — запросов в минуту на модель (500, 0 — без лимита)
+    LLM_RATE_LIMIT_TPM — токенов в минуту на модель (200000, 0 — без лимита)
+    LLM_MAX_RETRIES — повторов по умолчанию для make_api_request (2)
+    LLM_BREAKER_FAILURES — ошибок подряд до размыкания (5)
+    LLM_BREAKER_RESET_SECONDS — пауза до пробного запроса (30)
+    LLM_LIMITS_FILE — файл общих лимитов (data/llm_limits.sqlite3)
+"""
+
+import os
+import time
+import random
+import sqlite3
+import asyncio
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+
+import openai
+
+logger = logging.getLogger(__name__)
+
+# Верхняя граница ожидания по Retry-After, чтобы не «повесить» интерфейс
+MAX_RETRY_AFTER_SECONDS = 60
+
+DEFAULT_LIMITS_FILE = "data/llm_limits.sqlite3"
+
+# Сколько ждать, пока другой kernel обновляет общие лимиты, сек
+LIMITS_BUSY_TIMEOUT = 1.0
+
+
+def _env_float(name, default):
+    """Читает число из окружения, при ошибке — значение по умолчанию."""
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        logger.warning("Некорректное значение %s, используется %s", name, default)
+        return float(default)
+
+
+# Запросы, отправленные внутри background_requests(), уступают интерактивным
+_background_context = contextvars.ContextVar("llm_background_request", default=False)
+
+# Период перепроверки, не освободился ли API от интерактивных запросов
+BACKGROUND_POLL_SECONDS = 0.2
+
+
+@contextmanager
+def background_requests():
+    """
+    Помечает запросы в этом контексте как фоновые (низкий приоритет).
+
+    Пример:
+        with background_requests():
+            generator.generate_lesson(...)
+    """
+    token = _background_context.set(True)
+    try:
+        yield
+    finally:
+        _background_context.reset(token)
+
+
+def is_background_request():
+    """Проверяет, выполняется ли код внутри background_requests()."""
+    return _background_context.get()
+
+
+class CircuitOpenError(Exception):
+    """API временно недоступен: запросы не отправляются (circuit breaker)."""
+
+
+@dataclass
+class RetryPolicy:
+    """Параметры повторных попыток."""
+
+    retries: int = 2
+    initial_delay: float = 1.0
+    backoff_factor: float = 2.0
+    max_delay: float = 30.0
+
+    @classmethod
+    def default(cls):
+        """Политика по умолчанию (LLM_MAX_RETRIES повторов)."""
+        return cls(retries=int(_env_float("LLM_MAX_RETRIES", 2)))
+
+
+def is_retryable_error(error):
+    """
+    Проверяет, имеет ли смысл повторять запрос после ошибки.
+
+    Args:
+        error (Exception): Ошибка запроса
+
+    Returns:
+        bool: True для 408/409/429/5xx, сетевых ошибок и таймаутов
+    """
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        status = error.status_code
+        return status in (408, 409, 429) or status >= 500
+    return False
+
+
+def get_retry_after(error):
+    """
+    Извлекает подсказку сервера о паузе из заголовков ответа.
+
+    Args:
+        error (Exception): Ошибка запроса
+
+    Returns:
+        float | None: Пауза в секундах или None
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return min(float(value) / 1000, MAX_RETRY_AFTER_SECONDS)
+        except ValueError:
+            pass
+
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER_SECONDS)
+
+
+class SharedLimitStore:
+    """Состояние лимитов и circuit breaker в SQLite, общее для всех kernel."""
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str | Path): Путь к SQLite-файлу
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            str(self.path),
+            timeout=LIMITS_BUSY_TIMEOUT,
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS buckets (
+                model TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL,
+                PRIMARY KEY (model, kind)
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS breaker (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                state TEXT NOT NULL,
+                failures INTEGER NOT NULL,
+                opened_at REAL NOT NULL,
+                probe_started REAL NOT NULL
+            )
+            """
+        )
+
+    @contextmanager
+    def transaction(self):
+        """
+        Транзакция BEGIN IMMEDIATE: другие kernel ждут её завершения.
+
+        Yields:
+            sqlite3.Connection: Соединение внутри транзакции
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        """Закрывает соединение."""
+        with self._lock:
+            self._conn.close()
+
+
+def open_shared_limit_store(path=None):
+    """
+    Открывает файл общих лимитов (LLM_LIMITS_FILE).
+
+    Returns:
+        SharedLimitStore | None: Хранилище или None, если открыть не удалось
+            (тогда лимиты действуют в пределах процесса)
+    """
+    path = Path(path or os.getenv("LLM_LIMITS_FILE") or DEFAULT_LIMITS_FILE)
+    if not path.is_absolute():
+        path = Path(__file__).parent.absolute() / path
+    try:
+        return SharedLimitStore(path)
+    except Exception as e:
+        logger.warning(
+            f"Не удалось открыть общие лимиты LLM {path}: {str(e)}; "
+            "лимиты будут действовать только в этом процессе"
+        )
+        return None
+
+
+class TokenBucket:
+    """Token bucket с ёмкостью в одну минуту квоты."""
+
+    def __init__(self, per_minute, tokens=None, updated=None):
+        """
+        Args:
+            per_minute (float): Квота в минуту
+            tokens (float, optional): Текущий баланс (по умолчанию — полная квота)
+            updated (float, optional): Время последнего пополнения (time.time())
+        """
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity if tokens is None else float(tokens)
+        # Время общее для процессов, поэтому time.time(), а не monotonic()
+        self.updated = time.time() if updated is None else float(updated)
+
+    def reserve(self, amount):
+        """
+        Резервирует amount единиц квоты (баланс может уйти в минус).
+
+        Returns:
+            float: Сколько секунд нужно подождать до отправки
+        """
+        now = time.time()
+        elapsed = max(0.0, now - self.updated)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated = now
+        self.tokens -= amount
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def refund(self, amount):
+        """Возвращает (или дополнительно списывает при amount < 0) квоту."""
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    """Лимиты RPM и TPM для каждой модели."""
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, store=None):
+        """
+        Args:
+            requests_per_minute (float, optional): RPM; 0 — без лимита
+            tokens_per_minute (float, optional): TPM; 0 — без лимита
+            store (SharedLimitStore, optional): Общее для kernel хранилище
+                квот; без него квоты действуют в пределах процесса
+        """
+        self.requests_per_minute = (
+            requests_per_minute
+            if requests_per_minute is not None
+            else _env_float("LLM_RATE_LIMIT_RPM", 500)
+        )
+        self.tokens_per_minute = (
+            tokens_per_minute
+            if tokens_per_minute is not None
+            else _env_float("LLM_RATE_LIMIT_TPM", 200000)
+        )
+        self.store = store
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def _update_buckets(self, model, kinds, update):
+        """
+        Изменяет корзины модели.
+
+        С общим хранилищем корзины читаются и записываются в одной
+        транзакции; если хранилище недоступно (занято другим kernel),
+        изменяются корзины в памяти процесса.
+
+        Args:
+            model (str): Модель
+            kinds (Iterable[str]): Виды квоты ("rpm"/"tpm")
+            update (callable): Функция от {вид: TokenBucket}
+
+        Returns:
+            Результат update
+        """
+        limits = {"rpm": self.requests_per_minute, "tpm": self.tokens_per_minute}
+        with self._lock:
+            if self.store is not None:
+                try:
+                    with self.store.transaction() as conn:
+                        buckets = {}
+                        for kind in kinds:
+                            row = conn.execute(
+                                "SELECT tokens, updated FROM buckets "
+                                "WHERE model = ? AND kind = ?",
+                                (model, kind),
+                            ).fetchone()
+                            buckets[kind] = TokenBucket(
+                                limits[kind], *(row or (None, None))
+                            )
+                        result = update(buckets)
+                        conn.executemany(
+                            "INSERT OR REPLACE INTO buckets "
+                            "(model, kind, tokens, updated) VALUES (?, ?, ?, ?)",
+                            [
+                                (model, kind, bucket.tokens, bucket.updated)
+                                for kind, bucket in buckets.items()
+                            ],
+                        )
+                    # Память повторяет общее состояние — на случай, если
+                    # следующий раз хранилище окажется занято
+                    for kind, bucket in buckets.items():
+                        self._buckets[(model, kind)] = bucket
+                    return result
+                except sqlite3.Error as e:
+                    logger.warning(
+                        f"Общие лимиты LLM недоступны ({str(e)}), "
+                        "квота учитывается в памяти процесса"
+                    )
+            buckets = {}
+            for kind in kinds:
+                key = (model, kind)
+                if key not in self._buckets:
+                    self._buckets[key] = TokenBucket(limits[kind])
+                buckets[kind] = self._buckets[key]
+            return update(buckets)
+
+    def reserve(self, model, tokens):
+        """
+        Резервирует один запрос и tokens токенов для модели.
+
+        Returns:
+            float: Необходимая пауза перед отправкой, сек
+        """
+        amounts = {}
+        if self.requests_per_minute > 0:
+            amounts["rpm"] = 1
+        if self.tokens_per_minute > 0:
+            amounts["tpm"] = tokens
+        if not amounts:
+            return 0.0
+        return self._update_buckets(
+            model,
+            amounts,
+            lambda buckets: max(
+                bucket.reserve(amounts[kind]) for kind, bucket in buckets.items()
+            ),
+        )
+
+    def record_usage(self, model, estimated_tokens, actual_tokens):
+        """Корректирует TPM-баланс по фактическому расходу токенов."""
+        if self.tokens_per_minute <= 0 or actual_tokens is None:
+            return
+        self._update_buckets(
+            model,
+            ["tpm"],
+            lambda buckets: buckets["tpm"].refund(estimated_tokens - actual_tokens),
+        )
+
+
+class CircuitBreaker:
+    """Circuit breaker: closed → open → half-open → closed."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=None, reset_timeout=None, store=None):
+        """
+        Args:
+            failure_threshold (int, optional): Ошибок подряд до размыкания
+            reset_timeout (float, optional): Пауза до пробного запроса, сек
+            store (SharedLimitStore, optional): Общее для kernel хранилище
+                состояния цепи; без него цепь своя у каждого процесса
+        """
+        self.failure_threshold = int(
+            failure_threshold
+            if failure_threshold is not None
+            else _env_float("LLM_BREAKER_FAILURES", 5)
+        )
+        self.reset_timeout = (
+            reset_timeout
+            if reset_timeout is not None
+            else _env_float("LLM_BREAKER_RESET_SECONDS", 30)
+        )
+        self.store = store
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        # Время старта пробного запроса (0 — пробного запроса нет)
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+
+    def _fields(self):
+        return self.state, self.failures, self.opened_at, self._probe_started
+
+    def _update(self, update):
+        """
+        Изменяет состояние цепи.
+
+        С общим хранилищем состояние читается и записывается в одной
+        транзакции, чтобы все kernel видели одну цепь; если хранилище
+        недоступно (занято другим kernel), изменяется состояние в памяти
+        процесса.
+
+        Args:
+            update (callable): Функция без аргументов, меняющая поля цепи
+
+        Returns:
+            Результат update
+        """
+        with self._lock:
+            if self.store is not None:
+                local = self._fields()
+                try:
+                    with self.store.transaction() as conn:
+                        row = conn.execute(
+                            "SELECT state, failures, opened_at, probe_started "
+                            "FROM breaker WHERE id = 1"
+                        ).fetchone()
+                        if row is not None:
+                            (
+                                self.state,
+                                self.failures,
+                                self.opened_at,
+                                self._probe_started,
+                            ) = row
+                        result = update()
+                        conn.execute(
+                            "INSERT OR REPLACE INTO breaker "
+                            "(id, state, failures, opened_at, probe_started) "
+                            "VALUES (1, ?, ?, ?, ?)",
+                            self._fields(),
+                        )
+                    return result
+                except sqlite3.Error as e:
+                    logger.warning(
+                        f"Общее состояние circuit breaker недоступно ({str(e)}), "
+                        "используется состояние процесса"
+                    )
+                    # Изменение не записано — применяем его к прежнему состоянию
+                    self.state, self.failures, self.opened_at, self._probe_started = (
+                        local
+                    )
+            return update()
+
+    def allow_request(self):
+        """
+        Проверяет, можно ли отправить запрос.
+
+        Returns:
+            bool: False, если цепь разомкнута
+        """
+        return self._update(self._allow_request)
+
+    def _allow_request(self):
+        if self.state == self.CLOSED:
+            return True
+        now = time.time()
+        if self.state == self.OPEN:
+            if now - self.opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+            self._probe_started = 0.0
+        # HALF_OPEN: пропускаем один пробный запрос. Пробный запрос
+        # kernel, завершившегося без ответа, не держит цепь вечно
+        if self._probe_started and now - self._probe_started < self.reset_timeout:
+            return False
+        self._probe_started = now
+        return True
+
+    def record_success(self):
+        """Успешный запрос замыкает цепь."""
+        self._update(self._record_success)
+
+    def _record_success(self):
+        if self.state != self.CLOSED:
+            logger.info("API снова доступен, circuit breaker замкнут")
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_started = 0.0
+
+    def record_failure(self):
+        """Временная ошибка; после серии ошибок цепь размыкается."""
+        self._update(self._record_failure)
+
+    def _record_failure(self):
+        self.failures += 1
+        self._probe_started = 0.0
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(
+                    f"API недоступен ({self.failures} ошибок подряд), "
+                    f"запросы приостановлены на {self.reset_timeout:.0f} сек"
+                )
+            self.state = self.OPEN
+            self.opened_at = time.time()
+
+
+class RequestScheduler:
+    """Отправка запросов с лимитами, повторными попытками и circuit breaker."""
+
+    def __init__(self, limiter=None, breaker=None):
+        """
+        Args:
+            limiter (RateLimiter, optional): Лимитер RPM/TPM
+            breaker (CircuitBreaker, optional): Circuit breaker
+        """
+        self.limiter = limiter or RateLimiter()
+        self.breaker = breaker or CircuitBreaker()
+        self._foreground_active = 0
+        self._foreground_idle = threading.Condition()
+
+    def _enter_foreground(self):
+        with self._foreground_idle:
+            self._foreground_active += 1
+
+    def _leave_foreground(self):
+        with self._foreground_idle:
+            self._foreground_active -= 1
+            if not self._foreground_active:
+                self._foreground_idle.notify_all()
+
+    def _wait_foreground_idle(self):
+        """Фоновый запрос ждёт, пока идут интерактивные."""
+        with self._foreground_idle:
+            while self._foreground_active:
+                self._foreground_idle.wait(BACKGROUND_POLL_SECONDS)
+
+    @property
+    def foreground_active(self):
+        """Число выполняющихся сейчас интерактивных запросов."""
+        return self._foreground_active
+
+    @staticmethod
+    def _backoff_delay(policy, attempt, error):
+        """Пауза перед повтором: jitter-экспонента, но не меньше Retry-After."""
+        delay = min(
+            policy.initial_delay * policy.backoff_factor ** (attempt - 1),
+            policy.max_delay,
+        )
+        delay = random.uniform(delay / 2, delay)
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def _check_breaker(self):
+        if not self.breaker.allow_request():
+            raise CircuitOpenError(
+                "Сервис генерации временно недоступен. "
+                "Попробуйте повторить запрос через несколько секунд."
+            )
+
+    def _record_response(self, model, estimated_tokens, response):
+        # Ответ уже получен: ошибка учёта не должна его потерять
+        try:
+            self.breaker.record_success()
+        except Exception as e:
+            logger.warning(f"Не удалось учесть успешный запрос: {str(e)}")
+        self._record_usage(model, estimated_tokens, getattr(response, "usage", None))
+
+    def _record_usage(self, model, estimated_tokens, usage):
+        try:
+            self.limiter.record_usage(
+                model, estimated_tokens, getattr(usage, "total_tokens", None)
+            )
+        except Exception as e:
+            logger.warning(f"Не удалось учесть расход токенов: {str(e)}")
+
+    def _handle_error(self, error, attempt, policy):
+        """
+        Учитывает ошибку и решает, нужен ли повтор.
+
+        Returns:
+            float | None: Пауза перед повтором или None, если повторять не нужно
+        """
+        if not is_retryable_error(error):
+            # Сервер ответил (например, 400) — API доступен
+            self.breaker.record_success()
+            return None
+        self.breaker.record_failure()
+        if attempt > policy.retries:
+            return None
+        delay = self._backoff_delay(policy, attempt, error)
+        logger.warning(
+            f"Попытка {attempt}/{policy.retries + 1} неудачна: {str(error)}. "
+            f"Повтор через {delay:.1f} сек..."
+        )
+        return delay
+
+    def call(self, model, estimated_tokens, func, policy=None):
+        """
+        Выполняет запрос с учётом лимитов и повторов.
+
+        Args:
+            model (str): Модель (для лимитов)
+            estimated_tokens (int): Оценка токенов запроса
+            func (callable): Функция без аргументов, отправляющая запрос
+            policy (RetryPolicy, optional): Параметры повторов
+
+        Returns:
+            Ответ func
+
+        Raises:
+            CircuitOpenError: Если API временно отключён breaker'ом
+            Exception: Последняя ошибка запроса
+        """
+        background = is_background_request()
+        if background:
+            self._wait_foreground_idle()
+        else:
+            self._enter_foreground()
+        try:
+            response = self._send(model, estimated_tokens, func, policy)
+            self._record_response(model, estimated_tokens, response)
+            return response
+        finally:
+            if not background:
+                self._leave_foreground()
+
+    def stream(self, model, estimated_tokens, func, policy=None):
+        """
+        Выполняет потоковый запрос с учётом лимитов и повторов.
+
+        В отличие от call, запрос считается выполняющимся, пока поток не
+        прочитан до конца или не закрыт: всё это время фоновые запросы
+        ждут, а ошибка посреди потока учитывается circuit breaker'ом.
+        Повторяется только открытие потока.
+
+        Args:
+            model (str): Модель (для лимитов)
+            estimated_tokens (int): Оценка токенов запроса
+            func (callable): Функция без аргументов, открывающая поток
+            policy (RetryPolicy, optional): Параметры повторов
+
+        Yields:
+            Очередной фрагмент потока
+
+        Raises:
+            CircuitOpenError: Если API временно отключён breaker'ом
+            Exception: Ошибка открытия или чтения потока
+        """
+        background = is_background_request()
+        if background:
+            self._wait_foreground_idle()
+        else:
+            self._enter_foreground()
+        try:
+            stream = self._send(model, estimated_tokens, func, policy)
+            usage = None
+            try:
+                for chunk in stream:
+                    usage = getattr(chunk, "usage", None) or usage
+                    yield chunk
+            except Exception as e:
+                if is_retryable_error(e):
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                raise
+            finally:
+                stream.close()
+            self.breaker.record_success()
+            self._record_usage(model, estimated_tokens, usage)
+        except GeneratorExit:
+            # Поток закрыт читателем раньше конца: сервер отвечал
+            self.breaker.record_success()
+            raise
+        finally:
+            if not background:
+                self._leave_foreground()
+
+    def _send(self, model, estimated_tokens, func, policy=None):
+        """Отправляет запрос с повторами временных ошибок (без учёта успеха)."""
+        policy = policy or RetryPolicy.default()
+        attempt = 0
+        while True:
+            attempt += 1
+            self._check_breaker()
+            wait = self.limiter.reserve(model, estimated_tokens)
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                return func()
+            except Exception as e:
+                delay = self._handle_error(e, attempt, policy)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+
+    async def call_async(self, model, estimated_tokens, coro_factory, policy=None):
+        """
+        Асинхронный аналог call (паузы через asyncio.sleep).
+
+        Лимиты и circuit breaker учитываются в рабочем потоке: транзакция
+        общего хранилища может ждать другой kernel и не должна
+        останавливать event loop.
+
+        Args:
+            model (str): Модель (для лимитов)
+            estimated_tokens (int): Оценка токенов запроса
+            coro_factory (callable): Функция без аргументов, возвращающая корутину
+            policy (RetryPolicy, optional): Параметры повторов
+
+        Returns:
+            Ответ корутины
+        """
+        policy = policy or RetryPolicy.default()
+        background = is_background_request()
+        if background:
+            while self._foreground_active:
+                await asyncio.sleep(BACKGROUND_POLL_SECONDS)
+        else:
+            self._enter_foreground()
+        try:
+            attempt = 0
+            while True:
+                attempt += 1
+                await asyncio.to_thread(self._check_breaker)
+                wait = await asyncio.to_thread(
+                    self.limiter.reserve, model, estimated_tokens
+                )
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                try:
+                    response = await coro_factory()
+                except Exception as e:
+                    delay = await asyncio.to_thread(
+                        self._handle_error, e, attempt, policy
+                    )
+                    if delay is None:
+                        raise
+                    await asyncio.sleep(delay)
+                    continue
+                await asyncio.to_thread(
+                    self._record_response, model, estimated_tokens, response
+                )
+                return response
+        finally:
+            if not background:
+                self._leave_foreground()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_request_scheduler():
+    """
+    Возвращает общий для процесса планировщик запросов.
+
+    Квоты и circuit breaker планировщика общие для всех kernel установки
+    (см. SharedLimitStore).
+
+    Returns:
+        RequestScheduler: Общий экземпляр
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            store = open_shared_limit_store()
+            _scheduler = RequestScheduler(
+                limiter=RateLimiter(store=store), breaker=CircuitBreaker(store=store)
+            )
+        return _scheduler
@@ -0,0 +1,410 @@
+"""
+Запись и воспроизведение ответов LLM для офлайн-замеров.
+
+Режим задаётся переменной LLM_REPLAY_MODE:
+    off (по умолчанию) — обычная работа через прокси;
+    record — запросы идут в API как обычно, а пары запрос/ответ
+        сохраняются в LLM_REPLAY_DIR (рядом с отладочными ответами
+        save_debug_response, по умолчанию debug_responses/replay);
+    replay — сеть и прокси не нужны: ответы отдаются из записей через
+        httpx-транспорт, с искусственной задержкой и скоростью выдачи
+        токенов, чтобы замерять остальной конвейер повторяемо.
+
+Подключается в llm_transport: общий httpx-клиент получает
+RecordingTransport/ReplayTransport вместо обычного. Запись ищется по тому же
+ключу, что и в кэше ответов (модель, сообщения, температура, max_tokens,
+response_format), поэтому для чистых замеров кэш стоит отключить
+(LLM_CACHE_ENABLED=0).
+
+Настройки воспроизведения:
+    LLM_REPLAY_LATENCY_MS — задержка до первого байта ответа, мс (0)
+    LLM_REPLAY_TOKENS_PER_SEC — скорость выдачи токенов ответа (0 — мгновенно)
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+
+from llm_cache import LLMResponseCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REPLAY_DIR = "debug_responses/replay"
+
+# Символов ответа в одном чанке потоковой выдачи (примерно один токен)
+STREAM_CHUNK_CHARS = 4
+
+
+def get_replay_mode():
+    """
+    Возвращает режим записи/воспроизведения.
+
+    Returns:
+        str: "off", "record" или "replay"
+    """
+    mode = (os.getenv("LLM_REPLAY_MODE") or "off").strip().lower()
+    if mode not in ("off", "record", "replay"):
+        logger.warning(
+            f"Неизвестный LLM_REPLAY_MODE={mode}, запись/воспроизведение отключены"
+        )
+        return "off"
+    return mode
+
+
+def _env_float(name, default):
+    """Читает число из окружения, при ошибке — значение по умолчанию."""
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return float(default)
+
+
+def _is_chat_completion(request):
+    return request.method == "POST" and request.url.path.endswith("/chat/completions")
+
+
+class ReplayStore:
+    """Каталог с записанными парами запрос/ответ (по файлу на запрос)."""
+
+    def __init__(self, directory=None):
+        """
+        Args:
+            directory (str | Path, optional): Каталог записей
+        """
+        self.directory = Path(
+            directory or os.getenv("LLM_REPLAY_DIR") or DEFAULT_REPLAY_DIR
+        )
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(request_body):
+        """Ключ записи — тот же, что у кэша ответов."""
+        return LLMResponseCache.make_key(request_body)
+
+    def load(self, key):
+        """
+        Загружает запись по ключу.
+
+        Returns:
+            dict | None: Запись или None, если её нет
+        """
+        path = self.directory / f"{key}.json"
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"Ошибка чтения записи {path}: {str(e)}")
+            return None
+
+    def save(self, key, request_body, content, model=None, usage=None):
+        """
+        Сохраняет пару запрос/ответ.
+
+        Args:
+            key (str): Ключ записи
+            request_body (dict): Тело запроса chat/completions
+            content (str): Текст ответа
+            model (str, optional): Модель из ответа
+            usage (dict, optional): Расход токенов из ответа
+        """
+        record = {
+            "timestamp": datetime.now().strftime("%Y%m%d_%H%M%S"),
+            "request": {
+                name: request_body.get(name)
+                for name in (
+                    "model",
+                    "messages",
+                    "temperature",
+                    "max_tokens",
+                    "response_format",
+                )
+            },
+            "response": {
+                "model": model or request_body.get("model"),
+                "content": content,
+                "usage": usage,
+            },
+        }
+        try:
+            with self._lock:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                with open(self.directory / f"{key}.json", "w", encoding="utf-8") as f:
+                    json.dump(record, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения записи ответа LLM: {str(e)}")
+
+
+def _content_from_sse(body):
+    """
+    Собирает текст ответа и расход токенов из потоковых SSE-чанков.
+
+    Returns:
+        tuple: (текст ответа, usage из последнего чанка или None)
+    """
+    parts = []
+    usage = None
+    for line in body.splitlines():
+        line = line.strip()
+        if not line.startswith("data:"):
+            continue
+        data = line[len("data:") :].strip()
+        if not data or data == "[DONE]":
+            continue
+        try:
+            chunk = json.loads(data)
+        except ValueError:
+            continue
+        usage = chunk.get("usage") or usage
+        for choice in chunk.get("choices") or []:
+            delta = (choice.get("delta") or {}).get("content")
+            if delta:
+                parts.append(delta)
+    return "".join(parts), usage
+
+
+def _estimate_usage(content):
+    """Оценка расхода токенов ответа без tiktoken (чанк воспроизведения ≈ токен)."""
+    tokens = max(1, len(content) // STREAM_CHUNK_CHARS) if content else 0
+    return {"prompt_tokens": 0, "completion_tokens": tokens, "total_tokens": tokens}
+
+
+def _record_response(store, request, response):
+    """Сохраняет успешный ответ chat/completions в хранилище."""
+    if response.status_code != 200:
+        return
+    try:
+        body = json.loads(request.content or b"{}")
+        if body.get("stream"):
+            content, usage = _content_from_sse(response.text)
+            model = body.get("model")
+            if usage is None:
+                # Поток без include_usage: число токенов считаем при записи,
+                # чтобы воспроизведение не обращалось к токенизатору
+                from prompt_budget import count_tokens
+
+                tokens = count_tokens(content, model)
+                usage = {
+                    "prompt_tokens": 0,
+                    "completion_tokens": tokens,
+                    "total_tokens": tokens,
+                }
+        else:
+            data = response.json()
+            content = data["choices"][0]["message"]["content"]
+            model, usage = data.get("model"), data.get("usage")
+        store.save(store.make_key(body), body, content, model=model, usage=usage)
+    except Exception as e:
+        logger.error(f"Ошибка записи ответа LLM: {str(e)}")
+
+
+class RecordingTransport(httpx.BaseTransport):
+    """Пропускает запросы в сеть и записывает ответы chat/completions."""
+
+    def __init__(self, transport, store=None):
+        """
+        Args:
+            transport (httpx.BaseTransport): Реальный транспорт
+            store (ReplayStore, optional): Хранилище записей
+        """
+        self.transport = transport
+        self.store = store or ReplayStore()
+
+    def handle_request(self, request):
+        response = self.transport.handle_request(request)
+        if _is_chat_completion(request):
+            # Поток при записи читается целиком — запись не для интерактива
+            response.read()
+            _record_response(self.store, request, response)
+        return response
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncRecordingTransport(httpx.AsyncBaseTransport):
+    """Асинхронный аналог RecordingTransport."""
+
+    def __init__(self, transport, store=None):
+        self.transport = transport
+        self.store = store or ReplayStore()
+
+    async def handle_async_request(self, request):
+        response = await self.transport.handle_async_request(request)
+        if _is_chat_completion(request):
+            await response.aread()
+            _record_response(self.store, request, response)
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class _ReplayPlan:
+    """Ответ, подготовленный к воспроизведению, и его тайминги."""
+
+    def __init__(self, store, request):
+        self.status_code = 200
+        self.stream = False
+        self.body = None
+        self.chunks = []
+        self.chunk_delay = 0.0
+        self.latency = _env_float("LLM_REPLAY_LATENCY_MS", 0) / 1000
+        tokens_per_sec = _env_float("LLM_REPLAY_TOKENS_PER_SEC", 0)
+
+        if not _is_chat_completion(request):
+            # Прогрев соединения (GET /models) и прочие служебные запросы
+            self.body = {"object": "list", "data": []}
+            self.latency = 0.0
+            return
+
+        request_body = json.loads(request.content or b"{}")
+        key = store.make_key(request_body)
+        record = store.load(key)
+        if record is None:
+            logger.warning(f"Нет записи ответа LLM для запроса {key[:12]}")
+            self.status_code = 404
+            self.body = {
+                "error": {
+                    "message": f"Нет записанного ответа для запроса {key}",
+                    "type": "replay_miss",
+                }
+            }
+            return
+
+        response = record.get("response") or {}
+        content = response.get("content") or ""
+        model = response.get("model") or request_body.get("model")
+        # Старые записи потоков сохранены без usage
+        usage = response.get("usage") or _estimate_usage(content)
+        generation_time = (
+            usage.get("completion_tokens", 0) / tokens_per_sec
+            if tokens_per_sec > 0
+            else 0.0
+        )
+
+        if request_body.get("stream"):
+            self.stream = True
+            include_usage = (request_body.get("stream_options") or {}).get(
+                "include_usage"
+            )
+            self.chunks = _build_sse_chunks(
+                content, model, key, usage if include_usage else None
+            )
+            self.chunk_delay = generation_time / max(len(self.chunks), 1)
+        else:
+            self.latency += generation_time
+            self.body = {
+                "id": f"replay-{key[:12]}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": usage,
+            }
+
+    @property
+    def headers(self):
+        if self.stream:
+            return {"content-type": "text/event-stream"}
+        return {"content-type": "application/json"}
+
+    def json_bytes(self):
+        return json.dumps(self.body, ensure_ascii=False).encode("utf-8")
+
+
+def _build_sse_chunks(content, model, key, usage=None):
+    """Режет ответ на SSE-чанки chat.completion.chunk (usage — последним чанком)."""
+
+    def event(delta, finish_reason=None, usage=None):
+        chunk = {
+            "id": f"replay-{key[:12]}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": (
+                []
+                if usage
+                else [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            ),
+        }
+        if usage:
+            chunk["usage"] = usage
+        return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8")
+
+    chunks = [event({"role": "assistant", "content": ""})]
+    for start in range(0, len(content), STREAM_CHUNK_CHARS):
+        chunks.append(event({"content": content[start : start + STREAM_CHUNK_CHARS]}))
+    chunks.append(event({}, finish_reason="stop"))
+    if usage:
+        chunks.append(event({}, usage=usage))
+    chunks.append(b"data: [DONE]\n\n")
+    return chunks
+
+
+class ReplayTransport(httpx.BaseTransport):
+    """Отдаёт записанные ответы вместо обращения к сети."""
+
+    def __init__(self, store=None):
+        """
+        Args:
+            store (ReplayStore, optional): Хранилище записей
+        """
+        self.store = store or ReplayStore()
+
+    def handle_request(self, request):
+        request.read()
+        plan = _ReplayPlan(self.store, request)
+        if plan.latency:
+            time.sleep(plan.latency)
+        if not plan.stream:
+            return httpx.Response(
+                plan.status_code, headers=plan.headers, content=plan.json_bytes()
+            )
+
+        def body():
+            for chunk in plan.chunks:
+                if plan.chunk_delay:
+                    time.sleep(plan.chunk_delay)
+                yield chunk
+
+        return httpx.Response(plan.status_code, headers=plan.headers, content=body())
+
+
+class AsyncReplayTransport(httpx.AsyncBaseTransport):
+    """Асинхронный аналог ReplayTransport (паузы через asyncio.sleep)."""
+
+    def __init__(self, store=None):
+        self.store = store or ReplayStore()
+
+    async def handle_async_request(self, request):
+        await request.aread()
+        plan = _ReplayPlan(self.store, request)
+        if plan.latency:
+            await asyncio.sleep(plan.latency)
+        if not plan.stream:
+            return httpx.Response(
+                plan.status_code, headers=plan.headers, content=plan.json_bytes()
+            )
+
+        async def body():
+            for chunk in plan.chunks:
+                if plan.chunk_delay:
+                    await asyncio.sleep(plan.chunk_delay)
+                yield chunk
+
+        return httpx.Response(plan.status_code, headers=plan.headers, content=body())
@@ -0,0 +1,242 @@
+"""
+Объединение одинаковых одновременных запросов к LLM (single-flight).
+
+Двойной клик по кнопке, повторный вызов обработчика виджета или фоновая
+предзагрузка могут запустить одну и ту же генерацию несколько раз подряд.
+Пока первый запрос с данным ключом выполняется, остальные вызывающие
+не отправляют свой запрос, а ждут его и получают тот же результат
+(или то же исключение).
+
+Синхронные вызовы объединяются между потоками, асинхронные — внутри
+одного event loop. Потоковый запрос (stream) объединяется с синхронными,
+и пришедший первым поток отдаёт ожидающим полный ответ.
+
+Интерактивный запрос не ждёт фоновый (из background_requests(), например
+предзагрузку урока): фоновый запрос может ещё стоять в очереди за
+интерактивными и идёт без потокового показа, поэтому интерактивный
+выполняется сам. Сколько ждать готовую предзагрузку, решает вызывающий
+код (LessonPrefetcher.take_lesson с таймаутом).
+"""
+
+import asyncio
+import logging
+import threading
+
+from llm_rate_limit import is_background_request
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """Выполняющийся синхронный запрос."""
+
+    def __init__(self, background=False):
+        self.background = background
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+        # Ведущий поток прервали до конца ответа: ожидающие повторяют запрос
+        self.aborted = False
+
+
+class SingleFlight:
+    """Группа одновременных вызовов, объединяемых по ключу."""
+
+    def __init__(self):
+        """Инициализация группы."""
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._async_calls = {}
+        self.coalesced = 0
+
+    def do(self, key, func):
+        """
+        Выполняет func или присоединяется к уже выполняющемуся вызову.
+
+        Args:
+            key (str): Ключ запроса
+            func (callable): Функция без аргументов, выполняющая запрос
+
+        Returns:
+            Результат func (общий для всех ожидающих)
+
+        Raises:
+            Exception: Исключение, выброшенное func
+        """
+        while True:
+            call, leader = self._join(key)
+            if leader:
+                break
+            if not call.aborted:
+                if call.error is not None:
+                    raise call.error
+                return call.result
+
+        if call is None:
+            return func()
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def stream(self, key, chunks_factory):
+        """
+        Потоковый аналог do: отдаёт фрагменты ответа по мере получения.
+
+        Если запрос с этим ключом уже выполняется, ждёт его и отдаёт полный
+        ответ одним фрагментом (фоновый запрос интерактивный поток не ждёт,
+        а выполняет запрос сам). Иначе сам выполняет запрос; ожидающие (в
+        том числе через do) получают склеенные фрагменты. Если поток
+        прервали до конца, ожидающие выполняют запрос заново.
+
+        Args:
+            key (str): Ключ запроса
+            chunks_factory (callable): Функция без аргументов, возвращающая
+                итератор текстовых фрагментов
+
+        Yields:
+            str: Очередной фрагмент ответа
+
+        Raises:
+            Exception: Исключение, выброшенное запросом
+        """
+        while True:
+            call, leader = self._join(key)
+            if leader:
+                break
+            if not call.aborted:
+                if call.error is not None:
+                    raise call.error
+                yield call.result
+                return
+
+        if call is None:
+            yield from chunks_factory()
+            return
+        parts = []
+        try:
+            for chunk in chunks_factory():
+                parts.append(chunk)
+                yield chunk
+            call.result = "".join(parts)
+        except GeneratorExit:
+            call.aborted = True
+            raise
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def _join(self, key):
+        """
+        Регистрирует вызов по ключу или ждёт уже выполняющийся.
+
+        Returns:
+            tuple: (_Call, True) — вызов нужно выполнить самому;
+                (None, True) — выполнить самому, не регистрируя (ключ занят
+                фоновым вызовом, а этот — интерактивный);
+                (_Call, False) — завершённый чужой вызов
+        """
+        background = is_background_request()
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call(background)
+                self._calls[key] = call
+                return call, True
+            if call.background and not background:
+                logger.info(
+                    "Тот же запрос выполняется в фоне — интерактивный запрос не ждёт его"
+                )
+                return None, True
+            call.waiters += 1
+            self.coalesced += 1
+
+        logger.info("Запрос к LLM присоединён к уже выполняющемуся")
+        call.done.wait()
+        return call, False
+
+    async def do_async(self, key, coro_factory):
+        """
+        Асинхронный аналог do для корутин в одном event loop.
+
+        Args:
+            key (str): Ключ запроса
+            coro_factory (callable): Функция без аргументов, возвращающая корутину
+
+        Returns:
+            Результат корутины (общий для всех ожидающих)
+
+        Raises:
+            Exception: Исключение, выброшенное корутиной
+        """
+        loop = asyncio.get_running_loop()
+        flight_key = (id(loop), key)
+
+        with self._lock:
+            future = self._async_calls.get(flight_key)
+            if future is not None and not future.done():
+                self.coalesced += 1
+                leader = False
+            else:
+                future = loop.create_future()
+                # Исключение может остаться без ожидающих — помечаем его прочитанным
+                future.add_done_callback(lambda f: f.cancelled() or f.exception())
+                self._async_calls[flight_key] = future
+                leader = True
+
+        if not leader:
+            logger.info("Асинхронный запрос к LLM присоединён к уже выполняющемуся")
+            # shield: отмена одного ожидающего не отменяет общий запрос
+            return await asyncio.shield(future)
+
+        try:
+            result = await coro_factory()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                if self._async_calls.get(flight_key) is future:
+                    del self._async_calls[flight_key]
+
+    def in_flight(self):
+        """
+        Возвращает число выполняющихся сейчас запросов.
+
+        Returns:
+            int: Синхронные и асинхронные запросы вместе
+        """
+        with self._lock:
+            return len(self._calls) + sum(
+                1 for future in self._async_calls.values() if not future.done()
+            )
+
+
+_single_flight = SingleFlight()
+
+
+def get_single_flight():
+    """
+    Возвращает общую для процесса группу объединения запросов.
+
+    Returns:
+        SingleFlight: Общий экземпляр
+    """
+    return _single_flight
@@ -0,0 +1,343 @@
+"""
+Общий транспорт для обращений к LLM.
+
+Все генераторы (наследники BaseContentGenerator) раньше создавали свой
+httpx.Client и свой клиент OpenAI, поэтому каждый открывал отдельный пул
+соединений и заново проходил TLS-рукопожатие через прокси. Этот модуль
+держит один пул соединений на процесс, с настраиваемыми лимитами и
+keep-alive, и умеет заранее «прогреть» соединение с прокси.
+
+Настройки (переменные окружения / .env):
+    LLM_POOL_MAX_CONNECTIONS — максимум одновременных соединений (20)
+    LLM_POOL_MAX_KEEPALIVE — максимум простаивающих keep-alive соединений (10)
+    LLM_POOL_KEEPALIVE_EXPIRY — время жизни простаивающего соединения, сек (60)
+    LLM_CONNECT_TIMEOUT — таймаут установки соединения, сек (15)
+    LLM_READ_TIMEOUT — таймаут чтения ответа, сек (120)
+
+Для асинхронного пути (AsyncOpenAI) пул создаётся отдельно на каждый
+event loop: httpx.AsyncClient привязан к циклу, в котором открыты его
+соединения. В Jupyter это один цикл kernel, то есть тоже один пул.
+
+При LLM_REPLAY_MODE=record/replay в пул подставляется транспорт записи
+или воспроизведения ответов (см. llm_replay); в режиме replay прокси
+не требуется.
+"""
+
+import os
+import asyncio
+import logging
+import threading
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+from llm_replay import (
+    AsyncRecordingTransport,
+    AsyncReplayTransport,
+    RecordingTransport,
+    ReplayTransport,
+    get_replay_mode,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+
+_lock = threading.RLock()
+_http_client = None
+_http_client_key = None
+_retired_http_clients = []
+_openai_clients = {}
+_async_clients = {}
+_warmup_thread = None
+
+
+def get_proxy_url():
+    """
+    Возвращает URL прокси из OPENAI_PROXY/HTTPS_PROXY/HTTP_PROXY.
+
+    Returns:
+        str: URL прокси
+
+    Raises:
+        RuntimeError: Если прокси не задан
+    """
+    proxy_url = (
+        os.getenv("OPENAI_PROXY")
+        or os.getenv("HTTPS_PROXY")
+        or os.getenv("HTTP_PROXY")
+        or ""
+    ).strip()
+    if not proxy_url or proxy_url.startswith("${"):
+        raise RuntimeError(
+            "Прокси не задан. Укажите OPENAI_PROXY или HTTPS_PROXY/HTTP_PROXY."
+        )
+    return proxy_url
+
+
+def _env_number(name, default, cast=float):
+    """Читает числовую настройку из окружения, при ошибке — значение по умолчанию."""
+    value = os.getenv(name)
+    if value is None or not str(value).strip():
+        return default
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        logger.warning(
+            "Некорректное значение %s=%r, используется %s", name, value, default
+        )
+        return default
+
+
+def get_pool_settings():
+    """
+    Собирает настройки пула соединений из окружения.
+
+    Returns:
+        dict: max_connections, max_keepalive_connections, keepalive_expiry,
+            connect_timeout, read_timeout
+    """
+    return {
+        "max_connections": _env_number("LLM_POOL_MAX_CONNECTIONS", 20, int),
+        "max_keepalive_connections": _env_number("LLM_POOL_MAX_KEEPALIVE", 10, int),
+        "keepalive_expiry": _env_number("LLM_POOL_KEEPALIVE_EXPIRY", 60.0),
+        "connect_timeout": _env_number("LLM_CONNECT_TIMEOUT", 15.0),
+        "read_timeout": _env_number("LLM_READ_TIMEOUT", 120.0),
+    }
+
+
+def build_limits(settings):
+    """Строит httpx.Limits из настроек пула."""
+    return httpx.Limits(
+        max_connections=settings["max_connections"],
+        max_keepalive_connections=settings["max_keepalive_connections"],
+        keepalive_expiry=settings["keepalive_expiry"],
+    )
+
+
+def build_timeout(settings):
+    """Строит httpx.Timeout из настроек пула."""
+    return httpx.Timeout(settings["read_timeout"], connect=settings["connect_timeout"])
+
+
+def _get_transport_proxy(mode):
+    """Прокси для режима транспорта: при воспроизведении сеть не нужна."""
+    return None if mode == "replay" else get_proxy_url()
+
+
+def _build_http_client(mode, proxy_url, settings):
+    """Создаёт httpx.Client с транспортом для режима записи/воспроизведения."""
+    if mode == "replay":
+        return httpx.Client(
+            transport=ReplayTransport(), timeout=build_timeout(settings)
+        )
+    if mode == "record":
+        transport = httpx.HTTPTransport(proxy=proxy_url, limits=build_limits(settings))
+        return httpx.Client(
+            transport=RecordingTransport(transport), timeout=build_timeout(settings)
+        )
+    return httpx.Client(
+        proxy=proxy_url,
+        limits=build_limits(settings),
+        timeout=build_timeout(settings),
+    )
+
+
+def _build_async_http_client(mode, proxy_url, settings):
+    """Асинхронный аналог _build_http_client."""
+    if mode == "replay":
+        return httpx.AsyncClient(
+            transport=AsyncReplayTransport(), timeout=build_timeout(settings)
+        )
+    if mode == "record":
+        transport = httpx.AsyncHTTPTransport(
+            proxy=proxy_url, limits=build_limits(settings)
+        )
+        return httpx.AsyncClient(
+            transport=AsyncRecordingTransport(transport),
+            timeout=build_timeout(settings),
+        )
+    return httpx.AsyncClient(
+        proxy=proxy_url,
+        limits=build_limits(settings),
+        timeout=build_timeout(settings),
+    )
+
+
+def get_shared_http_client():
+    """
+    Возвращает общий для процесса httpx.Client с пулом соединений.
+
+    Клиент пересоздаётся, только если изменились прокси или настройки пула
+    (например, после повторной загрузки .env в том же kernel).
+
+    Returns:
+        httpx.Client: Общий HTTP-клиент
+
+    Raises:
+        RuntimeError: Если прокси не задан
+    """
+    global _http_client, _http_client_key
+
+    mode = get_replay_mode()
+    proxy_url = _get_transport_proxy(mode)
+    settings = get_pool_settings()
+    key = (mode, proxy_url, tuple(sorted(settings.items())))
+
+    with _lock:
+        if _http_client is not None and _http_client_key == key:
+            return _http_client
+
+        if _http_client is not None:
+            logger.info("Настройки транспорта изменились, пересоздаём пул соединений")
+            # Старый пул не закрываем: на нём могут идти запросы, начатые
+            # до смены настроек; он закроется при close_shared_clients
+            _retired_http_clients.append(_http_client)
+            _http_client = None
+            _openai_clients.clear()
+
+        _http_client = _build_http_client(mode, proxy_url, settings)
+        _http_client_key = key
+        if mode != "off":
+            logger.info(f"Режим записи/воспроизведения ответов LLM: {mode}")
+        logger.info(
+            "Создан общий пул соединений LLM (max=%s, keepalive=%s, expiry=%ss)",
+            settings["max_connections"],
+            settings["max_keepalive_connections"],
+            settings["keepalive_expiry"],
+        )
+        return _http_client
+
+
+def get_shared_openai_client(api_key):
+    """
+    Возвращает клиент OpenAI поверх общего пула соединений.
+
+    Для одного API-ключа клиент создаётся один раз и переиспользуется
+    всеми генераторами.
+
+    Args:
+        api_key (str): API ключ OpenAI
+
+    Returns:
+        OpenAI: Клиент OpenAI
+
+    Raises:
+        RuntimeError: Если прокси не задан
+    """
+    http_client = get_shared_http_client()
+    with _lock:
+        client = _openai_clients.get(api_key)
+        if client is None:
+            # Повторы выполняет llm_rate_limit.RequestScheduler (Retry-After,
+            # circuit breaker), поэтому встроенные повторы SDK отключены
+            client = OpenAI(api_key=api_key, http_client=http_client, max_retries=0)
+            _openai_clients[api_key] = client
+        return client
+
+
+def get_shared_async_openai_client(api_key):
+    """
+    Возвращает AsyncOpenAI поверх общего асинхронного пула текущего event loop.
+
+    Должна вызываться из корутины (или при запущенном цикле), чтобы пул
+    был привязан к тому циклу, в котором будет использоваться.
+
+    Args:
+        api_key (str): API ключ OpenAI
+
+    Returns:
+        AsyncOpenAI: Асинхронный клиент OpenAI
+
+    Raises:
+        RuntimeError: Если прокси не задан или нет запущенного event loop
+    """
+    mode = get_replay_mode()
+    proxy_url = _get_transport_proxy(mode)
+    settings = get_pool_settings()
+    loop = asyncio.get_running_loop()
+    key = (id(loop), api_key, mode, proxy_url, tuple(sorted(settings.items())))
+
+    with _lock:
+        # Чистим клиенты закрытых циклов (asyncio.run в CLI создаёт новый цикл)
+        for stale_key, (stale_loop, _) in list(_async_clients.items()):
+            if stale_loop.is_closed():
+                del _async_clients[stale_key]
+
+        entry = _async_clients.get(key)
+        if entry is None:
+            http_client = _build_async_http_client(mode, proxy_url, settings)
+            client = AsyncOpenAI(
+                api_key=api_key, http_client=http_client, max_retries=0
+            )
+            entry = (loop, client)
+            _async_clients[key] = entry
+            logger.info("Создан асинхронный пул соединений LLM для текущего event loop")
+        return entry[1]
+
+
+def _close_clients():
+    """Закрывает общий HTTP-клиент и сбрасывает клиенты OpenAI (под _lock)."""
+    global _http_client, _http_client_key
+
+    clients = _retired_http_clients + ([_http_client] if _http_client else [])
+    for http_client in clients:
+        try:
+            http_client.close()
+        except Exception as e:
+            logger.warning(f"Ошибка при закрытии пула соединений: {str(e)}")
+    _retired_http_clients.clear()
+    _http_client = None
+    _http_client_key = None
+    _openai_clients.clear()
+    # Асинхронные пулы закрываются вместе со своим event loop
+    _async_clients.clear()
+
+
+def close_shared_clients():
+    """Закрывает общий пул соединений (например, при завершении работы)."""
+    with _lock:
+        _close_clients()
+
+
+def warm_up_connection(base_url=None):
+    """
+    Прогревает соединение с API через прокси в фоновом потоке.
+
+    Отправляет лёгкий запрос без авторизации: ответ (обычно 401) не важен,
+    главное — TCP/TLS-соединение через прокси остаётся в keep-alive пуле
+    и первый настоящий запрос к модели не платит за рукопожатие.
+
+    Args:
+        base_url (str, optional): Базовый URL API; по умолчанию
+            OPENAI_BASE_URL или https://api.openai.com/v1
+
+    Returns:
+        threading.Thread | None: Поток прогрева или None, если прогрев
+            невозможен (нет прокси) либо уже выполняется
+    """
+    global _warmup_thread
+
+    try:
+        http_client = get_shared_http_client()
+    except Exception as e:
+        logger.debug(f"Прогрев соединения пропущен: {str(e)}")
+        return None
+
+    url = (base_url or os.getenv("OPENAI_BASE_URL") or DEFAULT_BASE_URL).rstrip("/")
+
+    def _warm_up():
+        try:
+            response = http_client.get(f"{url}/models")
+            logger.info("Соединение с LLM API прогрето (HTTP %s)", response.status_code)
+        except Exception as e:
+            logger.warning(f"Не удалось прогреть соединение с LLM API: {str(e)}")
+
+    with _lock:
+        if _warmup_thread is not None and _warmup_thread.is_alive():
+            return None
+        _warmup_thread = threading.Thread(
+            target=_warm_up, name="llm-warmup", daemon=True
+        )
+        _warmup_thread.start()
+        return _warmup_thread
@@ -0,0 +1,453 @@
+"""
+Ротация и хранение журналов.
+
+Журналы TeachAI (activity/questions/assessment, lesson_history.md,
+teachai.log) и отладочные ответы в
+debug_responses/ раньше росли без ограничений. Теперь файл, превысивший
+LOG_MAX_MB, переименовывается в сегмент <имя>.<ГГГГММДД-ЧЧММСС>.gz
+(сжимается gzip), а новые записи идут в пустой файл. У каждого журнала
+хранится не больше LOG_MAX_FILES сегментов и не старше LOG_MAX_AGE_DAYS.
+В debug_responses/ удаляются самые старые файлы сверх
+DEBUG_RESPONSES_MAX_FILES / DEBUG_RESPONSES_MAX_MB и старше
+DEBUG_RESPONSES_MAX_AGE_DAYS (записи llm_replay в подкаталогах не трогаются).
+
+Журналы учащегося (logs/learners/<learner_id>/, включая его teachai.log)
+пишет и ротирует только kernel этого учащегося. При запуске ротируются
+только журналы своего каталога: журналы других учащихся могут быть
+открыты их kernel. Если один журнал всё же пишут несколько процессов
+(несколько kernel без learner_id), RotatingLogHandler замечает, что файл
+ротирован другим процессом, и переоткрывает его.
+
+Политику задаёт ConfigManager при загрузке конфигурации
+(configure_log_rotation); до этого используются переменные окружения.
+
+Настройки (переменные окружения / .env):
+    LOG_MAX_MB — размер журнала, после которого он ротируется (10, 0 — без ротации)
+    LOG_MAX_FILES — сколько сегментов хранить на журнал (5)
+    LOG_MAX_AGE_DAYS — сколько дней хранить сегменты (30, 0 — без ограничения)
+    LOG_COMPRESS — сжимать сегменты gzip (1)
+    DEBUG_RESPONSES_MAX_FILES — файлов в debug_responses/ (500)
+    DEBUG_RESPONSES_MAX_MB — объём debug_responses/ (50)
+    DEBUG_RESPONSES_MAX_AGE_DAYS — сколько дней хранить отладочные ответы (14)
+"""
+
+import os
+import re
+import gzip
+import time
+import shutil
+import logging
+import threading
+import logging.handlers
+from collections import namedtuple
+from datetime import datetime
+
+from learner_namespace import LEARNERS_DIR
+
+logger = logging.getLogger(__name__)
+
+LogRotationPolicy = namedtuple(
+    "LogRotationPolicy", ["max_bytes", "max_files", "max_age_days", "compress"]
+)
+LogRotationPolicy.__doc__ = (
+    "Политика ротации: размер файла, число и возраст сегментов, сжатие."
+)
+
+# Суффикс сегмента: .20250101-120000, .20250101-120000-2, с .gz или без
+_SEGMENT_SUFFIX = re.compile(r"^\.\d{8}-\d{6}(-\d+)?(\.gz)?$")
+
+# Как часто допускается обход каталога отладочных ответов, секунд
+DIRECTORY_PRUNE_INTERVAL = 60
+
+_policy = None
+_debug_policy = None
+_policy_lock = threading.Lock()
+_last_prune = {}  # каталог -> time.monotonic() последнего обхода
+_handler_files = set()  # журналы, открытые RotatingLogHandler
+
+
+def _env_float(name, default):
+    """Читает число из окружения, при ошибке — значение по умолчанию."""
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        logger.warning("Некорректное значение %s, используется %s", name, default)
+        return float(default)
+
+
+def policy_from_env():
+    """
+    Политика ротации журналов из переменных окружения.
+
+    Returns:
+        LogRotationPolicy: Политика для журналов
+    """
+    return LogRotationPolicy(
+        max_bytes=int(_env_float("LOG_MAX_MB", 10) * 1024 * 1024),
+        max_files=max(0, int(_env_float("LOG_MAX_FILES", 5))),
+        max_age_days=_env_float("LOG_MAX_AGE_DAYS", 30),
+        compress=os.getenv("LOG_COMPRESS", "1").strip().lower()
+        not in ("0", "false", "no", "off"),
+    )
+
+
+def debug_policy_from_env():
+    """
+    Политика хранения отладочных ответов из переменных окружения.
+
+    Returns:
+        LogRotationPolicy: max_bytes — общий объём каталога, max_files — число файлов
+    """
+    return LogRotationPolicy(
+        max_bytes=int(_env_float("DEBUG_RESPONSES_MAX_MB", 50) * 1024 * 1024),
+        max_files=max(0, int(_env_float("DEBUG_RESPONSES_MAX_FILES", 500))),
+        max_age_days=_env_float("DEBUG_RESPONSES_MAX_AGE_DAYS", 14),
+        compress=False,
+    )
+
+
+def configure_log_rotation(policy=None, debug_policy=None):
+    """
+    Задаёт политики ротации журналов и хранения отладочных ответов.
+
+    Args:
+        policy (LogRotationPolicy, optional): Политика журналов (None — из окружения)
+        debug_policy (LogRotationPolicy, optional): Политика debug_responses/
+    """
+    global _policy, _debug_policy
+    with _policy_lock:
+        _policy = policy
+        _debug_policy = debug_policy
+
+
+def get_rotation_policy():
+    """Текущая политика ротации журналов."""
+    with _policy_lock:
+        return _policy or policy_from_env()
+
+
+def get_debug_policy():
+    """Текущая политика хранения отладочных ответов."""
+    with _policy_lock:
+        return _debug_policy or debug_policy_from_env()
+
+
+def list_segments(path):
+    """
+    Сегменты журнала, от старых к новым.
+
+    Args:
+        path (str): Путь к текущему файлу журнала
+
+    Returns:
+        list[str]: Пути к сегментам
+    """
+    directory = os.path.dirname(path) or "."
+    base = os.path.basename(path)
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    segments = [
+        name
+        for name in names
+        if name.startswith(base) and _SEGMENT_SUFFIX.match(name[len(base) :])
+    ]
+    # Имена сегментов упорядочены по времени; "-N" — ротации в одну секунду
+    segments.sort(key=lambda name: _segment_sort_key(name[len(base) :]))
+    return [os.path.join(directory, name) for name in segments]
+
+
+def _is_segment(name):
+    """Является ли имя файла сегментом журнала."""
+    return re.search(r"\.\d{8}-\d{6}(-\d+)?(\.gz)?$", name) is not None
+
+
+def _segment_sort_key(suffix):
+    match = _SEGMENT_SUFFIX.match(suffix)
+    stamp = suffix[1:16]
+    return stamp, int(match.group(1)[1:]) if match.group(1) else 1
+
+
+def rotate_if_needed(path, policy=None):
+    """
+    Ротирует журнал, если он больше допустимого размера.
+
+    Args:
+        path (str): Путь к файлу журнала
+        policy (LogRotationPolicy, optional): Политика (по умолчанию текущая)
+
+    Returns:
+        bool: True если журнал ротирован
+    """
+    policy = policy or get_rotation_policy()
+    if policy.max_bytes <= 0:
+        return False
+    try:
+        if os.path.getsize(path) < policy.max_bytes:
+            return False
+    except OSError:
+        return False
+    return rotate_file(path, policy) is not None
+
+
+def rotate_file(path, policy=None, background=False):
+    """
+    Переименовывает журнал в сегмент, сжимает его и удаляет лишние сегменты.
+
+    Args:
+        path (str): Путь к файлу журнала
+        policy (LogRotationPolicy, optional): Политика (по умолчанию текущая)
+        background (bool): Сжимать и чистить в отдельном потоке
+
+    Returns:
+        str | None: Путь к сегменту (до сжатия) или None при ошибке
+    """
+    policy = policy or get_rotation_policy()
+    segment = _new_segment_name(path)
+    try:
+        os.replace(path, segment)
+    except OSError as e:
+        logger.error(f"Ошибка при ротации журнала {path}: {str(e)}")
+        return None
+
+    if background:
+        threading.Thread(
+            target=_finish_rotation,
+            args=(path, segment, policy),
+            name="teachai-log-rotation",
+            daemon=True,
+        ).start()
+    else:
+        _finish_rotation(path, segment, policy)
+    return segment
+
+
+def _new_segment_name(path):
+    """Свободное имя сегмента с текущим временем."""
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    segment = f"{path}.{stamp}"
+    counter = 1
+    while os.path.exists(segment) or os.path.exists(segment + ".gz"):
+        counter += 1
+        segment = f"{path}.{stamp}-{counter}"
+    return segment
+
+
+def _finish_rotation(path, segment, policy):
+    """Сжимает сегмент и применяет ограничения хранения."""
+    # Сообщение пишется здесь, а не в rotate_file: из doRollover обработчика
+    # logging запись в тот же журнал недопустима
+    logger.info(f"Журнал {path} ротирован в {segment}")
+    if policy.compress:
+        compress_file(segment)
+    prune_segments(path, policy)
+
+
+def compress_file(path):
+    """
+    Сжимает файл gzip (path → path.gz) и удаляет исходный.
+
+    Args:
+        path (str): Путь к файлу
+
+    Returns:
+        str: Путь к сжатому файлу (или исходному при ошибке)
+    """
+    target = path + ".gz"
+    try:
+        with open(path, "rb") as src, gzip.open(target + ".tmp", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(target + ".tmp", target)
+        os.remove(path)
+        return target
+    except OSError as e:
+        logger.error(f"Ошибка при сжатии журнала {path}: {str(e)}")
+        return path
+
+
+def prune_segments(path, policy=None):
+    """
+    Удаляет сегменты журнала сверх max_files и старше max_age_days.
+
+    Args:
+        path (str): Путь к текущему файлу журнала
+        policy (LogRotationPolicy, optional): Политика (по умолчанию текущая)
+
+    Returns:
+        int: Число удалённых сегментов
+    """
+    policy = policy or get_rotation_policy()
+    segments = list_segments(path)
+    expired = set(segments[: max(0, len(segments) - policy.max_files)])
+    if policy.max_age_days > 0:
+        cutoff = time.time() - policy.max_age_days * 86400
+        for segment in segments:
+            try:
+                if os.path.getmtime(segment) < cutoff:
+                    expired.add(segment)
+            except OSError:
+                continue
+    removed = 0
+    for segment in expired:
+        try:
+            os.remove(segment)
+            removed += 1
+        except OSError as e:
+            logger.warning(f"Не удалось удалить сегмент журнала {segment}: {str(e)}")
+    return removed
+
+
+def open_segment(path):
+    """
+    Открывает сегмент или журнал для чтения текста (gzip — прозрачно).
+
+    Args:
+        path (str): Путь к файлу
+
+    Returns:
+        file: Текстовый файл в UTF-8
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def prune_directory(directory, policy=None, force=False):
+    """
+    Ограничивает каталог отладочных ответов по числу файлов, объёму и возрасту.
+
+    Удаляются самые старые файлы верхнего уровня; подкаталоги (например,
+    записи llm_replay) не затрагиваются. Обход выполняется не чаще раза
+    в DIRECTORY_PRUNE_INTERVAL секунд.
+
+    Args:
+        directory (str): Каталог
+        policy (LogRotationPolicy, optional): Политика (по умолчанию текущая для debug_responses/)
+        force (bool): Обойти каталог независимо от интервала
+
+    Returns:
+        int: Число удалённых файлов
+    """
+    now = time.monotonic()
+    key = os.path.abspath(directory)
+    with _policy_lock:
+        if (
+            not force
+            and now - _last_prune.get(key, -DIRECTORY_PRUNE_INTERVAL)
+            < DIRECTORY_PRUNE_INTERVAL
+        ):
+            return 0
+        _last_prune[key] = now
+    policy = policy or get_debug_policy()
+
+    files = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+    except OSError:
+        return 0
+    files.sort()
+
+    cutoff = (
+        time.time() - policy.max_age_days * 86400 if policy.max_age_days > 0 else None
+    )
+    total_bytes = sum(size for _, size, _ in files)
+    count = len(files)
+    removed = 0
+    for mtime, size, path in files:
+        over_limits = (policy.max_files and count > policy.max_files) or (
+            policy.max_bytes and total_bytes > policy.max_bytes
+        )
+        if not over_limits and (cutoff is None or mtime >= cutoff):
+            break
+        try:
+            os.remove(path)
+            removed += 1
+            count -= 1
+            total_bytes -= size
+        except OSError as e:
+            logger.warning(f"Не удалось удалить {path}: {str(e)}")
+    if removed:
+        logger.info(f"Каталог {directory}: удалено старых файлов: {removed}")
+    return removed
+
+
+def apply_log_retention(log_dir="logs", debug_dir="debug_responses"):
+    """
+    Применяет ограничения хранения ко всем журналам и отладочным ответам.
+
+    Вызывается при запуске: журналы, выросшие за прошлые сеансы, ротируются,
+    старые сегменты удаляются. Каталоги учащихся (learners/) внутри
+    log_dir не обходятся: их журналы ротирует kernel учащегося.
+
+    Args:
+        log_dir (str): Каталог журналов (обходится рекурсивно)
+        debug_dir (str): Каталог отладочных ответов
+    """
+    policy = get_rotation_policy()
+    for root, dirs, names in os.walk(log_dir):
+        if root == log_dir and LEARNERS_DIR in dirs:
+            dirs.remove(LEARNERS_DIR)
+        for name in names:
+            path = os.path.join(root, name)
+            if name.endswith(".tmp") or _is_segment(name):
+                continue
+            try:
+                # Открытый обработчиком logging журнал он ротирует сам
+                if os.path.abspath(path) not in _handler_files:
+                    rotate_if_needed(path, policy)
+                prune_segments(path, policy)
+            except Exception as e:
+                logger.error(f"Ошибка при обработке журнала {path}: {str(e)}")
+    if debug_dir and os.path.isdir(debug_dir):
+        prune_directory(debug_dir, force=True)
+
+
+class RotatingLogHandler(logging.handlers.RotatingFileHandler):
+    """Файловый обработчик logging с ротацией по текущей политике TeachAI."""
+
+    def __init__(self, filename, encoding="utf-8"):
+        """
+        Инициализация обработчика.
+
+        Args:
+            filename (str): Путь к файлу журнала
+            encoding (str): Кодировка
+        """
+        super().__init__(
+            filename, mode="a", maxBytes=0, backupCount=0, encoding=encoding
+        )
+        _handler_files.add(self.baseFilename)
+
+    def shouldRollover(self, record):
+        # Политика может смениться после загрузки .env
+        self.maxBytes = get_rotation_policy().max_bytes
+        self._reopen_if_rotated()
+        return super().shouldRollover(record)
+
+    def _reopen_if_rotated(self):
+        """Переоткрывает журнал, если его ротировал другой процесс."""
+        if self.stream is None:
+            return
+        try:
+            rotated = not os.path.samestat(
+                os.stat(self.baseFilename), os.fstat(self.stream.fileno())
+            )
+        except OSError:
+            rotated = True
+        if rotated:
+            self.stream.close()
+            self.stream = self._open()
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        # Сжатие — в отдельном потоке, чтобы не задерживать записывающий поток
+        rotate_file(self.baseFilename, background=True)
+        if self.stream is None and not self.delay:
+            self.stream = self._open()
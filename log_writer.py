@@ -0,0 +1,391 @@
+"""
+Фоновая запись журналов.
+
+Раньше журналы (activity/questions/assessment, lesson_history.md,
+control_tasks_log.json) писались прямо в обработчиках виджетов, и каждое
+нажатие ждало диска. Теперь записи кладутся в ограниченную очередь, а
+отдельный поток раз в LOG_WRITER_FLUSH_MS забирает всё накопившееся и
+пишет пачкой: по одному открытию на файл, строки одного файла — одним
+write, из нескольких полных перезаписей одного файла выполняется последняя.
+Порядок записей внутри файла сохраняется. Кроме файлов поток выполняет
+по порядку и другие операции записи (call) — например, вставки в SQLite
+хранилища попыток контрольных заданий. Перед дописыванием файл,
+выросший сверх LOG_MAX_MB, ротируется (см. log_rotation).
+
+Если очередь заполнена (диск не успевает), запись телеметрии отбрасывается
+(LOG_WRITER_OVERFLOW=drop) или вызывающий поток ждёт свободного места не
+дольше LOG_WRITER_BLOCK_SECONDS (block). Перед завершением работы
+TeachAIEngine.shutdown дописывает очередь до конца.
+
+Настройки (переменные окружения / .env):
+    LOG_WRITER — фоновая запись журналов (1, 0 — писать сразу)
+    LOG_WRITER_QUEUE_SIZE — ёмкость очереди, записей (10000)
+    LOG_WRITER_FLUSH_MS — интервал записи пачки, мс (200)
+    LOG_WRITER_FSYNC — none, flush (fsync при flush/shutdown) или batch (после каждой пачки)
+    LOG_WRITER_OVERFLOW — drop или block при заполненной очереди (drop)
+    LOG_WRITER_BLOCK_SECONDS — максимальное ожидание в режиме block (5)
+"""
+
+import os
+import queue
+import atexit
+import logging
+import threading
+import time
+
+from log_rotation import rotate_if_needed
+
+logger = logging.getLogger(__name__)
+
+FSYNC_POLICIES = ("none", "flush", "batch")
+OVERFLOW_POLICIES = ("drop", "block")
+
+# Сколько записей максимум забирается из очереди в одну пачку
+MAX_BATCH_ITEMS = 2000
+
+# Операции очереди
+_APPEND = "append"
+_REPLACE = "replace"
+_CALL = "call"
+_FLUSH = "flush"
+_STOP = "stop"
+
+
+def _env_float(name, default):
+    """Читает число из окружения, при ошибке — значение по умолчанию."""
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        logger.warning("Некорректное значение %s, используется %s", name, default)
+        return float(default)
+
+
+def _env_choice(name, default, choices):
+    """Читает значение из списка допустимых, при ошибке — значение по умолчанию."""
+    value = (os.getenv(name) or default).strip().lower()
+    if value not in choices:
+        logger.warning("Некорректное значение %s, используется %s", name, default)
+        return default
+    return value
+
+
+class LogWriter:
+    """Фоновый поток записи журналов с ограниченной очередью."""
+
+    def __init__(self):
+        """Инициализация по настройкам из окружения (поток запускается при первой записи)."""
+        self.enabled = os.getenv("LOG_WRITER", "1").strip().lower() not in (
+            "0",
+            "false",
+            "no",
+            "off",
+        )
+        self.queue_size = max(1, int(_env_float("LOG_WRITER_QUEUE_SIZE", 10000)))
+        self.flush_interval = max(0.0, _env_float("LOG_WRITER_FLUSH_MS", 200) / 1000)
+        self.fsync_policy = _env_choice("LOG_WRITER_FSYNC", "none", FSYNC_POLICIES)
+        self.overflow_policy = _env_choice(
+            "LOG_WRITER_OVERFLOW", "drop", OVERFLOW_POLICIES
+        )
+        self.block_timeout = max(0.0, _env_float("LOG_WRITER_BLOCK_SECONDS", 5))
+
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._worker = None
+        self._closed = False
+        self._unsynced = set()  # файлы, записанные после последнего fsync
+
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.errors = 0
+
+    def append(self, path, text):
+        """
+        Дописывает текст в конец файла.
+
+        Args:
+            path (str): Путь к файлу
+            text (str): Текст (для JSON Lines — строка с переводом строки)
+
+        Returns:
+            bool: True если запись принята, False если отброшена
+        """
+        return self._submit((_APPEND, str(path), text))
+
+    def replace(self, path, content):
+        """
+        Перезаписывает файл целиком (атомарно, через временный файл).
+
+        Args:
+            path (str): Путь к файлу
+            content (str | callable): Новое содержимое или функция без
+                аргументов, возвращающая его; функция вызывается в потоке
+                записи, и из нескольких перезаписей в пачке — только последняя
+
+        Returns:
+            bool: True если запись принята, False если отброшена
+        """
+        return self._submit((_REPLACE, str(path), content))
+
+    def call(self, operation, critical=False):
+        """
+        Выполняет операцию записи в потоке записи (по порядку с остальными).
+
+        Args:
+            operation (callable): Функция без аргументов
+            critical (bool): Не отбрасывать при заполненной очереди, а ждать
+                места (для данных, которые нельзя потерять)
+
+        Returns:
+            bool: True если операция принята, False если отброшена
+        """
+        return self._submit((_CALL, None, operation), critical=critical)
+
+    def flush(self, timeout=None):
+        """
+        Дожидается записи всего, что было поставлено в очередь до вызова.
+
+        Args:
+            timeout (float, optional): Максимальное ожидание, секунд
+
+        Returns:
+            bool: True если очередь записана
+        """
+        if not self._is_running():
+            self._sync_unsynced()
+            return True
+        done = threading.Event()
+        try:
+            self._queue.put((_FLUSH, None, done), timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def shutdown(self, timeout=10.0):
+        """
+        Дописывает очередь и останавливает поток записи.
+
+        Args:
+            timeout (float): Максимальное ожидание записи очереди, секунд
+        """
+        with self._lock:
+            self._closed = True
+            worker = self._worker
+        if worker is None:
+            self._sync_unsynced()
+            return
+        try:
+            self._queue.put((_STOP, None, None), timeout=timeout)
+        except queue.Full:
+            logger.warning("Очередь журналов не освободилась, часть записей потеряна")
+            return
+        worker.join(timeout)
+        if worker.is_alive():
+            logger.warning("Фоновая запись журналов не завершилась вовремя")
+        with self._lock:
+            self._worker = None
+
+    def get_stats(self):
+        """
+        Статистика записи журналов.
+
+        Returns:
+            dict: queued, written, dropped, batches, errors и настройки
+        """
+        return {
+            "enabled": self.enabled,
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "errors": self.errors,
+            "queue_size": self.queue_size,
+            "flush_ms": int(self.flush_interval * 1000),
+            "fsync": self.fsync_policy,
+            "overflow": self.overflow_policy,
+        }
+
+    def _is_running(self):
+        with self._lock:
+            return self._worker is not None and self._worker.is_alive()
+
+    def _submit(self, item, critical=False):
+        """Ставит операцию в очередь (или выполняет сразу, если поток не используется)."""
+        if not self.enabled or not self._ensure_worker():
+            with self._write_lock:
+                self._write_batch([item])
+            return True
+        try:
+            if critical:
+                self._queue.put(item)
+            elif self.overflow_policy == "block":
+                self._queue.put(item, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning(
+                    f"Очередь журналов заполнена, отброшено записей: {self.dropped}"
+                )
+            return False
+
+    def _ensure_worker(self):
+        """Запускает поток записи; False после shutdown (тогда пишем сразу)."""
+        with self._lock:
+            if self._closed:
+                return False
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name="teachai-log-writer", daemon=True
+                )
+                self._worker.start()
+            return True
+
+    def _run(self):
+        """Цикл потока записи: собирает пачку за интервал и пишет её."""
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while item[0] not in (_FLUSH, _STOP) and len(batch) < MAX_BATCH_ITEMS:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = (
+                        self._queue.get(timeout=remaining)
+                        if remaining > 0
+                        else self._queue.get_nowait()
+                    )
+                except queue.Empty:
+                    break
+                batch.append(item)
+
+            with self._write_lock:
+                self._write_batch(batch)
+
+            if batch[-1][0] == _STOP:
+                return
+
+    def _write_batch(self, batch):
+        """
+        Записывает пачку операций.
+
+        Операции группируются по файлам: перезапись отменяет накопленные
+        до неё дописывания этого файла, дописывания объединяются в одну
+        запись. Операции call выполняются после файлов в порядке очереди.
+        """
+        pending = {}  # путь -> [содержимое перезаписи или None, [тексты]]
+        calls = []
+        markers = []
+        for op, path, payload in batch:
+            if op == _APPEND:
+                pending.setdefault(path, [None, []])[1].append(payload)
+            elif op == _REPLACE:
+                pending[path] = [payload, []]
+            elif op == _CALL:
+                calls.append(payload)
+            else:
+                markers.append((op, payload))
+
+        for path, (content, texts) in pending.items():
+            try:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                if content is not None:
+                    self._replace_file(
+                        path, content() if callable(content) else content
+                    )
+                if texts:
+                    rotate_if_needed(path)
+                    with open(path, "a", encoding="utf-8") as f:
+                        f.write("".join(texts))
+                        if self.fsync_policy == "batch":
+                            f.flush()
+                            os.fsync(f.fileno())
+                if self.fsync_policy == "flush":
+                    self._unsynced.add(path)
+                self.written += len(texts) + (content is not None)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Ошибка при записи журнала {path}: {str(e)}")
+        for operation in calls:
+            try:
+                operation()
+                self.written += 1
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Ошибка при выполнении фоновой записи: {str(e)}")
+        if pending or calls:
+            self.batches += 1
+
+        for op, done in markers:
+            self._sync_unsynced()
+            if done is not None:
+                done.set()
+
+    def _replace_file(self, path, content):
+        """Атомарно заменяет содержимое файла."""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+            if self.fsync_policy != "none":
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _sync_unsynced(self):
+        """fsync файлов, записанных после последнего flush (политика flush)."""
+        paths, self._unsynced = self._unsynced, set()
+        for path in paths:
+            try:
+                with open(path, "rb") as f:
+                    os.fsync(f.fileno())
+            except OSError as e:
+                logger.warning(f"Ошибка fsync журнала {path}: {str(e)}")
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_log_writer():
+    """
+    Возвращает общий для процесса поток записи журналов.
+
+    Returns:
+        LogWriter: Общий экземпляр
+    """
+    global _writer
+    with _writer_lock:
+        if _writer is None or _writer._closed:
+            _writer = LogWriter()
+        return _writer
+
+
+def flush_log_writer(timeout=None):
+    """
+    Дожидается записи журналов, поставленных в очередь.
+
+    Args:
+        timeout (float, optional): Максимальное ожидание, секунд
+
+    Returns:
+        bool: True если очередь записана
+    """
+    with _writer_lock:
+        writer = _writer
+    return writer.flush(timeout) if writer is not None else True
+
+
+def shutdown_log_writer():
+    """Дописывает очередь и останавливает общий поток записи журналов."""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.shutdown()
+        logger.info(f"Запись журналов: {writer.get_stats()}")
+
+
+atexit.register(shutdown_log_writer)
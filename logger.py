@@ -1,6 +1,16 @@
 """
 Модуль для логирования действий и ошибок системы.
 Отвечает за запись логов в файлы разных типов для различных аспектов работы системы.
+
+Журналы действий, вопросов и тестов хранятся в формате JSON Lines
+(одна запись — одна строка): новая запись дописывается в конец файла, и
+стоимость записи не зависит от длины журнала. Прежние файлы-массивы
+activity_log.json, questions_log.json и assessment_log.json один раз
+переносятся в .jsonl при создании логгера. Выросшие журналы ротируются
+в сжатые сегменты (см. log_rotation).
+
+Запись идёт через фоновый поток (log_writer): обработчики интерфейса не
+ждут диска. Чтение журнала сначала дожидается записи очереди.
 """
 
 import os
@@ -9,6 +19,69 @@ import logging
 from pathlib import Path
 from datetime import datetime
 
+from log_writer import get_log_writer, flush_log_writer
+from log_rotation import list_segments, open_segment
+
+logger = logging.getLogger(__name__)
+
+# Имена журналов в каталоге логов
+LESSON_HISTORY_FILE = "lesson_history.md"
+QUESTIONS_LOG_FILE = "questions_log.jsonl"
+ASSESSMENT_LOG_FILE = "assessment_log.jsonl"
+ACTIVITY_LOG_FILE = "activity_log.jsonl"
+
+
+def iter_log_records(log_file, include_rotated=False):
+    """
+    Последовательно читает записи журнала, не загружая файл целиком.
+
+    Повреждённые строки (например, недописанная при сбое последняя
+    строка) пропускаются. Файл в прежнем формате (JSON-массив)
+    читается целиком.
+
+    Args:
+        log_file (str): Путь к файлу лога
+        include_rotated (bool): Сначала прочитать ротированные сегменты
+            (см. log_rotation), от старых к новым
+
+    Yields:
+        dict: Записи лога в порядке добавления
+    """
+    flush_log_writer()
+    paths = list_segments(log_file) if include_rotated else []
+    for path in paths + [log_file]:
+        yield from _iter_log_file(path)
+
+
+def _iter_log_file(path):
+    """Записи одного файла журнала (текущего или сегмента .gz)."""
+    try:
+        with open_segment(path) as f:
+            first_line = f.readline()
+            if first_line.lstrip().startswith("["):
+                records = json.loads(first_line + f.read())
+                yield from (records if isinstance(records, list) else [records])
+                return
+            if first_line.strip():
+                yield from _parse_log_lines(path, [(1, first_line)])
+            yield from _parse_log_lines(path, enumerate(f, 2))
+    except FileNotFoundError:
+        return
+    except (json.JSONDecodeError, OSError) as e:
+        logger.error(f"Ошибка при загрузке лога {path}: {str(e)}")
+
+
+def _parse_log_lines(path, numbered_lines):
+    """Разбирает строки JSON Lines, пропуская повреждённые."""
+    for line_number, line in numbered_lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            logger.warning(f"Пропущена повреждённая строка {line_number} в логе {path}")
+
 
 class Logger:
     """Логгер для записи действий и ошибок системы в различные файлы."""
@@ -21,10 +94,10 @@ class Logger:
             log_dir (str): Директория для хранения логов
         """
         self.log_dir = log_dir
-        self.lesson_history_file = os.path.join(log_dir, "lesson_history.md")
-        self.questions_log_file = os.path.join(log_dir, "questions_log.json")
-        self.assessment_log_file = os.path.join(log_dir, "assessment_log.json")
-        self.activity_log_file = os.path.join(log_dir, "activity_log.json")
+        self.lesson_history_file = os.path.join(log_dir, LESSON_HISTORY_FILE)
+        self.questions_log_file = os.path.join(log_dir, QUESTIONS_LOG_FILE)
+        self.assessment_log_file = os.path.join(log_dir, ASSESSMENT_LOG_FILE)
+        self.activity_log_file = os.path.join(log_dir, ACTIVITY_LOG_FILE)
 
         # Настраиваем логгер Python
         self.logger = logging.getLogger(__name__)
@@ -38,28 +111,90 @@ class Logger:
     def _initialize_log_files(self):
         """Инициализирует файлы логов, если они не существуют."""
         try:
+            # Записи прежнего логгера того же каталога должны лечь до переноса
+            flush_log_writer()
+
             # Инициализация lesson_history.md
             if not os.path.exists(self.lesson_history_file):
                 with open(self.lesson_history_file, "w", encoding="utf-8") as f:
                     f.write("# История уроков\n\n")
 
-            # Инициализация JSON логов
+            # Перенос журналов из прежнего формата (JSON-массивы)
             for log_file in [
                 self.questions_log_file,
                 self.assessment_log_file,
                 self.activity_log_file,
             ]:
-                if not os.path.exists(log_file):
-                    with open(log_file, "w", encoding="utf-8") as f:
-                        json.dump([], f, ensure_ascii=False, indent=2)
+                self._migrate_legacy_log(log_file)
+                self._terminate_last_line(log_file)
 
             self.logger.debug("Файлы логов успешно инициализированы")
         except Exception as e:
             self.logger.error(f"Ошибка при инициализации файлов логов: {str(e)}")
 
+    def _migrate_legacy_log(self, log_file):
+        """
+        Переносит записи из прежнего JSON-массива (<имя>.json) в JSON Lines.
+
+        Новый файл пишется целиком во временный и подменяется атомарно,
+        после чего старый файл переименовывается в <имя>.json.migrated.
+        Если перенос прервался после подмены, повторно записи не копируются.
+
+        Args:
+            log_file (str): Путь к файлу журнала .jsonl
+        """
+        legacy_file = os.path.splitext(log_file)[0] + ".json"
+        if not os.path.exists(legacy_file):
+            return
+        try:
+            if not os.path.exists(log_file):
+                with open(legacy_file, "r", encoding="utf-8") as f:
+                    records = json.load(f)
+                if not isinstance(records, list):
+                    records = [records]
+                tmp_file = log_file + ".tmp"
+                with open(tmp_file, "w", encoding="utf-8") as f:
+                    for record in records:
+                        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                os.replace(tmp_file, log_file)
+                self.logger.info(
+                    f"Лог {legacy_file} перенесён в {log_file} ({len(records)} записей)"
+                )
+            os.replace(legacy_file, legacy_file + ".migrated")
+        except Exception as e:
+            self.logger.error(f"Ошибка при переносе лога {legacy_file}: {str(e)}")
+
+    def _terminate_last_line(self, log_file):
+        """
+        Создаёт журнал или завершает недописанную при сбое последнюю строку,
+        чтобы новая запись не склеилась с ней.
+
+        Args:
+            log_file (str): Путь к файлу журнала .jsonl
+        """
+        with open(log_file, "a+b") as f:
+            if f.tell() == 0:
+                return
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+
+    def iter_log(self, log_file, include_rotated=False):
+        """
+        Последовательно читает записи журнала (см. iter_log_records).
+
+        Args:
+            log_file (str): Путь к файлу лога
+            include_rotated (bool): Сначала прочитать ротированные сегменты
+
+        Yields:
+            dict: Записи лога в порядке добавления
+        """
+        yield from iter_log_records(log_file, include_rotated)
+
     def _load_json_log(self, log_file):
         """
-        Загружает JSON лог из файла.
+        Загружает лог из файла.
 
         Args:
             log_file (str): Путь к файлу лога
@@ -67,16 +202,29 @@ class Logger:
         Returns:
             list: Список записей лога или пустой список в случае ошибки
         """
+        return list(self.iter_log(log_file))
+
+    def _append_json_log(self, log_file, log_entry):
+        """
+        Дописывает запись в конец журнала JSON Lines (в фоновом потоке).
+
+        Args:
+            log_file (str): Путь к файлу лога
+            log_entry (dict): Запись лога
+
+        Returns:
+            bool: True если запись принята, False если отброшена или ошибка
+        """
         try:
-            with open(log_file, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError) as e:
-            self.logger.error(f"Ошибка при загрузке лога {log_file}: {str(e)}")
-            return []
+            line = json.dumps(log_entry, ensure_ascii=False) + "\n"
+            return get_log_writer().append(log_file, line)
+        except Exception as e:
+            self.logger.error(f"Ошибка при записи в лог {log_file}: {str(e)}")
+            return False
 
     def _save_json_log(self, log_file, log_data):
         """
-        Сохраняет данные лога в JSON файл.
+        Перезаписывает журнал целиком (атомарно, в фоновом потоке).
 
         Args:
             log_file (str): Путь к файлу лога
@@ -86,13 +234,51 @@ class Logger:
             bool: True если сохранение прошло успешно, иначе False
         """
         try:
-            with open(log_file, "w", encoding="utf-8") as f:
-                json.dump(log_data, f, ensure_ascii=False, indent=2)
-            return True
+            content = "".join(
+                json.dumps(log_entry, ensure_ascii=False) + "\n"
+                for log_entry in log_data
+            )
+            return get_log_writer().replace(log_file, content)
         except Exception as e:
             self.logger.error(f"Ошибка при сохранении лога {log_file}: {str(e)}")
             return False
 
+    def get_activity_log(self, include_rotated=False):
+        """
+        Возвращает журнал действий.
+
+        Args:
+            include_rotated (bool): Включить записи ротированных сегментов
+
+        Returns:
+            list: Записи журнала действий в порядке добавления
+        """
+        return list(self.iter_log(self.activity_log_file, include_rotated))
+
+    def get_questions_log(self, include_rotated=False):
+        """
+        Возвращает журнал вопросов.
+
+        Args:
+            include_rotated (bool): Включить записи ротированных сегментов
+
+        Returns:
+            list: Записи журнала вопросов в порядке добавления
+        """
+        return list(self.iter_log(self.questions_log_file, include_rotated))
+
+    def get_assessment_log(self, include_rotated=False):
+        """
+        Возвращает журнал результатов тестирования.
+
+        Args:
+            include_rotated (bool): Включить записи ротированных сегментов
+
+        Returns:
+            list: Записи журнала тестирования в порядке добавления
+        """
+        return list(self.iter_log(self.assessment_log_file, include_rotated))
+
     def log_lesson(self, course, section, topic, lesson_title, lesson_content):
         """
         Записывает информацию об уроке в историю уроков.
@@ -110,18 +296,18 @@ class Logger:
         try:
             timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-            with open(self.lesson_history_file, "a", encoding="utf-8") as f:
-                f.write(f"## {lesson_title}\n")
-                f.write(
-                    f"**Курс:** {course} | **Раздел:** {section} | **Тема:** {topic}\n"
-                )
-                f.write(f"**Дата:** {timestamp}\n\n")
-                # Сохраняем только первые 1000 символов контента для экономии места
-                content_preview = lesson_content[:1000]
-                if len(lesson_content) > 1000:
-                    content_preview += "... (содержание сокращено)"
-                f.write(f"{content_preview}\n\n")
-                f.write("---\n\n")
+            # Сохраняем только первые 1000 символов контента для экономии места
+            content_preview = lesson_content[:1000]
+            if len(lesson_content) > 1000:
+                content_preview += "... (содержание сокращено)"
+            get_log_writer().append(
+                self.lesson_history_file,
+                f"## {lesson_title}\n"
+                f"**Курс:** {course} | **Раздел:** {section} | **Тема:** {topic}\n"
+                f"**Дата:** {timestamp}\n\n"
+                f"{content_preview}\n\n"
+                "---\n\n",
+            )
 
             # Логируем действие
             self.log_activity(
@@ -153,16 +339,10 @@ class Logger:
         try:
             timestamp = datetime.now().isoformat()
 
-            # Загружаем текущий лог вопросов
-            questions_log = self._load_json_log(self.questions_log_file)
-
-            # Добавляем новую запись
-            questions_log.append(
-                {"timestamp": timestamp, "question": question, "answer": answer}
+            return self._append_json_log(
+                self.questions_log_file,
+                {"timestamp": timestamp, "question": question, "answer": answer},
             )
-
-            # Сохраняем обновленный лог
-            return self._save_json_log(self.questions_log_file, questions_log)
         except Exception as e:
             self.logger.error(f"Ошибка при записи вопроса в лог: {str(e)}")
             return False
@@ -197,9 +377,6 @@ class Logger:
         try:
             timestamp = datetime.now().isoformat()
 
-            # Загружаем текущий лог тестирования
-            assessment_log = self._load_json_log(self.assessment_log_file)
-
             # Формируем массив вопросов с ответами
             question_details = []
             for i, question in enumerate(questions):
@@ -213,8 +390,8 @@ class Logger:
                     }
                 )
 
-            # Добавляем новую запись
-            assessment_log.append(
+            return self._append_json_log(
+                self.assessment_log_file,
                 {
                     "timestamp": timestamp,
                     "course": course,
@@ -223,11 +400,8 @@ class Logger:
                     "lesson": lesson,
                     "questions": question_details,
                     "score": score,
-                }
+                },
             )
-
-            # Сохраняем обновленный лог
-            return self._save_json_log(self.assessment_log_file, assessment_log)
         except Exception as e:
             self.logger.error(f"Ошибка при записи результатов тестирования: {str(e)}")
             return False
@@ -248,9 +422,6 @@ class Logger:
         try:
             timestamp = datetime.now().isoformat()
 
-            # Загружаем текущий лог активности
-            activity_log = self._load_json_log(self.activity_log_file)
-
             # Формируем запись
             log_entry = {
                 "timestamp": timestamp,
@@ -264,11 +435,7 @@ class Logger:
             if status == "error" and error:
                 log_entry["error"] = error
 
-            # Добавляем новую запись
-            activity_log.append(log_entry)
-
-            # Сохраняем обновленный лог
-            return self._save_json_log(self.activity_log_file, activity_log)
+            return self._append_json_log(self.activity_log_file, log_entry)
         except Exception as e:
             self.logger.error(f"Ошибка при записи действия в лог: {str(e)}")
             return False
@@ -0,0 +1,281 @@
+"""
+Бюджет токенов для промптов.
+
+Раньше текст урока в промптах обрезался по символам (6000, 2000, 8000...).
+Кириллица токенизируется иначе, чем латиница, поэтому одинаковый лимит
+в символах давал то слишком длинный (дорогой) промпт, то обрывал мысль
+на середине. Здесь текст считается в токенах и обрезается по абзацам
+в пределах бюджета своей секции промпта.
+
+Подсчёт токенов — через tiktoken, если он установлен и файл кодировки
+уже лежит в кэше tiktoken (TIKTOKEN_CACHE_DIR); иначе — эвристика по числу
+ASCII- и не-ASCII-символов. Способ подсчёта выбирается при первом подсчёте
+и не меняется до конца процесса: иначе один и тот же урок обрезался бы
+по-разному, и у одинаковых запросов менялись бы ключи кэша LLM и записей
+replay. Если файла кодировки нет, он скачивается (у tiktoken — без
+таймаута) в фоновом потоке и не задерживает сборку промптов; tiktoken
+начнёт использоваться со следующего запуска.
+
+Настройки (переменные окружения / .env):
+    TIKTOKEN_DOWNLOAD — скачивать файл кодировки в фоне (1, 0 — только эвристика)
+
+При LLM_REPLAY_MODE=replay файл кодировки не скачивается: используется
+только локальный кэш tiktoken (как при записи — иначе промпты обрезались
+бы иначе и не совпали с записями) или эвристика.
+"""
+
+import os
+import re
+import hashlib
+import logging
+import tempfile
+import threading
+
+from llm_replay import get_replay_mode
+
+try:
+    import tiktoken
+
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Бюджеты секций промпта, токенов
+DEFAULT_SECTION_BUDGETS = {
+    "system": 400,  # системное сообщение (см. BaseContentGenerator._build_request_kwargs)
+    "outline": 800,  # описания курса и урока из плана курса
+    "lesson": 2400,  # текст урока для анализа (понятия, релевантность, задания)
+    "lesson_context": 800,  # короткий контекст урока (ответы, объяснения)
+    "question": 400,
+}
+
+# Служебные токены на каждое сообщение chat-формата
+TOKENS_PER_MESSAGE = 4
+
+DEFAULT_ENCODING = "o200k_base"
+
+# Откуда tiktoken скачивает файлы кодировок (имя файла в кэше — SHA-1 URL)
+ENCODINGS_URL = "https://openaipublic.blob.core.windows.net/encodings"
+
+_encodings = {}  # имя кодировки -> Encoding или None (эвристика до конца процесса)
+_encodings_lock = threading.Lock()
+
+
+def _encoding_name(model):
+    """Имя кодировки tiktoken для модели (без обращения к сети)."""
+    try:
+        return tiktoken.encoding_name_for_model(model) if model else DEFAULT_ENCODING
+    except Exception:
+        return DEFAULT_ENCODING
+
+
+def _is_cached_locally(name):
+    """Лежит ли файл кодировки в кэше tiktoken."""
+    if "TIKTOKEN_CACHE_DIR" in os.environ:
+        cache_dir = os.environ["TIKTOKEN_CACHE_DIR"]
+    elif "DATA_GYM_CACHE_DIR" in os.environ:
+        cache_dir = os.environ["DATA_GYM_CACHE_DIR"]
+    else:
+        cache_dir = os.path.join(tempfile.gettempdir(), "data-gym-cache")
+    if not cache_dir:
+        return False
+    blob = f"{ENCODINGS_URL}/{name}.tiktoken"
+    return os.path.exists(
+        os.path.join(cache_dir, hashlib.sha1(blob.encode()).hexdigest())
+    )
+
+
+def _download_allowed():
+    """Разрешено ли скачивать файл кодировки (при воспроизведении — нет)."""
+    if get_replay_mode() == "replay":
+        return False
+    return os.getenv("TIKTOKEN_DOWNLOAD", "1").strip().lower() not in (
+        "0",
+        "false",
+        "no",
+        "off",
+    )
+
+
+def _download_encoding(name):
+    """Скачивает файл кодировки в кэш tiktoken (для следующих запусков)."""
+    try:
+        tiktoken.get_encoding(name)
+        logger.info(
+            f"Кодировка tiktoken {name} скачана, используется со следующего запуска"
+        )
+    except Exception as e:
+        logger.warning(f"Не удалось скачать кодировку tiktoken {name}: {str(e)}")
+
+
+def _get_encoding(model=None):
+    """
+    Возвращает кодировку tiktoken для модели или None.
+
+    Решение принимается один раз на процесс: кодировка из кэша tiktoken
+    читается сразу; если файла нет, до конца процесса используется
+    эвристика (None), а файл скачивается в фоновом потоке.
+    """
+    if not TIKTOKEN_AVAILABLE:
+        return None
+    name = _encoding_name(model)
+    with _encodings_lock:
+        if name in _encodings:
+            return _encodings[name]
+        encoding = None
+        if _is_cached_locally(name):
+            try:
+                encoding = tiktoken.get_encoding(name)
+            except Exception as e:
+                logger.warning(
+                    f"Кодировка tiktoken недоступна, используется оценка: {str(e)}"
+                )
+        elif _download_allowed():
+            threading.Thread(
+                target=_download_encoding,
+                args=(name,),
+                name="tiktoken-load",
+                daemon=True,
+            ).start()
+        _encodings[name] = encoding
+        return encoding
+
+
+def count_tokens(text, model=None):
+    """
+    Считает токены в тексте.
+
+    Args:
+        text (str): Текст
+        model (str, optional): Модель (для выбора кодировки tiktoken)
+
+    Returns:
+        int: Число токенов (точное или оценка)
+    """
+    if not text:
+        return 0
+    text = str(text)
+    encoding = _get_encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    # Латиница — около 4 символов на токен, кириллица — около 2.5
+    ascii_chars = sum(1 for char in text if ord(char) < 128)
+    return int(ascii_chars / 4 + (len(text) - ascii_chars) / 2.5) + 1
+
+
+def count_message_tokens(messages, model=None):
+    """
+    Считает токены в списке сообщений chat-формата.
+
+    Args:
+        messages (list): Сообщения [{"role": ..., "content": ...}]
+        model (str, optional): Модель
+
+    Returns:
+        int: Число токенов промпта
+    """
+    total = 2
+    for message in messages or []:
+        total += TOKENS_PER_MESSAGE + count_tokens(message.get("content"), model)
+    return total
+
+
+def _split_sentences(text):
+    """Делит абзац на предложения."""
+    return [part for part in re.split(r"(?<=[.!?…])\s+", text) if part]
+
+
+def trim_to_token_budget(text, max_tokens, model=None):
+    """
+    Обрезает текст до бюджета, не разрывая абзацы.
+
+    Абзацы берутся целиком, пока помещаются. Если не помещается даже
+    первый абзац (например, текст без переносов строк), он обрезается
+    по предложениям.
+
+    Args:
+        text (str): Текст
+        max_tokens (int): Бюджет, токенов
+        model (str, optional): Модель
+
+    Returns:
+        str: Текст, укладывающийся в бюджет
+    """
+    if not text or not max_tokens or count_tokens(text, model) <= max_tokens:
+        return text or ""
+
+    paragraphs = [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+    kept = []
+    used = 0
+    for paragraph in paragraphs:
+        cost = count_tokens(paragraph, model) + 1
+        if used + cost > max_tokens:
+            break
+        kept.append(paragraph)
+        used += cost
+
+    if kept:
+        return "\n\n".join(kept)
+
+    # Первый абзац сам по себе больше бюджета — режем по предложениям
+    sentences = []
+    used = 0
+    for sentence in _split_sentences(paragraphs[0]):
+        cost = count_tokens(sentence, model) + 1
+        if used + cost > max_tokens:
+            break
+        sentences.append(sentence)
+        used += cost
+    if sentences:
+        return " ".join(sentences)
+
+    # Одно гигантское «предложение» — последний рубеж, срез по символам
+    ratio = max_tokens / max(count_tokens(paragraphs[0], model), 1)
+    return paragraphs[0][: int(len(paragraphs[0]) * ratio)]
+
+
+class PromptBudget:
+    """Распределение токенов промпта по секциям."""
+
+    def __init__(self, model=None, budgets=None):
+        """
+        Инициализация бюджета.
+
+        Args:
+            model (str, optional): Модель (для подсчёта токенов)
+            budgets (dict, optional): Переопределение бюджетов секций
+        """
+        self.model = model
+        self.budgets = dict(DEFAULT_SECTION_BUDGETS)
+        if budgets:
+            self.budgets.update(budgets)
+
+    def fit(self, section, text, max_tokens=None):
+        """
+        Обрезает текст секции до её бюджета.
+
+        Args:
+            section (str): Секция (system, outline, lesson, lesson_context,
+                question)
+            text (str): Текст секции
+            max_tokens (int, optional): Бюджет вместо стандартного
+
+        Returns:
+            str: Текст в пределах бюджета
+        """
+        budget = max_tokens or self.budgets.get(section)
+        if not text or not budget:
+            return text or ""
+        trimmed = trim_to_token_budget(text, budget, self.model)
+        if len(trimmed) < len(text):
+            logger.info(
+                f"Секция промпта '{section}' сокращена до бюджета {budget} токенов "
+                f"({len(text)} → {len(trimmed)} символов)"
+            )
+        return trimmed
+
+    def count(self, text):
+        """Считает токены текста для модели этого бюджета."""
+        return count_tokens(text, self.model)
@@ -51,53 +51,66 @@ class QAGenerator(BaseContentGenerator):
             Exception: Если не удалось сгенерировать ответ
         """
         try:
-            lesson_title = str(lesson) if lesson is not None else "Урок"
-            user_name_str = str(user_name) if user_name is not None else "Пользователь"
-
-            prompt = self._build_qa_prompt(
+            prompt, messages, debug_data = self._prepare_qa_request(
                 course,
                 section,
                 topic,
-                lesson_title,
+                lesson,
                 user_question,
                 lesson_content,
-                user_name_str,
+                user_name,
                 communication_style,
             )
 
-            messages = [
-                {
-                    "role": "system",
-                    "content": "Ты - опытный преподаватель, который отвечает на вопросы студентов по учебным материалам. Отвечай профессионально, четко и по существу, БЕЗ приветствий в начале ответа.",
-                },
-                {"role": "user", "content": prompt},
-            ]
-
             answer = self.make_api_request(
                 messages=messages, temperature=0.7, max_tokens=2000
             )
 
-            # Сохраняем отладочную информацию
-            self.save_debug_response(
-                "question_answer",
-                prompt,
-                answer,
-                {
-                    "course": course,
-                    "section": section,
-                    "topic": topic,
-                    "lesson": lesson_title,
-                    "user_question": user_question,
-                    "user_name": user_name_str,
-                    "communication_style": communication_style,
-                },
+            return self._finalize_answer(
+                answer, prompt, debug_data, communication_style
+            )
+
+        except Exception as e:
+            self.logger.error(
+                f"Критическая ошибка при генерации ответа на вопрос: {str(e)}"
+            )
+            raise Exception(f"Не удалось сгенерировать ответ на вопрос: {str(e)}")
+
+    async def answer_question_async(
+        self,
+        course,
+        section,
+        topic,
+        lesson,
+        user_question,
+        lesson_content,
+        user_name,
+        communication_style="friendly",
+    ):
+        """
+        Асинхронно генерирует ответ на вопрос (AsyncOpenAI).
+
+        Аргументы и результат совпадают с answer_question.
+        """
+        try:
+            prompt, messages, debug_data = self._prepare_qa_request(
+                course,
+                section,
+                topic,
+                lesson,
+                user_question,
+                lesson_content,
+                user_name,
+                communication_style,
             )
 
-            # ИСПРАВЛЕНО: Применяем красивое форматирование ответов
-            styled_answer = self._apply_answer_styles(answer, communication_style)
+            answer = await self.make_api_request_async(
+                messages=messages, temperature=0.7, max_tokens=2000
+            )
 
-            self.logger.info("Ответ на вопрос успешно сгенерирован")
-            return styled_answer
+            return self._finalize_answer(
+                answer, prompt, debug_data, communication_style
+            )
 
         except Exception as e:
             self.logger.error(
@@ -105,6 +118,67 @@ class QAGenerator(BaseContentGenerator):
             )
             raise Exception(f"Не удалось сгенерировать ответ на вопрос: {str(e)}")
 
+    def _prepare_qa_request(
+        self,
+        course,
+        section,
+        topic,
+        lesson,
+        user_question,
+        lesson_content,
+        user_name,
+        communication_style,
+    ):
+        """
+        Готовит промпт, сообщения и отладочные данные для ответа на вопрос.
+
+        Returns:
+            tuple: (prompt, messages, debug_data)
+        """
+        lesson_title = str(lesson) if lesson is not None else "Урок"
+        user_name_str = str(user_name) if user_name is not None else "Пользователь"
+
+        prompt = self._build_qa_prompt(
+            course,
+            section,
+            topic,
+            lesson_title,
+            user_question,
+            lesson_content,
+            user_name_str,
+            communication_style,
+        )
+
+        messages = [
+            {
+                "role": "system",
+                "content": "Ты - опытный преподаватель, который отвечает на вопросы студентов по учебным материалам. Отвечай профессионально, четко и по существу, БЕЗ приветствий в начале ответа.",
+            },
+            {"role": "user", "content": prompt},
+        ]
+
+        debug_data = {
+            "course": course,
+            "section": section,
+            "topic": topic,
+            "lesson": lesson_title,
+            "user_question": user_question,
+            "user_name": user_name_str,
+            "communication_style": communication_style,
+        }
+        return prompt, messages, debug_data
+
+    def _finalize_answer(self, answer, prompt, debug_data, communication_style):
+        """Сохраняет отладочный ответ и применяет стили к ответу."""
+        # Сохраняем отладочную информацию
+        self.save_debug_response("question_answer", prompt, answer, debug_data)
+
+        # ИСПРАВЛЕНО: Применяем красивое форматирование ответов
+        styled_answer = self._apply_answer_styles(answer, communication_style)
+
+        self.logger.info("Ответ на вопрос успешно сгенерирован")
+        return styled_answer
+
     def _apply_answer_styles(self, answer, communication_style):
         """
         ИСПРАВЛЕНО: Применяет красивые CSS стили к ответу.
@@ -243,6 +317,8 @@ class QAGenerator(BaseContentGenerator):
         style_description = ContentUtils.COMMUNICATION_STYLES.get(
             communication_style, ContentUtils.COMMUNICATION_STYLES["friendly"]
         )
+        lesson_excerpt = self.prompt_budget.fit("lesson_context", lesson_content)
+        question_text = self.prompt_budget.fit("question", user_question)
 
         return f"""
         Ответь на вопрос пользователя {user_name_str} по следующему уроку:
@@ -253,10 +329,10 @@ class QAGenerator(BaseContentGenerator):
         Урок: {lesson_title}
 
         Содержание урока:
-        {lesson_content[:2000]}  # Ограничиваем длину для запроса
+        {lesson_excerpt}
 
         Вопрос пользователя:
-        {user_question}
+        {question_text}
 
         Используй следующий стиль общения: {style_description}
 
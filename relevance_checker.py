@@ -93,7 +93,6 @@ class RelevanceChecker(BaseContentGenerator):
             content_for_check = self.prepare_lesson_text_for_analysis(
                 analysis_source,
                 course_context,
-                max_chars=6000,
                 lesson_title=lesson_title,
             )
             if headers:
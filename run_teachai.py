@@ -18,14 +18,32 @@ logger = logging.getLogger(__name__)
 
 # Порядок важен: сначала базовые модули, затем зависящие от них.
 _RELOAD_ORDER: tuple[str, ...] = (
+    "log_rotation",
+    "log_writer",
+    "logger",
+    "prompt_budget",
+    "llm_cache",
+    "llm_replay",
+    "llm_transport",
+    "llm_singleflight",
+    "llm_rate_limit",
+    "async_tasks",
     "content_utils",
     "relevance_checker",
     "concepts_generator",
     "content_generator",
     "lesson_generator",
+    "course_catalog",
+    "course_plan_index",
+    "course_data_manager",
+    "lesson_prefetcher",
+    "lesson_artifacts",
     "lesson_display",
     "lesson_interface",
     "lesson_interaction",
+    "learner_namespace",
+    "lesson_store",
+    "state_storage",
     "state_manager",
     "engine",
     "interface",
@@ -49,13 +67,17 @@ def reload_project_modules() -> None:
                 logger.warning("Не удалось перезагрузить %s: %s", name, exc)
 
 
-def start_jupyter(*, reload_modules: bool = False) -> Optional[Any]:
+def start_jupyter(
+    *, reload_modules: bool = False, learner_id: Optional[str] = None
+) -> Optional[Any]:
     """Запускает TeachAI в Jupyter и отображает интерактивный интерфейс.
 
     Args:
         reload_modules: Перезагружать ли уже импортированные модули проекта.
             По умолчанию False — безопаснее для kernel (reload + виджеты
             часто вызывают зависание). True — только при активной разработке.
+        learner_id: ID учащегося, когда одним сервером пользуется весь
+            класс (по умолчанию TEACHAI_LEARNER_ID из .env).
 
     Returns:
         Виджет интерфейса (VBox) или None при ошибке запуска.
@@ -70,7 +92,7 @@ def start_jupyter(*, reload_modules: bool = False) -> Optional[Any]:
     from engine import TeachAIEngine
 
     print("⏳ Загрузка дашборда...", flush=True)
-    engine = TeachAIEngine()
+    engine = TeachAIEngine(learner_id=learner_id)
     interface_element = engine.start()
 
     if interface_element:
@@ -8,6 +8,10 @@ from IPython.display import display, clear_output
 import logging
 import time
 from interface_utils import InterfaceUtils, InterfaceState
+from lesson_prefetcher import get_lesson_prefetcher
+
+# С какого размера каталога над списком курсов появляется поиск
+COURSE_SEARCH_MIN_COURSES = 15
 
 # Подписи полей формы знакомства: без фиксированной узкой колонки и обрезки
 _SETUP_FIELD_STYLE = {"description_width": "initial"}
@@ -142,11 +146,16 @@ class SetupInterface:
                 )
 
                 if success:
-                    # Сбрасываем старые данные курса и прогресса при новом профиле
-                    self.state_manager.reset_learning_and_course_data()
+                    # Сброс курса и флаг первого запуска — одной записью состояния
+                    with self.state_manager.transaction():
+                        # Сбрасываем старые данные курса и прогресса при новом профиле
+                        self.state_manager.reset_learning_and_course_data()
 
-                    # Устанавливаем флаг, что это не первый запуск
-                    self.state_manager.set_not_first_run()
+                        # Устанавливаем флаг, что это не первый запуск
+                        self.state_manager.set_not_first_run()
+                    get_lesson_prefetcher(
+                        self.state_manager, self.content_generator
+                    ).cancel()
 
                     # Логируем действие
                     self.system_logger.log_activity(
@@ -243,7 +252,7 @@ class SetupInterface:
             # Функция для обновления описания при выборе курса
             def on_course_change(change):
                 course_id = change["new"]
-                course = next((c for c in courses if c["id"] == course_id), None)
+                course = self.state_manager.get_course_by_id(course_id)
                 if course:
                     description_html = f"""
                     <div style="padding: 15px; background-color: #f8f9fa; border-radius: 8px; margin: 15px 0; border: 1px solid #dee2e6;">
@@ -258,6 +267,25 @@ class SetupInterface:
             # Привязываем функцию к выпадающему списку
             course_dropdown.observe(on_course_change, names="value")
 
+            # Для большого каталога — поиск по названию и ключевым словам
+            course_search = None
+            if len(courses) > COURSE_SEARCH_MIN_COURSES:
+                course_search = widgets.Text(
+                    placeholder="Поиск курса по названию или ключевым словам",
+                    description="Поиск:",
+                    style={"description_width": "initial"},
+                    layout=widgets.Layout(width="500px"),
+                )
+
+                def on_search_change(change):
+                    found = self.state_manager.search_courses(change["new"])
+                    if found:
+                        course_dropdown.options = [
+                            (course["title"], course["id"]) for course in found
+                        ]
+
+                course_search.observe(on_search_change, names="value")
+
             # Показываем описание первого курса
             if courses:
                 first_course = courses[0]
@@ -292,7 +320,7 @@ class SetupInterface:
                     clear_output(wait=True)
 
                     course_id = course_dropdown.value
-                    course = next((c for c in courses if c["id"] == course_id), None)
+                    course = self.state_manager.get_course_by_id(course_id)
 
                     if course:
                         try:
@@ -316,6 +344,11 @@ class SetupInterface:
                             # Сохраняем план курса
                             success = self.state_manager.save_course_plan(course_plan)
 
+                            # Предзагрузка прежнего курса больше не нужна
+                            get_lesson_prefetcher(
+                                self.state_manager, self.content_generator
+                            ).cancel()
+
                             # Обновляем прогресс обучения
                             self.state_manager.update_learning_progress(
                                 course=course_id
@@ -444,6 +477,7 @@ class SetupInterface:
                 [
                     header,
                     description,
+                    *([course_search] if course_search is not None else []),
                     course_dropdown,
                     course_description,
                     settings_widget,
@@ -10,6 +10,9 @@ from IPython.display import display, HTML
 import ipywidgets as widgets
 from pathlib import Path
 
+from llm_transport import warm_up_connection
+from course_plan_index import get_course_plan_index
+
 # Импортируем InterfaceState для правильной работы
 from interface import InterfaceState
 
@@ -38,6 +41,10 @@ class StartupDashboard:
         try:
             self.logger.info("Создание интерактивного дашборда статистики...")
             
+            # Пока пользователь смотрит на дашборд, прогреваем соединение
+            # с LLM API через прокси, чтобы первый урок не ждал рукопожатия
+            warm_up_connection()
+            
             # Получаем данные для дашборда
             dashboard_data = self._collect_dashboard_data()
             
@@ -267,14 +274,9 @@ class StartupDashboard:
             learning = state.get("learning", {})
             
             completed_lessons = learning.get("completed_lessons", [])
-            course_plan = state.get("course_plan", {})
-            sections = course_plan.get("sections", [])
             
-            # Подсчитываем общее количество уроков
-            total_lessons = 0
-            for section in sections:
-                for topic in section.get("topics", []):
-                    total_lessons += len(topic.get("lessons", []))
+            # Общее количество уроков — из итогов прогресса
+            total_lessons = self.state_manager.get_progress_totals()["plan_total"]
             
             # Процент завершения
             progress_percent = learning.get("course_progress_percent", 0)
@@ -334,29 +336,20 @@ class StartupDashboard:
             state = self.state_manager.state
             learning = state.get("learning", {})
             
-            lesson_scores = learning.get("lesson_scores", {})
-            lesson_attempts = learning.get("lesson_attempts", {})
+            totals = self.state_manager.get_progress_totals()
             
             # Средняя оценка
             average_score = learning.get("average_score", 0)
-            if lesson_scores:
-                scores = list(lesson_scores.values())
-                average_score = sum(scores) / len(scores)
-            
-            # Количество пройденных тестов
-            passed_tests = sum(1 for score in lesson_scores.values() if score >= 70)
-            total_tests = len(lesson_scores)
-            
-            # Общее количество попыток
-            total_attempts = sum(len(attempts) for attempts in lesson_attempts.values())
+            if totals["scores_count"]:
+                average_score = totals["scores_sum"] / totals["scores_count"]
             
             return {
                 "average_score": round(average_score, 1),
-                "passed_tests_count": passed_tests,
-                "total_tests_count": total_tests,
-                "total_attempts_count": total_attempts,
-                "best_score": max(lesson_scores.values()) if lesson_scores else 0,
-                "worst_score": min(lesson_scores.values()) if lesson_scores else 0
+                "passed_tests_count": totals["scores_passed"],
+                "total_tests_count": totals["scores_count"],
+                "total_attempts_count": totals["attempts_count"],
+                "best_score": totals["best_score"],
+                "worst_score": totals["worst_score"]
             }
         except Exception as e:
             self.logger.error(f"Ошибка при получении статистики тестов: {str(e)}")
@@ -372,21 +365,21 @@ class StartupDashboard:
             incomplete_lessons = []
             lesson_completion_status = learning.get("lesson_completion_status", {})
             
+            lesson_attempts = learning.get("lesson_attempts", {})
+            
             # Проверяем все уроки в плане курса
-            for section in course_plan.get("sections", []):
-                for topic in section.get("topics", []):
-                    for lesson in topic.get("lessons", []):
-                        lesson_id = f"{section['id']}:{topic['id']}:{lesson['id']}"
-                        
-                        # Если урок не завершен или нет информации о нем
-                        if not lesson_completion_status.get(lesson_id, False):
-                            incomplete_lessons.append({
-                                "lesson_id": lesson_id,
-                                "title": lesson.get("title", "Без названия"),
-                                "section": section.get("title", ""),
-                                "topic": topic.get("title", ""),
-                                "has_attempts": lesson_id in learning.get("lesson_attempts", {})
-                            })
+            for entry in get_course_plan_index(course_plan).entries:
+                lesson_id = f"{entry.section_id}:{entry.topic_id}:{entry.lesson_id}"
+                
+                # Если урок не завершен или нет информации о нем
+                if not lesson_completion_status.get(lesson_id, False):
+                    incomplete_lessons.append({
+                        "lesson_id": lesson_id,
+                        "title": entry.lesson.get("title", "Без названия"),
+                        "section": entry.section.get("title", ""),
+                        "topic": entry.topic.get("title", ""),
+                        "has_attempts": lesson_id in lesson_attempts
+                    })
             
             return incomplete_lessons
             
@@ -397,21 +390,10 @@ class StartupDashboard:
     def _get_control_tasks_statistics(self) -> Dict[str, Any]:
         """Получает статистику контрольных заданий."""
         try:
-            state = self.state_manager.state
-            
-            # Получаем статистику контрольных заданий из корневого уровня state
-            control_tasks = state.get("control_tasks", {})
+            totals = self.state_manager.get_progress_totals()
             
-            completed_tasks = 0
-            failed_tasks = 0
-            
-            # Исправлено: control_tasks содержит dict для каждого lesson_id
-            for lesson_id, task_result in control_tasks.items():
-                if isinstance(task_result, dict):
-                    if task_result.get("is_correct", False):
-                        completed_tasks += 1
-                    else:
-                        failed_tasks += 1
+            completed_tasks = totals["control_tasks_correct"]
+            failed_tasks = totals["control_tasks_failed"]
             
             total_tasks = completed_tasks + failed_tasks
             
@@ -732,28 +714,18 @@ class StartupDashboard:
             current_section = progress_stats.get("current_section", "")
             current_topic = progress_stats.get("current_topic", "")
             
+            index = get_course_plan_index(self.state_manager.state.get("course_plan", {}))
+            
             # Если есть информация о текущем уроке, получаем его название
             if current_section and current_topic and current_lesson:
-                course_plan = self.state_manager.state.get("course_plan", {})
-                
-                # Ищем урок в плане курса
-                for section in course_plan.get("sections", []):
-                    if section.get("id") == current_section:
-                        for topic in section.get("topics", []):
-                            if topic.get("id") == current_topic:
-                                for lesson in topic.get("lessons", []):
-                                    if lesson.get("id") == current_lesson:
-                                        return lesson.get("title", "Без названия")
+                lesson = index.lesson(current_section, current_topic, current_lesson)
+                if lesson is not None:
+                    return lesson.get("title", "Без названия")
             
             # Если нет информации о текущем уроке, возвращаем первый урок из плана
-            course_plan = self.state_manager.state.get("course_plan", {})
-            if course_plan.get("sections"):
-                first_section = course_plan["sections"][0]
-                if first_section.get("topics"):
-                    first_topic = first_section["topics"][0]
-                    if first_topic.get("lessons"):
-                        first_lesson = first_topic["lessons"][0]
-                        return first_lesson.get("title", "Без названия")
+            first = index.first()
+            if first is not None:
+                return first.lesson.get("title", "Без названия")
             
             return "Не выбран"
             
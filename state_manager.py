@@ -2,50 +2,161 @@
 Базовый модуль для управления состоянием системы.
 Отвечает за загрузку, сохранение и инициализацию состояния.
 РЕФАКТОРИНГ: Выделены базовые операции из большого модуля (600 строк → 200 строк)
+
+Запись отложенная (write-behind): save_state() только помечает состояние
+изменённым, а фоновый поток записывает его, когда серия изменений
+затихнет (STATE_WRITE_DELAY_MS, по умолчанию 500 мс; 0 — синхронная
+запись, как раньше). Несколько изменений можно объединить явно:
+
+    with state_manager.transaction():
+        state_manager.save_lesson_assessment(...)
+        state_manager.mark_lesson_complete_manually(...)
+
+flush() записывает немедленно, shutdown() записывает и останавливает
+фоновый поток.
+
+Частые действия передают в save_state() пути изменённых узлов, например
+save_state(("learning", "questions_count", lesson_id)). Журнальный бэкенд
+сравнивает и копирует только эти узлы, а не всё состояние; save_state()
+без путей и shutdown() сравнивают состояние целиком.
+
+С learner_id состояние хранится в каталоге учащегося
+data/learners/<learner_id>/, а уроки — в общем хранилище data/ (см.
+learner_namespace). Каталог учащегося блокируется на время работы
+менеджера, чтобы несколько kernel не писали одно состояние. Без learner_id
+блокировки нет: data/state.json можно открыть из нескольких kernel, как и
+раньше.
 """
 
 import os
-import json
+import copy
+import time
+import hashlib
+import atexit
 import logging
+import functools
+import threading
+import weakref
+from contextlib import contextmanager
 from pathlib import Path
 from datetime import datetime
 
 # Импортируем специализированные менеджеры
 from user_profile_manager import UserProfileManager
-from learning_progress_manager import LearningProgressManager
+from learning_progress_manager import LearningProgressManager, STATISTICS_PATHS
 from course_data_manager import CourseDataManager
+from lesson_store import LessonContentStore, DEFAULT_STORE_FILE
+from state_storage import create_state_backend
+from lesson_utils import LessonUtils
+from learner_namespace import (
+    LOCK_FILE_NAME,
+    StateFileLock,
+    learner_state_file,
+    normalize_learner_id,
+)
+
+# Отложенная запись ждёт затишья не дольше этого числа задержек
+MAX_WRITE_DELAYS = 10
+
+# Открытые менеджеры по файлу состояния: новый экземпляр для того же файла
+# сначала дописывает и закрывает прежний, иначе прочитал бы устаревшие данные
+_open_managers = weakref.WeakValueDictionary()
+_open_managers_lock = threading.Lock()
+
+
+def _flush_at_exit(manager_ref):
+    """Дописывает состояние при выходе, если менеджер ещё жив (хук atexit)."""
+    manager = manager_ref()
+    if manager is not None:
+        manager.flush()
 
 
 class StateManager:
     """Базовый менеджер состояния - координирует специализированные менеджеры."""
 
-    def __init__(self, state_file="data/state.json"):
+    def __init__(self, state_file="data/state.json", learner_id=None):
         """
         Инициализация менеджера состояния.
 
         Args:
             state_file (str): Путь к файлу состояния
+            learner_id (str, optional): ID учащегося; состояние хранится в
+                data/learners/<learner_id>/ рядом с общими данными
+
+        Raises:
+            StateLockError: Состояние учащегося уже открыто в другом процессе
         """
         # Определяем абсолютный путь к файлу состояния
         self.project_dir = Path(__file__).parent.absolute()
-        self.state_file = self.project_dir / state_file
+        self.learner_id = normalize_learner_id(learner_id)
+        self.shared_data_dir = (self.project_dir / state_file).parent
+        self.state_file = self.project_dir / learner_state_file(self.learner_id, state_file)
         self.logger = logging.getLogger(__name__)
 
         # Создаем директорию для данных, если она не существует
         self._ensure_data_directory()
 
+        # Отложенная запись
+        try:
+            self.write_delay = float(os.getenv("STATE_WRITE_DELAY_MS", 500)) / 1000
+        except ValueError:
+            self.write_delay = 0.5
+        self._version = 0  # увеличивается при каждом изменении состояния
+        self._saved_version = 0
+        # Пути изменённых с прошлой записи узлов; () — всё состояние
+        self._dirty_paths = set()
+        self._tx_depth = 0
+        self._tx_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._write_requested = threading.Event()
+        self._writer = None
+        self._closed = False
+        self._retire_previous_manager()
+
+        # Один процесс на каталог учащегося; блокировка держится до shutdown().
+        # Без learner_id data/state.json, как и раньше, не блокируется
+        self._state_lock = None
+        if self.learner_id is not None:
+            self._state_lock = StateFileLock(self.state_file.parent / LOCK_FILE_NAME)
+            self._state_lock.acquire()
+
+        # Хранилище состояния (json или sqlite, см. state_storage)
+        self.backend = create_state_backend(self.state_file)
+
         # Загружаем состояние
         self.state = self._load_state()
 
+        # Содержание уроков хранится отдельно от state.json, общее для учащихся
+        self.lesson_store = LessonContentStore(self.shared_data_dir / DEFAULT_STORE_FILE)
+        self._migrate_lesson_content_cache()
+
         # Инициализируем специализированные менеджеры
         self.user_profile = UserProfileManager(self)
         self.learning_progress = LearningProgressManager(self)
         self.course_data = CourseDataManager(self)
 
+        # Хранилище уроков не растёт бесконечно: вытеснение при запуске
+        self.enforce_lesson_cache_limits()
+
+        # Хук держит слабую ссылку: иначе atexit не дал бы удалить прежние
+        # менеджеры (и их хранилища) до конца работы kernel
+        self._atexit_hook = functools.partial(_flush_at_exit, weakref.ref(self))
+        atexit.register(self._atexit_hook)
+
         self.logger.info(
             "StateManager успешно инициализирован с специализированными менеджерами"
+            + (f" (учащийся {self.learner_id})" if self.learner_id else "")
         )
 
+    def _retire_previous_manager(self):
+        """Дописывает и закрывает прежний менеджер того же файла состояния."""
+        key = str(self.state_file.resolve())
+        with _open_managers_lock:
+            previous = _open_managers.get(key)
+            _open_managers[key] = self
+        if previous is not None and previous is not self:
+            previous.shutdown()
+
     def _ensure_data_directory(self):
         """Убеждается, что директория для данных существует."""
         try:
@@ -78,20 +189,38 @@ class StateManager:
             dict: Состояние системы или пустой словарь, если файл не существует
         """
         try:
-            if self.state_file.exists():
-                with open(self.state_file, "r", encoding="utf-8") as f:
-                    state = json.load(f)
-                self.logger.debug(f"Состояние успешно загружено из {self.state_file}")
+            state = self.backend.load()
+            if state is not None:
+                self.logger.debug(
+                    f"Состояние успешно загружено ({self.backend.name}) из {self.state_file.parent}"
+                )
                 return state
             else:
                 self.logger.info(
-                    f"Файл состояния {self.state_file} не найден, создаем новое состояние"
+                    f"Сохранённое состояние в {self.state_file.parent} не найдено, создаем новое состояние"
                 )
                 return self._create_default_state()
         except Exception as e:
             self.logger.error(f"Ошибка при загрузке состояния: {str(e)}")
             return self._create_default_state()
 
+    def _migrate_lesson_content_cache(self):
+        """Однократно переносит lesson_content_cache из state.json в хранилище уроков."""
+        legacy_cache = self.state.get("lesson_content_cache")
+        if not legacy_cache:
+            self.state.pop("lesson_content_cache", None)
+            return
+        try:
+            imported = self.lesson_store.import_entries(legacy_cache)
+            del self.state["lesson_content_cache"]
+            self.save_state()
+            self.logger.info(
+                f"Кэш уроков перенесён из {self.state_file.name} в хранилище уроков: {imported}"
+            )
+        except Exception as e:
+            # Оставляем уроки в state.json до следующей попытки
+            self.logger.error(f"Ошибка при переносе кэша уроков: {str(e)}")
+
     def _create_default_state(self):
         """
         Создает структуру состояния по умолчанию.
@@ -135,30 +264,157 @@ class StateManager:
             },
         }
 
-    def save_state(self):
-        """
-        Сохраняет текущее состояние в файл.
+    @property
+    def dirty(self):
+        """Есть ли изменения, ещё не записанные в хранилище."""
+        return self._version != self._saved_version
 
-        Returns:
-            bool: True если сохранение прошло успешно, иначе False
+    def save_state(self, *paths):
         """
-        try:
-            # Обновляем время последнего доступа
-            self.state["system"]["last_access"] = datetime.now().isoformat()
+        Помечает состояние изменённым и планирует запись.
 
-            # Создаем директорию, если она не существует
-            self.state_file.parent.mkdir(exist_ok=True, parents=True)
+        При STATE_WRITE_DELAY_MS=0 записывает сразу. Внутри transaction()
+        запись откладывается до выхода из внешнего блока.
 
-            # Сохраняем состояние в файл
-            with open(self.state_file, "w", encoding="utf-8") as f:
-                json.dump(self.state, f, ensure_ascii=False, indent=2)
+        Args:
+            *paths (tuple): Пути (кортежи ключей) изменённых узлов, например
+                ("learning", "questions_count", lesson_id); без путей
+                изменённым считается всё состояние
 
-            self.logger.debug(f"Состояние успешно сохранено в {self.state_file}")
-            return True
+        Returns:
+            bool: True если сохранение прошло (или запланировано) успешно, иначе False
+        """
+        try:
+            with self._tx_lock:
+                self._dirty_paths.update(paths or [()])
+                self._version += 1
+                in_transaction = self._tx_depth > 0
+            if in_transaction:
+                return True
+            return self._request_write()
         except Exception as e:
             self.logger.error(f"Ошибка при сохранении состояния: {str(e)}")
             return False
 
+    @contextmanager
+    def transaction(self):
+        """
+        Объединяет несколько изменений состояния в одну запись.
+
+        Пример:
+            with state_manager.transaction():
+                state_manager.update_learning_progress(...)
+                state_manager.increment_questions_count(...)
+        """
+        with self._tx_lock:
+            self._tx_depth += 1
+        try:
+            yield self
+        finally:
+            with self._tx_lock:
+                self._tx_depth -= 1
+                outermost = self._tx_depth == 0
+            if outermost and self.dirty:
+                self._request_write()
+
+    def _request_write(self):
+        """Записывает сразу или будит фоновый поток записи."""
+        if self.write_delay <= 0 or self._closed:
+            return self.flush()
+        self._write_requested.set()
+        if self._writer is None or not self._writer.is_alive():
+            self._writer = threading.Thread(
+                target=self._writer_loop, name="state-writer", daemon=True
+            )
+            self._writer.start()
+        return True
+
+    def _writer_loop(self):
+        """Фоновая запись: ждёт затишья и записывает серию изменений одним разом."""
+        while not self._closed:
+            self._write_requested.wait()
+            if self._closed:
+                return
+            started = time.monotonic()
+            max_wait = self.write_delay * MAX_WRITE_DELAYS
+            while True:
+                self._write_requested.clear()
+                if not self._write_requested.wait(self.write_delay):
+                    break
+                if self._closed or time.monotonic() - started >= max_wait:
+                    break
+            self.flush(snapshot=True)
+
+    def flush(self, snapshot=False):
+        """
+        Немедленно записывает несохранённые изменения.
+
+        Args:
+            snapshot (bool): Сохранять копию состояния (при записи из фонового
+                потока, пока интерфейс продолжает изменять словарь)
+
+        Returns:
+            bool: True если состояние записано (или изменений не было), иначе False
+        """
+        with self._write_lock:
+            with self._tx_lock:
+                version = self._version
+                if version == self._saved_version:
+                    return True
+                dirty_paths = self._dirty_paths
+                self._dirty_paths = set()
+            try:
+                # Обновляем время последнего доступа
+                self.state["system"]["last_access"] = datetime.now().isoformat()
+                dirty_paths.add(("system", "last_access"))
+
+                if self.backend.tracks_dirty_paths:
+                    # Бэкенд копирует только изменённые узлы сам
+                    self.backend.save(self.state, dirty_paths=dirty_paths)
+                else:
+                    self.backend.save(self._snapshot() if snapshot else self.state)
+                self._saved_version = version
+
+                self.logger.debug(f"Состояние успешно сохранено ({self.backend.name})")
+                return True
+            except Exception as e:
+                with self._tx_lock:
+                    self._dirty_paths.update(dirty_paths)
+                self.logger.error(f"Ошибка при сохранении состояния: {str(e)}")
+                return False
+
+    def _snapshot(self):
+        """Копия состояния; повторяется, если словарь изменился во время копирования."""
+        for _ in range(3):
+            try:
+                return copy.deepcopy(self.state)
+            except RuntimeError:
+                continue
+        return copy.deepcopy(self.state)
+
+    def shutdown(self):
+        """
+        Записывает несохранённые изменения и останавливает фоновую запись.
+
+        Returns:
+            bool: True если состояние записано, иначе False
+        """
+        self._closed = True
+        self._write_requested.set()
+        writer = self._writer
+        if writer is not None and writer.is_alive() and writer is not threading.current_thread():
+            writer.join(timeout=5)
+        if self.backend.tracks_dirty_paths:
+            # Изменения, не отмеченные путями в save_state(), находит полное сравнение
+            with self._tx_lock:
+                self._dirty_paths.add(())
+                self._version += 1
+        saved = self.flush()
+        atexit.unregister(self._atexit_hook)
+        if self._state_lock is not None:
+            self._state_lock.release()
+        return saved
+
     def reset_learning_and_course_data(self):
         """
         Сбрасывает данные курса и прогресса обучения, сохраняя профиль пользователя.
@@ -267,6 +523,9 @@ class StateManager:
     def calculate_course_progress(self):
         return self.learning_progress.calculate_course_progress()
 
+    def get_progress_totals(self):
+        return self.learning_progress.get_progress_totals()
+
     # Методы данных курса
     def save_course_plan(self, course_plan):
         return self.course_data.save_course_plan(course_plan)
@@ -274,15 +533,24 @@ class StateManager:
     def get_course_plan(self):
         return self.course_data.get_course_plan()
 
+    def get_plan_index(self):
+        return self.course_data.get_plan_index()
+
     def get_course_by_id(self, course_id):
         return self.course_data.get_course_by_id(course_id)
 
     def get_all_courses(self):
         return self.course_data.get_all_courses()
 
+    def search_courses(self, query, limit=None):
+        return self.course_data.search_courses(query, limit=limit)
+
     def get_next_lesson(self):
         return self.course_data.get_next_lesson()
 
+    def get_lesson_after(self, section_id, topic_id, lesson_id):
+        return self.course_data.get_lesson_after(section_id, topic_id, lesson_id)
+
     def get_lesson_data(self, section_id, topic_id, lesson_id):
         return self.course_data.get_lesson_data(section_id, topic_id, lesson_id)
 
@@ -298,19 +566,18 @@ class StateManager:
             is_correct (bool): Правильно ли выполнено задание
         """
         try:
-            # Инициализируем секцию контрольных заданий если её нет
-            if "control_tasks" not in self.state:
-                self.state["control_tasks"] = {}
-
-            # Сохраняем результат
-            self.state["control_tasks"][lesson_id] = {
-                "task_title": task_title,
-                "is_correct": is_correct,
-                "completed_at": datetime.now().isoformat(),
-            }
+            # Сохраняем результат (и обновляем итоги прогресса)
+            self.learning_progress.record_control_task_result(
+                lesson_id,
+                {
+                    "task_title": task_title,
+                    "is_correct": is_correct,
+                    "completed_at": datetime.now().isoformat(),
+                },
+            )
 
             # Сохраняем состояние
-            self.save_state()
+            self.save_state(("control_tasks", lesson_id), *STATISTICS_PATHS)
 
             self.logger.info(
                 f"Результат контрольного задания сохранен: {lesson_id} - {is_correct}"
@@ -320,6 +587,37 @@ class StateManager:
             self.logger.error(f"Ошибка при сохранении результата контрольного задания: {str(e)}")
 
 
+    def _lesson_store_key(self, lesson_id):
+        """
+        Ключ урока в хранилище уроков.
+
+        У одного учащегося — ID урока. С learner_id хранилище общее, и ключ
+        строится из того, от чего зависит генерация: названий курса,
+        раздела, темы и урока, стиля общения и имени учащегося. Учащиеся
+        с одинаковым планом курса, стилем и именем получают один и тот же
+        урок. Имя входит в ключ, потому что LLM обращается к учащемуся по
+        имени в падежных формах, и заменить его в готовом тексте нельзя.
+        """
+        if self.learner_id is None:
+            return lesson_id
+        try:
+            section_id, topic_id, short_lesson_id = lesson_id.split(":")
+            if self.get_plan_index().get(section_id, topic_id, short_lesson_id) is None:
+                return f"learner:{self.learner_id}:{lesson_id}"
+            titles = LessonUtils().get_element_titles(
+                self.state["course_plan"], section_id, topic_id, short_lesson_id
+            )
+            user = self.state["user"]
+            parts = list(titles) + [
+                user.get("communication_style", "friendly"),
+                user.get("name", ""),
+            ]
+            digest = hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()
+            return f"shared:{digest}"
+        except Exception as e:
+            self.logger.warning(f"Не удалось построить общий ключ урока {lesson_id}: {str(e)}")
+            return f"learner:{self.learner_id}:{lesson_id}"
+
     def save_lesson_content(self, lesson_id, lesson_title, lesson_content, raw_content=None):
         """
         Сохраняет содержание урока в постоянное хранилище.
@@ -334,28 +632,16 @@ class StateManager:
             bool: True если сохранение прошло успешно, иначе False
         """
         try:
-            # Инициализируем секцию кэша уроков, если её нет
-            if "lesson_content_cache" not in self.state:
-                self.state["lesson_content_cache"] = {}
-            
-            cache_entry = {
-                "title": lesson_title,
-                "content": lesson_content,
-                "cached_at": datetime.now().isoformat(),
-            }
-            if raw_content:
-                cache_entry["raw_content"] = raw_content
-
-            # Сохраняем содержание урока
-            self.state["lesson_content_cache"][lesson_id] = cache_entry
-            
-            # Сохраняем состояние
-            success = self.save_state()
-            
-            if success:
-                self.logger.info(f"Содержание урока {lesson_id} сохранено в кэш")
-            
-            return success
+            self.lesson_store.put(
+                self._lesson_store_key(lesson_id),
+                lesson_title,
+                lesson_content,
+                raw_content=raw_content,
+                course_id=self._current_course_id(),
+            )
+            self.logger.info(f"Содержание урока {lesson_id} сохранено в кэш")
+            self.enforce_lesson_cache_limits()
+            return True
             
         except Exception as e:
             self.logger.error(f"Ошибка при сохранении содержания урока: {str(e)}")
@@ -372,18 +658,13 @@ class StateManager:
             dict: Словарь с title и content или None если не найден
         """
         try:
-            lesson_cache = self.state.get("lesson_content_cache", {})
-            cached_lesson = lesson_cache.get(lesson_id)
+            cached_lesson = self.lesson_store.get(
+                self._lesson_store_key(lesson_id), course_id=self._current_course_id()
+            )
             
             if cached_lesson:
                 self.logger.info(f"Найдено кэшированное содержание урока {lesson_id}")
-                result = {
-                    "title": cached_lesson["title"],
-                    "content": cached_lesson["content"],
-                }
-                if cached_lesson.get("raw_content"):
-                    result["raw_content"] = cached_lesson["raw_content"]
-                return result
+                return cached_lesson
             else:
                 self.logger.debug(f"Кэшированное содержание урока {lesson_id} не найдено")
                 return None
@@ -392,24 +673,101 @@ class StateManager:
             self.logger.error(f"Ошибка при получении кэшированного содержания урока: {str(e)}")
             return None
 
-    def clear_lesson_content_cache(self):
+    def _current_course_id(self):
+        """ID текущего курса (из плана) или None."""
+        return self.state.get("course_plan", {}).get("id") or None
+
+    def enforce_lesson_cache_limits(self):
+        """
+        Вытесняет уроки из хранилища сверх лимитов (см. lesson_store).
+
+        Текущий урок и LESSON_STORE_KEEP_AHEAD следующих за ним не
+        вытесняются. С learner_id хранилище общее для учащихся с разными
+        курсами и позициями: эти уроки закрепляются за учащимся (pin), и
+        evict не трогает закреплённые любым учащимся уроки, а остальные
+        вытесняются только по LRU и давности — ни курс, ни пройденные уроки
+        одного учащегося не говорят, что урок не нужен другому.
+
+        Returns:
+            dict: evicted и evicted_bytes
+        """
+        try:
+            shared = self.learner_id is not None
+            if not shared and not self.lesson_store.needs_eviction():
+                return {"evicted": 0, "evicted_bytes": 0}
+
+            index = self.get_plan_index()
+            learning = self.state["learning"]
+            current = index.get(
+                learning.get("current_section"),
+                learning.get("current_topic"),
+                learning.get("current_lesson"),
+            )
+            start = current.position if current is not None else 0
+            keep = index.entries[start : start + self.lesson_store.keep_ahead + 1]
+            protected = [
+                self._lesson_store_key(f"{e.section_id}:{e.topic_id}:{e.lesson_id}") for e in keep
+            ]
+            if shared:
+                self.lesson_store.pin(self.learner_id, protected)
+                if not self.lesson_store.needs_eviction():
+                    return {"evicted": 0, "evicted_bytes": 0}
+                return self.lesson_store.evict(protected=protected)
+
+            completed = [
+                self._lesson_store_key(key)
+                for key in index.lesson_keys()
+                if self.learning_progress.is_lesson_completed(key)
+            ]
+            return self.lesson_store.evict(
+                protected=protected,
+                current_course=self._current_course_id(),
+                completed=completed,
+            )
+        except Exception as e:
+            self.logger.error(f"Ошибка при вытеснении уроков из хранилища: {str(e)}")
+            return {"evicted": 0, "evicted_bytes": 0}
+
+    def get_lesson_cache_stats(self):
+        """
+        Возвращает статистику хранилища уроков.
+
+        Returns:
+            dict: Статистика LessonContentStore.get_stats()
+        """
+        return self.lesson_store.get_stats()
+
+    def clear_lesson_content_cache(self, all_learners=False):
         """
         Очищает кэш содержания уроков.
-        
+
+        С learner_id хранилище общее, и очищаются только уроки этого
+        учащегося: уроки его плана курса, его личные и закреплённые им.
+        Уроки, закреплённые другими учащимися, остаются.
+
+        Args:
+            all_learners (bool): Очистить всё хранилище, с уроками всех
+                учащихся (операция администратора)
+
         Returns:
             bool: True если очистка прошла успешно, иначе False
         """
         try:
-            if "lesson_content_cache" in self.state:
-                del self.state["lesson_content_cache"]
-                
-            success = self.save_state()
-            
-            if success:
+            if self.learner_id is None or all_learners:
+                self.lesson_store.clear()
                 self.logger.info("Кэш содержания уроков очищен")
-                
-            return success
-            
+                return True
+
+            deleted = self.lesson_store.clear_owner(
+                self.learner_id,
+                [self._lesson_store_key(key) for key in self.get_plan_index().lesson_keys()],
+                key_prefix=f"learner:{self.learner_id}:",
+            )
+            self.logger.info(
+                f"Кэш уроков учащегося {self.learner_id} очищен ({deleted} уроков)"
+            )
+            return True
+
         except Exception as e:
             self.logger.error(f"Ошибка при очистке кэша уроков: {str(e)}")
             return False
@@ -425,11 +783,8 @@ class StateManager:
             bool: True если очистка прошла успешно, иначе False
         """
         try:
-            lesson_cache = self.state.get("lesson_content_cache", {})
-            if lesson_id in lesson_cache:
-                del lesson_cache[lesson_id]
-                self.save_state()
-                self.logger.info(f"Кэш урока {lesson_id} очищен")
+            self.lesson_store.delete(self._lesson_store_key(lesson_id))
+            self.logger.info(f"Кэш урока {lesson_id} очищен")
             return True
         except Exception as e:
             self.logger.error(f"Ошибка при очистке кэша урока {lesson_id}: {str(e)}")
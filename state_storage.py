@@ -0,0 +1,884 @@
+"""
+Хранилища состояния для StateManager.
+
+StateManager работает с одним словарем состояния (user, learning,
+course_plan, system, control_tasks), а способ его хранения задаётся
+бэкендом:
+
+    json — весь словарь в data/state.json (по умолчанию, как раньше);
+        запись атомарная (временный файл и замена) и пропускается,
+        если содержимое не изменилось;
+    sqlite — нормализованные таблицы в data/state.sqlite3 (WAL): профиль,
+        прогресс, оценки, попытки, статусы уроков, счётчики вопросов,
+        результаты контрольных заданий и план курса. При сохранении
+        записываются только изменившиеся строки, в одной транзакции,
+        поэтому стоимость действия не растёт с объёмом прогресса,
+        а читатели из других процессов видят согласованное состояние.
+
+    journal — state.json как снимок плюс журнал state.journal: каждое
+        сохранение дописывает в журнал одну строку с операциями в духе
+        JSON Patch (add/replace/remove по JSON Pointer). Сравниваются и
+        копируются только изменённые узлы состояния (dirty_paths, их
+        передаёт StateManager.save_state), поэтому стоимость сохранения
+        не растёт с объёмом состояния. При загрузке журнал
+        проигрывается поверх снимка (оборванная при сбое последняя строка
+        пропускается), а когда журнал превышает STATE_JOURNAL_MAX_KB, снимок
+        переписывается, а журнал переносится в state.journal.history —
+        историю изменений прогресса.
+
+При первом запуске sqlite-бэкенда существующий state.json переносится
+в базу и переименовывается в state.json.migrated. Если json-бэкенд находит
+рядом журнал (после работы с journal), он проигрывает его при загрузке.
+
+Настройки (переменные окружения / .env):
+    STATE_BACKEND — json, sqlite или journal (json)
+    STATE_JOURNAL_MAX_KB — размер журнала, после которого он сворачивается в снимок (256)
+"""
+
+import os
+import copy
+import json
+import sqlite3
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+SQLITE_STATE_FILE = "state.sqlite3"
+JOURNAL_SUFFIX = ".journal"
+JOURNAL_HISTORY_SUFFIX = ".journal.history"
+
+# Скалярные поля learning, которые хранятся парами ключ/значение;
+# словари и списки learning вынесены в отдельные таблицы
+_LEARNING_TABLES = (
+    "completed_lessons",
+    "lesson_scores",
+    "lesson_attempts",
+    "lesson_completion_status",
+    "questions_count",
+)
+
+# Оценки без объявленного типа: SQLite хранит int и float как есть
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS profile (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS system (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS learning (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS completed_lessons (
+    position INTEGER PRIMARY KEY,
+    lesson_id TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS lesson_scores (
+    lesson_id TEXT PRIMARY KEY,
+    score
+);
+CREATE TABLE IF NOT EXISTS lesson_attempts (
+    lesson_id TEXT NOT NULL,
+    attempt_no INTEGER NOT NULL,
+    score,
+    is_passed INTEGER,
+    timestamp TEXT,
+    data TEXT,
+    PRIMARY KEY (lesson_id, attempt_no)
+);
+CREATE TABLE IF NOT EXISTS lesson_completion_status (
+    lesson_id TEXT PRIMARY KEY,
+    completed INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS questions_count (
+    lesson_id TEXT PRIMARY KEY,
+    count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS control_task_results (
+    lesson_id TEXT PRIMARY KEY,
+    task_title TEXT,
+    is_correct INTEGER,
+    completed_at TEXT
+);
+CREATE TABLE IF NOT EXISTS course_plan (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    plan TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS extra (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _loads(value):
+    return json.loads(value) if value is not None else None
+
+
+def _atomic_write_json(path, state):
+    """Пишет JSON во временный файл и атомарно заменяет им path."""
+    path.parent.mkdir(exist_ok=True, parents=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _escape_pointer(key):
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+
+def _unescape_pointer(token):
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def diff_state(old, new, path=""):
+    """
+    Строит операции, превращающие old в new (в духе JSON Patch).
+
+    Словари сравниваются по ключам, списки, выросшие с конца, дают
+    операции add "/-", прочие изменения — replace целиком.
+
+    Args:
+        old: Прежнее значение
+        new: Новое значение
+        path (str): JSON Pointer текущего узла
+
+    Returns:
+        list[dict]: Операции {"op", "path", "value"}
+    """
+    if old == new:
+        return []
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops = []
+        for key, value in new.items():
+            child = f"{path}/{_escape_pointer(key)}"
+            if key not in old:
+                ops.append({"op": "add", "path": child, "value": value})
+            else:
+                ops.extend(diff_state(old[key], value, child))
+        for key in old:
+            if key not in new:
+                ops.append({"op": "remove", "path": f"{path}/{_escape_pointer(key)}"})
+        return ops
+    if isinstance(old, list) and isinstance(new, list) and new[: len(old)] == old:
+        return [
+            {"op": "add", "path": f"{path}/-", "value": value}
+            for value in new[len(old) :]
+        ]
+    return [{"op": "replace", "path": path, "value": new}]
+
+
+def _has_path(state, path):
+    """Есть ли в состоянии узел по пути из ключей словарей."""
+    node = state
+    for key in path:
+        if not isinstance(node, dict) or key not in node:
+            return False
+        node = node[key]
+    return True
+
+
+def _get_path(state, path):
+    node = state
+    for key in path:
+        node = node[key]
+    return node
+
+
+def _pointer(path):
+    return "".join(f"/{_escape_pointer(key)}" for key in path)
+
+
+def diff_paths(old, new, paths=None):
+    """
+    Строит операции diff_state только для изменённых узлов.
+
+    Узел, которого нет в одном из состояний, добавляется или удаляется
+    целиком; если нет его родителя, сравнивается ближайший общий предок.
+
+    Args:
+        old (dict): Прежнее состояние
+        new (dict): Новое состояние
+        paths (Iterable[tuple], optional): Пути (кортежи ключей) изменённых
+            узлов; None или пустой путь () — сравнить всё состояние
+
+    Returns:
+        list[dict]: Операции {"op", "path", "value"}
+    """
+    if paths is None:
+        return diff_state(old, new)
+    roots = set()
+    for path in paths:
+        path = tuple(path)
+        while path and not (_has_path(old, path[:-1]) and _has_path(new, path[:-1])):
+            path = path[:-1]
+        roots.add(path)
+    if () in roots:
+        return diff_state(old, new)
+    ops = []
+    for path in sorted(roots):
+        # Узел внутри уже сравниваемого узла не сравнивается повторно
+        if any(
+            path[: len(other)] == other for other in roots if len(other) < len(path)
+        ):
+            continue
+        in_old, in_new = _has_path(old, path), _has_path(new, path)
+        if in_old and in_new:
+            ops.extend(
+                diff_state(_get_path(old, path), _get_path(new, path), _pointer(path))
+            )
+        elif in_new:
+            ops.append(
+                {"op": "add", "path": _pointer(path), "value": _get_path(new, path)}
+            )
+        elif in_old:
+            ops.append({"op": "remove", "path": _pointer(path)})
+    return ops
+
+
+def apply_ops(state, ops):
+    """
+    Применяет операции diff_state к состоянию на месте.
+
+    Args:
+        state (dict): Состояние
+        ops (list[dict]): Операции
+
+    Returns:
+        dict: То же состояние (или новое, если заменён корень)
+    """
+    for op in ops:
+        if op["path"] == "":
+            state = op["value"]
+            continue
+        tokens = [_unescape_pointer(t) for t in op["path"].split("/")[1:]]
+        parent = state
+        for token in tokens[:-1]:
+            parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+        last = tokens[-1]
+        if op["op"] == "remove":
+            if isinstance(parent, list):
+                del parent[int(last)]
+            else:
+                parent.pop(last, None)
+        elif isinstance(parent, list):
+            if last == "-":
+                parent.append(op["value"])
+            else:
+                parent[int(last)] = op["value"]
+        else:
+            parent[last] = op["value"]
+    return state
+
+
+def _snapshot_seq(state):
+    """Номер последней записи журнала, учтённой в снимке."""
+    if isinstance(state, dict) and isinstance(state.get("system"), dict):
+        return state["system"].get("journal_seq", 0)
+    return 0
+
+
+def replay_journal(state, journal_path):
+    """
+    Проигрывает журнал поверх снимка.
+
+    Записи, уже учтённые в снимке (seq не больше system.journal_seq),
+    пропускаются — так сбой между записью снимка и очисткой журнала не
+    применяет операции дважды. Оборванная (недописанная при сбое) строка
+    и всё после неё тоже пропускаются.
+
+    Args:
+        state (dict | None): Снимок
+        journal_path (Path): Путь к журналу
+
+    Returns:
+        tuple: (состояние, число проигранных записей, номер последней записи,
+            журнал прочитан целиком без повреждений)
+    """
+    applied = 0
+    intact = True
+    last_seq = _snapshot_seq(state)
+    if state is None:
+        state = {}
+    with open(journal_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                logger.warning(
+                    f"Журнал состояния обрывается после записи {last_seq}, остаток пропущен"
+                )
+                intact = False
+                break
+            seq = entry.get("seq", 0)
+            if seq and seq <= last_seq:
+                continue
+            state = apply_ops(state, entry.get("ops") or [])
+            last_seq = max(last_seq, seq)
+            applied += 1
+    return state, applied, last_seq, intact
+
+
+class StateBackend:
+    """Интерфейс хранилища состояния."""
+
+    name = "base"
+
+    def load(self):
+        """
+        Загружает состояние.
+
+        Returns:
+            dict | None: Состояние или None, если оно ещё не сохранялось
+        """
+        raise NotImplementedError
+
+    # save() читает только узлы dirty_paths и не требует копии состояния
+    tracks_dirty_paths = False
+
+    def save(self, state, dirty_paths=None):
+        """
+        Сохраняет состояние.
+
+        Args:
+            state (dict): Полное состояние
+            dirty_paths (Iterable[tuple], optional): Пути узлов, изменённых
+                с прошлого сохранения (None — могло измениться всё)
+
+        Raises:
+            Exception: Если сохранить не удалось
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Освобождает ресурсы хранилища."""
+
+
+class JsonStateBackend(StateBackend):
+    """Всё состояние в одном JSON-файле."""
+
+    name = "json"
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str | Path): Путь к state.json
+        """
+        self.path = Path(path)
+        # Отпечаток последнего записанного содержимого (без last_access)
+        self._digest = None
+
+    def load(self):
+        journal = self.path.with_name(self.path.name + JOURNAL_SUFFIX)
+        if not self.path.exists() and not journal.exists():
+            return None
+        state = None
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        if journal.exists():
+            # Остался журнал от бэкенда journal: без него снимок устарел
+            state, applied, _, _ = replay_journal(state, journal)
+            logger.info(
+                f"Проигран журнал состояния ({applied} записей), он будет свёрнут в {self.path.name}"
+            )
+            self._digest = None
+            return state
+        self._digest = self._content_digest(state)
+        return state
+
+    @staticmethod
+    def _content_digest(state):
+        """Отпечаток состояния без времени последнего доступа."""
+        content = dict(state)
+        if isinstance(content.get("system"), dict):
+            content["system"] = {
+                k: v for k, v in content["system"].items() if k != "last_access"
+            }
+        raw = json.dumps(content, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def save(self, state, dirty_paths=None):
+        digest = self._content_digest(state)
+        if digest == self._digest:
+            return
+        # Запись во временный файл и атомарная замена: при сбое посреди
+        # записи state.json остаётся прежним, а не обрезанным
+        _atomic_write_json(self.path, state)
+        self._digest = digest
+        journal = self.path.with_name(self.path.name + JOURNAL_SUFFIX)
+        if journal.exists():
+            os.remove(journal)
+
+
+class JournalStateBackend(StateBackend):
+    """Снимок state.json и журнал изменений, дописываемый при каждом сохранении."""
+
+    name = "journal"
+    tracks_dirty_paths = True
+
+    def __init__(self, path, max_journal_bytes=None):
+        """
+        Args:
+            path (str | Path): Путь к снимку state.json
+            max_journal_bytes (int, optional): Размер журнала до сворачивания
+        """
+        self.path = Path(path)
+        self.journal_path = self.path.with_name(self.path.name + JOURNAL_SUFFIX)
+        self.history_path = self.path.with_name(self.path.name + JOURNAL_HISTORY_SUFFIX)
+        if max_journal_bytes is None:
+            try:
+                max_journal_bytes = float(os.getenv("STATE_JOURNAL_MAX_KB", 256)) * 1024
+            except ValueError:
+                max_journal_bytes = 256 * 1024
+        self.max_journal_bytes = int(max_journal_bytes)
+        self._lock = threading.Lock()
+        # Собственная копия состояния на момент последней записи: diff с ней —
+        # новая запись журнала; обновляется операциями записи, из неё же
+        # пишется снимок
+        self._persisted = None
+        self._seq = 0
+
+    def load(self):
+        with self._lock:
+            state = None
+            if self.path.exists():
+                with open(self.path, "r", encoding="utf-8") as f:
+                    state = json.load(f)
+            self._seq = _snapshot_seq(state)
+            intact = True
+            if self.journal_path.exists():
+                state, applied, self._seq, intact = replay_journal(
+                    state, self.journal_path
+                )
+                logger.debug(f"Проиграно записей журнала состояния: {applied}")
+            if state is not None:
+                self._persisted = copy.deepcopy(state)
+                # Повреждённый хвост сворачиваем сразу, иначе новые записи
+                # оказались бы после него и не проигрывались
+                if not intact or self._journal_size() > self.max_journal_bytes:
+                    self._compact()
+            return state
+
+    def save(self, state, dirty_paths=None):
+        with self._lock:
+            if self._persisted is None:
+                # Снимка ещё нет — первая запись сразу снимком
+                self._persisted = copy.deepcopy(state)
+                self._compact()
+                return
+            ops = self._diff(state, dirty_paths)
+            if not ops or all(op["path"] == "/system/last_access" for op in ops):
+                return
+            self._seq += 1
+            entry = {"seq": self._seq, "ts": datetime.now().isoformat(), "ops": ops}
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._persisted = apply_ops(self._persisted, ops)
+            if self._journal_size() > self.max_journal_bytes:
+                self._compact()
+
+    def _diff(self, state, dirty_paths):
+        """
+        Операции для изменённых узлов с копиями их значений.
+
+        Состояние читается без снимка (StateManager не копирует его для
+        этого бэкенда); если словарь изменился во время чтения, попытка
+        повторяется.
+        """
+        for attempt in range(3):
+            try:
+                return copy.deepcopy(diff_paths(self._persisted, state, dirty_paths))
+            except RuntimeError:
+                if attempt == 2:
+                    raise
+
+    def _journal_size(self):
+        try:
+            return self.journal_path.stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    def _compact(self):
+        """Переписывает снимок (из _persisted) и переносит журнал в историю."""
+        state = self._persisted
+        snapshot = dict(state)
+        snapshot["system"] = dict(state.get("system") or {}, journal_seq=self._seq)
+        _atomic_write_json(self.path, snapshot)
+        if self.journal_path.exists():
+            with open(self.journal_path, "r", encoding="utf-8") as src, open(
+                self.history_path, "a", encoding="utf-8"
+            ) as dst:
+                for line in src:
+                    dst.write(line)
+            os.remove(self.journal_path)
+        logger.info(f"Журнал состояния свёрнут в снимок {self.path.name}")
+
+
+class SQLiteStateBackend(StateBackend):
+    """Состояние в нормализованных таблицах SQLite (WAL)."""
+
+    name = "sqlite"
+
+    def __init__(self, path, legacy_json=None, read_only=False):
+        """
+        Args:
+            path (str | Path): Путь к SQLite-файлу
+            legacy_json (str | Path, optional): state.json для однократного переноса
+            read_only (bool): Открыть существующую базу только для чтения
+                (без создания таблиц и переноса state.json)
+        """
+        self.path = Path(path)
+        self.legacy_json = Path(legacy_json) if legacy_json else None
+        self._lock = threading.Lock()
+        # Последнее записанное состояние: сравнение с ним даёт изменённые строки
+        self._persisted = None
+
+        if read_only:
+            self.legacy_json = None
+            # Без журнала WAL базу никто не пишет: immutable не создаёт рядом
+            # файлов -wal/-shm, которые read-only соединение не смогло бы убрать
+            wal = self.path.with_name(self.path.name + "-wal")
+            mode = "mode=ro" if wal.exists() else "immutable=1"
+            self._conn = sqlite3.connect(
+                f"{self.path.absolute().as_uri()}?{mode}",
+                uri=True,
+                check_same_thread=False,
+                isolation_level=None,
+            )
+            return
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self._conn = sqlite3.connect(
+            str(self.path), check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def _is_empty(self):
+        return self._conn.execute("SELECT COUNT(*) FROM system").fetchone()[0] == 0
+
+    def load(self):
+        with self._lock:
+            if self._is_empty():
+                return self._migrate_legacy_json()
+            state = self._read_all()
+            self._persisted = copy.deepcopy(state)
+            return state
+
+    def _migrate_legacy_json(self):
+        """Переносит state.json в базу (один раз)."""
+        if not self.legacy_json or not self.legacy_json.exists():
+            return None
+        with open(self.legacy_json, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        self._write_changes(state)
+        migrated = self.legacy_json.with_name(self.legacy_json.name + ".migrated")
+        os.replace(self.legacy_json, migrated)
+        logger.info(
+            f"Состояние перенесено из {self.legacy_json.name} в {self.path.name}"
+        )
+        return state
+
+    def _read_all(self):
+        conn = self._conn
+        state = {}
+        state["user"] = {
+            k: _loads(v) for k, v in conn.execute("SELECT key, value FROM profile")
+        }
+        state["system"] = {
+            k: _loads(v) for k, v in conn.execute("SELECT key, value FROM system")
+        }
+
+        learning = {
+            k: _loads(v) for k, v in conn.execute("SELECT key, value FROM learning")
+        }
+        learning["completed_lessons"] = [
+            row[0]
+            for row in conn.execute(
+                "SELECT lesson_id FROM completed_lessons ORDER BY position"
+            )
+        ]
+        learning["lesson_scores"] = dict(
+            conn.execute("SELECT lesson_id, score FROM lesson_scores")
+        )
+        attempts = {}
+        for lesson_id, data in conn.execute(
+            "SELECT lesson_id, data FROM lesson_attempts ORDER BY lesson_id, attempt_no"
+        ):
+            attempts.setdefault(lesson_id, []).append(_loads(data))
+        learning["lesson_attempts"] = attempts
+        learning["lesson_completion_status"] = {
+            lesson_id: bool(completed)
+            for lesson_id, completed in conn.execute(
+                "SELECT lesson_id, completed FROM lesson_completion_status"
+            )
+        }
+        learning["questions_count"] = dict(
+            conn.execute("SELECT lesson_id, count FROM questions_count")
+        )
+        state["learning"] = learning
+
+        row = conn.execute("SELECT plan FROM course_plan WHERE id = 0").fetchone()
+        if row is not None:
+            state["course_plan"] = _loads(row[0])
+
+        control_tasks = {
+            lesson_id: {
+                "task_title": task_title,
+                "is_correct": bool(is_correct),
+                "completed_at": completed_at,
+            }
+            for lesson_id, task_title, is_correct, completed_at in conn.execute(
+                "SELECT lesson_id, task_title, is_correct, completed_at FROM control_task_results"
+            )
+        }
+        if control_tasks:
+            state["control_tasks"] = control_tasks
+
+        for key, value in conn.execute("SELECT key, value FROM extra"):
+            state[key] = _loads(value)
+        return state
+
+    def save(self, state, dirty_paths=None):
+        with self._lock:
+            self._write_changes(state)
+
+    def _write_changes(self, state):
+        """Записывает строки, отличающиеся от последнего сохранения, одной транзакцией."""
+        old = self._persisted or {}
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._sync_pairs("profile", old.get("user") or {}, state.get("user") or {})
+            self._sync_pairs(
+                "system", old.get("system") or {}, state.get("system") or {}
+            )
+
+            old_learning = old.get("learning") or {}
+            learning = state.get("learning") or {}
+            self._sync_pairs(
+                "learning",
+                {k: v for k, v in old_learning.items() if k not in _LEARNING_TABLES},
+                {k: v for k, v in learning.items() if k not in _LEARNING_TABLES},
+            )
+            self._sync_completed(
+                old_learning.get("completed_lessons") or [],
+                learning.get("completed_lessons") or [],
+            )
+            self._sync_rows(
+                "lesson_scores",
+                old_learning.get("lesson_scores") or {},
+                learning.get("lesson_scores") or {},
+                "INSERT OR REPLACE INTO lesson_scores (lesson_id, score) VALUES (?, ?)",
+                lambda lesson_id, score: (lesson_id, score),
+            )
+            self._sync_attempts(
+                old_learning.get("lesson_attempts") or {},
+                learning.get("lesson_attempts") or {},
+            )
+            self._sync_rows(
+                "lesson_completion_status",
+                old_learning.get("lesson_completion_status") or {},
+                learning.get("lesson_completion_status") or {},
+                "INSERT OR REPLACE INTO lesson_completion_status (lesson_id, completed) VALUES (?, ?)",
+                lambda lesson_id, completed: (lesson_id, int(bool(completed))),
+            )
+            self._sync_rows(
+                "questions_count",
+                old_learning.get("questions_count") or {},
+                learning.get("questions_count") or {},
+                "INSERT OR REPLACE INTO questions_count (lesson_id, count) VALUES (?, ?)",
+                lambda lesson_id, count: (lesson_id, int(count)),
+            )
+            self._sync_rows(
+                "control_task_results",
+                old.get("control_tasks") or {},
+                state.get("control_tasks") or {},
+                "INSERT OR REPLACE INTO control_task_results "
+                "(lesson_id, task_title, is_correct, completed_at) VALUES (?, ?, ?, ?)",
+                lambda lesson_id, result: (
+                    lesson_id,
+                    result.get("task_title"),
+                    int(bool(result.get("is_correct"))),
+                    result.get("completed_at"),
+                ),
+            )
+
+            if "course_plan" in state and state["course_plan"] != old.get(
+                "course_plan"
+            ):
+                conn.execute(
+                    "INSERT OR REPLACE INTO course_plan (id, plan) VALUES (0, ?)",
+                    (_dumps(state["course_plan"]),),
+                )
+
+            known = {"user", "system", "learning", "control_tasks", "course_plan"}
+            self._sync_pairs(
+                "extra",
+                {k: v for k, v in old.items() if k not in known},
+                {k: v for k, v in state.items() if k not in known},
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._persisted = copy.deepcopy(state)
+
+    def _sync_pairs(self, table, old, new):
+        """Таблица ключ/значение: upsert изменённых ключей, удаление пропавших."""
+        changed = [
+            (k, _dumps(v)) for k, v in new.items() if k not in old or old[k] != v
+        ]
+        removed = [(k,) for k in old if k not in new]
+        if changed:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {table} (key, value) VALUES (?, ?)", changed
+            )
+        if removed:
+            self._conn.executemany(f"DELETE FROM {table} WHERE key = ?", removed)
+
+    def _sync_rows(self, table, old, new, upsert_sql, to_row):
+        """Таблица по lesson_id: upsert изменённых уроков, удаление пропавших."""
+        changed = [
+            to_row(lesson_id, value)
+            for lesson_id, value in new.items()
+            if lesson_id not in old or old[lesson_id] != value
+        ]
+        removed = [(lesson_id,) for lesson_id in old if lesson_id not in new]
+        if changed:
+            self._conn.executemany(upsert_sql, changed)
+        if removed:
+            self._conn.executemany(f"DELETE FROM {table} WHERE lesson_id = ?", removed)
+
+    def _sync_completed(self, old, new):
+        """Список пройденных уроков: дописываем хвост или переписываем целиком."""
+        if old == new:
+            return
+        if new[: len(old)] == old:
+            rows = [
+                (position, lesson_id)
+                for position, lesson_id in enumerate(new)
+                if position >= len(old)
+            ]
+        else:
+            self._conn.execute("DELETE FROM completed_lessons")
+            rows = list(enumerate(new))
+        self._conn.executemany(
+            "INSERT INTO completed_lessons (position, lesson_id) VALUES (?, ?)", rows
+        )
+
+    def _sync_attempts(self, old, new):
+        """Попытки тестов: новые попытки дописываются, изменённые списки переписываются."""
+        for lesson_id, attempts in new.items():
+            previous = old.get(lesson_id) or []
+            if attempts == previous:
+                continue
+            if attempts[: len(previous)] == previous:
+                start = len(previous)
+            else:
+                self._conn.execute(
+                    "DELETE FROM lesson_attempts WHERE lesson_id = ?", (lesson_id,)
+                )
+                start = 0
+            self._conn.executemany(
+                "INSERT INTO lesson_attempts "
+                "(lesson_id, attempt_no, score, is_passed, timestamp, data) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        lesson_id,
+                        attempt_no,
+                        attempt.get("score"),
+                        int(bool(attempt.get("is_passed"))),
+                        attempt.get("timestamp"),
+                        _dumps(attempt),
+                    )
+                    for attempt_no, attempt in enumerate(attempts)
+                    if attempt_no >= start
+                ],
+            )
+        removed = [(lesson_id,) for lesson_id in old if lesson_id not in new]
+        if removed:
+            self._conn.executemany(
+                "DELETE FROM lesson_attempts WHERE lesson_id = ?", removed
+            )
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def create_state_backend(state_file, backend=None):
+    """
+    Создаёт хранилище состояния по настройке STATE_BACKEND.
+
+    Args:
+        state_file (Path): Путь к state.json (база sqlite создаётся рядом)
+        backend (str, optional): json, sqlite или journal вместо настройки
+
+    Returns:
+        StateBackend: Хранилище состояния
+    """
+    name = (backend or os.getenv("STATE_BACKEND") or "json").strip().lower()
+    state_file = Path(state_file)
+    if name == "sqlite":
+        try:
+            return SQLiteStateBackend(
+                state_file.parent / SQLITE_STATE_FILE, legacy_json=state_file
+            )
+        except Exception as e:
+            logger.error(
+                f"Не удалось открыть SQLite-хранилище состояния, используется JSON: {str(e)}"
+            )
+    elif name == "journal":
+        return JournalStateBackend(state_file)
+    elif name != "json":
+        logger.warning(f"Неизвестный STATE_BACKEND={name}, используется json")
+    return JsonStateBackend(state_file)
+
+
+def read_state_snapshot(state_file):
+    """
+    Читает состояние учащегося без побочных эффектов (для выгрузок).
+
+    В отличие от create_state_backend(...).load() ничего не создаёт и не
+    переносит: если рядом есть state.sqlite3 с состоянием, она читается
+    только для чтения, иначе читается state.json с проигранным журналом.
+
+    Args:
+        state_file (Path): Путь к state.json
+
+    Returns:
+        dict | None: Состояние или None, если его нет
+    """
+    state_file = Path(state_file)
+    sqlite_file = state_file.parent / SQLITE_STATE_FILE
+    if sqlite_file.exists():
+        backend = SQLiteStateBackend(sqlite_file, read_only=True)
+        try:
+            state = backend.load()
+        finally:
+            backend.close()
+        if state is not None:
+            return state
+    return JsonStateBackend(state_file).load()
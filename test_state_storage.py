@@ -0,0 +1,66 @@
+"""Тесты хранилищ состояния (state_storage)."""
+
+import copy
+
+import pytest
+
+from state_storage import JournalStateBackend
+
+
+def _make_state():
+    return {
+        "user": {"name": "Аня", "communication_style": "friendly"},
+        "learning": {
+            "questions_count": {"s1:t1:l1": 2},
+            "lesson_scores": {"s1:t1:l1": 80},
+        },
+        "course_plan": {"id": "c1", "sections": []},
+        "system": {"first_run": False},
+    }
+
+
+def _without_journal_seq(state):
+    state = copy.deepcopy(state)
+    state["system"].pop("journal_seq", None)
+    return state
+
+
+def test_journal_reload_without_journal(tmp_path):
+    """Первое сохранение пишет только снимок — он загружается без журнала."""
+    path = tmp_path / "state.json"
+    state = _make_state()
+    JournalStateBackend(path).save(state)
+    assert path.exists()
+    assert not path.with_name("state.json.journal").exists()
+
+    loaded = JournalStateBackend(path).load()
+
+    assert _without_journal_seq(loaded) == state
+
+
+@pytest.mark.parametrize(
+    "dirty_paths",
+    [None, [("user", "name"), ("learning", "questions_count", "s1:t1:l1")]],
+)
+def test_journal_reload_with_journal(tmp_path, dirty_paths):
+    """Изменения после снимка проигрываются из журнала при загрузке."""
+    path = tmp_path / "state.json"
+    backend = JournalStateBackend(path)
+    state = _make_state()
+    backend.save(state)
+
+    state["user"]["name"] = "Петя"
+    state["learning"]["questions_count"]["s1:t1:l1"] += 1
+    backend.save(state, dirty_paths=dirty_paths)
+    assert path.with_name("state.json.journal").exists()
+
+    reopened = JournalStateBackend(path)
+    loaded = reopened.load()
+    assert _without_journal_seq(loaded) == state
+
+    # Загруженное состояние сохраняется и снова загружается без потерь
+    loaded["learning"]["lesson_scores"]["s1:t1:l2"] = 90
+    reopened.save(loaded, dirty_paths=[("learning", "lesson_scores", "s1:t1:l2")])
+    assert _without_journal_seq(JournalStateBackend(path).load()) == (
+        _without_journal_seq(loaded)
+    )